@@ -3035,6 +3035,29 @@ class Bot(TeleGenicObject):
             :class:`TeleGenic.error.TeleGenicError`
 
         """
+        return Update.de_list(  # type: ignore[return-value]
+            self._get_updates_json(
+                offset=offset,
+                limit=limit,
+                timeout=timeout,
+                read_latency=read_latency,
+                allowed_updates=allowed_updates,
+                api_kwargs=api_kwargs,
+            ),
+            self,
+        )
+
+    def _get_updates_json(
+        self,
+        offset: int = None,
+        limit: int = 100,
+        timeout: float = 0,
+        read_latency: float = 2.0,
+        allowed_updates: List[str] = None,
+        api_kwargs: JSONDict = None,
+    ) -> List[JSONDict]:
+        # Like get_updates, but returns the updates without converting them to Update objects.
+        # Used by Updater to convert them on another thread
         data: JSONDict = {'timeout': timeout}
 
         if offset:
@@ -3064,7 +3087,7 @@ class Bot(TeleGenicObject):
         else:
             self.logger.debug('No new updates found.')
 
-        return Update.de_list(result, self)  # type: ignore[return-value]
+        return result
 
     @log
     def set_webhook(
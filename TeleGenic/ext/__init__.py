@@ -20,12 +20,22 @@
 """Extensions over the TeleGenic Bot API to facilitate bot making"""
 
 from .extbot import ExtBot
+from .serializer import BinarySerializer, PickleSerializer, Serializer
 from .basepersistence import BasePersistence
 from .picklepersistence import PicklePersistence
 from .dictpersistence import DictPersistence
+from .jsonlinespersistence import JsonLinesPersistence
+from .sqlitepersistence import SqlitePersistence
+from .shardedpersistence import ShardedPersistence
+from .snapshotpersistence import SnapshotPersistence
+from .writebehindpersistence import WriteBehindPersistence
 from .handler import Handler
 from .callbackcontext import CallbackContext
 from .contexttypes import ContextTypes
+from .timerwheel import TimerWheel
+from .retryscheduler import RetryScheduler
+from .trackingdict import TrackingDict
+from .lazydatadict import LazyDataDict
 from .dispatcher import Dispatcher, DispatcherHandlerStop, block
 
 # https://bugs.python.org/issue41451, fixed on 3.7+, doesn't actually remove slots
@@ -40,7 +50,11 @@ except AttributeError as exc:
         raise exc
 
 from .jobqueue import JobQueue, Job
+from .updatequeue import PriorityUpdateQueue, UpdateQueue
 from .updater import Updater
+from .asyncdispatcher import AsyncDispatcher
+from .asyncupdater import AsyncUpdater
+from .multibotupdater import MultiBotUpdater
 from .callbackqueryhandler import CallbackQueryHandler
 from .choseninlineresulthandler import ChosenInlineResultHandler
 from .inlinequeryhandler import InlineQueryHandler
@@ -51,6 +65,7 @@ from .regexhandler import RegexHandler
 from .stringcommandhandler import StringCommandHandler
 from .stringregexhandler import StringRegexHandler
 from .typehandler import TypeHandler
+from .conversationstore import ConversationStore
 from .conversationhandler import ConversationHandler
 from .precheckoutqueryhandler import PreCheckoutQueryHandler
 from .shippingqueryhandler import ShippingQueryHandler
@@ -61,11 +76,15 @@ from .pollhandler import PollHandler
 from .chatmemberhandler import ChatMemberHandler
 from .chatjoinrequesthandler import ChatJoinRequestHandler
 from .defaults import Defaults
+from .processcallback import ProcessCallback, ProcessContext
 from .callbackdatacache import CallbackDataCache, InvalidCallbackData
 
 __all__ = (
+    'AsyncDispatcher',
+    'AsyncUpdater',
     'BaseFilter',
     'BasePersistence',
+    'BinarySerializer',
     'CallbackContext',
     'CallbackDataCache',
     'CallbackQueryHandler',
@@ -75,6 +94,7 @@ __all__ = (
     'CommandHandler',
     'ContextTypes',
     'ConversationHandler',
+    'ConversationStore',
     'Defaults',
     'DelayQueue',
     'DictPersistence',
@@ -87,20 +107,36 @@ __all__ = (
     'InvalidCallbackData',
     'Job',
     'JobQueue',
+    'JsonLinesPersistence',
+    'LazyDataDict',
     'MessageFilter',
     'MessageHandler',
     'MessageQueue',
+    'MultiBotUpdater',
     'PicklePersistence',
+    'PickleSerializer',
     'PollAnswerHandler',
     'PollHandler',
     'PreCheckoutQueryHandler',
     'PrefixHandler',
+    'PriorityUpdateQueue',
+    'ProcessCallback',
+    'ProcessContext',
     'RegexHandler',
+    'RetryScheduler',
+    'Serializer',
+    'ShardedPersistence',
     'ShippingQueryHandler',
+    'SnapshotPersistence',
+    'SqlitePersistence',
     'StringCommandHandler',
     'StringRegexHandler',
+    'TimerWheel',
+    'TrackingDict',
     'TypeHandler',
     'UpdateFilter',
+    'UpdateQueue',
     'Updater',
+    'WriteBehindPersistence',
     'block',
 )
@@ -0,0 +1,466 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the AsyncDispatcher class."""
+
+import asyncio
+import functools
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Empty, Queue
+from threading import Event
+from time import sleep
+from typing import TYPE_CHECKING, Any, Callable, Coroutine, Optional, Set, TypeVar, Union
+from uuid import uuid4
+
+from TeleGenic import TeleGenicError
+from TeleGenic.ext.dispatcher import Dispatcher, DispatcherHandlerStop
+from TeleGenic.ext.handler import Handler
+from TeleGenic.ext.utils.handlerindex import update_routing_keys
+from TeleGenic.ext.utils.promise import Promise
+from TeleGenic.ext.utils.types import CCT, UD, CD, BD
+from TeleGenic.utils.helpers import DefaultValue, DEFAULT_FALSE
+
+if TYPE_CHECKING:
+    from TeleGenic import Bot
+    from TeleGenic.ext import BasePersistence, ContextTypes, JobQueue
+
+RT = TypeVar('RT')
+
+
+class AsyncDispatcher(Dispatcher[CCT, UD, CD, BD]):
+    """A :class:`TeleGenic.ext.Dispatcher` that processes updates on an :mod:`asyncio` event loop.
+
+    Handler and error handler callbacks may be coroutine functions, i.e. be defined with
+    ``async def``. Those are awaited on the event loop, so that many slow API calls can be in
+    flight at the same time without occupying a worker thread each. Callbacks that are plain
+    functions are run in a thread pool with :attr:`workers` threads, so they don't block the event
+    loop.
+
+    Each update is processed in its own :class:`asyncio.Task`. At most
+    :attr:`concurrent_updates` updates are processed at the same time.
+
+    Note:
+        * Because updates are processed concurrently, the order in which the callbacks for
+          different updates are run is not guaranteed, not even for updates from the same chat.
+          Pass ``concurrent_updates=1`` to process one update after the other.
+        * Coroutine functions that are passed to :meth:`block` or are the callback of a handler
+          with ``run_async=True`` are scheduled on the event loop instead of a worker thread.
+        * Coroutine functions can not be used as callbacks of the handlers within a
+          :class:`TeleGenic.ext.ConversationHandler`, since the conversation handler needs the
+          next state synchronously. The conversation handler itself is run in the thread pool.
+        * Error handlers that are coroutine functions are always run as if they were registered
+          with ``run_async=True``. Hence, they can't stop the processing of an update by raising
+          :class:`TeleGenic.ext.DispatcherHandlerStop`.
+        * The dispatcher still reads updates from the thread safe :attr:`update_queue`, so that
+          updates can be put into the queue from any thread.
+
+    .. versionadded:: 13.11
+
+    Args:
+        bot (:class:`TeleGenic.Bot`): The bot object that should be passed to the handlers.
+        update_queue (:obj:`Queue`): The synchronized queue that will contain the updates.
+        job_queue (:class:`TeleGenic.ext.JobQueue`, optional): The :class:`TeleGenic.ext.JobQueue`
+                instance to pass onto handler callbacks.
+        workers (:obj:`int`, optional): Number of maximum concurrent worker threads for the
+            ``@run_async`` decorator and :meth:`run_async` and number of threads for running
+            callbacks that are not coroutine functions. Defaults to 4.
+        persistence (:class:`TeleGenic.ext.BasePersistence`, optional): The persistence class to
+            store data that should be persistent over restarts.
+        use_context (:obj:`bool`, optional): If set to :obj:`True` uses the context based callback
+            API (ignored if `dispatcher` argument is used). Defaults to :obj:`True`.
+            **New users**: set this to :obj:`True`.
+        context_types (:class:`TeleGenic.ext.ContextTypes`, optional): Pass an instance
+            of :class:`TeleGenic.ext.ContextTypes` to customize the types used in the
+            ``context`` interface. If not passed, the defaults documented in
+            :class:`TeleGenic.ext.ContextTypes` will be used.
+        concurrent_updates (:obj:`int`, optional): The maximum number of updates that are
+            processed at the same time. Defaults to ``256``.
+        max_workers (:obj:`int`, optional): Maximum number of worker threads for the
+            ``@run_async`` decorator and :meth:`run_async` and of threads for running callbacks
+            that are not coroutine functions. See :class:`TeleGenic.ext.Dispatcher`. Defaults to
+            ``workers``.
+
+    Attributes:
+        bot (:class:`TeleGenic.Bot`): The bot object that should be passed to the handlers.
+        update_queue (:obj:`Queue`): The synchronized queue that will contain the updates.
+        job_queue (:class:`TeleGenic.ext.JobQueue`): Optional. The :class:`TeleGenic.ext.JobQueue`
+            instance to pass onto handler callbacks.
+        workers (:obj:`int`, optional): Number of maximum concurrent worker threads for the
+            ``@run_async`` decorator and :meth:`run_async`.
+        user_data (:obj:`defaultdict`): A dictionary handlers can use to store data for the user.
+        chat_data (:obj:`defaultdict`): A dictionary handlers can use to store data for the chat.
+        bot_data (:obj:`dict`): A dictionary handlers can use to store data for the bot.
+        persistence (:class:`TeleGenic.ext.BasePersistence`): Optional. The persistence class to
+            store data that should be persistent over restarts.
+        context_types (:class:`TeleGenic.ext.ContextTypes`): Container for the types used
+            in the ``context`` interface.
+        concurrent_updates (:obj:`int`): The maximum number of updates that are processed at the
+            same time.
+
+    """
+
+    __slots__ = (
+        'concurrent_updates',
+        '_loop',
+        '_loop_ready',
+        '_start_error',
+        '_stopping',
+        '_executor',
+        '_queue_reader',
+        '_tasks',
+    )
+
+    def __init__(
+        self,
+        bot: 'Bot',
+        update_queue: Queue,
+        workers: int = 4,
+        exception_event: Event = None,
+        job_queue: 'JobQueue' = None,
+        persistence: 'BasePersistence' = None,
+        use_context: bool = True,
+        context_types: 'ContextTypes[CCT, UD, CD, BD]' = None,
+        concurrent_updates: int = 256,
+        max_workers: int = None,
+    ):
+        super().__init__(
+            bot,
+            update_queue,
+            workers=workers,
+            max_workers=max_workers,
+            exception_event=exception_event,
+            job_queue=job_queue,
+            persistence=persistence,
+            use_context=use_context,
+            context_types=context_types,
+        )
+        if concurrent_updates < 1:
+            raise ValueError('concurrent_updates must be a positive integer')
+
+        self.concurrent_updates = concurrent_updates
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_ready = Event()
+        self._start_error: Optional[Exception] = None
+        self._stopping = Event()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queue_reader: Optional[ThreadPoolExecutor] = None
+        self._tasks: Set[asyncio.Future] = set()
+
+    @property
+    def loop(self) -> Optional[asyncio.AbstractEventLoop]:
+        """:class:`asyncio.AbstractEventLoop`: The event loop the updates are processed on or
+        :obj:`None`, if the dispatcher is not running.
+        """
+        return self._loop
+
+    def wait_for_loop(self, timeout: float = None) -> Optional[asyncio.AbstractEventLoop]:
+        """Blocks until the event loop of the dispatcher is running and returns it.
+
+        Args:
+            timeout (:obj:`float`, optional): Maximum time in seconds to wait. ``None`` means
+                indefinite. Default is ``None``.
+
+        Returns:
+            :class:`asyncio.AbstractEventLoop`: The event loop or :obj:`None`, if the ``timeout``
+            expired.
+
+        Raises:
+            :class:`TeleGenic.error.TeleGenicError`: If the dispatcher failed to start.
+        """
+        self._loop_ready.wait(timeout)
+        if self._start_error is not None:
+            raise TeleGenicError('The dispatcher failed to start') from self._start_error
+        return self._loop
+
+    def start(self, ready: Event = None) -> None:
+        """Thread target of thread 'dispatcher'.
+
+        Creates a new event loop for the current thread and processes the update queue on it
+        until :meth:`stop` is called.
+
+        Args:
+            ready (:obj:`threading.Event`, optional): If specified, the event will be set once the
+                dispatcher is ready.
+
+        """
+        if self.running:
+            self.logger.warning('already running')
+            if ready is not None:
+                ready.set()
+            return
+
+        if self.exception_event.is_set():
+            msg = 'reusing dispatcher after exception event is forbidden'
+            self.logger.error(msg)
+            raise TeleGenicError(msg)
+
+        self._start_error = None
+        self._loop_ready.clear()
+        try:
+            self._init_async_threads(str(uuid4()), self.workers)
+            self._executor = ThreadPoolExecutor(
+                max_workers=max(self.max_workers, 1),
+                thread_name_prefix=f'Bot:{self.bot.id}:executor',
+            )
+            self._queue_reader = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=f'Bot:{self.bot.id}:queue_reader'
+            )
+            loop = asyncio.new_event_loop()
+        except Exception as exc:
+            self.logger.exception('Failed to start the dispatcher')
+            self._start_error = exc
+            for executor in (self._executor, self._queue_reader):
+                if executor is not None:
+                    executor.shutdown()
+            # Stops the worker threads that were already started
+            super().stop()
+            # Don't keep threads waiting for the loop forever
+            self._loop_ready.set()
+            if ready is not None:
+                ready.set()
+            raise
+
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self.running = True
+        self.logger.debug('Dispatcher started')
+        self._loop_ready.set()
+
+        if ready is not None:
+            ready.set()
+
+        try:
+            loop.run_until_complete(self._dispatch_updates())
+        finally:
+            self._loop_ready.clear()
+            self._loop = None
+            loop.close()
+            self._executor.shutdown()
+            self._queue_reader.shutdown()
+            self.running = False
+            self.logger.debug('Dispatcher thread stopped')
+
+    async def _dispatch_updates(self) -> None:
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrent_updates)
+
+        def on_done(task: asyncio.Future) -> None:
+            self._tasks.discard(task)
+            semaphore.release()
+            self.update_queue.task_done()
+
+        while True:
+            try:
+                # Pop update from update queue without blocking the event loop
+                update = await loop.run_in_executor(
+                    self._queue_reader, self.update_queue.get, True, 1
+                )
+            except Empty:
+                if self._stopping.is_set():
+                    self.logger.debug('orderly stopping')
+                    break
+                if self.exception_event.is_set():
+                    self.logger.critical('stopping due to exception in another thread')
+                    break
+                continue
+
+            self.logger.debug('Processing Update: %s', update)
+            await semaphore.acquire()
+            task = loop.create_task(self.process_update_async(update))
+            self._tasks.add(task)
+            task.add_done_callback(on_done)
+
+        # Let the updates in progress and the scheduled coroutines finish
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stop(self) -> None:
+        """Stops the event loop after all updates in the queue were processed and the pending
+        tasks are done. Afterwards, stops the worker threads.
+        """
+        if self.running:
+            self._stopping.set()
+            while self.running:
+                sleep(0.1)
+            self._stopping.clear()
+
+        super().stop()
+
+    async def _run_sync(self, func: Callable[..., RT], *args: object, **kwargs: object) -> RT:
+        # Runs a blocking function in the thread pool, so it doesn't block the event loop
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def process_update_async(self, update: object) -> None:
+        """Processes a single update and updates the persistence. This is the coroutine version
+        of :meth:`process_update` and must be awaited on the event loop of the dispatcher.
+
+        Callbacks that are coroutine functions are awaited, all other callbacks are run in the
+        thread pool.
+
+        Args:
+            update (:class:`TeleGenic.Update` | :obj:`object` | \
+                :class:`TeleGenic.error.TeleGenicError`):
+                The update to process.
+
+        """
+        # An error happened while polling
+        if isinstance(update, TeleGenicError):
+            await self._run_sync(self.process_update, update)
+            return
+
+        context = None
+        handled = False
+        sync_modes = []
+        routing = update_routing_keys(update)
+
+        for group in self.groups:
+            try:
+                for handler in self._get_handler_index(group).candidates(*routing):
+                    check = handler.check_update(update)
+                    if check is not None and check is not False:
+                        if not context and self.use_context:
+                            context = self.context_types.context.from_update(update, self)
+                            await self._run_sync(context.refresh_data)
+                        handled = True
+                        sync_modes.append(handler.block)
+                        await self._handle_update(handler, update, check, context)
+                        break
+
+            # Stop processing with any other handler.
+            except DispatcherHandlerStop:
+                self.logger.debug('Stopping further handlers due to DispatcherHandlerStop')
+                await self._run_sync(self.update_persistence, update=update)
+                break
+
+            # Dispatch any error.
+            except Exception as exc:
+                try:
+                    await self._run_sync(self.dispatch_error, update, exc)
+                except DispatcherHandlerStop:
+                    self.logger.debug('Error handler stopped further handlers')
+                    break
+                # Errors should not stop the thread.
+                except Exception:
+                    self.logger.exception('An uncaught error was raised while handling the error.')
+
+        # Update persistence, if handled
+        if handled and not self._handled_only_async(sync_modes):
+            await self._run_sync(self.update_persistence, update=update)
+
+    async def _handle_update(
+        self, handler: Handler, update: object, check: object, context: Optional[CCT]
+    ) -> None:
+        if not asyncio.iscoroutinefunction(handler.callback):
+            await self._run_sync(handler.handle_update, update, self, check, context)
+            return
+
+        # For coroutine functions, this only creates the coroutine (or schedules it, if the
+        # handler is to be run asynchronously), so it's safe to call this on the event loop
+        result = handler.handle_update(update, self, check, context)
+        if asyncio.iscoroutine(result):
+            await result
+
+    def _block(
+        self,
+        func: Callable[..., object],
+        *args: object,
+        update: object = None,
+        error_handling: bool = True,
+        **kwargs: object,
+    ) -> Promise:
+        if not asyncio.iscoroutinefunction(func):
+            return super()._block(
+                func, *args, update=update, error_handling=error_handling, **kwargs
+            )
+
+        if self._loop is None:
+            raise RuntimeError('Coroutine functions can only be scheduled while running')
+
+        promise = Promise(func, args, kwargs, update=update, error_handling=error_handling)
+        # This may be called from the event loop as well as from the thread pool
+        self._loop.call_soon_threadsafe(self._schedule_promise, promise)
+        return promise
+
+    def run_coroutine(self, coroutine: Coroutine[Any, Any, RT]) -> 'Future[RT]':
+        """Schedules a coroutine on the event loop of the dispatcher. This method is thread safe.
+        When stopping, the dispatcher waits for the coroutine to finish before closing the event
+        loop.
+
+        Args:
+            coroutine (:term:`coroutine`): The coroutine to run.
+
+        Returns:
+            :class:`concurrent.futures.Future`: A future that holds the result of the coroutine.
+
+        Raises:
+            RuntimeError: If the dispatcher is not running.
+
+        """
+        if self._loop is None:
+            raise RuntimeError('Coroutines can only be scheduled while running')
+        return asyncio.run_coroutine_threadsafe(self._track(coroutine), self._loop)
+
+    async def _track(self, coroutine: Coroutine[Any, Any, RT]) -> RT:
+        task = asyncio.current_task()
+        self._tasks.add(task)  # type: ignore[arg-type]
+        try:
+            return await coroutine
+        finally:
+            self._tasks.discard(task)  # type: ignore[arg-type]
+
+    def _schedule_promise(self, promise: Promise) -> None:
+        task = asyncio.ensure_future(self._run_promise(promise))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_promise(self, promise: Promise) -> None:
+        await promise.run_coroutine()
+        await self._run_sync(self._finish_promise, promise)
+
+    def add_error_handler(
+        self,
+        callback: Callable[[object, CCT], None],
+        block: Union[bool, DefaultValue] = DEFAULT_FALSE,  # pylint: disable=W0621
+    ) -> None:
+        """Registers an error handler in the Dispatcher. This handler will receive every error
+        which happens in your bot.
+
+        Note:
+            Attempts to add the same callback multiple times will be ignored. Callbacks that are
+            coroutine functions are always run asynchronously.
+
+        Warning:
+            The errors handled within these handlers won't show up in the logger, so you
+            need to make sure that you reraise the error.
+
+        Args:
+            callback (:obj:`callable`): The callback function for this error handler. Will be
+                called when an error is raised. Callback signature for context based API:
+
+                ``def callback(update: object, context: CallbackContext)``
+
+                The error that happened will be present in context.error.
+            run_async (:obj:`bool`, optional): Whether this handlers callback should be run
+                asynchronously using :meth:`run_async`. Defaults to :obj:`False`.
+
+        """
+        if asyncio.iscoroutinefunction(callback):
+            block = True
+        super().add_error_handler(callback, block=block)
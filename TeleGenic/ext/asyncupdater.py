@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the AsyncUpdater class."""
+
+import asyncio
+import functools
+from queue import Full, Queue
+from typing import TYPE_CHECKING, Any, Callable, Dict, Union, no_type_check
+
+from TeleGenic import Bot, TeleGenicError
+from TeleGenic.error import InvalidToken, RetryAfter, TimedOut
+from TeleGenic.ext.asyncdispatcher import AsyncDispatcher
+from TeleGenic.ext.retryscheduler import RetryScheduler
+from TeleGenic.ext.updater import Updater
+from TeleGenic.ext.utils.types import CCT, UD, CD, BD
+from TeleGenic.utils.helpers import DEFAULT_FALSE, DefaultValue
+
+if TYPE_CHECKING:
+    from TeleGenic.ext import BasePersistence, ContextTypes, Defaults
+
+
+class AsyncUpdater(Updater[CCT, UD, CD, BD]):
+    """A :class:`TeleGenic.ext.Updater` that employs an :class:`TeleGenic.ext.AsyncDispatcher`.
+
+    When polling, the long polling requests are driven by the event loop of the dispatcher, i.e.
+    the loop awaits :meth:`TeleGenic.Bot.get_updates` while it processes the updates that already
+    arrived. Webhooks are served by the :mod:`tornado` server, which runs its own event loop, as
+    for :class:`TeleGenic.ext.Updater`.
+
+    .. versionadded:: 13.11
+
+    Args:
+        token (:obj:`str`, optional): The bot's token given by the @BotFather.
+        base_url (:obj:`str`, optional): Base_url for the bot.
+        base_file_url (:obj:`str`, optional): Base_file_url for the bot.
+        workers (:obj:`int`, optional): Amount of threads in the thread pool for functions
+            decorated with ``@run_async`` and for callbacks that are not coroutine functions
+            (ignored if `dispatcher` argument is used).
+        bot (:class:`TeleGenic.Bot`, optional): A pre-initialized bot instance (ignored if
+            `dispatcher` argument is used).
+        dispatcher (:class:`TeleGenic.ext.AsyncDispatcher`, optional): A pre-initialized
+            dispatcher instance.
+        private_key (:obj:`bytes`, optional): Private key for decryption of TeleGenic passport data.
+        private_key_password (:obj:`bytes`, optional): Password for above private key.
+        user_sig_handler (:obj:`function`, optional): Takes ``signum, frame`` as positional
+            arguments. This will be called when a signal is received, defaults are (SIGINT,
+            SIGTERM, SIGABRT) settable with :attr:`idle`.
+        request_kwargs (:obj:`dict`, optional): Keyword args to control the creation of a
+            `TeleGenic.utils.request.Request` object (ignored if `bot` or `dispatcher` argument is
+            used).
+        use_context (:obj:`bool`, optional): If set to :obj:`True` uses the context based callback
+            API (ignored if `dispatcher` argument is used). Defaults to :obj:`True`.
+        persistence (:class:`TeleGenic.ext.BasePersistence`, optional): The persistence class to
+            store data that should be persistent over restarts (ignored if `dispatcher` argument is
+            used).
+        defaults (:class:`TeleGenic.ext.Defaults`, optional): An object containing default values to
+            be used if not set explicitly in the bot methods.
+        arbitrary_callback_data (:obj:`bool` | :obj:`int` | :obj:`None`, optional): Whether to
+            allow arbitrary objects as callback data for :class:`TeleGenic.InlineKeyboardButton`.
+        context_types (:class:`TeleGenic.ext.ContextTypes`, optional): Pass an instance
+            of :class:`TeleGenic.ext.ContextTypes` to customize the types used in the
+            ``context`` interface.
+        concurrent_updates (:obj:`int`, optional): The maximum number of updates that are
+            processed at the same time (ignored if `dispatcher` argument is used). Defaults to
+            ``256``.
+        update_queue (:obj:`Queue`, optional): The queue to put the updates into (ignored if
+            `dispatcher` argument is used). Defaults to an unbounded :obj:`queue.Queue`.
+        max_workers (:obj:`int`, optional): Maximum number of threads in the thread pool (ignored
+            if `dispatcher` argument is used). Defaults to ``workers``.
+
+    Raises:
+        ValueError: If both :attr:`token` and :attr:`bot` are passed or none of them.
+        TypeError: If :attr:`dispatcher` is not an :class:`TeleGenic.ext.AsyncDispatcher`.
+
+    Attributes:
+        bot (:class:`TeleGenic.Bot`): The bot used with this Updater.
+        user_sig_handler (:obj:`function`): Optional. Function to be called when a signal is
+            received.
+        update_queue (:obj:`Queue`): Queue for the updates.
+        job_queue (:class:`TeleGenic.ext.JobQueue`): Jobqueue for the updater.
+        dispatcher (:class:`TeleGenic.ext.AsyncDispatcher`): Dispatcher that handles the updates
+            and dispatches them to the handlers.
+        running (:obj:`bool`): Indicates if the updater is running.
+        persistence (:class:`TeleGenic.ext.BasePersistence`): Optional. The persistence class to
+            store data that should be persistent over restarts.
+        use_context (:obj:`bool`): Optional. :obj:`True` if using context based callbacks.
+
+    """
+
+    __slots__ = ('_concurrent_updates',)
+
+    def __init__(  # pylint: disable=R0913
+        self,
+        api_key: str = None,
+        base_url: str = None,
+        workers: int = 4,
+        bot: Bot = None,
+        private_key: bytes = None,
+        private_key_password: bytes = None,
+        user_sig_handler: Callable = None,
+        request_kwargs: Dict[str, Any] = None,
+        persistence: 'BasePersistence' = None,
+        defaults: 'Defaults' = None,
+        use_context: bool = True,
+        dispatcher: AsyncDispatcher[CCT, UD, CD, BD] = None,
+        base_file_url: str = None,
+        arbitrary_callback_data: Union[DefaultValue, bool, int, None] = DEFAULT_FALSE,
+        context_types: 'ContextTypes[CCT, UD, CD, BD]' = None,
+        concurrent_updates: int = 256,
+        update_queue: Queue = None,
+        max_workers: int = None,
+    ):
+        if dispatcher is not None and not isinstance(dispatcher, AsyncDispatcher):
+            raise TypeError('dispatcher must be an instance of AsyncDispatcher')
+
+        self._concurrent_updates = concurrent_updates
+        super().__init__(
+            api_key=api_key,
+            base_url=base_url,
+            workers=workers,
+            bot=bot,
+            private_key=private_key,
+            private_key_password=private_key_password,
+            user_sig_handler=user_sig_handler,
+            request_kwargs=request_kwargs,
+            persistence=persistence,
+            defaults=defaults,
+            use_context=use_context,
+            dispatcher=dispatcher,
+            base_file_url=base_file_url,
+            arbitrary_callback_data=arbitrary_callback_data,
+            context_types=context_types,
+            update_queue=update_queue,
+            max_workers=max_workers,
+        )
+
+    def _create_dispatcher(self, *args: Any, **kwargs: Any) -> AsyncDispatcher[CCT, UD, CD, BD]:
+        return AsyncDispatcher(*args, concurrent_updates=self._concurrent_updates, **kwargs)
+
+    @no_type_check
+    def _start_polling(
+        self,
+        poll_interval,
+        timeout,
+        read_latency,
+        bootstrap_retries,
+        drop_pending_updates,
+        allowed_updates,
+        decode_queue=None,
+        ready=None,
+    ):  # pragma: no cover
+        # Thread target of thread 'updater'. Bootstraps and then waits while the event loop of the
+        # dispatcher pulls updates from TeleGenic and inserts them in the update queue. If
+        # decode_queue is passed, the updates are passed to the thread 'decoder' instead.
+
+        self.logger.debug('Updater thread started (polling)')
+
+        self._bootstrap(
+            bootstrap_retries,
+            drop_pending_updates=drop_pending_updates,
+            webhook_url='',
+            allowed_updates=None,
+        )
+
+        self.logger.debug('Bootstrap done')
+
+        self.dispatcher.wait_for_loop()
+
+        if ready is not None:
+            ready.set()
+
+        future = self.dispatcher.run_coroutine(
+            self._poll_updates(poll_interval, timeout, read_latency, allowed_updates, decode_queue)
+        )
+        future.result()
+
+    @no_type_check
+    async def _poll_updates(
+        self, poll_interval, timeout, read_latency, allowed_updates, decode_queue=None
+    ):
+        loop = asyncio.get_running_loop()
+        get_updates = functools.partial(
+            self.bot.get_updates if decode_queue is None else self.bot._get_updates_json,
+            read_latency=read_latency,
+            allowed_updates=allowed_updates,
+        )
+
+        def put_updates(updates):
+            for update in updates:
+                self.update_queue.put(update)
+
+        async def polling_action_cb():
+            # Apply backpressure: Don't fetch more updates than the queue can take
+            if not await loop.run_in_executor(None, self._wait_for_queue_space):
+                return True
+
+            # The request itself is blocking, so it's awaited in the default executor
+            updates = await loop.run_in_executor(
+                None,
+                functools.partial(
+                    get_updates,
+                    self.last_update_id,
+                    timeout=self.retry_scheduler.poll_timeout(timeout),
+                ),
+            )
+            self.retry_scheduler.record_batch(len(updates))
+
+            if updates:
+                if not self.running:
+                    self.logger.debug('Updates ignored and will be pulled again on restart')
+                else:
+                    # A bounded queue may block, which must not happen on the event loop, as it
+                    # is the one consuming the queue
+                    if decode_queue is None:
+                        await loop.run_in_executor(None, put_updates, updates)
+                        self.last_update_id = updates[-1].update_id + 1
+                    else:
+                        await loop.run_in_executor(None, decode_queue.put, updates)
+                        self.last_update_id = updates[-1]['update_id'] + 1
+
+            return True
+
+        def polling_onerr_cb(exc):
+            # Put the error into the update queue and let the Dispatcher
+            # broadcast it
+            try:
+                self.update_queue.put(exc, block=False)
+            except Full:
+                self.logger.debug('Update queue is full, dropping error %s', exc)
+
+        await self._network_loop_retry_async(
+            polling_action_cb,
+            polling_onerr_cb,
+            'getting Updates',
+            poll_interval,
+            self.retry_scheduler,
+        )
+
+    @no_type_check
+    async def _network_loop_retry_async(
+        self, action_cb, onerr_cb, description, interval, scheduler=None
+    ):
+        """Coroutine version of :meth:`_network_loop_retry`. `action_cb` must be a coroutine
+        function. Waiting between the calls doesn't block the event loop.
+        """
+        self.logger.debug('Start network loop retry %s', description)
+        if scheduler is None:
+            scheduler = RetryScheduler()
+        scheduler.interval = interval
+        while self.running:
+            scheduler.before_request()
+            try:
+                if not await action_cb():
+                    scheduler.record_success()
+                    break
+            except RetryAfter as exc:
+                self.logger.info('%s', exc)
+                cur_interval = scheduler.record_failure(exc)
+            except TimedOut as toe:
+                self.logger.debug('Timed out %s: %s', description, toe)
+                cur_interval = scheduler.record_failure(toe)
+            except InvalidToken as pex:
+                self.logger.error('Invalid token; aborting')
+                raise pex
+            except TeleGenicError as TeleGenic_exc:
+                self.logger.error('Error while %s: %s', description, TeleGenic_exc)
+                onerr_cb(TeleGenic_exc)
+                cur_interval = scheduler.record_failure(TeleGenic_exc)
+            else:
+                cur_interval = scheduler.record_success()
+
+            if cur_interval:
+                await asyncio.sleep(cur_interval)
@@ -17,19 +17,151 @@
 # You should have received a copy of the GNU Lesser Public License
 # along with this program.  If not, see [http://www.gnu.org/licenses/].
 """This module contains the BasePersistence class."""
+import datetime
 import warnings
 from sys import version_info as py_ver
 from abc import ABC, abstractmethod
 from copy import copy
-from typing import Dict, Optional, Tuple, cast, ClassVar, Generic, DefaultDict
+from typing import Collection, Dict, List, Optional, Tuple, cast, ClassVar, Generic, DefaultDict
 
 from TeleGenic.utils.deprecate import set_new_attribute_deprecated
 
 from TeleGenic import Bot
 import TeleGenic.ext.extbot
+from TeleGenic.ext.lazydatadict import LazyDataDict
 
 from TeleGenic.ext.utils.types import UD, CD, BD, ConversationDict, CDCData
 
+# Immutable types that can't contain a bot
+_PLAIN_TYPES = frozenset(
+    {
+        str,
+        bytes,
+        int,
+        float,
+        complex,
+        bool,
+        type(None),
+        datetime.date,
+        datetime.datetime,
+        datetime.time,
+        datetime.timedelta,
+    }
+)
+_NOT_PLAIN = object()
+
+
+def _is_plain_key(key: object, marker: Optional[str]) -> bool:
+    if key.__class__ in _PLAIN_TYPES:
+        return marker is None or key != marker
+    if key.__class__ is tuple or key.__class__ is frozenset:
+        return all(_is_plain_key(item, marker) for item in key)  # type: ignore[attr-defined]
+    return False
+
+
+def _copy_plain_data(obj: object, marker: Optional[str] = None) -> object:
+    """Copies ``obj``, if it only consists of dicts, lists, tuples, sets and immutable builtin
+    values, which can't contain a bot. This is much faster than walking the data with
+    ``_replace_bot``/``_insert_bot`` and works without recursion, so that deeply nested data can
+    be copied as well. Returns ``_NOT_PLAIN`` as soon as anything else or the string ``marker``
+    is encountered.
+    """
+    if obj.__class__ in _PLAIN_TYPES:
+        return _NOT_PLAIN if marker is not None and obj == marker else obj
+
+    memo: Dict[int, object] = {}
+    # Each frame is [copy, items left to copy in reverse order, type, current key]. Tuples are
+    # collected in a list and built once all of their items are copied.
+    stack: List[list] = []
+
+    def is_flat(values: Collection) -> bool:
+        # Checks in C whether all values are immutable builtin values other than marker
+        return _PLAIN_TYPES.issuperset(map(type, values)) and (
+            marker is None or marker not in values
+        )
+
+    def enter(value: object) -> object:
+        # Returns the copy of value or None, if a frame was pushed to copy its items
+        cls = value.__class__
+        if cls is list or cls is tuple:
+            # We copy the items for thread safety, i.e. the list may change while we iterate
+            items = list(value)  # type: ignore[call-overload]
+            if cls is tuple and is_flat(items):
+                return value
+            new: object = items if is_flat(items) else []
+            if cls is list:
+                memo[id(value)] = new
+            if new is items:
+                return new
+            items.reverse()
+            stack.append([new, items, cls, None])
+            return None
+        if isinstance(value, dict):
+            # We copy the dict for thread safety, i.e. it may change while we iterate
+            snapshot = dict(value)
+            if not is_flat(snapshot) and not all(_is_plain_key(key, marker) for key in snapshot):
+                return _NOT_PLAIN
+            if cls is dict:
+                if is_flat(list(snapshot.values())):
+                    memo[id(value)] = snapshot
+                    return snapshot
+                new = {}
+            else:
+                # E.g. defaultdict. Like _replace_bot, we copy the dict and fill it again
+                try:
+                    new = copy(value)
+                except Exception:
+                    return _NOT_PLAIN
+                new.clear()  # type: ignore[attr-defined]
+            memo[id(value)] = new
+            items = list(snapshot.items())
+            items.reverse()
+            stack.append([new, items, dict, None])
+            return None
+        if cls is set or cls is frozenset:
+            if all(_is_plain_key(item, marker) for item in value):  # type: ignore[attr-defined]
+                return set(value) if cls is set else value  # type: ignore[call-overload]
+        return _NOT_PLAIN
+
+    copied = enter(obj)
+    if copied is not None:
+        return copied
+
+    while True:
+        frame = stack[-1]
+        new, items, kind, _ = frame
+        if items:
+            item = items.pop()
+            if kind is dict:
+                # The keys were already checked when entering the dict
+                frame[3], value = item
+            else:
+                value = item
+
+            if value.__class__ in _PLAIN_TYPES:
+                if marker is not None and value == marker:
+                    return _NOT_PLAIN
+            elif id(value) in memo:
+                value = memo[id(value)]
+            else:
+                value = enter(value)
+                if value is _NOT_PLAIN:
+                    return _NOT_PLAIN
+                if value is None:
+                    # The copy is added once all of its items are copied
+                    continue
+        else:
+            stack.pop()
+            value = tuple(new) if kind is tuple else new
+            if not stack:
+                return value
+            frame = stack[-1]
+
+        if frame[2] is dict:
+            frame[0][frame[3]] = value
+        else:
+            frame[0].append(value)
+
 
 class BasePersistence(Generic[UD, CD, BD], ABC):
     """Interface class for adding persistence to your bot.
@@ -188,7 +320,12 @@ class BasePersistence(Generic[UD, CD, BD], ABC):
         # Allow user defined subclasses to have custom attributes.
         if issubclass(self.__class__, BasePersistence) and self.__class__.__name__ not in {
             'DictPersistence',
+            'JsonLinesPersistence',
             'PicklePersistence',
+            'ShardedPersistence',
+            'SnapshotPersistence',
+            'SqlitePersistence',
+            'WriteBehindPersistence',
         }:
             object.__setattr__(self, key, value)
             return
@@ -215,12 +352,21 @@ class BasePersistence(Generic[UD, CD, BD], ABC):
         ``copy.copy``. If the parsing of an object fails, the object will be returned unchanged and
         the error will be logged.
 
+        .. versionchanged:: 13.11
+           Data that only consists of ``dict``, ``list``, ``tuple``, ``set`` and immutable builtin
+           values like ``str``, ``int`` or ``datetime.datetime`` is copied without recursion and
+           considerably faster.
+
         Args:
             obj (:obj:`object`): The object
 
         Returns:
             :obj:`obj`: Copy of the object with Bot instances replaced.
         """
+        # Data consisting only of builtin containers and values can't contain a bot
+        copied = _copy_plain_data(obj)
+        if copied is not _NOT_PLAIN:
+            return copied
         return cls._replace_bot(obj, {})
 
     @classmethod
@@ -316,12 +462,23 @@ class BasePersistence(Generic[UD, CD, BD], ABC):
         ``copy.copy``. If the parsing of an object fails, the object will be returned unchanged and
         the error will be logged.
 
+        .. versionchanged:: 13.11
+           Data that only consists of ``dict``, ``list``, ``tuple``, ``set`` and immutable builtin
+           values like ``str``, ``int`` or ``datetime.datetime`` is copied without recursion and
+           considerably faster. A :class:`TeleGenic.ext.LazyDataDict` is returned
+           unchanged, as the bot is inserted into its entries, when they are loaded.
+
         Args:
             obj (:obj:`object`): The object
 
         Returns:
             :obj:`obj`: Copy of the object with Bot instances inserted.
         """
+        if isinstance(obj, LazyDataDict):
+            return obj
+        copied = _copy_plain_data(obj, marker=self.REPLACED_BOT)
+        if copied is not _NOT_PLAIN:
+            return copied
         return self._insert_bot(obj, {})
 
     def _insert_bot(self, obj: object, memo: Dict[int, object]) -> object:  # pylint: disable=R0911
@@ -29,12 +29,15 @@ from typing import (
     TypeVar,
     Union,
     cast,
+    List,
 )
 
 from TeleGenic import Update
+from TeleGenic.constants import UPDATE_CALLBACK_QUERY
 from TeleGenic.utils.helpers import DefaultValue, DEFAULT_FALSE
 
 from .handler import Handler
+from .utils.handlerindex import CALLBACK_PREFIX, UPDATE_TYPE, RoutingKey, regex_literal_prefix
 from .utils.types import CCT
 
 if TYPE_CHECKING:
@@ -176,6 +179,12 @@ class CallbackQueryHandler(Handler[Update, CCT]):
         self.pass_groups = pass_groups
         self.pass_groupdict = pass_groupdict
 
+    def _routing_keys(self) -> List[RoutingKey]:
+        prefix = regex_literal_prefix(self.pattern)
+        if prefix:
+            return [(CALLBACK_PREFIX, prefix)]
+        return [(UPDATE_TYPE, UPDATE_CALLBACK_QUERY)]
+
     def check_update(self, update: object) -> Optional[Union[bool, object]]:
         """Determines whether an update should be passed to this handlers :attr:`callback`.
 
@@ -18,10 +18,13 @@
 # along with this program.  If not, see [http://www.gnu.org/licenses/].
 """This module contains the ChatJoinRequestHandler class."""
 
+from typing import List
 
 from TeleGenic import Update
+from TeleGenic.constants import UPDATE_CHAT_JOIN_REQUEST
 
 from .handler import Handler
+from .utils.handlerindex import UPDATE_TYPE, RoutingKey
 from .utils.types import CCT
 
 
@@ -87,6 +90,9 @@ class ChatJoinRequestHandler(Handler[Update, CCT]):
 
     __slots__ = ()
 
+    def _routing_keys(self) -> List[RoutingKey]:
+        return [(UPDATE_TYPE, UPDATE_CHAT_JOIN_REQUEST)]
+
     def check_update(self, update: object) -> bool:
         """Determines whether an update should be passed to this handlers :attr:`callback`.
 
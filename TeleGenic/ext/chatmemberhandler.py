@@ -17,11 +17,13 @@
 # You should have received a copy of the GNU Lesser Public License
 # along with this program.  If not, see [http://www.gnu.org/licenses/].
 """This module contains the ChatMemberHandler classes."""
-from typing import ClassVar, TypeVar, Union, Callable
+from typing import ClassVar, TypeVar, Union, Callable, List
 
 from TeleGenic import Update
+from TeleGenic.constants import UPDATE_MY_CHAT_MEMBER, UPDATE_CHAT_MEMBER
 from TeleGenic.utils.helpers import DefaultValue, DEFAULT_FALSE
 from .handler import Handler
+from .utils.handlerindex import UPDATE_TYPE, RoutingKey
 from .utils.types import CCT
 
 RT = TypeVar('RT')
@@ -124,6 +126,9 @@ class ChatMemberHandler(Handler[Update, CCT]):
 
         self.chat_member_types = chat_member_types
 
+    def _routing_keys(self) -> List[RoutingKey]:
+        return [(UPDATE_TYPE, UPDATE_MY_CHAT_MEMBER), (UPDATE_TYPE, UPDATE_CHAT_MEMBER)]
+
     def check_update(self, update: object) -> bool:
         """Determines whether an update should be passed to this handlers :attr:`callback`.
 
@@ -18,12 +18,24 @@
 # along with this program.  If not, see [http://www.gnu.org/licenses/].
 """This module contains the ChosenInlineResultHandler class."""
 import re
-from typing import Optional, TypeVar, Union, Callable, TYPE_CHECKING, Pattern, Match, cast
+from typing import (
+    Optional,
+    TypeVar,
+    Union,
+    Callable,
+    TYPE_CHECKING,
+    Pattern,
+    Match,
+    cast,
+    List,
+)
 
 from TeleGenic import Update
+from TeleGenic.constants import UPDATE_CHOSEN_INLINE_RESULT
 
 from TeleGenic.utils.helpers import DefaultValue, DEFAULT_FALSE
 from .handler import Handler
+from .utils.handlerindex import UPDATE_TYPE, RoutingKey
 from .utils.types import CCT
 
 RT = TypeVar('RT')
@@ -126,6 +138,9 @@ class ChosenInlineResultHandler(Handler[Update, CCT]):
 
         self.pattern = pattern
 
+    def _routing_keys(self) -> List[RoutingKey]:
+        return [(UPDATE_TYPE, UPDATE_CHOSEN_INLINE_RESULT)]
+
     def check_update(self, update: object) -> Optional[Union[bool, object]]:
         """Determines whether an update should be passed to this handlers :attr:`callback`.
 
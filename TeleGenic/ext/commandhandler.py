@@ -29,6 +29,7 @@ from TeleGenic.utils.helpers import DefaultValue, DEFAULT_FALSE
 
 from .utils.types import CCT
 from .handler import Handler
+from .utils.handlerindex import COMMAND, RoutingKey
 
 if TYPE_CHECKING:
     from TeleGenic.ext import Dispatcher
@@ -177,6 +178,9 @@ class CommandHandler(Handler[Update, CCT]):
                 self.filters &= ~Filters.update.edited_message
         self.pass_args = pass_args
 
+    def _routing_keys(self) -> List[RoutingKey]:
+        return [(COMMAND, command) for command in self.command]
+
     def check_update(
         self, update: object
     ) -> Optional[Union[bool, Tuple[List[str], Optional[Union[bool, Dict]]]]]:
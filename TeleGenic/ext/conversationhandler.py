@@ -23,7 +23,7 @@ import logging
 import warnings
 import functools
 import datetime
-from threading import Lock
+from threading import RLock
 from typing import TYPE_CHECKING, Dict, List, NoReturn, Optional, Union, Tuple, cast, ClassVar
 
 from TeleGenic import Update
@@ -36,18 +36,20 @@ from TeleGenic.ext import (
     Handler,
     InlineQueryHandler,
 )
+from TeleGenic.ext.conversationstore import ConversationStore
 from TeleGenic.ext.utils.promise import Promise
 from TeleGenic.ext.utils.types import ConversationDict
 from TeleGenic.ext.utils.types import CCT
+from TeleGenic.utils.deprecate import TeleGenicDeprecationWarning
 
 if TYPE_CHECKING:
-    from TeleGenic.ext import Dispatcher, Job
+    from TeleGenic.ext import Dispatcher
 CheckUpdateType = Optional[Tuple[Tuple[int, ...], Handler, object]]
 
 
 class _ConversationTimeoutContext:
     # '__dict__' is not included since this a private class
-    __slots__ = ('conversation_key', 'update', 'dispatcher', 'callback_context')
+    __slots__ = ('conversation_key', 'update', 'dispatcher', 'callback_context', 'state')
 
     def __init__(
         self,
@@ -55,11 +57,14 @@ class _ConversationTimeoutContext:
         update: Update,
         dispatcher: 'Dispatcher',
         callback_context: Optional[CallbackContext],
+        state: object,
     ):
         self.conversation_key = conversation_key
         self.update = update
         self.dispatcher = dispatcher
         self.callback_context = callback_context
+        # The state the timeout was scheduled for
+        self.state = state
 
 
 class ConversationHandler(Handler[Update, CCT]):
@@ -150,6 +155,14 @@ class ConversationHandler(Handler[Update, CCT]):
             who's :attr:`check_update` method returns :obj:`True` that are in the state
             :attr:`ConversationHandler.TIMEOUT`.
 
+            .. versionchanged:: 13.11
+                The timeouts of all conversations are handled by the
+                :attr:`TeleGenic.ext.Dispatcher.timer_wheel` instead of one job of the
+                :class:`TeleGenic.ext.JobQueue` per conversation. Hence, a
+                :class:`TeleGenic.ext.JobQueue` is no longer required. The
+                :attr:`ConversationHandler.TIMEOUT` handlers are run by the worker threads of
+                the dispatcher.
+
             Note:
                  Using `conversation_timeout` with nested conversations is currently not
                  supported. You can still try to use it, but it will likely behave differently
@@ -199,8 +212,6 @@ class ConversationHandler(Handler[Update, CCT]):
         'persistent',
         '_persistence',
         '_map_to_parent',
-        'timeout_jobs',
-        '_timeout_jobs_lock',
         '_conversations',
         '_conversations_lock',
         'logger',
@@ -249,10 +260,9 @@ class ConversationHandler(Handler[Update, CCT]):
         Set by dispatcher"""
         self._map_to_parent = map_to_parent
 
-        self.timeout_jobs: Dict[Tuple[int, ...], 'Job'] = {}
-        self._timeout_jobs_lock = Lock()
-        self._conversations: ConversationDict = {}
-        self._conversations_lock = Lock()
+        self._conversations = ConversationStore()
+        # Reentrant, so that a timeout can end the conversation while checking that it's current
+        self._conversations_lock = RLock()
 
         self.logger = logging.getLogger(__name__)
 
@@ -439,9 +449,36 @@ class ConversationHandler(Handler[Update, CCT]):
     def conversations(self) -> ConversationDict:  # skipcq: PY-D0003
         return self._conversations
 
+    @property
+    def timeout_jobs(self) -> Dict[Tuple[int, ...], None]:
+        """Dict[Tuple[:obj:`int`], :obj:`None`]: A new :obj:`dict`, whose keys are the keys of the
+        conversations that currently have a timeout.
+
+        .. deprecated:: 13.11
+            Timeouts are no longer scheduled as jobs of the :class:`TeleGenic.ext.JobQueue`, so
+            there are no jobs to return and the values are always :obj:`None`. Changing the
+            returned :obj:`dict` has no effect. Use
+            :meth:`TeleGenic.ext.ConversationStore.has_timeout` of :attr:`conversations` instead.
+        """
+        warnings.warn(
+            'ConversationHandler.timeout_jobs is deprecated. Use '
+            'ConversationHandler.conversations.has_timeout instead.',
+            TeleGenicDeprecationWarning,
+            stacklevel=2,
+        )
+        with self._conversations_lock:
+            conversations = self._conversations
+            return {key: None for key in conversations if conversations.has_timeout(key)}
+
+    @timeout_jobs.setter
+    def timeout_jobs(self, value: object) -> NoReturn:
+        raise ValueError('You can not assign a new value to timeout_jobs.')
+
     @conversations.setter
     def conversations(self, value: ConversationDict) -> None:
-        self._conversations = value
+        old_conversations = self._conversations
+        old_conversations.cancel_timeouts()
+        self._conversations = ConversationStore(value, timer_wheel=old_conversations.timer_wheel)
         # Set conversations for nested conversations
         for handlers in self.states.values():
             for handler in handlers:
@@ -492,15 +529,25 @@ class ConversationHandler(Handler[Update, CCT]):
     ) -> None:
         if new_state != self.END:
             try:
-                # both job_queue & conversation_timeout are checked before calling _schedule_job
-                j_queue = dispatcher.job_queue
-                self.timeout_jobs[conversation_key] = j_queue.run_once(  # type: ignore[union-attr]
-                    self._trigger_timeout,
-                    self.conversation_timeout,  # type: ignore[arg-type]
-                    context=_ConversationTimeoutContext(
-                        conversation_key, update, dispatcher, context
-                    ),
+                timeout = self.conversation_timeout
+                if isinstance(timeout, datetime.timedelta):
+                    timeout = timeout.total_seconds()
+                # The conversations may have been replaced while a promise was running
+                conversations = self._conversations
+                # The timeouts of all conversations of the dispatcher share its timer wheel. This
+                # happens with the first timeout, so no timeouts are left in the previous wheel
+                conversations.timer_wheel = dispatcher.timer_wheel
+                ctxt = _ConversationTimeoutContext(
+                    conversation_key, update, dispatcher, context, new_state
+                )
+                # The promise is run by the worker pool of the dispatcher, which updates the
+                # persistence for the update afterwards
+                conversations.set_timeout(
+                    conversation_key,
+                    timeout,  # type: ignore[arg-type]
+                    Promise(self._trigger_timeout, (ctxt,), {}, update=update),
                 )
+                dispatcher._start_timer_wheel()  # pylint: disable=W0212
             except Exception as exc:
                 self.logger.exception(
                     "Failed to schedule timeout job due to the following exception:"
@@ -616,39 +663,27 @@ class ConversationHandler(Handler[Update, CCT]):
         conversation_key, handler, check_result = check_result  # type: ignore[assignment,misc]
         raise_dp_handler_stop = False
 
-        with self._timeout_jobs_lock:
-            # Remove the old timeout job (if present)
-            timeout_job = self.timeout_jobs.pop(conversation_key, None)
-
-            if timeout_job is not None:
-                timeout_job.schedule_removal()
+        # Remove the old timeout (if present)
+        self._conversations.cancel_timeout(conversation_key)
         try:
             new_state = handler.handle_update(update, dispatcher, check_result, context)
         except DispatcherHandlerStop as exception:
             new_state = exception.state
             raise_dp_handler_stop = True
-        with self._timeout_jobs_lock:
-            if self.conversation_timeout:
-                if dispatcher.job_queue is not None:
-                    # Add the new timeout job
-                    if isinstance(new_state, Promise):
-                        new_state.add_done_callback(
-                            functools.partial(
-                                self._schedule_job,
-                                dispatcher=dispatcher,
-                                update=update,
-                                context=context,
-                                conversation_key=conversation_key,
-                            )
-                        )
-                    elif new_state != self.END:
-                        self._schedule_job(
-                            new_state, dispatcher, update, context, conversation_key
-                        )
-                else:
-                    self.logger.warning(
-                        "Ignoring `conversation_timeout` because the Dispatcher has no JobQueue."
+        if self.conversation_timeout:
+            # Add the new timeout
+            if isinstance(new_state, Promise):
+                new_state.add_done_callback(
+                    functools.partial(
+                        self._schedule_job,
+                        dispatcher=dispatcher,
+                        update=update,
+                        context=context,
+                        conversation_key=conversation_key,
                     )
+                )
+            elif new_state != self.END:
+                self._schedule_job(new_state, dispatcher, update, context, conversation_key)
 
         if isinstance(self.map_to_parent, dict) and new_state in self.map_to_parent:
             self._update_state(self.END, conversation_key)
@@ -691,24 +726,47 @@ class ConversationHandler(Handler[Update, CCT]):
                 if self.persistent and self.persistence and self.name:
                     self.persistence.update_conversation(self.name, key, new_state)
 
-    def _trigger_timeout(self, context: CallbackContext, job: 'Job' = None) -> None:
-        self.logger.debug('conversation timeout was triggered!')
-
-        # Backward compatibility with bots that do not use CallbackContext
-        if isinstance(context, CallbackContext):
-            job = context.job
-            ctxt = cast(_ConversationTimeoutContext, job.context)  # type: ignore[union-attr]
-        else:
-            ctxt = cast(_ConversationTimeoutContext, job.context)
-
-        callback_context = ctxt.callback_context
+    def _trigger_timeout(self, ctxt: _ConversationTimeoutContext) -> None:
+        try:
+            self._handle_timeout(ctxt)
+        except Exception as exc:
+            try:
+                ctxt.dispatcher.dispatch_error(ctxt.update, exc)
+            # Errors should not stop the other timeouts from being handled
+            except Exception:
+                self.logger.exception(
+                    'An error was raised while handling a conversation timeout and an '
+                    'uncaught error was raised while handling the error with an '
+                    'error_handler.'
+                )
 
-        with self._timeout_jobs_lock:
-            found_job = self.timeout_jobs[ctxt.conversation_key]
-            if found_job is not job:
-                # The timeout has been cancelled in handle_update
+    def _timeout_is_current(self, ctxt: _ConversationTimeoutContext) -> bool:
+        # Must be called while holding _conversations_lock. The timer wheel removes a timeout
+        # before handling it, so an update may have continued the conversation meanwhile
+        if self._conversations.has_timeout(ctxt.conversation_key):
+            # The conversation got a newer timeout
+            return False
+        state = self._conversations.get(ctxt.conversation_key)
+        if state is None:
+            # The conversation ended
+            return False
+        expected = ctxt.state
+        if isinstance(expected, Promise):
+            if isinstance(state, tuple) and len(state) == 2 and isinstance(state[1], Promise):
+                return state[1] is expected
+            # The promise is done, it was resolved by check_update
+            expected = expected.result(0)
+        # If the handler returned None, the state was kept. Any other change of the state would
+        # have come with a newer timeout or ended the conversation
+        return expected is None or state == expected
+
+    def _handle_timeout(self, ctxt: _ConversationTimeoutContext) -> None:
+        with self._conversations_lock:
+            if not self._timeout_is_current(ctxt):
+                self.logger.debug('Ignoring an outdated conversation timeout.')
                 return
-            del self.timeout_jobs[ctxt.conversation_key]
+        self.logger.debug('conversation timeout was triggered!')
+        callback_context = ctxt.callback_context
 
         handlers = self.states.get(self.TIMEOUT, [])
         for handler in handlers:
@@ -722,4 +780,7 @@ class ConversationHandler(Handler[Update, CCT]):
                         'ConversationHandler has no effect. Ignoring.'
                     )
 
-        self._update_state(self.END, ctxt.conversation_key)
+        with self._conversations_lock:
+            # The TIMEOUT handlers ran without holding the lock
+            if self._timeout_is_current(ctxt):
+                self._update_state(self.END, ctxt.conversation_key)
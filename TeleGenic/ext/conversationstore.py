@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the ConversationStore class."""
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from TeleGenic.ext.timerwheel import TimerWheel
+
+
+class ConversationStore(dict):
+    """A :obj:`dict` holding the states of the conversations of a
+    :class:`TeleGenic.ext.ConversationHandler`, whose entries can be given a time to live.
+    The timeouts of all entries are kept in a single :class:`TeleGenic.ext.TimerWheel`, so that
+    the expired entries can be collected in one place by :meth:`pop_expired` or by the thread of
+    :attr:`timer_wheel` instead of scheduling a job per entry.
+
+    Expired entries are not deleted, as ending a conversation is up to the
+    :class:`TeleGenic.ext.ConversationHandler`. Deleting an entry cancels its timeout.
+
+    A timer wheel can be shared by several stores, e.g. the
+    :attr:`TeleGenic.ext.Dispatcher.timer_wheel` is shared by all conversation handlers of a
+    dispatcher. The timeouts of the stores are kept apart, so the keys in the timer wheel are
+    not the keys of the entries.
+
+    Note:
+        The timeouts are protected by a lock, the states themselves are not.
+
+    .. versionadded:: 13.11
+
+    Args:
+        timer_wheel (:class:`TeleGenic.ext.TimerWheel`, optional): The timer wheel to hold the
+            timeouts. Defaults to a new timer wheel. All other arguments are passed to
+            :obj:`dict`.
+
+    Attributes:
+        timer_wheel (:class:`TeleGenic.ext.TimerWheel`): The timer wheel holding the timeouts.
+    """
+
+    __slots__ = ('timer_wheel', '_namespace', '__dict__')
+
+    def __init__(self, *args: Any, timer_wheel: TimerWheel = None, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.timer_wheel = TimerWheel() if timer_wheel is None else timer_wheel
+        # Keeps the timeouts apart from those of other stores sharing the timer wheel
+        self._namespace = object()
+
+    def set_timeout(self, key: Hashable, timeout: float, data: object = None) -> float:
+        """Sets the timeout of an entry, replacing a previous timeout of the entry.
+
+        Args:
+            key (:obj:`tuple`): The key of the entry.
+            timeout (:obj:`float`): The time to live of the entry in seconds.
+            data (:obj:`object`, optional): Data returned by :meth:`pop_expired` together with the
+                key.
+
+        Returns:
+            :obj:`float`: The deadline in terms of :func:`time.monotonic`.
+        """
+        return self.timer_wheel.schedule((self._namespace, key), timeout, data)
+
+    def cancel_timeout(self, key: Hashable) -> bool:
+        """Cancels the timeout of an entry.
+
+        Args:
+            key (:obj:`tuple`): The key of the entry.
+
+        Returns:
+            :obj:`bool`: Whether the entry had a timeout.
+        """
+        return self.timer_wheel.cancel((self._namespace, key))
+
+    def has_timeout(self, key: Hashable) -> bool:
+        """
+        Args:
+            key (:obj:`tuple`): The key of the entry.
+
+        Returns:
+            :obj:`bool`: Whether the entry has a timeout that did not expire yet.
+        """
+        return (self._namespace, key) in self.timer_wheel
+
+    def next_deadline(self) -> Optional[float]:
+        """
+        Note:
+            If :attr:`timer_wheel` is shared, the timeouts of the other stores are considered,
+            too.
+
+        Returns:
+            :obj:`float`: The earliest deadline in terms of :func:`time.monotonic` or :obj:`None`,
+            if no entry has a timeout.
+        """
+        return self.timer_wheel.next_deadline()
+
+    def pop_expired(self, now: float = None) -> List[Tuple[Hashable, object]]:
+        """Removes the timeouts that expired and returns the affected entries. See
+        :meth:`TeleGenic.ext.TimerWheel.expire`.
+
+        Note:
+            If :attr:`timer_wheel` is shared, the expired timeouts of the other stores are
+            removed as well, without being returned. Shared timer wheels should be handled by
+            their thread instead, see :meth:`TeleGenic.ext.TimerWheel.start`.
+
+        Args:
+            now (:obj:`float`, optional): The current time in terms of :func:`time.monotonic`.
+                Defaults to the current time.
+
+        Returns:
+            List[Tuple[:obj:`tuple`, :obj:`object`]]: The keys and the data passed to
+            :meth:`set_timeout` for the expired entries, ordered by their deadline.
+        """
+        return [
+            (key, data)
+            for (namespace, key), data in self.timer_wheel.expire(now)  # type: ignore[misc]
+            if namespace is self._namespace
+        ]
+
+    def __delitem__(self, key: Any) -> None:
+        super().__delitem__(key)
+        self.cancel_timeout(key)
+
+    def pop(self, key: Any, *default: Any) -> Any:
+        self.cancel_timeout(key)
+        return super().pop(key, *default)
+
+    def cancel_timeouts(self) -> None:
+        """Cancels the timeouts of all entries."""
+        for key in list(self):
+            self.cancel_timeout(key)
+
+    def clear(self) -> None:
+        self.cancel_timeouts()
+        super().clear()
+
+    def __reduce__(self) -> Tuple[type, Tuple[Dict]]:
+        # The timeouts are not meant to be stored
+        return dict, (dict(self),)
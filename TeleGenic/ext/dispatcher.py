@@ -23,14 +23,16 @@ import warnings
 import weakref
 from collections import defaultdict
 from functools import wraps
+from itertools import count
 from queue import Empty, Queue
 from threading import BoundedSemaphore, Event, Lock, Thread, current_thread
-from time import sleep
+from time import monotonic, sleep
 from typing import (
     TYPE_CHECKING,
     Callable,
     DefaultDict,
     Dict,
+    Hashable,
     List,
     Optional,
     Set,
@@ -46,10 +48,14 @@ from TeleGenic import TeleGenicError, Update
 from TeleGenic.ext import BasePersistence, ContextTypes
 from TeleGenic.ext.callbackcontext import CallbackContext
 from TeleGenic.ext.handler import Handler
+from TeleGenic.ext.processcallback import _shutdown_default_executor
 import TeleGenic.ext.extbot
 from TeleGenic.ext.callbackdatacache import CallbackDataCache
+from TeleGenic.ext.timerwheel import Expired, TimerWheel
+from TeleGenic.ext.trackingdict import TrackingDict
 from TeleGenic.utils.deprecate import TeleGenicDeprecationWarning, set_new_attribute_deprecated
 from TeleGenic.ext.utils.promise import Promise
+from TeleGenic.ext.utils.handlerindex import HandlerIndex, update_routing_keys
 from TeleGenic.utils.helpers import DefaultValue, DEFAULT_FALSE
 from TeleGenic.ext.utils.types import CCT, UD, CD, BD
 
@@ -58,6 +64,7 @@ if TYPE_CHECKING:
     from TeleGenic.ext import JobQueue
 
 DEFAULT_GROUP: int = 0
+_LANE_STOP = object()
 
 UT = TypeVar('UT')
 
@@ -123,6 +130,15 @@ class DispatcherHandlerStop(Exception):
         self.state = state
 
 
+def _default_lane_key(update: object) -> Hashable:
+    if isinstance(update, Update):
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return update.effective_user.id
+    return None
+
+
 class Dispatcher(Generic[CCT, UD, CD, BD]):
     """This class dispatches all kinds of updates to its registered handlers.
 
@@ -144,6 +160,43 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
             :class:`TeleGenic.ext.ContextTypes` will be used.
 
             .. versionadded:: 13.6
+        lanes (:obj:`int`, optional): Number of lanes to process updates on. If greater than 0,
+            updates are distributed onto this many lane threads by the key returned from
+            :attr:`lane_key`, so that updates with the same key are processed one after the other
+            in the order they arrived, while updates with different keys are processed in
+            parallel. Defaults to ``0``, i.e. all updates are processed by the dispatcher thread.
+
+            .. versionadded:: 13.11
+        lane_key (:obj:`callable`, optional): A function that takes an update and returns a
+            hashable key. Updates with the same key are processed on the same lane. Defaults to
+            the id of :attr:`TeleGenic.Update.effective_chat` or, if not available, the id of
+            :attr:`TeleGenic.Update.effective_user`. Updates without chat and user, as well as
+            arbitrary objects, are all processed on the same lane.
+
+            .. versionadded:: 13.11
+        max_workers (:obj:`int`, optional): Maximum number of worker threads. If greater than
+            ``workers``, the pool starts with ``workers`` threads and adds threads while
+            asynchronous functions have to wait for a free worker, either because all workers are
+            busy or because functions waited longer than ``worker_latency_threshold`` seconds.
+            Threads beyond ``workers`` stop again after being idle for ``worker_idle_timeout``
+            seconds. Defaults to ``workers``, i.e. a pool of fixed size.
+
+            .. versionadded:: 13.11
+        worker_idle_timeout (:obj:`float`, optional): Seconds after which an idle thread beyond
+            ``workers`` is stopped. Defaults to ``60``.
+
+            .. versionadded:: 13.11
+        worker_latency_threshold (:obj:`float`, optional): If a function waited longer than this
+            many seconds for a worker, another thread is started. Defaults to ``0.5``.
+
+            .. versionadded:: 13.11
+
+    Note:
+        When using :attr:`lanes`, handlers run in parallel for different chats. Data that is
+        shared between lanes, like :attr:`bot_data` or the ``user_data`` of a user that writes in
+        multiple chats, must still be accessed in a thread safe way. If conversations are tracked
+        per user only (see :attr:`TeleGenic.ext.ConversationHandler.per_chat`), pass a
+        :attr:`lane_key` that returns the user id.
 
     Attributes:
         bot (:class:`TeleGenic.Bot`): The bot object that should be passed to the handlers.
@@ -152,6 +205,17 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
             instance to pass onto handler callbacks.
         workers (:obj:`int`, optional): Number of maximum concurrent worker threads for the
             ``@run_async`` decorator and :meth:`run_async`.
+        max_workers (:obj:`int`): Maximum number of worker threads.
+
+            .. versionadded:: 13.11
+        worker_idle_timeout (:obj:`float`): Seconds after which an idle thread beyond
+            :attr:`workers` is stopped.
+
+            .. versionadded:: 13.11
+        worker_latency_threshold (:obj:`float`): If a function waited longer than this many
+            seconds for a worker, another thread is started.
+
+            .. versionadded:: 13.11
         user_data (:obj:`defaultdict`): A dictionary handlers can use to store data for the user.
         chat_data (:obj:`defaultdict`): A dictionary handlers can use to store data for the chat.
         bot_data (:obj:`dict`): A dictionary handlers can use to store data for the bot.
@@ -161,6 +225,15 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
             in the ``context`` interface.
 
             .. versionadded:: 13.6
+        lanes (:obj:`int`): Number of lanes to process updates on.
+
+            .. versionadded:: 13.11
+        timer_wheel (:class:`TeleGenic.ext.TimerWheel`): Holds the conversation timeouts of all
+            :class:`TeleGenic.ext.ConversationHandler` of this dispatcher. Its thread is started
+            with the first timeout and stopped by :meth:`stop`. Expired timeouts are handled by
+            the worker threads.
+
+            .. versionadded:: 13.11
 
     """
 
@@ -177,6 +250,7 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
         '_update_persistence_lock',
         'handlers',
         'groups',
+        '_handler_index',
         'error_handlers',
         'running',
         '__stop_event',
@@ -187,6 +261,20 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
         '__dict__',
         '__weakref__',
         'context_types',
+        'lanes',
+        '_lane_key',
+        '__lane_queues',
+        '__lane_threads',
+        'max_workers',
+        'worker_idle_timeout',
+        'worker_latency_threshold',
+        '__pool_lock',
+        '__pool_open',
+        '__pool_base_name',
+        '__worker_numbers',
+        '__idle_workers',
+        '__queue_latency',
+        'timer_wheel',
     )
 
     __singleton_lock = Lock()
@@ -204,6 +292,11 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
         job_queue: 'JobQueue' = None,
         persistence: BasePersistence = None,
         use_context: bool = True,
+        lanes: int = 0,
+        lane_key: Callable[[object], Hashable] = None,
+        max_workers: int = None,
+        worker_idle_timeout: float = 60.0,
+        worker_latency_threshold: float = 0.5,
     ):
         ...
 
@@ -218,6 +311,11 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
         persistence: BasePersistence = None,
         use_context: bool = True,
         context_types: ContextTypes[CCT, UD, CD, BD] = None,
+        lanes: int = 0,
+        lane_key: Callable[[object], Hashable] = None,
+        max_workers: int = None,
+        worker_idle_timeout: float = 60.0,
+        worker_latency_threshold: float = 0.5,
     ):
         ...
 
@@ -231,13 +329,23 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
         persistence: BasePersistence = None,
         use_context: bool = True,
         context_types: ContextTypes[CCT, UD, CD, BD] = None,
+        lanes: int = 0,
+        lane_key: Callable[[object], Hashable] = None,
+        max_workers: int = None,
+        worker_idle_timeout: float = 60.0,
+        worker_latency_threshold: float = 0.5,
     ):
         self.bot = bot
         self.update_queue = update_queue
         self.job_queue = job_queue
         self.workers = workers
+        self.max_workers = workers if max_workers is None else max_workers
+        self.worker_idle_timeout = worker_idle_timeout
+        self.worker_latency_threshold = worker_latency_threshold
         self.use_context = use_context
         self.context_types = cast(ContextTypes[CCT, UD, CD, BD], context_types or ContextTypes())
+        self.lanes = lanes
+        self._lane_key = lane_key or _default_lane_key
 
         if not use_context:
             warnings.warn(
@@ -246,10 +354,12 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
                 stacklevel=3,
             )
 
-        if self.workers < 1:
+        if self.max_workers < 1:
             warnings.warn(
                 'Asynchronous callbacks can not be processed without at least one worker thread.'
             )
+        if self.max_workers < self.workers:
+            raise ValueError('max_workers must not be smaller than workers')
 
         self.user_data: DefaultDict[int, UD] = defaultdict(self.context_types.user_data)
         self.chat_data: DefaultDict[int, CD] = defaultdict(self.context_types.chat_data)
@@ -293,6 +403,7 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
         """Dict[:obj:`int`, List[:class:`TeleGenic.ext.Handler`]]: Holds the handlers per group."""
         self.groups: List[int] = []
         """List[:obj:`int`]: A list with all groups."""
+        self._handler_index: Dict[int, HandlerIndex] = {}
         self.error_handlers: Dict[Callable, Union[bool, DefaultValue]] = {}
         """Dict[:obj:`callable`, :obj:`bool`]: A dict, where the keys are error handlers and the
         values indicate whether they are to be run asynchronously."""
@@ -303,6 +414,15 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
         self.__exception_event = exception_event or Event()
         self.__async_queue: Queue = Queue()
         self.__async_threads: Set[Thread] = set()
+        self.__pool_lock = Lock()
+        self.__pool_open = False
+        self.__pool_base_name = ''
+        self.__worker_numbers = count()
+        self.__idle_workers = 0
+        self.__queue_latency = 0.0
+        self.__lane_queues: List[Queue] = []
+        self.__lane_threads: List[Thread] = []
+        self.timer_wheel = TimerWheel()
 
         # For backward compatibility, we allow a "singleton" mode for the dispatcher. When there's
         # only one instance of Dispatcher, it will be possible to use the `run_async` decorator.
@@ -327,14 +447,107 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
     def exception_event(self) -> Event:  # skipcq: PY-D0003
         return self.__exception_event
 
-    def _init_async_threads(self, base_name: str, workers: int) -> None:
-        base_name = f'{base_name}_' if base_name else ''
+    @property
+    def worker_pool_size(self) -> int:
+        """:obj:`int`: The current number of worker threads.
+
+        .. versionadded:: 13.11
+        """
+        return len(self.__async_threads)
+
+    @property
+    def worker_queue_latency(self) -> float:
+        """:obj:`float`: Moving average of the seconds that asynchronous functions waited for a
+        free worker thread.
+
+        .. versionadded:: 13.11
+        """
+        return self.__queue_latency
 
-        for i in range(workers):
-            thread = Thread(target=self._pooled, name=f'Bot:{self.bot.id}:worker:{base_name}{i}')
-            self.__async_threads.add(thread)
+    def _init_lanes(self, base_name: str) -> None:
+        for i in range(self.lanes):
+            queue: Queue = Queue()
+            thread = Thread(
+                target=self._lane, args=(queue,), name=f'Bot:{self.bot.id}:lane:{base_name}_{i}'
+            )
+            self.__lane_queues.append(queue)
+            self.__lane_threads.append(thread)
             thread.start()
 
+    def _lane(self, queue: Queue) -> None:
+        while 1:
+            update = queue.get()
+            if update is _LANE_STOP:
+                break
+            self.logger.debug('Processing Update: %s', update)
+            self.process_update(update)
+            self.update_queue.task_done()
+
+    def _stop_lanes(self) -> None:
+        # Each lane processes the updates already assigned to it before stopping
+        for queue in self.__lane_queues:
+            queue.put(_LANE_STOP)
+        for i, thread in enumerate(self.__lane_threads):
+            self.logger.debug('Waiting for lane %s/%s to end', i + 1, self.lanes)
+            thread.join()
+        self.__lane_queues = []
+        self.__lane_threads = []
+
+    def _dispatch_to_lane(self, update: object) -> None:
+        try:
+            key = self._lane_key(update)
+        except Exception:
+            self.logger.exception('Computing the lane for an update failed.')
+            key = None
+        self.__lane_queues[hash(key) % self.lanes].put(update)
+
+    def _init_async_threads(self, base_name: str, workers: int) -> None:
+        with self.__pool_lock:
+            self.__pool_base_name = f'{base_name}_' if base_name else ''
+            self.__worker_numbers = count()
+            self.__pool_open = True
+            for _ in range(workers):
+                self._add_worker()
+
+    def _add_worker(self) -> None:
+        # Must be called while holding __pool_lock
+        thread = Thread(
+            target=self._pooled,
+            name=f'Bot:{self.bot.id}:worker:{self.__pool_base_name}{next(self.__worker_numbers)}',
+        )
+        self.__async_threads.add(thread)
+        thread.start()
+
+    def _scale_up(self, latency: float = 0.0) -> None:
+        if len(self.__async_threads) >= self.max_workers:
+            return
+        with self.__pool_lock:
+            if not self.__pool_open or len(self.__async_threads) >= self.max_workers:
+                return
+            if (
+                self.__async_queue.qsize() > self.__idle_workers
+                or latency > self.worker_latency_threshold
+            ):
+                self.logger.debug(
+                    'Adding worker thread %d/%d',
+                    len(self.__async_threads) + 1,
+                    self.max_workers,
+                )
+                self._add_worker()
+
+    def _retire_worker(self) -> bool:
+        # Called by idle workers. Returns whether the worker should stop
+        with self.__pool_lock:
+            if not self.__pool_open or len(self.__async_threads) <= self.workers:
+                return False
+            self.__async_threads.discard(current_thread())
+            self.logger.debug(
+                'Stopping idle worker thread, %d/%d left',
+                len(self.__async_threads),
+                self.max_workers,
+            )
+            return True
+
     @classmethod
     def _set_singleton(cls, val: Optional['Dispatcher']) -> None:
         cls.logger.debug('Setting singleton dispatcher as %s', val)
@@ -357,47 +570,68 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
 
     def _pooled(self) -> None:
         thr_name = current_thread().name
+        # Only threads of an elastic pool wait with a timeout to be able to stop when idle
+        idle_timeout = self.worker_idle_timeout if self.max_workers > self.workers else None
         while 1:
-            promise = self.__async_queue.get()
+            with self.__pool_lock:
+                self.__idle_workers += 1
+            try:
+                item = self.__async_queue.get(timeout=idle_timeout)
+            except Empty:
+                if self._retire_worker():
+                    break
+                continue
+            finally:
+                with self.__pool_lock:
+                    self.__idle_workers -= 1
 
             # If unpacking fails, the thread pool is being closed from Updater._join_async_threads
-            if not isinstance(promise, Promise):
+            if not isinstance(item, tuple):
                 self.logger.debug(
                     "Closing block thread %s/%d", thr_name, len(self.__async_threads)
                 )
                 break
 
+            queued_at, promise = item
+            latency = monotonic() - queued_at
+            self.__queue_latency = 0.8 * self.__queue_latency + 0.2 * latency
+            if latency > self.worker_latency_threshold:
+                self._scale_up(latency)
+
             promise.run()
+            self._finish_promise(promise)
 
-            if not promise.exception:
-                self.update_persistence(update=promise.update)
-                continue
+    def _finish_promise(self, promise: Promise) -> None:
+        # Updates the persistence or handles the error after a promise has been run
+        if not promise.exception:
+            self.update_persistence(update=promise.update)
+            return
 
-            if isinstance(promise.exception, DispatcherHandlerStop):
-                self.logger.warning(
-                    'DispatcherHandlerStop is not supported with async functions; func: %s',
-                    promise.pooled_function.__name__,
-                )
-                continue
+        if isinstance(promise.exception, DispatcherHandlerStop):
+            self.logger.warning(
+                'DispatcherHandlerStop is not supported with async functions; func: %s',
+                promise.pooled_function.__name__,
+            )
+            return
 
-            # Avoid infinite recursion of error handlers.
-            if promise.pooled_function in self.error_handlers:
-                self.logger.error('An uncaught error was raised while handling the error.')
-                continue
+        # Avoid infinite recursion of error handlers.
+        if promise.pooled_function in self.error_handlers:
+            self.logger.error('An uncaught error was raised while handling the error.')
+            return
 
-            # Don't perform error handling for a `Promise` with deactivated error handling. This
-            # should happen only via the deprecated `@run_async` decorator or `Promises` created
-            # within error handlers
-            if not promise.error_handling:
-                self.logger.error('A promise with deactivated error handling raised an error.')
-                continue
+        # Don't perform error handling for a `Promise` with deactivated error handling. This
+        # should happen only via the deprecated `@run_async` decorator or `Promises` created
+        # within error handlers
+        if not promise.error_handling:
+            self.logger.error('A promise with deactivated error handling raised an error.')
+            return
 
-            # If we arrive here, an exception happened in the promise and was neither
-            # DispatcherHandlerStop nor raised by an error handler. So we can and must handle it
-            try:
-                self.dispatch_error(promise.update, promise.exception, promise=promise)
-            except Exception:
-                self.logger.exception('An uncaught error was raised while handling the error.')
+        # If we arrive here, an exception happened in the promise and was neither
+        # DispatcherHandlerStop nor raised by an error handler. So we can and must handle it
+        try:
+            self.dispatch_error(promise.update, promise.exception, promise=promise)
+        except Exception:
+            self.logger.exception('An uncaught error was raised while handling the error.')
 
     def block(
         self, func: Callable[..., object], *args: object, update: object = None, **kwargs: object
@@ -437,9 +671,13 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
     ) -> Promise:
         # TODO: Remove error_handling parameter once we drop the @run_async decorator
         promise = Promise(func, args, kwargs, update=update, error_handling=error_handling)
-        self.__async_queue.put(promise)
+        self._enqueue(promise)
         return promise
 
+    def _enqueue(self, promise: Promise) -> None:
+        self.__async_queue.put((monotonic(), promise))
+        self._scale_up()
+
     def start(self, ready: Event = None) -> None:
         """Thread target of thread 'dispatcher'.
 
@@ -461,7 +699,10 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
             self.logger.error(msg)
             raise TeleGenicError(msg)
 
-        self._init_async_threads(str(uuid4()), self.workers)
+        base_name = str(uuid4())
+        self._init_async_threads(base_name, self.workers)
+        if self.lanes > 0:
+            self._init_lanes(base_name)
         self.running = True
         self.logger.debug('Dispatcher started')
 
@@ -481,10 +722,17 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
                     break
                 continue
 
+            if self.__lane_queues:
+                # The lane marks the update as done
+                self._dispatch_to_lane(update)
+                continue
+
             self.logger.debug('Processing Update: %s', update)
             self.process_update(update)
             self.update_queue.task_done()
 
+        if self.__lane_queues:
+            self._stop_lanes()
         self.running = False
         self.logger.debug('Dispatcher thread stopped')
 
@@ -496,9 +744,14 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
                 sleep(0.1)
             self.__stop_event.clear()
 
+        self.timer_wheel.stop()
+
         # async threads must be join()ed only after the dispatcher thread was joined,
         # otherwise we can still have new async threads dispatched
-        threads = list(self.__async_threads)
+        with self.__pool_lock:
+            # Keeps idle workers from stopping on their own and the pool from growing
+            self.__pool_open = False
+            threads = list(self.__async_threads)
         total = len(threads)
 
         # Stop all threads in the thread pool by put()ting one non-tuple per thread
@@ -508,12 +761,30 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
         for i, thr in enumerate(threads):
             self.logger.debug('Waiting for async thread %s/%s to end', i + 1, total)
             thr.join()
-            self.__async_threads.remove(thr)
+            self.__async_threads.discard(thr)
             self.logger.debug('async thread %s/%s has ended', i + 1, total)
 
+        # Only after the workers, which may still wait for ProcessCallbacks, have ended
+        _shutdown_default_executor()
+
     @property
     def has_running_threads(self) -> bool:  # skipcq: PY-D0003
-        return self.running or bool(self.__async_threads)
+        return self.running or bool(self.__async_threads) or self.timer_wheel.running
+
+    def _start_timer_wheel(self) -> None:
+        # Does nothing, if the thread is already running
+        self.timer_wheel.start(self._handle_timeouts, name=f'Bot:{self.bot.id}:timer_wheel')
+
+    def _handle_timeouts(self, expired: Expired) -> None:
+        # The data of the timeouts in timer_wheel are the promises handling them. They are run by
+        # the worker pool like asynchronous handlers, so that slow TIMEOUT handlers neither delay
+        # the other timeouts nor each other
+        for _, promise in expired:
+            if self.max_workers < 1:
+                promise.run()  # type: ignore[attr-defined]
+                self._finish_promise(promise)  # type: ignore[arg-type]
+            else:
+                self._enqueue(promise)  # type: ignore[arg-type]
 
     def process_update(self, update: object) -> None:
         """Processes a single update and updates the persistence.
@@ -541,10 +812,11 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
         context = None
         handled = False
         sync_modes = []
+        routing = update_routing_keys(update)
 
         for group in self.groups:
             try:
-                for handler in self.handlers[group]:
+                for handler in self._get_handler_index(group).candidates(*routing):
                     check = handler.check_update(update)
                     if check is not None and check is not False:
                         if not context and self.use_context:
@@ -573,14 +845,24 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
                     self.logger.exception('An uncaught error was raised while handling the error.')
 
         # Update persistence, if handled
-        handled_only_async = all(sync_modes)
-        if handled:
+        if handled and not self._handled_only_async(sync_modes):
+            self.update_persistence(update=update)
+
+    def _handled_only_async(self, sync_modes: List[Union[bool, DefaultValue]]) -> bool:
+        # If update was only handled by async handlers, we don't need to update the persistence
+        # after processing the update
+        if all(mode is DEFAULT_FALSE for mode in sync_modes) and self.bot.defaults:
             # Respect default settings
-            if all(mode is DEFAULT_FALSE for mode in sync_modes) and self.bot.defaults:
-                handled_only_async = self.bot.defaults.block
-            # If update was only handled by async handlers, we don't need to update here
-            if not handled_only_async:
-                self.update_persistence(update=update)
+            return self.bot.defaults.block
+        return all(sync_modes)
+
+    def _get_handler_index(self, group: int) -> HandlerIndex:
+        handlers = self.handlers[group]
+        index = self._handler_index.get(group)
+        if index is None or not index.is_valid_for(handlers):
+            index = HandlerIndex(handlers)
+            self._handler_index[group] = index
+        return index
 
     def add_handler(self, handler: Handler[UT, CCT], group: int = DEFAULT_GROUP) -> None:
         """Register a handler.
@@ -602,6 +884,15 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
             group will not be used. The order in which handlers were added to the group defines the
             priority.
 
+        Note:
+            To avoid calling :meth:`TeleGenic.ext.Handler.check_update` of every handler for every
+            update, handlers that can only match specific updates (e.g. a
+            :class:`TeleGenic.ext.CommandHandler`) are filed in a routing index per group. The
+            index is rebuilt when :attr:`handlers` is changed or an attribute of a handler is set.
+            Attributes that the routing depends on, like
+            :attr:`TeleGenic.ext.CommandHandler.command`, must not be changed in place, e.g. by
+            appending to the list. Assign a new value instead.
+
         Args:
             handler (:class:`TeleGenic.ext.Handler`): A Handler instance.
             group (:obj:`int`, optional): The group identifier. Default is 0.
@@ -637,6 +928,7 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
             self.groups = sorted(self.groups)
 
         self.handlers[group].append(handler)
+        self._handler_index.pop(group, None)
 
     def remove_handler(self, handler: Handler, group: int = DEFAULT_GROUP) -> None:
         """Remove a handler from the specified group.
@@ -648,6 +940,7 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
         """
         if handler in self.handlers[group]:
             self.handlers[group].remove(handler)
+            self._handler_index.pop(group, None)
             if not self.handlers[group]:
                 del self.handlers[group]
                 self.groups.remove(group)
@@ -695,10 +988,11 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
                             'the error with an error_handler'
                         )
                         self.logger.exception(message)
-            if self.persistence.store_bot_data:
+            if self.persistence.store_bot_data and self._take_change(self.bot_data):
                 try:
                     self.persistence.update_bot_data(self.bot_data)
                 except Exception as exc:
+                    self._restore_change(self.bot_data)
                     try:
                         self.dispatch_error(update, exc)
                     except Exception:
@@ -710,9 +1004,13 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
                         self.logger.exception(message)
             if self.persistence.store_chat_data:
                 for chat_id in chat_ids:
+                    chat_data = self.chat_data[chat_id]
+                    if not self._take_change(chat_data):
+                        continue
                     try:
-                        self.persistence.update_chat_data(chat_id, self.chat_data[chat_id])
+                        self.persistence.update_chat_data(chat_id, chat_data)
                     except Exception as exc:
+                        self._restore_change(chat_data)
                         try:
                             self.dispatch_error(update, exc)
                         except Exception:
@@ -724,9 +1022,13 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
                             self.logger.exception(message)
             if self.persistence.store_user_data:
                 for user_id in user_ids:
+                    user_data = self.user_data[user_id]
+                    if not self._take_change(user_data):
+                        continue
                     try:
-                        self.persistence.update_user_data(user_id, self.user_data[user_id])
+                        self.persistence.update_user_data(user_id, user_data)
                     except Exception as exc:
+                        self._restore_change(user_data)
                         try:
                             self.dispatch_error(update, exc)
                         except Exception:
@@ -737,6 +1039,23 @@ class Dispatcher(Generic[CCT, UD, CD, BD]):
                             )
                             self.logger.exception(message)
 
+    @staticmethod
+    def _take_change(data: object) -> bool:
+        # Returns whether data has to be passed to the persistence. Data that doesn't track its
+        # changes is always passed. The tracking is reset before the data is written, so that
+        # changes made in the meantime are not lost
+        if not isinstance(data, TrackingDict):
+            return True
+        changed = data.changed
+        data.mark_as_unchanged()
+        return changed
+
+    @staticmethod
+    def _restore_change(data: object) -> None:
+        # Makes sure that data which could not be written is passed again next time
+        if isinstance(data, TrackingDict):
+            data.mark_as_changed()
+
     def add_error_handler(
         self,
         callback: Callable[[object, CCT], None],
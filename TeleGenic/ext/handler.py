@@ -18,12 +18,23 @@
 # along with this program.  If not, see [http://www.gnu.org/licenses/].
 """This module contains the base class for handlers as used by the Dispatcher."""
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, TypeVar, Union, Generic
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    TypeVar,
+    Union,
+    Generic,
+)
 from sys import version_info as py_ver
 
 from TeleGenic.utils.deprecate import set_new_attribute_deprecated
 
 from TeleGenic import Update
+from TeleGenic.ext.utils.handlerindex import RoutingKey, invalidate_indexes
 from TeleGenic.ext.utils.promise import Promise
 from TeleGenic.utils.helpers import DefaultValue, DEFAULT_FALSE
 from TeleGenic.ext.utils.types import CCT
@@ -131,6 +142,8 @@ class Handler(Generic[UT, CCT], ABC):
         self.block = block
 
     def __setattr__(self, key: str, value: object) -> None:
+        # The routing keys of the handler may depend on the attribute
+        invalidate_indexes()
         # See comment on BaseFilter to know why this was done.
         if key.startswith('__'):
             key = f"_{self.__class__.__name__}{key}"
@@ -161,6 +174,22 @@ class Handler(Generic[UT, CCT], ABC):
 
         """
 
+    def _routing_keys(self) -> Optional[List[RoutingKey]]:
+        """
+        Returns the keys under which the :class:`TeleGenic.ext.Dispatcher` files this handler in
+        its routing index. The handler will only be checked for updates that share at least one
+        of these keys. :obj:`None` means that the handler has to be checked for every update.
+
+        The keys are only used, if the class that overrides this method also implements
+        :meth:`check_update`. Hence, subclasses that change :meth:`check_update` don't have to
+        take care of this method.
+
+        Returns:
+            List[Tuple[:obj:`str`, :obj:`object`]] | :obj:`None`
+
+        """
+        return None
+
     def handle_update(
         self,
         update: UT,
@@ -32,9 +32,11 @@ from typing import (
 )
 
 from TeleGenic import Update
+from TeleGenic.constants import UPDATE_INLINE_QUERY
 from TeleGenic.utils.helpers import DefaultValue, DEFAULT_FALSE
 
 from .handler import Handler
+from .utils.handlerindex import CHAT_TYPE, UPDATE_TYPE, RoutingKey
 from .utils.types import CCT
 
 if TYPE_CHECKING:
@@ -162,6 +164,11 @@ class InlineQueryHandler(Handler[Update, CCT]):
         self.pass_groups = pass_groups
         self.pass_groupdict = pass_groupdict
 
+    def _routing_keys(self) -> List[RoutingKey]:
+        if self.chat_types is not None:
+            return [(CHAT_TYPE, (UPDATE_INLINE_QUERY, chat_type)) for chat_type in self.chat_types]
+        return [(UPDATE_TYPE, UPDATE_INLINE_QUERY)]
+
     def check_update(self, update: object) -> Optional[Union[bool, Match]]:
         """
         Determines whether an update should be passed to this handlers :attr:`callback`.
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the JsonLinesPersistence class."""
+import logging
+import os
+from collections import defaultdict
+from threading import Lock
+from typing import IO, DefaultDict, Dict, Iterator, Optional, Tuple, cast
+
+from TeleGenic.ext.dictpersistence import DictPersistence
+from TeleGenic.ext.utils.types import ConversationDict, CDCData
+
+try:
+    import ujson as json
+except ImportError:
+    import json  # type: ignore[no-redef]
+
+
+def _decode_keys(data: Dict) -> Dict:
+    # Like decode_user_chat_data_from_json, but for a single entry
+    decoded = {}
+    for key, value in data.items():
+        try:
+            key = int(key)
+        except ValueError:
+            pass
+        decoded[key] = value
+    return decoded
+
+
+class JsonLinesPersistence(DictPersistence):
+    """A :class:`TeleGenic.ext.DictPersistence` that stores the data in a file in the
+    `JSON Lines <https://jsonlines.org/>`_ format. Each line holds a single entry, i.e. the data of
+    one user or chat, the bot data, the callback data or the state of one conversation::
+
+        {"type": "user_data", "id": 123, "data": {"key": "value"}}
+        {"type": "conversation", "name": "handler", "key": [123, 123], "state": 1}
+
+    When an entry changes, a line with the new value is appended, so that only the changed entry
+    is encoded and written. The file is read line by line and later lines replace earlier ones
+    for the same entry. This way, neither loading nor saving the data needs to hold the complete
+    JSON string in memory. :meth:`flush` rewrites the file with one line per entry.
+
+    Note:
+        An incompletely written last line, e.g. because of a crash, is discarded on loading.
+
+    Warning:
+        :class:`JsonLinesPersistence` will try to replace :class:`TeleGenic.Bot` instances by
+        :attr:`REPLACED_BOT` and insert the bot set with
+        :meth:`TeleGenic.ext.BasePersistence.set_bot` upon loading of the data. This is to ensure
+        that changes to the bot apply to the saved objects, too. If you change the bots token, this
+        may lead to e.g. ``Chat not found`` errors. For the limitations on replacing bots see
+        :meth:`TeleGenic.ext.BasePersistence.replace_bot` and
+        :meth:`TeleGenic.ext.BasePersistence.insert_bot`.
+
+    .. versionadded:: 13.11
+
+    Args:
+        filepath (:obj:`str`): Path of the file. It is created, if it does not exist.
+        store_user_data (:obj:`bool`, optional): Whether user_data should be saved by this
+            persistence class. Default is :obj:`True`.
+        store_chat_data (:obj:`bool`, optional): Whether chat_data should be saved by this
+            persistence class. Default is :obj:`True`.
+        store_bot_data (:obj:`bool`, optional): Whether bot_data should be saved by this
+            persistence class. Default is :obj:`True`.
+        store_callback_data (:obj:`bool`, optional): Whether callback_data should be saved by this
+            persistence class. Default is :obj:`False`.
+        on_flush (:obj:`bool`, optional): When :obj:`True`, the file is only written when
+            :meth:`flush` is called. When :obj:`False`, a line is appended for every changed
+            entry. Default is :obj:`False`.
+
+    Attributes:
+        filepath (:obj:`str`): Path of the file.
+        store_user_data (:obj:`bool`): Whether user_data should be saved by this
+            persistence class.
+        store_chat_data (:obj:`bool`): Whether chat_data should be saved by this
+            persistence class.
+        store_bot_data (:obj:`bool`): Whether bot_data should be saved by this
+            persistence class.
+        store_callback_data (:obj:`bool`): Whether callback_data be saved by this
+            persistence class.
+        on_flush (:obj:`bool`): Whether the file is only written when :meth:`flush` is called.
+    """
+
+    __slots__ = ('filepath', 'on_flush', '_loaded', '_file', '_file_lock')
+
+    def __init__(
+        self,
+        filepath: str,
+        store_user_data: bool = True,
+        store_chat_data: bool = True,
+        store_bot_data: bool = True,
+        store_callback_data: bool = False,
+        on_flush: bool = False,
+    ):
+        super().__init__(
+            store_user_data=store_user_data,
+            store_chat_data=store_chat_data,
+            store_bot_data=store_bot_data,
+            store_callback_data=store_callback_data,
+        )
+        self.filepath = filepath
+        self.on_flush = on_flush
+        self._loaded = False
+        self._file: Optional[IO[str]] = None
+        self._file_lock = Lock()
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        self._user_data = defaultdict(dict)
+        self._chat_data = defaultdict(dict)
+        try:
+            file = open(self.filepath, 'r+b')  # pylint: disable=R1732
+        except OSError:
+            return
+        with file:
+            valid_size = 0
+            for number, line in enumerate(file, start=1):
+                if not line.endswith(b'\n'):
+                    # Appending after it would corrupt the next line, so it is removed
+                    logging.getLogger(__name__).warning(
+                        'Discarding the incomplete last line of %s', self.filepath
+                    )
+                    file.truncate(valid_size)
+                    break
+                valid_size += len(line)
+                if line.strip():
+                    self._load_line(line, number)
+
+    def _load_line(self, line: bytes, number: int) -> None:
+        try:
+            entry = json.loads(line)
+            kind = entry['type']
+            if kind == 'user_data':
+                self._user_data[int(entry['id'])] = _decode_keys(entry['data'])  # type: ignore
+            elif kind == 'chat_data':
+                self._chat_data[int(entry['id'])] = _decode_keys(entry['data'])  # type: ignore
+            elif kind == 'bot_data':
+                self._bot_data = entry['data']
+            elif kind == 'callback_data':
+                data = entry['data']
+                self._callback_data = cast(
+                    CDCData,
+                    ([(one, float(two), three) for one, two, three in data[0]], data[1]),
+                )
+            elif kind == 'conversation':
+                conversations = self._conversations
+                if conversations is None:
+                    conversations = self._conversations = {}
+                conversations.setdefault(entry['name'], {})[tuple(entry['key'])] = entry['state']
+            else:
+                raise ValueError(f'Unknown type {kind}')
+        except (ValueError, TypeError, KeyError, IndexError, AttributeError) as exc:
+            raise TypeError(
+                f"Unable to deserialize line {number} of {self.filepath}. Not valid JSON Lines "
+                "data"
+            ) from exc
+
+    def _entries(self) -> Iterator[Dict[str, object]]:
+        for user_id, data in (self._user_data or {}).items():
+            yield {'type': 'user_data', 'id': user_id, 'data': data}
+        for chat_id, data in (self._chat_data or {}).items():
+            yield {'type': 'chat_data', 'id': chat_id, 'data': data}
+        if self._bot_data is not None:
+            yield {'type': 'bot_data', 'data': self._bot_data}
+        if self._callback_data is not None:
+            yield {'type': 'callback_data', 'data': self._callback_data}
+        for name, conversations in (self._conversations or {}).items():
+            for key, state in conversations.items():
+                if state is not None:
+                    yield {'type': 'conversation', 'name': name, 'key': key, 'state': state}
+
+    def _append(self, entry: Dict[str, object]) -> None:
+        if self.on_flush:
+            return
+        line = json.dumps(entry) + '\n'
+        with self._file_lock:
+            if self._file is None:
+                # pylint: disable=R1732
+                self._file = open(self.filepath, 'a', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+
+    def get_user_data(self) -> DefaultDict[int, Dict[object, object]]:
+        """Returns the user_data from the file, if it exists, or an empty :obj:`defaultdict`.
+
+        Returns:
+            :obj:`defaultdict`: The restored user data.
+        """
+        self._load()
+        return super().get_user_data()
+
+    def get_chat_data(self) -> DefaultDict[int, Dict[object, object]]:
+        """Returns the chat_data from the file, if it exists, or an empty :obj:`defaultdict`.
+
+        Returns:
+            :obj:`defaultdict`: The restored chat data.
+        """
+        self._load()
+        return super().get_chat_data()
+
+    def get_bot_data(self) -> Dict[object, object]:
+        """Returns the bot_data from the file, if it exists, or an empty :obj:`dict`.
+
+        Returns:
+            :obj:`dict`: The restored bot data.
+        """
+        self._load()
+        return super().get_bot_data()
+
+    def get_callback_data(self) -> Optional[CDCData]:
+        """Returns the callback_data from the file, if it exists, or :obj:`None`.
+
+        Returns:
+            Optional[:class:`TeleGenic.ext.utils.types.CDCData`]: The restored meta data or
+            :obj:`None`, if no data was stored.
+        """
+        self._load()
+        return super().get_callback_data()
+
+    def get_conversations(self, name: str) -> ConversationDict:
+        """Returns the conversations from the file, if it exists, or an empty dict.
+
+        Args:
+            name (:obj:`str`): The handlers name.
+
+        Returns:
+            :obj:`dict`: The restored conversations for the handler.
+        """
+        self._load()
+        return super().get_conversations(name)
+
+    def update_conversation(
+        self, name: str, key: Tuple[int, ...], new_state: Optional[object]
+    ) -> None:
+        """Will update the conversations for the given handler and depending on :attr:`on_flush`
+        append a line to the file.
+
+        Args:
+            name (:obj:`str`): The handler's name.
+            key (:obj:`tuple`): The key the state is changed for.
+            new_state (:obj:`tuple` | :obj:`any`): The new state for the given key.
+        """
+        if (self._conversations or {}).get(name, {}).get(key) == new_state:
+            return
+        super().update_conversation(name, key, new_state)
+        self._append({'type': 'conversation', 'name': name, 'key': key, 'state': new_state})
+
+    def update_user_data(self, user_id: int, data: Dict) -> None:
+        """Will update the user_data (if changed) and depending on :attr:`on_flush` append a line
+        to the file.
+
+        Args:
+            user_id (:obj:`int`): The user the data might have been changed for.
+            data (:obj:`dict`): The :attr:`TeleGenic.ext.Dispatcher.user_data` ``[user_id]``.
+        """
+        if (self._user_data or {}).get(user_id) == data:
+            return
+        super().update_user_data(user_id, data)
+        self._append({'type': 'user_data', 'id': user_id, 'data': data})
+
+    def update_chat_data(self, chat_id: int, data: Dict) -> None:
+        """Will update the chat_data (if changed) and depending on :attr:`on_flush` append a line
+        to the file.
+
+        Args:
+            chat_id (:obj:`int`): The chat the data might have been changed for.
+            data (:obj:`dict`): The :attr:`TeleGenic.ext.Dispatcher.chat_data` ``[chat_id]``.
+        """
+        if (self._chat_data or {}).get(chat_id) == data:
+            return
+        super().update_chat_data(chat_id, data)
+        self._append({'type': 'chat_data', 'id': chat_id, 'data': data})
+
+    def update_bot_data(self, data: Dict) -> None:
+        """Will update the bot_data (if changed) and depending on :attr:`on_flush` append a line
+        to the file.
+
+        Args:
+            data (:obj:`dict`): The :attr:`TeleGenic.ext.Dispatcher.bot_data`.
+        """
+        if self._bot_data == data:
+            return
+        super().update_bot_data(data)
+        self._append({'type': 'bot_data', 'data': data})
+
+    def update_callback_data(self, data: CDCData) -> None:
+        """Will update the callback_data (if changed) and depending on :attr:`on_flush` append a
+        line to the file.
+
+        Args:
+            data (:class:`TeleGenic.ext.utils.types.CDCData`): The relevant data to restore
+                :class:`TeleGenic.ext.CallbackDataCache`.
+        """
+        if self._callback_data == data:
+            return
+        super().update_callback_data(data)
+        self._append({'type': 'callback_data', 'data': self._callback_data})
+
+    def flush(self) -> None:
+        """Rewrites the file with one line per entry. The new file is written next to the old one
+        and replaces it only when it is complete.
+        """
+        self._load()
+        temporary = f'{self.filepath}.tmp'
+        with self._file_lock:
+            with open(temporary, 'w', encoding='utf-8') as file:
+                for entry in self._entries():
+                    file.write(json.dumps(entry))
+                    file.write('\n')
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            os.replace(temporary, self.filepath)
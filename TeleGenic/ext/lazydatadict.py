@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the LazyDataDict class."""
+import logging
+from collections import defaultdict
+from threading import RLock
+from typing import Any, Callable, Optional
+
+
+class LazyDataDict(defaultdict):
+    """A :obj:`defaultdict` for ``user_data`` and ``chat_data`` that only holds the entries of
+    recently active users and chats in memory. Persistence classes that can load single entries
+    return it from :meth:`~TeleGenic.ext.BasePersistence.get_user_data` and
+    :meth:`~TeleGenic.ext.BasePersistence.get_chat_data`, so that the data is not loaded at
+    startup. Instead, an entry is loaded by :attr:`loader`, when it is accessed for the first time,
+    e.g. by :meth:`TeleGenic.ext.CallbackContext.from_update`. If there is no stored entry,
+    :attr:`default_factory` is used like for a :obj:`defaultdict`.
+
+    If more than :attr:`max_size` entries are held, the least recently accessed entries are
+    removed from memory. Before an entry is removed, it is passed to :attr:`on_evict`, which should
+    write it to the persistence. An evicted entry is loaded again on the next access.
+
+    Note:
+        Only accessing an entry via ``data[key]`` loads it. ``key in data``, ``data.get(key)``
+        and iterating only take the entries into account, which are currently held in memory.
+
+    Warning:
+        An entry that is still in use, e.g. by a handler running in a worker thread, may be
+        evicted, if :attr:`max_size` other entries are accessed in the meantime. Changes made to
+        the evicted object afterwards are not seen by the persistence. Choose :attr:`max_size`
+        well above the number of users or chats that are active at the same time.
+
+    .. versionadded:: 13.11
+
+    Args:
+        default_factory (:obj:`callable`): Creates the entry for keys without stored data.
+        loader (:obj:`callable`): Takes a key and returns the stored data for it or :obj:`None`,
+            if there is none.
+        max_size (:obj:`int`, optional): The maximum number of entries held in memory. Pass
+            :obj:`None` to never evict entries. Defaults to :obj:`None`.
+        on_evict (:obj:`callable`, optional): Takes a key and its data and is called before the
+            entry is evicted.
+
+    Attributes:
+        loader (:obj:`callable`): Loads the stored data for a key.
+        max_size (:obj:`int`): Optional. The maximum number of entries held in memory.
+        on_evict (:obj:`callable`): Optional. Called with key and data before an entry is
+            evicted.
+    """
+
+    __slots__ = ('loader', 'max_size', 'on_evict', '_lock', '__dict__')
+
+    def __init__(
+        self,
+        default_factory: Callable[[], Any],
+        loader: Callable[[Any], Any],
+        max_size: int = None,
+        on_evict: Callable[[Any, Any], None] = None,
+    ):
+        super().__init__(default_factory)
+        self.loader = loader
+        self.max_size = max_size
+        self.on_evict: Optional[Callable[[Any, Any], None]] = on_evict
+        # Handlers may access the data from different threads. Without the lock, an entry could be
+        # loaded twice and the two threads would work on different objects
+        self._lock = RLock()
+
+    def __getitem__(self, key: Any) -> Any:
+        with self._lock:
+            if dict.__contains__(self, key):
+                # Moves the entry to the end, so that the first entry is the least recently used
+                value = dict.pop(self, key)
+                dict.__setitem__(self, key, value)
+                return value
+
+            value = self.loader(key)
+            if value is None:
+                if self.default_factory is None:
+                    raise KeyError(key)
+                value = self.default_factory()
+            dict.__setitem__(self, key, value)
+            self._evict()
+            return value
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        with self._lock:
+            dict.pop(self, key, None)
+            dict.__setitem__(self, key, value)
+            self._evict()
+
+    def copy(self) -> defaultdict:
+        """Returns a plain :obj:`defaultdict` holding the entries that are currently in memory."""
+        return defaultdict(self.default_factory, self)
+
+    __copy__ = copy
+
+    def __reduce__(self) -> Any:
+        # Like copies, pickled data is a plain defaultdict, as the loader can't be pickled
+        return defaultdict, (self.default_factory,), None, None, iter(self.items())
+
+    def _evict(self) -> None:
+        # Must be called while holding the lock
+        if self.max_size is None:
+            return
+        while len(self) > self.max_size:
+            key = next(iter(self))
+            value = dict.pop(self, key)
+            if self.on_evict is None:
+                continue
+            try:
+                self.on_evict(key, value)
+            except Exception:
+                logging.getLogger(__name__).exception(
+                    'Writing the data for %r before evicting it failed. Keeping it in memory.', key
+                )
+                # Keep the data, it would be lost otherwise. We try again on the next eviction
+                dict.__setitem__(self, key, value)
+                return
@@ -0,0 +1,474 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the MultiBotUpdater class."""
+import logging
+import sys
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from queue import Queue
+from signal import SIGABRT, SIGINT, SIGTERM, signal
+from threading import Event, Lock, Thread
+from time import monotonic, sleep
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
+from uuid import uuid4
+
+from TeleGenic import TeleGenicError, Update
+from TeleGenic.error import InvalidToken, RetryAfter, TimedOut
+from TeleGenic.ext.dispatcher import Dispatcher
+from TeleGenic.ext.extbot import ExtBot
+from TeleGenic.ext.retryscheduler import RetryScheduler
+from TeleGenic.utils.deprecate import set_new_attribute_deprecated
+from TeleGenic.utils.helpers import DEFAULT_FALSE, DefaultValue
+from TeleGenic.utils.request import Request
+
+if TYPE_CHECKING:
+    from TeleGenic.ext import BasePersistence, ContextTypes, Defaults
+
+# The connections kept for getUpdates requests, if there is one request per bot
+_LONG_POLL_CONNECTIONS = 128
+
+
+class _BotEntry:
+    __slots__ = ('dispatcher', 'lane', 'offset', 'bootstrapped', 'scheduler', 'due')
+
+    def __init__(self, dispatcher: Dispatcher, lane: int):
+        self.dispatcher = dispatcher
+        self.lane = lane
+        self.offset = 0
+        self.bootstrapped = False
+        self.scheduler = RetryScheduler()
+        self.due = 0.0
+
+
+class MultiBotUpdater:
+    """Polls the updates of many bots in a single :class:`TeleGenic.ext.Updater`-like object.
+    Instead of running an :class:`~TeleGenic.ext.Updater` per bot, each with its own threads and
+    connection pool, all bots share
+
+    * one connection pool,
+    * a pool of threads performing the ``getUpdates`` requests, driven by a single polling thread
+      that waits for whichever request completes first,
+    * ``workers`` threads passing the updates to the :class:`TeleGenic.ext.Dispatcher` of their
+      bot. The updates of one bot are always processed by the same thread in the order they
+      arrived.
+
+    The dispatchers are not started themselves. Their worker threads for asynchronous handlers
+    are only started while needed, see :attr:`TeleGenic.ext.Dispatcher.max_workers`. No
+    :class:`TeleGenic.ext.JobQueue` is created. Errors are handled per bot, each bot has its own
+    :class:`TeleGenic.ext.RetryScheduler`.
+
+    By default, each bot is long polled, i.e. one ``getUpdates`` request per bot waits for new
+    updates and the polling pool has one thread per bot. Updates arrive right away and idle bots
+    cause one request per ``timeout`` seconds. The price is a thread and a connection per bot. The
+    threads are blocked on their sockets most of the time, but each one reserves a stack.
+
+    Passing ``poll_workers`` caps the number of threads and connections. Long polling would keep
+    the bots without a thread waiting, though. So if there are more bots than ``poll_workers``,
+    the bots are polled in turn with a ``getUpdates`` timeout of ``0`` instead. As such requests
+    return right away, a bot is polled again at the earliest after ``short_poll_interval``
+    seconds, unless more updates are pending. E.g. 50 bots with the default
+    ``short_poll_interval`` of one second cause about 50 requests per second, and updates take
+    up to a second to arrive. Only cap ``poll_workers``, if there are too many bots for a thread
+    each.
+
+    .. versionadded:: 13.11
+
+    Args:
+        poll_workers (:obj:`int`, optional): The maximum number of ``getUpdates`` requests running
+            at the same time. Defaults to one per bot.
+        workers (:obj:`int`, optional): The number of threads processing updates. Defaults to
+            ``4``.
+        request_kwargs (:obj:`dict`, optional): Keyword args to control the creation of the shared
+            `TeleGenic.utils.request.Request` object.
+        base_url (:obj:`str`, optional): Base_url for the bots.
+        base_file_url (:obj:`str`, optional): Base_file_url for the bots.
+        defaults (:class:`TeleGenic.ext.Defaults`, optional): An object containing default values
+            to be used if not set explicitly in the bot methods.
+        arbitrary_callback_data (:obj:`bool` | :obj:`int` | :obj:`None`, optional): Whether to
+            allow arbitrary objects as callback data for :class:`TeleGenic.InlineKeyboardButton`.
+
+    Attributes:
+        dispatchers (Dict[:obj:`str`, :class:`TeleGenic.ext.Dispatcher`]): The dispatchers of the
+            bots by the tokens of the bots.
+        poll_workers (:obj:`int`): Optional. The maximum number of ``getUpdates`` requests
+            running at the same time.
+        workers (:obj:`int`): The number of threads processing updates.
+        running (:obj:`bool`): Indicates if the updater is running.
+    """
+
+    __slots__ = (
+        'dispatchers',
+        'poll_workers',
+        'workers',
+        'running',
+        'is_idle',
+        'logger',
+        '_base_url',
+        '_base_file_url',
+        '_defaults',
+        '_arbitrary_callback_data',
+        '_request',
+        '_entries',
+        '_lanes',
+        '_threads',
+        '_lock',
+        '_stop_event',
+        '__dict__',
+    )
+
+    def __init__(
+        self,
+        poll_workers: int = None,
+        workers: int = 4,
+        request_kwargs: Dict[str, Any] = None,
+        base_url: str = None,
+        base_file_url: str = None,
+        defaults: 'Defaults' = None,
+        arbitrary_callback_data: Union[DefaultValue, bool, int, None] = DEFAULT_FALSE,
+    ):
+        if (poll_workers is not None and poll_workers < 1) or workers < 1:
+            raise ValueError('`poll_workers` and `workers` must be positive')
+        self.dispatchers: Dict[str, Dispatcher] = {}
+        self.poll_workers = poll_workers
+        self.workers = workers
+        self.running = False
+        self.is_idle = False
+        self.logger = logging.getLogger(__name__)
+        self._base_url = base_url
+        self._base_file_url = base_file_url
+        self._defaults = defaults
+        self._arbitrary_callback_data = (
+            False if arbitrary_callback_data is DEFAULT_FALSE else arbitrary_callback_data
+        )
+
+        # we need a connection pool the size of:
+        # * 1 for each of the polling requests
+        # * 1 for each of the threads processing updates
+        # * a few for the threads of asynchronous handlers and the main thread
+        # Connections of further polling requests are closed after each request
+        request_kwargs = dict(request_kwargs or {})
+        request_kwargs.setdefault(
+            'con_pool_size', (poll_workers or _LONG_POLL_CONNECTIONS) + workers + 4
+        )
+        self._request = Request(**request_kwargs)
+
+        self._entries: Dict[str, _BotEntry] = {}
+        self._lanes: List[Queue] = []
+        self._threads: List[Thread] = []
+        self._lock = Lock()
+        self._stop_event = Event()
+
+    def __setattr__(self, key: str, value: object) -> None:
+        set_new_attribute_deprecated(self, key, value)
+
+    def add_bot(
+        self,
+        token: str,
+        persistence: 'BasePersistence' = None,
+        context_types: 'ContextTypes' = None,
+        max_workers: int = 4,
+    ) -> Dispatcher:
+        """Adds a bot. Bots can be added while the updater is running.
+
+        Args:
+            token (:obj:`str`): The bot's token given by the @BotFather.
+            persistence (:class:`TeleGenic.ext.BasePersistence`, optional): The persistence class
+                to store data of this bot that should be persistent over restarts.
+            context_types (:class:`TeleGenic.ext.ContextTypes`, optional): Pass an instance
+                of :class:`TeleGenic.ext.ContextTypes` to customize the types used in the
+                ``context`` interface.
+            max_workers (:obj:`int`, optional): Maximum number of threads running asynchronous
+                handlers of this bot. Defaults to ``4``.
+
+        Returns:
+            :class:`TeleGenic.ext.Dispatcher`: The dispatcher of the bot. Add the handlers of the
+            bot to it.
+
+        Raises:
+            ValueError: If a bot with the same token was already added.
+        """
+        with self._lock:
+            if token in self.dispatchers:
+                raise ValueError(f'A bot with the token {token} was already added')
+            bot = ExtBot(
+                token,
+                self._base_url,
+                base_file_url=self._base_file_url,
+                request=self._request,
+                defaults=self._defaults,
+                arbitrary_callback_data=self._arbitrary_callback_data,  # type: ignore[arg-type]
+            )
+            dispatcher: Dispatcher = Dispatcher(
+                bot,
+                Queue(),
+                workers=0,
+                persistence=persistence,
+                context_types=context_types,
+                max_workers=max_workers,
+            )
+            self.dispatchers[token] = dispatcher
+            self._entries[token] = _BotEntry(dispatcher, len(self._entries) % self.workers)
+            if self.running:
+                self._start_dispatcher(dispatcher)
+            return dispatcher
+
+    @staticmethod
+    def _start_dispatcher(dispatcher: Dispatcher) -> None:
+        # The worker pool starts empty and grows while asynchronous handlers are waiting
+        dispatcher._init_async_threads(str(uuid4()), 0)  # pylint: disable=W0212
+
+    def start_polling(
+        self,
+        poll_interval: float = 0.0,
+        timeout: float = 10,
+        read_latency: float = 2.0,
+        allowed_updates: List[str] = None,
+        drop_pending_updates: bool = None,
+        short_poll_interval: float = 1.0,
+    ) -> None:
+        """Starts polling updates from TeleGenic for all bots.
+
+        Args:
+            poll_interval (:obj:`float`, optional): Time to wait between polling updates of a bot
+                from TeleGenic in seconds. Default is ``0.0``.
+            timeout (:obj:`float`, optional): Passed to :meth:`TeleGenic.Bot.get_updates`, unless
+                there are more bots than :attr:`poll_workers`. Defaults to ``10``.
+            read_latency (:obj:`float` | :obj:`int`, optional): Grace time in seconds for
+                receiving the reply from server. Will be added to the ``timeout`` value and used
+                as the read timeout from server. Defaults to ``2``.
+            allowed_updates (List[:obj:`str`], optional): Passed to
+                :meth:`TeleGenic.Bot.get_updates`.
+            drop_pending_updates (:obj:`bool`, optional): Whether to clean any pending updates on
+                TeleGenic servers before actually starting to poll. Default is :obj:`False`.
+            short_poll_interval (:obj:`float`, optional): The minimum time to wait between polling
+                updates of a bot in seconds, while there are more bots than :attr:`poll_workers`
+                and the bots are polled with a ``getUpdates`` timeout of ``0``. Must be positive.
+                Defaults to ``1.0``.
+
+        Raises:
+            ValueError: If ``short_poll_interval`` is not positive.
+
+        Note:
+            Failures while removing the webhook of a bot before polling are retried like failures
+            of :meth:`TeleGenic.Bot.get_updates`.
+        """
+        if short_poll_interval <= 0:
+            raise ValueError('short_poll_interval must be positive')
+        with self._lock:
+            if self.running:
+                return
+            self.running = True
+            self._stop_event.clear()
+            for dispatcher in self.dispatchers.values():
+                self._start_dispatcher(dispatcher)
+            self._lanes = [Queue() for _ in range(self.workers)]
+            self._threads = [
+                Thread(target=self._dispatch_updates, args=(lane,), name=f'dispatcher_{i}')
+                for i, lane in enumerate(self._lanes)
+            ]
+            self._threads.append(
+                Thread(
+                    target=self._poll_updates,
+                    args=(
+                        poll_interval,
+                        timeout,
+                        read_latency,
+                        allowed_updates,
+                        bool(drop_pending_updates),
+                        short_poll_interval,
+                    ),
+                    name='updater',
+                )
+            )
+            for thread in self._threads:
+                thread.start()
+
+    def _dispatch_updates(self, lane: Queue) -> None:
+        # Thread target of the threads 'dispatcher_*'
+        while True:
+            item = lane.get()
+            if item is None:
+                return
+            dispatcher, update = item
+            self.logger.debug('Processing Update: %s', update)
+            dispatcher.process_update(update)
+
+    def _poll(
+        self,
+        entry: _BotEntry,
+        timeout: float,
+        read_latency: float,
+        allowed_updates: Optional[List[str]],
+        drop_pending_updates: bool,
+    ) -> List[Update]:
+        # Runs on the polling pool
+        bot = entry.dispatcher.bot
+        if not entry.bootstrapped:
+            # Errors are handled like errors of getUpdates, i.e. bootstrapping is retried
+            bot.delete_webhook(drop_pending_updates=drop_pending_updates)
+            entry.bootstrapped = True
+        updates = bot.get_updates(
+            entry.offset,
+            timeout=entry.scheduler.poll_timeout(timeout),
+            read_latency=read_latency,
+            allowed_updates=allowed_updates,
+        )
+        entry.scheduler.record_batch(len(updates))
+        return updates
+
+    def _poll_updates(
+        self,
+        poll_interval: float,
+        timeout: float,
+        read_latency: float,
+        allowed_updates: Optional[List[str]],
+        drop_pending_updates: bool,
+        short_poll_interval: float,
+    ) -> None:
+        # Thread target of thread 'updater'. Keeps at most one getUpdates request per bot running
+        # and waits for the first one to complete.
+        self.logger.debug('Updater thread started (polling)')
+        pending: Dict[Future, Tuple[str, _BotEntry, float]] = {}
+        # Without a limit, the pool still has at most one thread per bot, as there is at most one
+        # request per bot running and idle threads are reused
+        max_workers = self.poll_workers or sys.maxsize
+        with ThreadPoolExecutor(max_workers, thread_name_prefix='poller') as executor:
+            while not self._stop_event.is_set():
+                now = monotonic()
+                with self._lock:
+                    entries = list(self._entries.items())
+                polling = {token for token, _, _ in pending.values()}
+                if self.poll_workers is None or len(entries) <= self.poll_workers:
+                    cur_timeout, cur_interval = timeout, poll_interval
+                else:
+                    # Short polls return right away, don't repeat them in a tight loop
+                    cur_timeout, cur_interval = 0, max(poll_interval, short_poll_interval)
+                for token, entry in entries:
+                    if token not in polling and entry.due <= now:
+                        entry.scheduler.before_request()
+                        future = executor.submit(
+                            self._poll,
+                            entry,
+                            cur_timeout,
+                            read_latency,
+                            allowed_updates,
+                            drop_pending_updates,
+                        )
+                        pending[future] = (token, entry, cur_interval)
+
+                # Wake up when the next bot is due again, but check the stop event regularly
+                waiting = [entry.due for token, entry in entries if entry.due > now]
+                wait_timeout = min([1.0] + [due - now for due in waiting])
+                if not pending:
+                    self._stop_event.wait(wait_timeout)
+                    continue
+                done, _ = wait(pending, timeout=wait_timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    token, entry, interval = pending.pop(future)
+                    self._handle_poll(future, token, entry, interval)
+
+            # Requests that are still running are waited for by the executor. Their updates are
+            # dropped and pulled again on restart, as the offset was not confirmed.
+        self.logger.debug('Updater thread stopped (polling)')
+
+    def _handle_poll(
+        self, future: Future, token: str, entry: _BotEntry, poll_interval: float
+    ) -> None:
+        # Same handling of errors as in Updater._network_loop_retry, but per bot
+        lane = self._lanes[entry.lane]
+        scheduler = entry.scheduler
+        scheduler.interval = poll_interval
+        try:
+            updates = future.result()
+        except RetryAfter as exc:
+            self.logger.info('%s', exc)
+            delay = scheduler.record_failure(exc)
+        except TimedOut as toe:
+            self.logger.debug('Timed out getting Updates of bot %s: %s', token, toe)
+            delay = scheduler.record_failure(toe)
+        except InvalidToken:
+            self.logger.error('Invalid token %s; no longer polling this bot', token)
+            with self._lock:
+                del self._entries[token]
+            return
+        except TeleGenicError as exc:
+            self.logger.error('Error while getting Updates of bot %s: %s', token, exc)
+            # Let the dispatcher of the bot broadcast the error
+            lane.put((entry.dispatcher, exc))
+            delay = scheduler.record_failure(exc)
+        except Exception as exc:  # pylint: disable=W0703
+            # Other bots must still be polled
+            self.logger.exception('Unhandled exception while getting Updates of bot %s', token)
+            delay = scheduler.record_failure(exc)
+        else:
+            delay = scheduler.record_success()
+            if updates:
+                if self._stop_event.is_set():
+                    self.logger.debug('Updates ignored and will be pulled again on restart')
+                    return
+                for update in updates:
+                    lane.put((entry.dispatcher, update))
+                entry.offset = updates[-1].update_id + 1
+        entry.due = monotonic() + delay
+
+    def stop(self) -> None:
+        """Stops polling and the threads processing the updates. Updates that were already
+        received are processed before the threads end.
+        """
+        with self._lock:
+            if not self.running:
+                return
+            self.logger.debug('Stopping MultiBotUpdater...')
+            self._stop_event.set()
+            *lane_threads, poll_thread = self._threads
+        poll_thread.join()
+        for lane in self._lanes:
+            lane.put(None)
+        for thread in lane_threads:
+            thread.join()
+        with self._lock:
+            for dispatcher in self.dispatchers.values():
+                dispatcher.stop()
+                if dispatcher.persistence:
+                    dispatcher.update_persistence()
+                    dispatcher.persistence.flush()
+            self._threads = []
+            self._lanes = []
+            self.running = False
+        self._request.stop()
+
+    def _signal_handler(self, signum: int, frame: object) -> None:  # pylint: disable=W0613
+        self.is_idle = False
+        self.logger.info('Received signal %s, stopping...', signum)
+        self.stop()
+
+    def idle(self, stop_signals: Union[List, Tuple] = (SIGINT, SIGTERM, SIGABRT)) -> None:
+        """Blocks until one of the signals are received and stops the updater.
+
+        Args:
+            stop_signals (:obj:`list` | :obj:`tuple`): List containing signals from the signal
+                module that should be subscribed to. :meth:`stop` will be called on receiving one
+                of those signals. Defaults to (``SIGINT``, ``SIGTERM``, ``SIGABRT``).
+        """
+        for sig in stop_signals:
+            signal(sig, self._signal_handler)
+
+        self.is_idle = True
+
+        while self.is_idle:
+            sleep(1)
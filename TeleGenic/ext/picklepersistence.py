@@ -17,10 +17,16 @@
 # You should have received a copy of the GNU Lesser Public License
 # along with this program.  If not, see [http://www.gnu.org/licenses/].
 """This module contains the PicklePersistence class."""
+import logging
+import os
 import pickle
+import shutil
 from collections import defaultdict
+from contextlib import suppress
+from threading import Lock, Thread
 from typing import (
     Any,
+    BinaryIO,
     Dict,
     Optional,
     Tuple,
@@ -32,6 +38,7 @@ from typing import (
 from TeleGenic.ext import BasePersistence
 from .utils.types import UD, CD, BD, ConversationDict, CDCData
 from .contexttypes import ContextTypes
+from .serializer import PickleSerializer, Serializer
 
 
 class PicklePersistence(BasePersistence[UD, CD, BD]):
@@ -46,6 +53,14 @@ class PicklePersistence(BasePersistence[UD, CD, BD]):
         :meth:`TeleGenic.ext.BasePersistence.replace_bot` and
         :meth:`TeleGenic.ext.BasePersistence.insert_bot`.
 
+    Note:
+        Saving the data on every transaction rewrites the complete file. With :attr:`journal`,
+        only the changed entry is appended to the journal file ``filename.journal`` instead. After
+        :attr:`journal_size` entries, a background thread rewrites the pickle file and
+        starts a new journal. When the data is loaded, the journal is replayed on top of the
+        pickle file. The pickle file is replaced atomically in journal mode, so a crash while
+        writing can't corrupt it. An incompletely written last journal entry is discarded.
+
     Args:
         filename (:obj:`str`): The filename for storing the pickle files. When :attr:`single_file`
             is :obj:`False` this will be used as a prefix.
@@ -72,6 +87,20 @@ class PicklePersistence(BasePersistence[UD, CD, BD]):
             :class:`TeleGenic.ext.ContextTypes` will be used.
 
             .. versionadded:: 13.6
+        journal (:obj:`bool`, optional): Whether changes should be appended to a journal instead
+            of rewriting the pickle file. Requires :attr:`single_file`. Has no effect, if
+            :attr:`on_flush` is :obj:`True`. Default is :obj:`False`.
+
+            .. versionadded:: 13.11
+        journal_size (:obj:`int`, optional): The number of journal entries after which the pickle
+            file is rewritten in the background. Default is ``1000``.
+
+            .. versionadded:: 13.11
+        serializer (:class:`TeleGenic.ext.Serializer`, optional): Converts the data to bytes and
+            back. Pass e.g. :class:`TeleGenic.ext.BinarySerializer` for smaller files. Defaults
+            to :class:`TeleGenic.ext.PickleSerializer`.
+
+            .. versionadded:: 13.11
 
     Attributes:
         filename (:obj:`str`): The filename for storing the pickle files. When :attr:`single_file`
@@ -97,6 +126,17 @@ class PicklePersistence(BasePersistence[UD, CD, BD]):
             in the ``context`` interface.
 
             .. versionadded:: 13.6
+        journal (:obj:`bool`): Whether changes are appended to a journal instead of rewriting the
+            pickle file.
+
+            .. versionadded:: 13.11
+        journal_size (:obj:`int`): The number of journal entries after which the pickle file is
+            rewritten in the background.
+
+            .. versionadded:: 13.11
+        serializer (:class:`TeleGenic.ext.Serializer`): Converts the data to bytes and back.
+
+            .. versionadded:: 13.11
     """
 
     __slots__ = (
@@ -109,6 +149,13 @@ class PicklePersistence(BasePersistence[UD, CD, BD]):
         'callback_data',
         'conversations',
         'context_types',
+        'journal',
+        'journal_size',
+        'serializer',
+        '_journal_file',
+        '_journal_entries',
+        '_journal_lock',
+        '_compaction',
     )
 
     @overload
@@ -121,6 +168,9 @@ class PicklePersistence(BasePersistence[UD, CD, BD]):
         single_file: bool = True,
         on_flush: bool = False,
         store_callback_data: bool = False,
+        journal: bool = False,
+        journal_size: int = 1000,
+        serializer: Serializer = None,
     ):
         ...
 
@@ -135,6 +185,9 @@ class PicklePersistence(BasePersistence[UD, CD, BD]):
         on_flush: bool = False,
         store_callback_data: bool = False,
         context_types: ContextTypes[Any, UD, CD, BD] = None,
+        journal: bool = False,
+        journal_size: int = 1000,
+        serializer: Serializer = None,
     ):
         ...
 
@@ -148,7 +201,12 @@ class PicklePersistence(BasePersistence[UD, CD, BD]):
         on_flush: bool = False,
         store_callback_data: bool = False,
         context_types: ContextTypes[Any, UD, CD, BD] = None,
+        journal: bool = False,
+        journal_size: int = 1000,
+        serializer: Serializer = None,
     ):
+        if journal and not single_file:
+            raise ValueError('`journal` requires `single_file`')
         super().__init__(
             store_user_data=store_user_data,
             store_chat_data=store_chat_data,
@@ -164,12 +222,19 @@ class PicklePersistence(BasePersistence[UD, CD, BD]):
         self.callback_data: Optional[CDCData] = None
         self.conversations: Optional[Dict[str, Dict[Tuple, object]]] = None
         self.context_types = cast(ContextTypes[Any, UD, CD, BD], context_types or ContextTypes())
+        self.journal = journal
+        self.journal_size = journal_size
+        self.serializer = serializer or PickleSerializer()
+        self._journal_file: Optional[BinaryIO] = None
+        self._journal_entries = 0
+        self._journal_lock = Lock()
+        self._compaction: Optional[Thread] = None
 
     def _load_singlefile(self) -> None:
         try:
             filename = self.filename
             with open(self.filename, "rb") as file:
-                data = pickle.load(file)
+                data = self.serializer.load(file)
                 self.user_data = defaultdict(self.context_types.user_data, data['user_data'])
                 self.chat_data = defaultdict(self.context_types.chat_data, data['chat_data'])
                 # For backwards compatibility with files not containing bot data
@@ -186,12 +251,124 @@ class PicklePersistence(BasePersistence[UD, CD, BD]):
             raise TypeError(f"File {filename} does not contain valid pickle data") from exc
         except Exception as exc:
             raise TypeError(f"Something went wrong unpickling {filename}") from exc
+        if self.journal:
+            self._replay_journal()
+
+    def _replay_journal(self) -> None:
+        # The old journal exists, if the last compaction did not finish. As the entries contain
+        # the complete new values, replaying it again after a finished compaction does no harm
+        self._journal_entries = 0
+        for filename in (f"{self.filename}.journal.old", f"{self.filename}.journal"):
+            try:
+                file = open(filename, "r+b")  # pylint: disable=R1732
+            except OSError:
+                continue
+            with file:
+                valid_size = 0
+                while True:
+                    try:
+                        kind, key, data = self.serializer.load(file)
+                    except Exception:
+                        break
+                    valid_size = file.tell()
+                    self._apply_journal_entry(kind, key, data)
+                    self._journal_entries += 1
+                if valid_size != file.seek(0, os.SEEK_END):
+                    # The last entry was not written completely, e.g. because of a crash. New
+                    # entries would not be read after it, so it is removed
+                    logging.getLogger(__name__).warning(
+                        'Discarding incomplete entries at the end of %s', filename
+                    )
+                    file.truncate(valid_size)
+
+    def _apply_journal_entry(self, kind: str, key: Any, data: Any) -> None:
+        if kind == 'user_data':
+            self.user_data[key] = data  # type: ignore[index]
+        elif kind == 'chat_data':
+            self.chat_data[key] = data  # type: ignore[index]
+        elif kind == 'bot_data':
+            self.bot_data = data
+        elif kind == 'callback_data':
+            self.callback_data = data
+        else:
+            name, conversation_key = key
+            self.conversations.setdefault(name, {})[conversation_key] = data  # type: ignore
+
+    def _append_journal(self, kind: str, key: Any, data: object) -> None:
+        with self._journal_lock:
+            if self._journal_file is None:
+                # pylint: disable=R1732
+                self._journal_file = open(f"{self.filename}.journal", "ab")
+            self.serializer.dump((kind, key, data), self._journal_file)
+            self._journal_file.flush()
+            self._journal_entries += 1
+            if self._journal_entries >= self.journal_size and self._compaction is None:
+                self._start_compaction()
+
+    def _start_compaction(self) -> None:
+        # Must be called while holding the journal lock. New entries go to a new journal, while
+        # the old one is kept until the pickle file containing its entries is written
+        self._close_journal()
+        journal, old_journal = f"{self.filename}.journal", f"{self.filename}.journal.old"
+        if os.path.exists(old_journal):
+            # The last compaction failed. Its entries are not contained in the pickle file yet,
+            # so the new entries are appended to them, in the order in which they are replayed
+            with open(journal, "rb") as source, open(old_journal, "ab") as target:
+                shutil.copyfileobj(source, target)
+                target.flush()
+            os.remove(journal)
+        else:
+            os.replace(journal, old_journal)
+        self._journal_entries = 0
+        self._compaction = Thread(
+            target=self._compact,
+            args=(self._snapshot(),),
+            name=f"PicklePersistence:{self.filename}:compaction",
+            daemon=True,
+        )
+        self._compaction.start()
 
-    @staticmethod
-    def _load_file(filename: str) -> Any:
+    def _compact(self, snapshot: Dict[str, object]) -> None:
+        try:
+            self._write_snapshot(snapshot)
+            os.remove(f"{self.filename}.journal.old")
+        except Exception:
+            # The old journal is kept, so the data is complete on disk. The next compaction
+            # merges it with the new journal and tries again
+            logging.getLogger(__name__).exception('Compacting the journal failed')
+        self._compaction = None
+
+    def _snapshot(self) -> Dict[str, object]:
+        # The values are replaced on update, never changed, so copying the containers suffices.
+        # Copying a dict doesn't release the GIL, so concurrent updates can't interfere
+        return {
+            'conversations': {
+                name: conversations.copy()
+                for name, conversations in dict(self.conversations or {}).items()
+            },
+            'user_data': dict(self.user_data or {}),
+            'chat_data': dict(self.chat_data or {}),
+            'bot_data': self.context_types.bot_data() if self.bot_data is None else self.bot_data,
+            'callback_data': self.callback_data,
+        }
+
+    def _write_snapshot(self, snapshot: Dict[str, object]) -> None:
+        temporary = f"{self.filename}.tmp"
+        with open(temporary, "wb") as file:
+            self.serializer.dump(snapshot, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.filename)
+
+    def _close_journal(self) -> None:
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
+
+    def _load_file(self, filename: str) -> Any:
         try:
             with open(filename, "rb") as file:
-                return pickle.load(file)
+                return self.serializer.load(file)
         except OSError:
             return None
         except pickle.UnpicklingError as exc:
@@ -208,12 +385,11 @@ class PicklePersistence(BasePersistence[UD, CD, BD]):
                 'bot_data': self.bot_data,
                 'callback_data': self.callback_data,
             }
-            pickle.dump(data, file)
+            self.serializer.dump(data, file)
 
-    @staticmethod
-    def _dump_file(filename: str, data: object) -> None:
+    def _dump_file(self, filename: str, data: object) -> None:
         with open(filename, "wb") as file:
-            pickle.dump(data, file)
+            self.serializer.dump(data, file)
 
     def get_user_data(self) -> DefaultDict[int, UD]:
         """Returns the user_data from the pickle file if it exists or an empty :obj:`defaultdict`.
@@ -338,6 +514,8 @@ class PicklePersistence(BasePersistence[UD, CD, BD]):
             if not self.single_file:
                 filename = f"{self.filename}_conversations"
                 self._dump_file(filename, self.conversations)
+            elif self.journal:
+                self._append_journal('conversations', (name, key), new_state)
             else:
                 self._dump_singlefile()
 
@@ -358,6 +536,8 @@ class PicklePersistence(BasePersistence[UD, CD, BD]):
             if not self.single_file:
                 filename = f"{self.filename}_user_data"
                 self._dump_file(filename, self.user_data)
+            elif self.journal:
+                self._append_journal('user_data', user_id, data)
             else:
                 self._dump_singlefile()
 
@@ -378,6 +558,8 @@ class PicklePersistence(BasePersistence[UD, CD, BD]):
             if not self.single_file:
                 filename = f"{self.filename}_chat_data"
                 self._dump_file(filename, self.chat_data)
+            elif self.journal:
+                self._append_journal('chat_data', chat_id, data)
             else:
                 self._dump_singlefile()
 
@@ -395,6 +577,8 @@ class PicklePersistence(BasePersistence[UD, CD, BD]):
             if not self.single_file:
                 filename = f"{self.filename}_bot_data"
                 self._dump_file(filename, self.bot_data)
+            elif self.journal:
+                self._append_journal('bot_data', None, self.bot_data)
             else:
                 self._dump_singlefile()
 
@@ -415,6 +599,8 @@ class PicklePersistence(BasePersistence[UD, CD, BD]):
             if not self.single_file:
                 filename = f"{self.filename}_callback_data"
                 self._dump_file(filename, self.callback_data)
+            elif self.journal:
+                self._append_journal('callback_data', None, self.callback_data)
             else:
                 self._dump_singlefile()
 
@@ -440,8 +626,29 @@ class PicklePersistence(BasePersistence[UD, CD, BD]):
         """
 
     def flush(self) -> None:
-        """Will save all data in memory to pickle file(s)."""
-        if self.single_file:
+        """Will save all data in memory to pickle file(s). In journal mode, the pickle file is
+        rewritten and the journal is removed.
+        """
+        if self.journal:
+            if not (
+                self.user_data
+                or self.chat_data
+                or self.bot_data
+                or self.callback_data
+                or self.conversations
+            ):
+                return
+            with self._journal_lock:
+                if self._compaction is not None:
+                    self._compaction.join()
+                self._write_snapshot(self._snapshot())
+                self._close_journal()
+                for filename in (f"{self.filename}.journal", f"{self.filename}.journal.old"):
+                    with suppress(FileNotFoundError):
+                        os.remove(filename)
+                self._journal_entries = 0
+                self._compaction = None
+        elif self.single_file:
             if (
                 self.user_data
                 or self.chat_data
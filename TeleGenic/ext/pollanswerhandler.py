@@ -18,10 +18,13 @@
 #  along with this program.  If not, see [http://www.gnu.org/licenses/].
 """This module contains the PollAnswerHandler class."""
 
+from typing import List
 
 from TeleGenic import Update
+from TeleGenic.constants import UPDATE_POLL_ANSWER
 
 from .handler import Handler
+from .utils.handlerindex import UPDATE_TYPE, RoutingKey
 from .utils.types import CCT
 
 
@@ -85,6 +88,9 @@ class PollAnswerHandler(Handler[Update, CCT]):
 
     __slots__ = ()
 
+    def _routing_keys(self) -> List[RoutingKey]:
+        return [(UPDATE_TYPE, UPDATE_POLL_ANSWER)]
+
     def check_update(self, update: object) -> bool:
         """Determines whether an update should be passed to this handlers :attr:`callback`.
 
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the ProcessCallback class."""
+import atexit
+import multiprocessing
+import os
+import pickle
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from threading import Lock
+from typing import TYPE_CHECKING, Callable, List, Mapping, MutableMapping, Optional
+
+from TeleGenic import Update
+from TeleGenic.utils.deprecate import set_new_attribute_deprecated
+
+if TYPE_CHECKING:
+    from TeleGenic.ext import CallbackContext
+
+_DEFAULT_EXECUTOR: Optional[ProcessPoolExecutor] = None
+_DEFAULT_EXECUTOR_LOCK = Lock()
+
+
+def _submit_to_default_executor(fn: Callable, *args: object) -> Future:
+    # Submits under the lock, so that _shutdown_default_executor can't shut the executor down
+    # between getting and using it
+    global _DEFAULT_EXECUTOR  # pylint: disable=W0603
+    with _DEFAULT_EXECUTOR_LOCK:
+        if _DEFAULT_EXECUTOR is None:
+            # Forking a process with running threads, like the ones of the dispatcher, may copy
+            # locks in a locked state. Spawned processes start from a fresh interpreter instead
+            _DEFAULT_EXECUTOR = ProcessPoolExecutor(
+                max_workers=os.cpu_count(), mp_context=multiprocessing.get_context('spawn')
+            )
+        return _DEFAULT_EXECUTOR.submit(fn, *args)
+
+
+def _shutdown_default_executor() -> None:
+    # Called by Dispatcher.stop and at exit. A later call of a ProcessCallback starts a new executor
+    global _DEFAULT_EXECUTOR  # pylint: disable=W0603
+    with _DEFAULT_EXECUTOR_LOCK:
+        executor, _DEFAULT_EXECUTOR = _DEFAULT_EXECUTOR, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+atexit.register(_shutdown_default_executor)
+
+
+class ProcessContext:
+    """The context that is passed to a callback wrapped in :class:`TeleGenic.ext.ProcessCallback`.
+    It contains copies of the data that the :class:`TeleGenic.ext.CallbackContext` of the update
+    holds in the main process. Changes to :attr:`chat_data`, :attr:`user_data` and
+    :attr:`bot_data` are merged back into the data of the dispatcher, once the callback returns.
+
+    .. versionadded:: 13.11
+
+    Attributes:
+        args (List[:obj:`str`]): Optional. The arguments passed to a command.
+        chat_data (:obj:`dict`): Optional. A copy of the ``chat_data`` of the chat.
+        user_data (:obj:`dict`): Optional. A copy of the ``user_data`` of the user.
+        bot_data (:obj:`dict`): A copy of the ``bot_data``.
+
+    """
+
+    __slots__ = ('args', 'chat_data', 'user_data', 'bot_data', '__dict__')
+
+    def __init__(
+        self,
+        args: Optional[List[str]],
+        chat_data: object,
+        user_data: object,
+        bot_data: object,
+    ):
+        self.args = args
+        self.chat_data = chat_data
+        self.user_data = user_data
+        self.bot_data = bot_data
+
+
+def _run_in_process(callback: Callable[[Update, ProcessContext], object], payload: bytes) -> tuple:
+    # Entry point in the child process
+    update_data, args, chat_data, user_data, bot_data = pickle.loads(payload)
+    update = Update.de_json(update_data, None)
+    context = ProcessContext(args, chat_data, user_data, bot_data)
+    result = callback(update, context)  # type: ignore[arg-type]
+    return result, context.chat_data, context.user_data, context.bot_data
+
+
+def _merge_data(current: object, base: object, changed: object) -> object:
+    # Three way merge of the data: Only the changes made by the callback in the child process, i.e.
+    # the differences between `base` and `changed`, are applied to `current`, so that concurrent
+    # changes to other keys in the main process are preserved. Returns the merged data.
+    if (
+        isinstance(current, MutableMapping)
+        and isinstance(base, Mapping)
+        and isinstance(changed, Mapping)
+    ):
+        for key in base.keys() - changed.keys():
+            current.pop(key, None)
+        for key, value in changed.items():
+            if key not in base or base[key] != value:
+                current[key] = value
+        return current
+    return current if changed == base else changed
+
+
+class ProcessCallback:
+    """Wraps a handler callback, such that it is run in a separate process. Use this for CPU
+    bound callbacks, e.g. for image processing, which would otherwise compete for the GIL with the
+    rest of the bot.
+
+    The update is shipped to the process as dictionary and rebuilt there, along with copies of
+    the ``chat_data``, ``user_data`` and ``bot_data`` of the update. Changes that the callback
+    makes to these are merged back key by key, once it returns. The return value of the callback
+    is returned to the handler, so e.g. the next state of a
+    :class:`TeleGenic.ext.ConversationHandler` can be computed in the process.
+
+    Example:
+        .. code:: python
+
+            def resize(update, context):
+                # runs in a separate process
+                ...
+                return thumbnail_bytes
+
+            def upload(update, context):
+                update.effective_message.reply_photo(context.result)
+
+            # block=True hands the callback to the worker pool of the dispatcher, so waiting for
+            # the process doesn't hold up other updates
+            dispatcher.add_handler(
+                MessageHandler(Filters.photo, ProcessCallback(resize, done=upload), block=True)
+            )
+
+    Note:
+        * ``callback`` must be picklable, i.e. be defined on module level. The same holds for its
+          return value, for the data and for the objects stored in it.
+        * The processes of the default executor import the module of ``callback`` anew. If the
+          bot is started from that module, guard the start with
+          ``if __name__ == '__main__':``.
+        * The update is rebuilt without bot, so shortcut methods like
+          :meth:`TeleGenic.Message.reply_text` can't be used within ``callback``. Use ``done``
+          to make API requests in the main process.
+        * The wrapped callback blocks the calling thread until the process finished. Pass
+          ``block=True`` to the handler, so that the callback runs in the worker pool of the
+          dispatcher via :meth:`TeleGenic.ext.Dispatcher.block` and the dispatcher thread is not
+          blocked, as in the example above.
+        * Only the context based API is supported.
+        * Only top level keys of the data are merged. If the data is not a mapping, it is replaced
+          by the copy from the process, if it was changed there.
+
+    .. versionadded:: 13.11
+
+    Args:
+        callback (:obj:`callable`): The callback to run in the process. Callback signature:
+            ``def callback(update: Update, context: ProcessContext)``.
+        executor (:class:`concurrent.futures.Executor`, optional): The executor to submit the
+            callback to. Defaults to a :class:`concurrent.futures.ProcessPoolExecutor` with one
+            process per CPU, which is shared by all instances of this class. Its processes are
+            started with the ``'spawn'`` method and it is shut down by
+            :meth:`TeleGenic.ext.Dispatcher.stop` and at exit.
+        done (:obj:`callable`, optional): A callback that is called in the main process after the
+            data was merged. It is called with the update and the
+            :class:`TeleGenic.ext.CallbackContext`. The return value of ``callback`` is available
+            as ``context.result``. If passed, the return value of ``done`` is returned instead.
+
+    Attributes:
+        callback (:obj:`callable`): The callback to run in the process.
+        executor (:class:`concurrent.futures.Executor`): Optional. The executor to submit the
+            callback to.
+        done (:obj:`callable`): Optional. A callback to call in the main process.
+
+    """
+
+    __slots__ = ('callback', 'executor', 'done', '__dict__')
+
+    def __init__(
+        self,
+        callback: Callable[[Update, ProcessContext], object],
+        executor: Executor = None,
+        done: Callable[[Update, 'CallbackContext'], object] = None,
+    ):
+        self.callback = callback
+        self.executor = executor
+        self.done = done
+
+    def __setattr__(self, key: str, value: object) -> None:
+        set_new_attribute_deprecated(self, key, value)
+
+    def __call__(self, update: Update, context: 'CallbackContext') -> object:
+        from TeleGenic.ext import CallbackContext  # pylint: disable=C0415
+
+        if not isinstance(context, CallbackContext):
+            raise TypeError('ProcessCallback only supports the context based callback API')
+
+        chat_data = context.chat_data
+        user_data = context.user_data
+        bot_data = context.bot_data
+        payload = pickle.dumps(
+            (update.to_dict(), context.args, chat_data, user_data, bot_data),
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+
+        if self.executor is None:
+            future = _submit_to_default_executor(_run_in_process, self.callback, payload)
+        else:
+            future = self.executor.submit(_run_in_process, self.callback, payload)
+        result, new_chat_data, new_user_data, new_bot_data = future.result()
+
+        # The payload holds the data as it was when the callback was submitted
+        _, _, base_chat_data, base_user_data, base_bot_data = pickle.loads(payload)
+        dispatcher = context.dispatcher
+        if chat_data is not None and update.effective_chat:
+            merged = _merge_data(chat_data, base_chat_data, new_chat_data)
+            if merged is not chat_data:
+                dispatcher.chat_data[update.effective_chat.id] = merged  # type: ignore[assignment]
+        if user_data is not None and update.effective_user:
+            merged = _merge_data(user_data, base_user_data, new_user_data)
+            if merged is not user_data:
+                dispatcher.user_data[update.effective_user.id] = merged  # type: ignore[assignment]
+        merged = _merge_data(bot_data, base_bot_data, new_bot_data)
+        if merged is not bot_data:
+            dispatcher.bot_data = merged
+
+        if self.done is None:
+            return result
+        context.result = result  # type: ignore[attr-defined]
+        return self.done(update, context)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the RetryScheduler class."""
+import logging
+import random
+from typing import ClassVar
+
+from TeleGenic.error import RetryAfter, TimedOut
+
+
+class RetryScheduler:
+    """Decides how long to wait between network requests that are repeated, like the
+    ``getUpdates`` requests of :class:`TeleGenic.ext.Updater`, and keeps track of whether the
+    connection to TeleGenic works.
+
+    After a failed request the waiting time depends on the error:
+
+    * :class:`TeleGenic.error.RetryAfter`: The time requested by TeleGenic.
+    * :class:`TeleGenic.error.TimedOut`: No waiting time for the first time out in a row, as
+      single time outs are common for long polling. Further time outs in a row are followed by an
+      exponential backoff, starting at :attr:`base_delay` and doubling up to :attr:`max_delay`.
+    * Any other :class:`TeleGenic.TeleGenicError`: An exponential backoff, starting at
+      :attr:`base_delay` and doubling up to :attr:`max_delay`.
+
+    All backoff times are randomized between half and the full value, so that many clients don't
+    retry at the same moment.
+
+    The scheduler also acts as a circuit breaker: After :attr:`failure_threshold` failures in a
+    row the state changes from :attr:`CLOSED` to :attr:`OPEN` and the next request is only made
+    after :attr:`reset_timeout` seconds, randomized like the backoff times, i.e. after between
+    half of and the full :attr:`reset_timeout`. That request is a trial in state
+    :attr:`HALF_OPEN`: If it succeeds, the state is :attr:`CLOSED` again. If it fails or times
+    out, the state is :attr:`OPEN` again. Otherwise, time outs are not counted as failures, as a
+    slow connection still works and waiting :attr:`reset_timeout` seconds after each of them
+    would stall the requests for long. While there are failures or
+    time outs, long polling requests use a timeout of at most :attr:`probe_timeout` seconds to
+    notice a recovered connection quickly, see :meth:`poll_timeout`.
+
+    After a successful request, the waiting time is :attr:`interval`, unless the last batch of
+    updates was full, i.e. more updates are already waiting, see :meth:`record_batch`.
+
+    .. versionadded:: 13.11
+
+    Args:
+        interval (:obj:`float`, optional): The waiting time after successful requests. Defaults
+            to ``0``.
+        base_delay (:obj:`float`, optional): The backoff time after the first failure. Defaults to
+            ``0.5``.
+        max_delay (:obj:`float`, optional): The maximum backoff time. Defaults to ``30``.
+        failure_threshold (:obj:`int`, optional): The number of failures in a row, after which the
+            circuit opens. Defaults to ``5``.
+        reset_timeout (:obj:`float`, optional): The maximum waiting time while the circuit is
+            open. Defaults to ``15``.
+        probe_timeout (:obj:`float`, optional): The maximum long polling timeout while there are
+            failures. Defaults to ``1``.
+
+    Attributes:
+        interval (:obj:`float`): The waiting time after successful requests.
+        base_delay (:obj:`float`): The backoff time after the first failure.
+        max_delay (:obj:`float`): The maximum backoff time.
+        failure_threshold (:obj:`int`): The number of failures in a row, after which the circuit
+            opens.
+        reset_timeout (:obj:`float`): The maximum waiting time while the circuit is open.
+        probe_timeout (:obj:`float`): The maximum long polling timeout while there are failures.
+        failures (:obj:`int`): The number of failures in a row, not counting time outs.
+        timeouts (:obj:`int`): The number of time outs in a row.
+        state (:obj:`str`): The state of the circuit, one of :attr:`CLOSED`, :attr:`OPEN` and
+            :attr:`HALF_OPEN`.
+    """
+
+    CLOSED: ClassVar[str] = 'closed'
+    """:obj:`str`: Requests succeed."""
+    OPEN: ClassVar[str] = 'open'
+    """:obj:`str`: Requests failed repeatedly, the next one is delayed by up to
+    :attr:`reset_timeout`."""
+    HALF_OPEN: ClassVar[str] = 'half_open'
+    """:obj:`str`: A trial request is made after the circuit was open."""
+
+    __slots__ = (
+        'interval',
+        'base_delay',
+        'max_delay',
+        'failure_threshold',
+        'reset_timeout',
+        'probe_timeout',
+        'failures',
+        'timeouts',
+        'state',
+        'logger',
+        '_backlog',
+        '__dict__',
+    )
+
+    def __init__(
+        self,
+        interval: float = 0.0,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 15.0,
+        probe_timeout: float = 1.0,
+    ):
+        if failure_threshold < 1:
+            raise ValueError('`failure_threshold` must be positive')
+        self.interval = interval
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout
+        self.failures = 0
+        self.timeouts = 0
+        self.state = self.CLOSED
+        self.logger = logging.getLogger(__name__)
+        self._backlog = False
+
+    @staticmethod
+    def _jitter(delay: float) -> float:
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def poll_timeout(self, timeout: float) -> float:
+        """
+        Args:
+            timeout (:obj:`float`): The configured long polling timeout.
+
+        Returns:
+            :obj:`float`: The timeout to use for the next long polling request.
+        """
+        if self.failures or self.timeouts:
+            return min(timeout, self.probe_timeout)
+        return timeout
+
+    def before_request(self) -> None:
+        """To be called before each request. Turns an open circuit into a half open one, as the
+        request is the trial."""
+        if self.state == self.OPEN:
+            self.state = self.HALF_OPEN
+
+    def record_batch(self, count: int, limit: int = 100) -> None:
+        """Records the number of updates a request returned.
+
+        Args:
+            count (:obj:`int`): The number of updates.
+            limit (:obj:`int`, optional): The maximum number of updates per request. Defaults to
+                ``100``.
+        """
+        self._backlog = count >= limit
+
+    def record_success(self) -> float:
+        """Records a successful request and closes the circuit.
+
+        Returns:
+            :obj:`float`: The number of seconds to wait before the next request.
+        """
+        if self.state != self.CLOSED:
+            self.logger.info('Connection recovered after %d failures', self.failures)
+        self.failures = 0
+        self.timeouts = 0
+        self.state = self.CLOSED
+        if self._backlog:
+            self._backlog = False
+            return 0.0
+        return self.interval
+
+    def record_failure(self, exc: Exception) -> float:
+        """Records a failed request.
+
+        Args:
+            exc (:obj:`Exception`): The exception raised by the request.
+
+        Returns:
+            :obj:`float`: The number of seconds to wait before the next request.
+        """
+        if isinstance(exc, RetryAfter):
+            # TeleGenic answered, so the connection works
+            return 0.5 + exc.retry_after
+
+        if isinstance(exc, TimedOut):
+            self.timeouts += 1
+            if self.state == self.HALF_OPEN:
+                # The trial didn't show that the connection works again
+                return self._open()
+            # Doesn't count towards opening the circuit
+            if self.timeouts == 1:
+                return 0.0
+            return self._backoff(self.timeouts - 1)
+
+        self.timeouts = 0
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            return self._open()
+
+        return self._backoff(self.failures)
+
+    def _open(self) -> float:
+        delay = self._jitter(self.reset_timeout)
+        if self.state == self.CLOSED:
+            self.logger.warning(
+                'Circuit opened after %d failures, retrying in %.1f seconds',
+                self.failures,
+                delay,
+            )
+        self.state = self.OPEN
+        return delay
+
+    def _backoff(self, attempt: int) -> float:
+        return self._jitter(min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the ShardedPersistence class."""
+from collections import defaultdict
+from threading import Lock
+from typing import DefaultDict, Dict, Hashable, Optional, Sequence, Tuple
+
+from TeleGenic import Bot
+from TeleGenic.ext import BasePersistence
+from TeleGenic.ext.utils.types import UD, CD, BD, ConversationDict, CDCData
+
+
+class ShardedPersistence(BasePersistence[UD, CD, BD]):
+    """Distributes the data over multiple persistences, e.g.
+    :class:`TeleGenic.ext.PicklePersistence` instances with different file names. The data of a
+    user or chat and the conversation states are stored in the shard selected by the ID of the user
+    or chat or by the conversation key, respectively. Each shard has its own lock, so that workers
+    persisting the data of different users and chats at the same time only wait for each other, if
+    the data belongs to the same shard. ``bot_data`` and ``callback_data`` are stored in the first
+    shard.
+
+    The ``get_*`` methods merge the data of all shards, :meth:`flush` flushes all shards.
+
+    Example:
+        .. code:: python
+
+            persistence = ShardedPersistence(
+                [PicklePersistence(f'bot_data_{i}') for i in range(8)]
+            )
+
+    Warning:
+        The shard of a user, chat or conversation depends on the number of shards. If you change
+        the number of shards, the stored data has to be redistributed accordingly.
+
+    .. versionadded:: 13.11
+
+    Args:
+        shards (Sequence[:class:`TeleGenic.ext.BasePersistence`]): The persistences to store the
+            data in. They must all have the same ``store_*`` settings, which are used for this
+            persistence, too.
+
+    Attributes:
+        shards (Tuple[:class:`TeleGenic.ext.BasePersistence`]): The persistences to store the
+            data in.
+
+    Raises:
+        ValueError: If no shards are passed or the shards have different ``store_*`` settings.
+    """
+
+    __slots__ = ('shards', '_locks')
+
+    def __init__(self, shards: Sequence[BasePersistence[UD, CD, BD]]):
+        if not shards:
+            raise ValueError('At least one shard is required')
+        first = shards[0]
+        settings = (
+            first.store_user_data,
+            first.store_chat_data,
+            first.store_bot_data,
+            first.store_callback_data,
+        )
+        for shard in shards:
+            if settings != (
+                shard.store_user_data,
+                shard.store_chat_data,
+                shard.store_bot_data,
+                shard.store_callback_data,
+            ):
+                raise ValueError('All shards must have the same store_* settings')
+        super().__init__(
+            store_user_data=first.store_user_data,
+            store_chat_data=first.store_chat_data,
+            store_bot_data=first.store_bot_data,
+            store_callback_data=first.store_callback_data,
+        )
+
+        self.shards = tuple(shards)
+        self._locks = tuple(Lock() for _ in self.shards)
+
+    def _index(self, key: Hashable) -> int:
+        if isinstance(key, int):
+            # The same shard for the same ID across restarts, unlike hash() of strings
+            return key % len(self.shards)
+        if isinstance(key, tuple) and key and isinstance(key[0], int):
+            # Conversations of the same chat end up in the same shard
+            return key[0] % len(self.shards)
+        return hash(key) % len(self.shards)
+
+    def set_bot(self, bot: Bot) -> None:
+        """Sets the bot for this persistence and all shards.
+
+        Args:
+            bot (:class:`TeleGenic.Bot`): The bot.
+        """
+        super().set_bot(bot)
+        for shard in self.shards:
+            shard.set_bot(bot)
+
+    @classmethod
+    def replace_bot(cls, obj: object) -> object:
+        """Returns ``obj`` unchanged. Bots are replaced by the shards.
+
+        Args:
+            obj (:obj:`object`): The object
+
+        Returns:
+            :obj:`obj`: ``obj``.
+        """
+        return obj
+
+    def insert_bot(self, obj: object) -> object:
+        """Returns ``obj`` unchanged. Bots are inserted by the shards.
+
+        Args:
+            obj (:obj:`object`): The object
+
+        Returns:
+            :obj:`obj`: ``obj``.
+        """
+        return obj
+
+    def get_user_data(self) -> DefaultDict[int, UD]:
+        """Returns the merged ``user_data`` of all shards.
+
+        Returns:
+            DefaultDict[:obj:`int`, :class:`TeleGenic.ext.utils.types.UD`]: The restored user data.
+        """
+        parts = [shard.get_user_data() for shard in self.shards]
+        user_data: DefaultDict[int, UD] = defaultdict(parts[0].default_factory)
+        for part in parts:
+            user_data.update(part)
+        return user_data
+
+    def get_chat_data(self) -> DefaultDict[int, CD]:
+        """Returns the merged ``chat_data`` of all shards.
+
+        Returns:
+            DefaultDict[:obj:`int`, :class:`TeleGenic.ext.utils.types.CD`]: The restored chat data.
+        """
+        parts = [shard.get_chat_data() for shard in self.shards]
+        chat_data: DefaultDict[int, CD] = defaultdict(parts[0].default_factory)
+        for part in parts:
+            chat_data.update(part)
+        return chat_data
+
+    def get_bot_data(self) -> BD:
+        """Returns the ``bot_data`` of the first shard.
+
+        Returns:
+            :class:`TeleGenic.ext.utils.types.BD`: The restored bot data.
+        """
+        return self.shards[0].get_bot_data()
+
+    def get_callback_data(self) -> Optional[CDCData]:
+        """Returns the ``callback_data`` of the first shard.
+
+        Returns:
+            Optional[:class:`TeleGenic.ext.utils.types.CDCData`]: The restored meta data or
+            :obj:`None`, if no data was stored.
+        """
+        return self.shards[0].get_callback_data()
+
+    def get_conversations(self, name: str) -> ConversationDict:
+        """Returns the merged conversations of the handler of all shards.
+
+        Args:
+            name (:obj:`str`): The handlers name.
+
+        Returns:
+            :obj:`dict`: The restored conversations for the handler.
+        """
+        conversations: Dict[Tuple[int, ...], object] = {}
+        for shard in self.shards:
+            conversations.update(shard.get_conversations(name))
+        return conversations
+
+    def update_conversation(
+        self, name: str, key: Tuple[int, ...], new_state: Optional[object]
+    ) -> None:
+        """Passes the new state of the conversation to the shard of ``key``.
+
+        Args:
+            name (:obj:`str`): The handler's name.
+            key (:obj:`tuple`): The key the state is changed for.
+            new_state (:obj:`tuple` | :obj:`any`): The new state for the given key.
+        """
+        index = self._index(key)
+        with self._locks[index]:
+            self.shards[index].update_conversation(name, key, new_state)
+
+    def update_user_data(self, user_id: int, data: UD) -> None:
+        """Passes the ``user_data`` to the shard of ``user_id``.
+
+        Args:
+            user_id (:obj:`int`): The user the data might have been changed for.
+            data (:class:`TeleGenic.ext.utils.types.UD`): The
+                :attr:`TeleGenic.ext.Dispatcher.user_data` ``[user_id]``.
+        """
+        index = self._index(user_id)
+        with self._locks[index]:
+            self.shards[index].update_user_data(user_id, data)
+
+    def update_chat_data(self, chat_id: int, data: CD) -> None:
+        """Passes the ``chat_data`` to the shard of ``chat_id``.
+
+        Args:
+            chat_id (:obj:`int`): The chat the data might have been changed for.
+            data (:class:`TeleGenic.ext.utils.types.CD`): The
+                :attr:`TeleGenic.ext.Dispatcher.chat_data` ``[chat_id]``.
+        """
+        index = self._index(chat_id)
+        with self._locks[index]:
+            self.shards[index].update_chat_data(chat_id, data)
+
+    def update_bot_data(self, data: BD) -> None:
+        """Passes the ``bot_data`` to the first shard.
+
+        Args:
+            data (:class:`TeleGenic.ext.utils.types.BD`): The
+                :attr:`TeleGenic.ext.Dispatcher.bot_data`.
+        """
+        with self._locks[0]:
+            self.shards[0].update_bot_data(data)
+
+    def update_callback_data(self, data: CDCData) -> None:
+        """Passes the ``callback_data`` to the first shard.
+
+        Args:
+            data (:class:`TeleGenic.ext.utils.types.CDCData`): The relevant data to restore
+                :class:`TeleGenic.ext.CallbackDataCache`.
+        """
+        with self._locks[0]:
+            self.shards[0].update_callback_data(data)
+
+    def refresh_user_data(self, user_id: int, user_data: UD) -> None:
+        """Calls :meth:`refresh_user_data` of the shard of ``user_id``.
+
+        Args:
+            user_id (:obj:`int`): The user ID this :attr:`user_data` is associated with.
+            user_data (:class:`TeleGenic.ext.utils.types.UD`): The ``user_data`` of a single user.
+        """
+        index = self._index(user_id)
+        with self._locks[index]:
+            self.shards[index].refresh_user_data(user_id, user_data)
+
+    def refresh_chat_data(self, chat_id: int, chat_data: CD) -> None:
+        """Calls :meth:`refresh_chat_data` of the shard of ``chat_id``.
+
+        Args:
+            chat_id (:obj:`int`): The chat ID this :attr:`chat_data` is associated with.
+            chat_data (:class:`TeleGenic.ext.utils.types.CD`): The ``chat_data`` of a single chat.
+        """
+        index = self._index(chat_id)
+        with self._locks[index]:
+            self.shards[index].refresh_chat_data(chat_id, chat_data)
+
+    def refresh_bot_data(self, bot_data: BD) -> None:
+        """Calls :meth:`refresh_bot_data` of the first shard.
+
+        Args:
+            bot_data (:class:`TeleGenic.ext.utils.types.BD`): The ``bot_data``.
+        """
+        with self._locks[0]:
+            self.shards[0].refresh_bot_data(bot_data)
+
+    def flush(self) -> None:
+        """Calls :meth:`flush` of all shards."""
+        for lock, shard in zip(self._locks, self.shards):
+            with lock:
+                shard.flush()
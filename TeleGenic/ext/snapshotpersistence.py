@@ -0,0 +1,539 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the SnapshotPersistence class."""
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from functools import partial
+from threading import Lock
+from typing import (
+    Any,
+    BinaryIO,
+    DefaultDict,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    cast,
+    overload,
+)
+
+from TeleGenic.ext import BasePersistence
+from TeleGenic.ext.contexttypes import ContextTypes
+from TeleGenic.ext.lazydatadict import LazyDataDict
+from TeleGenic.ext.serializer import PickleSerializer, Serializer
+from TeleGenic.ext.utils.types import UD, CD, BD, ConversationDict, CDCData
+
+# Layout of a snapshot file, all numbers are little endian:
+# * header: magic, offset and length of the other data, offset of the index
+# * the serialized entries of all users and chats, one after the other
+# * the other data: bot_data, callback_data and conversations, serialized together
+# * the index: for user_data and chat_data the number of entries followed by the sorted IDs, the
+#   offsets and the lengths of the entries as arrays of 8 byte integers
+_MAGIC = b'TGSNAP01'
+_HEADER = struct.Struct('<QQQ')
+_HEADER_SIZE = len(_MAGIC) + _HEADER.size
+_COUNT = struct.Struct('<Q')
+_TABLES = ('user_data', 'chat_data')
+
+_Index = Tuple[Sequence[int], Sequence[int], Sequence[int]]
+
+
+class _Snapshot:
+    """A memory-mapped snapshot file. Entries are read only when they are requested."""
+
+    __slots__ = ('_file', '_mmap', '_views', '_indexes', 'other')
+
+    def __init__(self, filepath: str):
+        # pylint: disable=R1732
+        self._file = open(filepath, 'rb')
+        self._views: List[memoryview] = []
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as exc:
+            self._file.close()
+            raise TypeError(f'{filepath} is not a valid snapshot') from exc
+        if len(self._mmap) < _HEADER_SIZE or self._mmap[: len(_MAGIC)] != _MAGIC:
+            self.close()
+            raise TypeError(f'{filepath} is not a valid snapshot')
+
+        other_offset, other_length, position = _HEADER.unpack_from(self._mmap, len(_MAGIC))
+        self.other = self._mmap[other_offset : other_offset + other_length]
+        self._indexes: Dict[str, _Index] = {}
+        for table in _TABLES:
+            (count,) = _COUNT.unpack_from(self._mmap, position)
+            position += _COUNT.size
+            arrays = []
+            for _ in range(3):
+                arrays.append(self._array(position, count))
+                position += 8 * count
+            self._indexes[table] = cast(_Index, tuple(arrays))
+
+    def _array(self, position: int, count: int) -> Sequence[int]:
+        if sys.byteorder == 'little':
+            # The index is used right from the file, without copying it
+            if not self._views:
+                self._views.append(memoryview(self._mmap))
+            data = self._views[0][position : position + 8 * count]
+            self._views.append(data)
+            integers = data.cast('q')
+            self._views.append(integers)
+            return integers
+        integers = array('q', self._mmap[position : position + 8 * count])
+        integers.byteswap()
+        return integers
+
+    def get(self, table: str, key: int) -> Optional[bytes]:
+        ids, offsets, lengths = self._indexes[table]
+        index = bisect_left(ids, key)  # type: ignore[arg-type]
+        if index == len(ids) or ids[index] != key:
+            return None
+        return self._mmap[offsets[index] : offsets[index] + lengths[index]]
+
+    def entries(self, table: str) -> Iterator[Tuple[int, bytes]]:
+        ids, offsets, lengths = self._indexes[table]
+        for key, offset, length in zip(ids, offsets, lengths):
+            yield key, self._mmap[offset : offset + length]
+
+    def close(self) -> None:
+        # The views have to be released before the mmap can be closed
+        for view in reversed(self._views):
+            view.release()
+        self._views.clear()
+        self._mmap.close()
+        self._file.close()
+
+
+def _write_snapshot(
+    file: BinaryIO,
+    tables: Dict[str, Iterator[Tuple[int, bytes]]],
+    other: bytes,
+) -> None:
+    file.write(bytes(_HEADER_SIZE))
+    indexes = {}
+    for table in _TABLES:
+        ids, offsets, lengths = array('q'), array('q'), array('q')
+        for key, data in tables[table]:
+            ids.append(key)
+            offsets.append(file.tell())
+            lengths.append(len(data))
+            file.write(data)
+        indexes[table] = (ids, offsets, lengths)
+
+    other_offset = file.tell()
+    file.write(other)
+    # Aligns the index
+    file.write(bytes(-file.tell() % 8))
+    index_offset = file.tell()
+    for table in _TABLES:
+        file.write(_COUNT.pack(len(indexes[table][0])))
+        for integers in indexes[table]:
+            if sys.byteorder == 'big':
+                integers.byteswap()
+            file.write(integers.tobytes())
+
+    file.seek(0)
+    file.write(_MAGIC + _HEADER.pack(other_offset, len(other), index_offset))
+
+
+def _merge(
+    old: Iterator[Tuple[int, bytes]], new: Dict[int, object], serializer: Serializer
+) -> Iterator[Tuple[int, bytes]]:
+    # Merges the sorted entries of the old snapshot with the changed entries. Unchanged entries
+    # are copied without decoding them
+    changed = sorted(new)
+    position = 0
+    for key, data in old:
+        while position < len(changed) and changed[position] < key:
+            yield changed[position], serializer.dumps(new[changed[position]])
+            position += 1
+        if position < len(changed) and changed[position] == key:
+            yield key, serializer.dumps(new[key])
+            position += 1
+        else:
+            yield key, data
+    for key in changed[position:]:
+        yield key, serializer.dumps(new[key])
+
+
+class SnapshotPersistence(BasePersistence[UD, CD, BD]):
+    """Stores the data in a snapshot file that is memory-mapped on startup instead of being
+    loaded completely. The file contains an index of the users and chats, so that the data of a
+    user or chat is only read and deserialized, when it is accessed for the first time. To do so,
+    user_data and chat_data are :class:`TeleGenic.ext.LazyDataDict` instances, which only keep
+    the :attr:`cache_size` most recently used entries in memory. ``bot_data``, ``callback_data``
+    and the conversations are loaded on startup.
+
+    Changes are kept in memory and written by :meth:`flush`, which is called by
+    :class:`TeleGenic.ext.Updater` on shutdown. It writes a new snapshot, where the entries of
+    users and chats that did not change are copied from the old snapshot without deserializing
+    them. As the changes accumulate in memory until then, you may want to call :meth:`flush`
+    regularly, e.g. with :meth:`TeleGenic.ext.JobQueue.run_repeating`.
+
+    Warning:
+        :class:`SnapshotPersistence` will try to replace :class:`TeleGenic.Bot` instances by
+        :attr:`REPLACED_BOT` and insert the bot set with
+        :meth:`TeleGenic.ext.BasePersistence.set_bot` upon loading of the data. This is to ensure
+        that changes to the bot apply to the saved objects, too. If you change the bots token, this
+        may lead to e.g. ``Chat not found`` errors. For the limitations on replacing bots see
+        :meth:`TeleGenic.ext.BasePersistence.replace_bot` and
+        :meth:`TeleGenic.ext.BasePersistence.insert_bot`.
+
+    .. versionadded:: 13.11
+
+    Args:
+        filepath (:obj:`str`): Path of the snapshot file. It is created by :meth:`flush`, if it
+            does not exist.
+        store_user_data (:obj:`bool`, optional): Whether user_data should be saved by this
+            persistence class. Default is :obj:`True`.
+        store_chat_data (:obj:`bool`, optional): Whether chat_data should be saved by this
+            persistence class. Default is :obj:`True`.
+        store_bot_data (:obj:`bool`, optional): Whether bot_data should be saved by this
+            persistence class. Default is :obj:`True`.
+        store_callback_data (:obj:`bool`, optional): Whether callback_data should be saved by this
+            persistence class. Default is :obj:`False`.
+        cache_size (:obj:`int`, optional): The maximum number of users and chats, respectively,
+            whose data is held in memory. Pass :obj:`None` to never evict data. Default is
+            ``10000``.
+        serializer (:class:`TeleGenic.ext.Serializer`, optional): Converts the data to bytes and
+            back. Defaults to :class:`TeleGenic.ext.PickleSerializer`.
+        context_types (:class:`TeleGenic.ext.ContextTypes`, optional): Pass an instance
+            of :class:`TeleGenic.ext.ContextTypes` to customize the types used in the
+            ``context`` interface. If not passed, the defaults documented in
+            :class:`TeleGenic.ext.ContextTypes` will be used.
+
+    Attributes:
+        filepath (:obj:`str`): Path of the snapshot file.
+        store_user_data (:obj:`bool`): Optional. Whether user_data should be saved by this
+            persistence class.
+        store_chat_data (:obj:`bool`): Optional. Whether chat_data should be saved by this
+            persistence class.
+        store_bot_data (:obj:`bool`): Optional. Whether bot_data should be saved by this
+            persistence class.
+        store_callback_data (:obj:`bool`): Optional. Whether callback_data be saved by this
+            persistence class.
+        cache_size (:obj:`int`): Optional. The maximum number of users and chats, respectively,
+            whose data is held in memory.
+        serializer (:class:`TeleGenic.ext.Serializer`): Converts the data to bytes and back.
+        context_types (:class:`TeleGenic.ext.ContextTypes`): Container for the types used
+            in the ``context`` interface.
+    """
+
+    __slots__ = (
+        'filepath',
+        'cache_size',
+        'serializer',
+        'context_types',
+        'user_data',
+        'chat_data',
+        'bot_data',
+        'callback_data',
+        'conversations',
+        '_snapshot',
+        '_loaded',
+        '_lock',
+        '_flush_lock',
+        '_changed',
+        '_flushing',
+    )
+
+    @overload
+    def __init__(
+        self: 'SnapshotPersistence[Dict, Dict, Dict]',
+        filepath: str,
+        store_user_data: bool = True,
+        store_chat_data: bool = True,
+        store_bot_data: bool = True,
+        store_callback_data: bool = False,
+        cache_size: Optional[int] = 10000,
+        serializer: Serializer = None,
+    ):
+        ...
+
+    @overload
+    def __init__(
+        self: 'SnapshotPersistence[UD, CD, BD]',
+        filepath: str,
+        store_user_data: bool = True,
+        store_chat_data: bool = True,
+        store_bot_data: bool = True,
+        store_callback_data: bool = False,
+        cache_size: Optional[int] = 10000,
+        serializer: Serializer = None,
+        context_types: ContextTypes[Any, UD, CD, BD] = None,
+    ):
+        ...
+
+    def __init__(
+        self,
+        filepath: str,
+        store_user_data: bool = True,
+        store_chat_data: bool = True,
+        store_bot_data: bool = True,
+        store_callback_data: bool = False,
+        cache_size: Optional[int] = 10000,
+        serializer: Serializer = None,
+        context_types: ContextTypes[Any, UD, CD, BD] = None,
+    ):
+        super().__init__(
+            store_user_data=store_user_data,
+            store_chat_data=store_chat_data,
+            store_bot_data=store_bot_data,
+            store_callback_data=store_callback_data,
+        )
+        self.filepath = filepath
+        self.cache_size = cache_size
+        self.serializer = serializer or PickleSerializer()
+        self.context_types = cast(ContextTypes[Any, UD, CD, BD], context_types or ContextTypes())
+        self.user_data: Optional[LazyDataDict] = None
+        self.chat_data: Optional[LazyDataDict] = None
+        self.bot_data: Optional[BD] = None
+        self.callback_data: Optional[CDCData] = None
+        self.conversations: Dict[str, Dict[Tuple, object]] = {}
+        self._snapshot: Optional[_Snapshot] = None
+        self._loaded = False
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        # Changed entries of users and chats, which are not in the snapshot yet. While flush()
+        # writes them, they are moved to _flushing
+        self._changed: Dict[str, Dict[int, object]] = {table: {} for table in _TABLES}
+        self._flushing: Dict[str, Dict[int, object]] = {table: {} for table in _TABLES}
+
+    def _loads(self, data: bytes) -> Any:
+        try:
+            return self.serializer.loads(data)
+        except Exception as exc:
+            raise TypeError(f'{self.filepath} contains data that can not be deserialized') from exc
+
+    def _load(self) -> None:
+        with self._lock:
+            if self._loaded:
+                return
+            if os.path.exists(self.filepath):
+                self._snapshot = _Snapshot(self.filepath)
+                other = self._loads(self._snapshot.other)
+                self.bot_data = other['bot_data']
+                self.callback_data = other['callback_data']
+                self.conversations = other['conversations']
+            self._loaded = True
+
+    def _load_entry(self, table: str, key: int) -> Any:
+        with self._lock:
+            for pending in (self._changed[table], self._flushing[table]):
+                if key in pending:
+                    return self.insert_bot(pending[key])
+            data = self._snapshot.get(table, key) if self._snapshot else None
+        return None if data is None else self.insert_bot(self._loads(data))
+
+    def get_user_data(self) -> DefaultDict[int, UD]:
+        """Returns a :class:`TeleGenic.ext.LazyDataDict` that loads the user_data from the
+        snapshot on first access.
+
+        Returns:
+            DefaultDict[:obj:`int`, :class:`TeleGenic.ext.utils.types.UD`]: The restored user data.
+        """
+        self._load()
+        if self.user_data is None:
+            self.user_data = LazyDataDict(
+                self.context_types.user_data,
+                loader=partial(self._load_entry, 'user_data'),
+                max_size=self.cache_size,
+            )
+        return self.user_data
+
+    def get_chat_data(self) -> DefaultDict[int, CD]:
+        """Returns a :class:`TeleGenic.ext.LazyDataDict` that loads the chat_data from the
+        snapshot on first access.
+
+        Returns:
+            DefaultDict[:obj:`int`, :class:`TeleGenic.ext.utils.types.CD`]: The restored chat data.
+        """
+        self._load()
+        if self.chat_data is None:
+            self.chat_data = LazyDataDict(
+                self.context_types.chat_data,
+                loader=partial(self._load_entry, 'chat_data'),
+                max_size=self.cache_size,
+            )
+        return self.chat_data
+
+    def get_bot_data(self) -> BD:
+        """Returns the bot_data from the snapshot, if it exists, or an empty object of type
+        :class:`TeleGenic.ext.utils.types.BD`.
+
+        Returns:
+            :class:`TeleGenic.ext.utils.types.BD`: The restored bot data.
+        """
+        self._load()
+        if self.bot_data is None:
+            self.bot_data = self.context_types.bot_data()
+        return self.bot_data  # type: ignore[return-value]
+
+    def get_callback_data(self) -> Optional[CDCData]:
+        """Returns the callback data from the snapshot, if it exists, or :obj:`None`.
+
+        Returns:
+            Optional[:class:`TeleGenic.ext.utils.types.CDCData`]: The restored meta data or
+            :obj:`None`, if no data was stored.
+        """
+        self._load()
+        if self.callback_data is None:
+            return None
+        return self.callback_data[0], self.callback_data[1].copy()
+
+    def get_conversations(self, name: str) -> ConversationDict:
+        """Returns the conversations of the handler from the snapshot, if they exist, or an empty
+        dict.
+
+        Args:
+            name (:obj:`str`): The handlers name.
+
+        Returns:
+            :obj:`dict`: The restored conversations for the handler.
+        """
+        self._load()
+        return self.conversations.get(name, {}).copy()
+
+    def update_conversation(
+        self, name: str, key: Tuple[int, ...], new_state: Optional[object]
+    ) -> None:
+        """Will update the conversations for the given handler. The change is written by
+        :meth:`flush`.
+
+        Args:
+            name (:obj:`str`): The handler's name.
+            key (:obj:`tuple`): The key the state is changed for.
+            new_state (:obj:`tuple` | :obj:`any`): The new state for the given key.
+        """
+        with self._lock:
+            conversations = self.conversations.setdefault(name, {})
+            if new_state is None:
+                conversations.pop(key, None)
+            else:
+                conversations[key] = new_state
+
+    def update_user_data(self, user_id: int, data: UD) -> None:
+        """Will remember the user_data to be written by :meth:`flush`.
+
+        Args:
+            user_id (:obj:`int`): The user the data might have been changed for.
+            data (:class:`TeleGenic.ext.utils.types.UD`): The
+                :attr:`TeleGenic.ext.Dispatcher.user_data` ``[user_id]``.
+        """
+        with self._lock:
+            self._changed['user_data'][user_id] = data
+
+    def update_chat_data(self, chat_id: int, data: CD) -> None:
+        """Will remember the chat_data to be written by :meth:`flush`.
+
+        Args:
+            chat_id (:obj:`int`): The chat the data might have been changed for.
+            data (:class:`TeleGenic.ext.utils.types.CD`): The
+                :attr:`TeleGenic.ext.Dispatcher.chat_data` ``[chat_id]``.
+        """
+        with self._lock:
+            self._changed['chat_data'][chat_id] = data
+
+    def update_bot_data(self, data: BD) -> None:
+        """Will update the bot_data. The change is written by :meth:`flush`.
+
+        Args:
+            data (:class:`TeleGenic.ext.utils.types.BD`): The
+                :attr:`TeleGenic.ext.Dispatcher.bot_data`.
+        """
+        self.bot_data = data
+
+    def update_callback_data(self, data: CDCData) -> None:
+        """Will update the callback_data. The change is written by :meth:`flush`.
+
+        Args:
+            data (:class:`TeleGenic.ext.utils.types.CDCData`): The relevant data to restore
+                :class:`TeleGenic.ext.CallbackDataCache`.
+        """
+        self.callback_data = (data[0], data[1].copy())
+
+    def refresh_user_data(self, user_id: int, user_data: UD) -> None:
+        """Does nothing.
+
+        .. seealso:: :meth:`TeleGenic.ext.BasePersistence.refresh_user_data`
+        """
+
+    def refresh_chat_data(self, chat_id: int, chat_data: CD) -> None:
+        """Does nothing.
+
+        .. seealso:: :meth:`TeleGenic.ext.BasePersistence.refresh_chat_data`
+        """
+
+    def refresh_bot_data(self, bot_data: BD) -> None:
+        """Does nothing.
+
+        .. seealso:: :meth:`TeleGenic.ext.BasePersistence.refresh_bot_data`
+        """
+
+    def flush(self) -> None:
+        """Writes a new snapshot containing all changes. The new snapshot is written next to the
+        old one and replaces it only when it is complete.
+        """
+        self._load()
+        with self._flush_lock:
+            with self._lock:
+                for table in _TABLES:
+                    self._flushing[table], self._changed[table] = self._changed[table], {}
+                other = self.serializer.dumps(
+                    {
+                        'bot_data': self.bot_data,
+                        'callback_data': self.callback_data,
+                        'conversations': self.conversations,
+                    }
+                )
+                snapshot = self._snapshot
+
+            temporary = f'{self.filepath}.tmp'
+            try:
+                with open(temporary, 'wb') as file:
+                    tables = {
+                        table: _merge(
+                            snapshot.entries(table) if snapshot else iter(()),
+                            self._flushing[table],
+                            self.serializer,
+                        )
+                        for table in _TABLES
+                    }
+                    _write_snapshot(file, tables, other)
+                    file.flush()
+                    os.fsync(file.fileno())
+            except Exception:
+                with self._lock:
+                    # Keeps the changes for the next try. Newer changes take precedence
+                    for table in _TABLES:
+                        self._flushing[table].update(self._changed[table])
+                        self._changed[table], self._flushing[table] = self._flushing[table], {}
+                raise
+
+            with self._lock:
+                if self._snapshot is not None:
+                    self._snapshot.close()
+                os.replace(temporary, self.filepath)
+                self._snapshot = _Snapshot(self.filepath)
+                self._flushing = {table: {} for table in _TABLES}
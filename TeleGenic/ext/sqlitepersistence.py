@@ -0,0 +1,481 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the SqlitePersistence class."""
+import json
+import pickle
+import sqlite3
+from collections import defaultdict
+from functools import partial
+from threading import Lock
+from typing import (
+    Any,
+    DefaultDict,
+    Dict,
+    Iterable,
+    Optional,
+    Tuple,
+    overload,
+    cast,
+)
+
+from TeleGenic.ext import BasePersistence
+from TeleGenic.ext.utils.types import UD, CD, BD, ConversationDict, CDCData
+from TeleGenic.ext.contexttypes import ContextTypes
+from TeleGenic.ext.lazydatadict import LazyDataDict
+from TeleGenic.ext.serializer import PickleSerializer, Serializer
+from TeleGenic.ext.trackingdict import TrackingDict
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS user_data (id INTEGER PRIMARY KEY, data BLOB NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS chat_data (id INTEGER PRIMARY KEY, data BLOB NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS single_data (name TEXT PRIMARY KEY, data BLOB NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS conversations ('
+    'name TEXT NOT NULL, key TEXT NOT NULL, state BLOB NOT NULL, PRIMARY KEY (name, key))',
+)
+
+# Identifies a row, e.g. ('user_data', 123) or ('conversations', ('name', (1, 2)))
+_RowKey = Tuple[str, Any]
+
+
+class SqlitePersistence(BasePersistence[UD, CD, BD]):
+    """Using a SQLite database for making your bot persistent. Each user, chat and conversation
+    is stored in its own row, so that an update only writes the data that actually changed
+    instead of the complete data. Values are serialized with :mod:`pickle` by default. The
+    database is opened in WAL mode on first access.
+
+    By default, all user and chat data is loaded on startup. With :attr:`lazy_load`, user_data and
+    chat_data are :class:`TeleGenic.ext.LazyDataDict` instances instead, which load the data of
+    a user or chat on first access and only keep the :attr:`cache_size` most recently used entries
+    in memory. Evicted entries are written to the database, unless they are
+    :class:`TeleGenic.ext.TrackingDict` instances that were not changed. This way, memory usage
+    scales with the number of active users and chats rather than with all users and chats ever
+    seen.
+
+    Warning:
+        :class:`SqlitePersistence` will try to replace :class:`TeleGenic.Bot` instances by
+        :attr:`REPLACED_BOT` and insert the bot set with
+        :meth:`TeleGenic.ext.BasePersistence.set_bot` upon loading of the data. This is to ensure
+        that changes to the bot apply to the saved objects, too. If you change the bots token, this
+        may lead to e.g. ``Chat not found`` errors. For the limitations on replacing bots see
+        :meth:`TeleGenic.ext.BasePersistence.replace_bot` and
+        :meth:`TeleGenic.ext.BasePersistence.insert_bot`.
+
+    .. versionadded:: 13.11
+
+    Args:
+        filepath (:obj:`str`): Path of the database file. It is created, if it does not exist.
+        store_user_data (:obj:`bool`, optional): Whether user_data should be saved by this
+            persistence class. Default is :obj:`True`.
+        store_chat_data (:obj:`bool`, optional): Whether chat_data should be saved by this
+            persistence class. Default is :obj:`True`.
+        store_bot_data (:obj:`bool`, optional): Whether bot_data should be saved by this
+            persistence class. Default is :obj:`True`.
+        on_flush (:obj:`bool`, optional): When :obj:`True`, the changed rows are only written
+            when :meth:`flush` is called, all in one transaction. When :obj:`False`, each change
+            is written in its own transaction right away. Default is :obj:`False`.
+        store_callback_data (:obj:`bool`, optional): Whether callback_data should be saved by this
+            persistence class. Default is :obj:`False`.
+        context_types (:class:`TeleGenic.ext.ContextTypes`, optional): Pass an instance
+            of :class:`TeleGenic.ext.ContextTypes` to customize the types used in the
+            ``context`` interface. If not passed, the defaults documented in
+            :class:`TeleGenic.ext.ContextTypes` will be used.
+        lazy_load (:obj:`bool`, optional): Whether user_data and chat_data should be loaded
+            entry by entry on first access instead of all at once. Default is :obj:`False`.
+        cache_size (:obj:`int`, optional): With :attr:`lazy_load`, the maximum number of users
+            and chats, respectively, whose data is held in memory. Pass :obj:`None` to never
+            evict data. Default is ``10000``.
+        serializer (:class:`TeleGenic.ext.Serializer`, optional): Converts the stored values to
+            bytes and back. Defaults to :class:`TeleGenic.ext.PickleSerializer`.
+
+    Attributes:
+        filepath (:obj:`str`): Path of the database file.
+        store_user_data (:obj:`bool`): Optional. Whether user_data should be saved by this
+            persistence class.
+        store_chat_data (:obj:`bool`): Optional. Whether chat_data should be saved by this
+            persistence class.
+        store_bot_data (:obj:`bool`): Optional. Whether bot_data should be saved by this
+            persistence class.
+        store_callback_data (:obj:`bool`): Optional. Whether callback_data be saved by this
+            persistence class.
+        on_flush (:obj:`bool`): Whether changed rows are only written when :meth:`flush` is
+            called.
+        context_types (:class:`TeleGenic.ext.ContextTypes`): Container for the types used
+            in the ``context`` interface.
+        lazy_load (:obj:`bool`): Whether user_data and chat_data are loaded entry by entry on
+            first access.
+        cache_size (:obj:`int`): Optional. With :attr:`lazy_load`, the maximum number of users
+            and chats, respectively, whose data is held in memory.
+        serializer (:class:`TeleGenic.ext.Serializer`): Converts the stored values to bytes and
+            back.
+    """
+
+    __slots__ = (
+        'filepath',
+        'on_flush',
+        'user_data',
+        'chat_data',
+        'bot_data',
+        'callback_data',
+        'conversations',
+        'context_types',
+        'lazy_load',
+        'cache_size',
+        'serializer',
+        '_connection',
+        '_lock',
+        '_pending',
+    )
+
+    @overload
+    def __init__(
+        self: 'SqlitePersistence[Dict, Dict, Dict]',
+        filepath: str,
+        store_user_data: bool = True,
+        store_chat_data: bool = True,
+        store_bot_data: bool = True,
+        on_flush: bool = False,
+        store_callback_data: bool = False,
+        lazy_load: bool = False,
+        cache_size: Optional[int] = 10000,
+        serializer: Serializer = None,
+    ):
+        ...
+
+    @overload
+    def __init__(
+        self: 'SqlitePersistence[UD, CD, BD]',
+        filepath: str,
+        store_user_data: bool = True,
+        store_chat_data: bool = True,
+        store_bot_data: bool = True,
+        on_flush: bool = False,
+        store_callback_data: bool = False,
+        context_types: ContextTypes[Any, UD, CD, BD] = None,
+        lazy_load: bool = False,
+        cache_size: Optional[int] = 10000,
+        serializer: Serializer = None,
+    ):
+        ...
+
+    def __init__(
+        self,
+        filepath: str,
+        store_user_data: bool = True,
+        store_chat_data: bool = True,
+        store_bot_data: bool = True,
+        on_flush: bool = False,
+        store_callback_data: bool = False,
+        context_types: ContextTypes[Any, UD, CD, BD] = None,
+        lazy_load: bool = False,
+        cache_size: Optional[int] = 10000,
+        serializer: Serializer = None,
+    ):
+        super().__init__(
+            store_user_data=store_user_data,
+            store_chat_data=store_chat_data,
+            store_bot_data=store_bot_data,
+            store_callback_data=store_callback_data,
+        )
+        self.filepath = filepath
+        self.on_flush = on_flush
+        self.user_data: Optional[DefaultDict[int, UD]] = None
+        self.chat_data: Optional[DefaultDict[int, CD]] = None
+        self.bot_data: Optional[BD] = None
+        self.callback_data: Optional[CDCData] = None
+        self.conversations: Dict[str, Dict[Tuple, object]] = {}
+        self.context_types = cast(ContextTypes[Any, UD, CD, BD], context_types or ContextTypes())
+        self.lazy_load = lazy_load
+        self.cache_size = cache_size
+        self.serializer = serializer or PickleSerializer(pickle.HIGHEST_PROTOCOL)
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = Lock()
+        # The rows that were not written yet and the data to write
+        self._pending: Dict[_RowKey, object] = {}
+
+    def _get_connection(self) -> sqlite3.Connection:
+        # Must be called while holding the lock
+        if self._connection is None:
+            # The dispatcher calls the persistence from different threads, access is guarded by
+            # the lock
+            connection = sqlite3.connect(self.filepath, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            with connection:
+                for statement in _SCHEMA:
+                    connection.execute(statement)
+            self._connection = connection
+        return self._connection
+
+    def _select(self, query: str, parameters: Iterable = ()) -> list:
+        with self._lock:
+            return self._get_connection().execute(query, tuple(parameters)).fetchall()
+
+    def _loads(self, data: bytes) -> Any:
+        try:
+            return self.serializer.loads(data)
+        except Exception as exc:
+            raise TypeError('The database contains data that can not be unpickled') from exc
+
+    def _load_single(self, name: str) -> Any:
+        rows = self._select('SELECT data FROM single_data WHERE name = ?', (name,))
+        return self._loads(rows[0][0]) if rows else None
+
+    def _load_entry(self, table: str, key: int) -> Any:
+        # Loads a single entry for a LazyDataDict. Data that was evicted but not written yet is
+        # still pending
+        with self._lock:
+            if (table, key) in self._pending:
+                return self.insert_bot(self._pending[(table, key)])
+        rows = self._select(f'SELECT data FROM {table} WHERE id = ?', (key,))
+        return self.insert_bot(self._loads(rows[0][0])) if rows else None
+
+    def _evict_entry(self, table: str, key: int, data: object) -> None:
+        if isinstance(data, TrackingDict) and not data.changed:
+            return
+        if table == 'user_data':
+            self.update_user_data(key, data)  # type: ignore[arg-type]
+        else:
+            self.update_chat_data(key, data)  # type: ignore[arg-type]
+
+    def _lazy_data(self, table: str, default_factory: Any) -> LazyDataDict:
+        return LazyDataDict(
+            default_factory,
+            loader=partial(self._load_entry, table),
+            max_size=self.cache_size,
+            on_evict=partial(self._evict_entry, table),
+        )
+
+    def get_user_data(self) -> DefaultDict[int, UD]:
+        """Returns the user_data from the database, if it exists, or an empty :obj:`defaultdict`.
+        With :attr:`lazy_load`, returns a :class:`TeleGenic.ext.LazyDataDict` instead.
+
+        Returns:
+            DefaultDict[:obj:`int`, :class:`TeleGenic.ext.utils.types.UD`]: The restored user data.
+        """
+        if self.lazy_load:
+            if self.user_data is None:
+                self.user_data = self._lazy_data('user_data', self.context_types.user_data)
+        elif self.user_data is None:
+            rows = self._select('SELECT id, data FROM user_data')
+            self.user_data = defaultdict(
+                self.context_types.user_data, {key: self._loads(data) for key, data in rows}
+            )
+        return self.user_data
+
+    def get_chat_data(self) -> DefaultDict[int, CD]:
+        """Returns the chat_data from the database, if it exists, or an empty :obj:`defaultdict`.
+        With :attr:`lazy_load`, returns a :class:`TeleGenic.ext.LazyDataDict` instead.
+
+        Returns:
+            DefaultDict[:obj:`int`, :class:`TeleGenic.ext.utils.types.CD`]: The restored chat data.
+        """
+        if self.lazy_load:
+            if self.chat_data is None:
+                self.chat_data = self._lazy_data('chat_data', self.context_types.chat_data)
+        elif self.chat_data is None:
+            rows = self._select('SELECT id, data FROM chat_data')
+            self.chat_data = defaultdict(
+                self.context_types.chat_data, {key: self._loads(data) for key, data in rows}
+            )
+        return self.chat_data
+
+    def get_bot_data(self) -> BD:
+        """Returns the bot_data from the database, if it exists, or an empty object of type
+        :class:`TeleGenic.ext.utils.types.BD`.
+
+        Returns:
+            :class:`TeleGenic.ext.utils.types.BD`: The restored bot data.
+        """
+        if self.bot_data is None:
+            data = self._load_single('bot_data')
+            self.bot_data = self.context_types.bot_data() if data is None else data
+        return self.bot_data  # type: ignore[return-value]
+
+    def get_callback_data(self) -> Optional[CDCData]:
+        """Returns the callback data from the database, if it exists, or :obj:`None`.
+
+        Returns:
+            Optional[:class:`TeleGenic.ext.utils.types.CDCData`]: The restored meta data or
+            :obj:`None`, if no data was stored.
+        """
+        if self.callback_data is None:
+            self.callback_data = self._load_single('callback_data')
+        if self.callback_data is None:
+            return None
+        return self.callback_data[0], self.callback_data[1].copy()
+
+    def get_conversations(self, name: str) -> ConversationDict:
+        """Returns the conversations of the handler from the database, if they exist, or an empty
+        dict.
+
+        Args:
+            name (:obj:`str`): The handlers name.
+
+        Returns:
+            :obj:`dict`: The restored conversations for the handler.
+        """
+        if name not in self.conversations:
+            rows = self._select('SELECT key, state FROM conversations WHERE name = ?', (name,))
+            self.conversations[name] = {
+                tuple(json.loads(key)): self._loads(state) for key, state in rows
+            }
+        return self.conversations[name].copy()
+
+    def update_conversation(
+        self, name: str, key: Tuple[int, ...], new_state: Optional[object]
+    ) -> None:
+        """Will update the conversations for the given handler and depending on :attr:`on_flush`
+        write the row of the conversation to the database.
+
+        Args:
+            name (:obj:`str`): The handler's name.
+            key (:obj:`tuple`): The key the state is changed for.
+            new_state (:obj:`tuple` | :obj:`any`): The new state for the given key.
+        """
+        conversations = self.conversations.setdefault(name, {})
+        if conversations.get(key) == new_state:
+            return
+        conversations[key] = new_state
+        self._changed(('conversations', (name, key)), new_state)
+
+    def update_user_data(self, user_id: int, data: UD) -> None:
+        """Will update the user_data and depending on :attr:`on_flush` write the row of the user
+        to the database.
+
+        Args:
+            user_id (:obj:`int`): The user the data might have been changed for.
+            data (:class:`TeleGenic.ext.utils.types.UD`): The
+                :attr:`TeleGenic.ext.Dispatcher.user_data` ``[user_id]``.
+        """
+        if self.lazy_load:
+            # The lazy user_data is the dispatchers data, so there is nothing to compare with
+            self._changed(('user_data', user_id), data)
+            return
+        if self.user_data is None:
+            self.user_data = defaultdict(self.context_types.user_data)
+        if self.user_data.get(user_id) == data:
+            return
+        self.user_data[user_id] = data
+        self._changed(('user_data', user_id), data)
+
+    def update_chat_data(self, chat_id: int, data: CD) -> None:
+        """Will update the chat_data and depending on :attr:`on_flush` write the row of the chat
+        to the database.
+
+        Args:
+            chat_id (:obj:`int`): The chat the data might have been changed for.
+            data (:class:`TeleGenic.ext.utils.types.CD`): The
+                :attr:`TeleGenic.ext.Dispatcher.chat_data` ``[chat_id]``.
+        """
+        if self.lazy_load:
+            self._changed(('chat_data', chat_id), data)
+            return
+        if self.chat_data is None:
+            self.chat_data = defaultdict(self.context_types.chat_data)
+        if self.chat_data.get(chat_id) == data:
+            return
+        self.chat_data[chat_id] = data
+        self._changed(('chat_data', chat_id), data)
+
+    def update_bot_data(self, data: BD) -> None:
+        """Will update the bot_data and depending on :attr:`on_flush` write it to the database.
+
+        Args:
+            data (:class:`TeleGenic.ext.utils.types.BD`): The
+                :attr:`TeleGenic.ext.Dispatcher.bot_data`.
+        """
+        if self.bot_data == data:
+            return
+        self.bot_data = data
+        self._changed(('single_data', 'bot_data'), data)
+
+    def update_callback_data(self, data: CDCData) -> None:
+        """Will update the callback_data (if changed) and depending on :attr:`on_flush` write it
+        to the database.
+
+        Args:
+            data (:class:`TeleGenic.ext.utils.types.CDCData`): The relevant data to restore
+                :class:`TeleGenic.ext.CallbackDataCache`.
+        """
+        if self.callback_data == data:
+            return
+        self.callback_data = (data[0], data[1].copy())
+        self._changed(('single_data', 'callback_data'), self.callback_data)
+
+    def refresh_user_data(self, user_id: int, user_data: UD) -> None:
+        """Does nothing.
+
+        .. seealso:: :meth:`TeleGenic.ext.BasePersistence.refresh_user_data`
+        """
+
+    def refresh_chat_data(self, chat_id: int, chat_data: CD) -> None:
+        """Does nothing.
+
+        .. seealso:: :meth:`TeleGenic.ext.BasePersistence.refresh_chat_data`
+        """
+
+    def refresh_bot_data(self, bot_data: BD) -> None:
+        """Does nothing.
+
+        .. seealso:: :meth:`TeleGenic.ext.BasePersistence.refresh_bot_data`
+        """
+
+    def flush(self) -> None:
+        """Writes all changes that were not written yet in one transaction."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            self._write(pending.items())
+
+    def _changed(self, row: _RowKey, data: object) -> None:
+        if self.on_flush:
+            with self._lock:
+                self._pending[row] = data
+        else:
+            self._write(((row, data),))
+
+    def _write(self, rows: Iterable[Tuple[_RowKey, object]]) -> None:
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                for (table, key), data in rows:
+                    self._write_row(connection, table, key, data)
+
+    def _write_row(
+        self, connection: sqlite3.Connection, table: str, key: Any, data: object
+    ) -> None:
+        if table == 'conversations':
+            name, conversation_key = key
+            encoded_key = json.dumps(conversation_key)
+            if data is None:
+                connection.execute(
+                    'DELETE FROM conversations WHERE name = ? AND key = ?', (name, encoded_key)
+                )
+            else:
+                connection.execute(
+                    'INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)',
+                    (name, encoded_key, self.serializer.dumps(data)),
+                )
+            return
+
+        column = 'name' if table == 'single_data' else 'id'
+        connection.execute(
+            f'INSERT OR REPLACE INTO {table} ({column}, data) VALUES (?, ?)',
+            (key, self.serializer.dumps(data)),
+        )
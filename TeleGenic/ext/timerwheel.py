@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the TimerWheel class."""
+import logging
+import math
+import time
+from threading import Event, Lock, Thread, current_thread
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+Expired = List[Tuple[Hashable, object]]
+
+
+class TimerWheel:
+    """A hashed timer wheel for a large number of timeouts, e.g. one per conversation. Time is
+    divided into ticks of :attr:`tick_interval` seconds and every timeout is put into the bucket
+    of the tick it expires in. Buckets are reused after :attr:`wheel_size` ticks, so a bucket may
+    hold timeouts of later revolutions of the wheel, too. Scheduling and cancelling a timeout are
+    constant time operations and expired timeouts are collected by walking over the buckets of the
+    ticks that passed.
+
+    Timeouts are identified by a key, scheduling a timeout for a key that already has one replaces
+    it. The expired timeouts can either be collected with :meth:`expire` or passed to a callback by
+    a thread started with :meth:`start`.
+
+    Note:
+        Timeouts expire at the end of their tick, i.e. up to :attr:`tick_interval` seconds late.
+
+    .. versionadded:: 13.11
+
+    Args:
+        tick_interval (:obj:`float`, optional): The length of a tick in seconds. Defaults to
+            ``0.05``.
+        wheel_size (:obj:`int`, optional): The number of buckets. Defaults to ``512``.
+
+    Attributes:
+        tick_interval (:obj:`float`): The length of a tick in seconds.
+        wheel_size (:obj:`int`): The number of buckets.
+    """
+
+    __slots__ = (
+        'tick_interval',
+        'wheel_size',
+        'logger',
+        '_buckets',
+        '_ticks',
+        '_cursor',
+        '_origin',
+        '_lock',
+        '_thread',
+        '_stop_event',
+        '__dict__',
+    )
+
+    def __init__(self, tick_interval: float = 0.05, wheel_size: int = 512):
+        if tick_interval <= 0 or wheel_size < 1:
+            raise ValueError('`tick_interval` and `wheel_size` must be positive')
+        self.tick_interval = tick_interval
+        self.wheel_size = wheel_size
+        self.logger = logging.getLogger(__name__)
+        self._buckets: List[Dict[Hashable, Tuple[float, object]]] = [
+            {} for _ in range(wheel_size)
+        ]
+        # The tick each key expires in, which also locates its bucket
+        self._ticks: Dict[Hashable, int] = {}
+        # The first tick that was not handled yet
+        self._cursor = 0
+        self._origin = time.monotonic()
+        self._lock = Lock()
+        self._thread: Optional[Thread] = None
+        self._stop_event = Event()
+
+    def __len__(self) -> int:
+        return len(self._ticks)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._ticks
+
+    @property
+    def running(self) -> bool:
+        """:obj:`bool`: Whether the thread started by :meth:`start` is running."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def _tick(self, timestamp: float) -> int:
+        return math.floor((timestamp - self._origin) / self.tick_interval)
+
+    def schedule(self, key: Hashable, delay: float, data: object = None) -> float:
+        """Schedules a timeout, replacing a previous timeout with the same key.
+
+        Args:
+            key (:obj:`object`): The key of the timeout.
+            delay (:obj:`float`): The number of seconds until the timeout expires.
+            data (:obj:`object`, optional): Data returned together with the key, when the timeout
+                expires.
+
+        Returns:
+            :obj:`float`: The deadline in terms of :func:`time.monotonic`.
+        """
+        deadline = time.monotonic() + delay
+        with self._lock:
+            old_tick = self._ticks.pop(key, None)
+            if old_tick is not None:
+                del self._buckets[old_tick % self.wheel_size][key]
+            # The first tick starting after the deadline, so that timeouts never expire early
+            tick = max(math.ceil((deadline - self._origin) / self.tick_interval), self._cursor)
+            self._ticks[key] = tick
+            self._buckets[tick % self.wheel_size][key] = (deadline, data)
+        return deadline
+
+    def cancel(self, key: Hashable) -> bool:
+        """Cancels a timeout.
+
+        Args:
+            key (:obj:`object`): The key of the timeout.
+
+        Returns:
+            :obj:`bool`: Whether there was a timeout for the key.
+        """
+        with self._lock:
+            tick = self._ticks.pop(key, None)
+            if tick is None:
+                return False
+            del self._buckets[tick % self.wheel_size][key]
+            return True
+
+    def clear(self) -> None:
+        """Cancels all timeouts."""
+        with self._lock:
+            self._ticks.clear()
+            for bucket in self._buckets:
+                bucket.clear()
+
+    def next_deadline(self) -> Optional[float]:
+        """
+        Returns:
+            :obj:`float`: The earliest deadline in terms of :func:`time.monotonic` or :obj:`None`,
+            if there are no timeouts.
+        """
+        with self._lock:
+            if not self._ticks:
+                return None
+            earliest = min(self._ticks.values())
+            bucket = self._buckets[earliest % self.wheel_size]
+            return min(
+                deadline for key, (deadline, _) in bucket.items() if self._ticks[key] == earliest
+            )
+
+    def expire(self, now: float = None) -> Expired:
+        """Removes the timeouts whose tick has passed.
+
+        Args:
+            now (:obj:`float`, optional): The current time in terms of :func:`time.monotonic`.
+                Defaults to the current time.
+
+        Returns:
+            List[Tuple[:obj:`object`, :obj:`object`]]: The keys and data of the expired timeouts,
+            ordered by their deadline.
+        """
+        if now is None:
+            now = time.monotonic()
+        expired = []
+        with self._lock:
+            current = self._tick(now)
+            if current < self._cursor:
+                return []
+            # After a full revolution, every bucket was visited once
+            for tick in range(max(self._cursor, current - self.wheel_size + 1), current + 1):
+                bucket = self._buckets[tick % self.wheel_size]
+                for key in [key for key in bucket if self._ticks[key] <= current]:
+                    del self._ticks[key]
+                    expired.append((bucket.pop(key), key))
+            self._cursor = current + 1
+        expired.sort(key=lambda item: item[0][0])
+        return [(key, data) for (_, data), key in expired]
+
+    def start(self, callback: Callable[[Expired], object], name: str = None) -> None:
+        """Starts a thread that calls :meth:`expire` every :attr:`tick_interval` seconds and
+        passes the expired timeouts to ``callback``. Exceptions raised by ``callback`` are
+        logged.
+
+        Args:
+            callback (:obj:`callable`): Called with the list returned by :meth:`expire`, if it is
+                not empty.
+            name (:obj:`str`, optional): The name of the thread.
+        """
+        with self._lock:
+            if self.running:
+                return
+            self._stop_event.clear()
+            self._thread = Thread(
+                target=self._run, args=(callback,), name=name or 'Bot:TimerWheel', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self, callback: Callable[[Expired], object]) -> None:
+        while not self._stop_event.wait(self.tick_interval):
+            expired = self.expire()
+            if not expired:
+                continue
+            try:
+                callback(expired)
+            except Exception:
+                self.logger.exception('An uncaught error was raised while handling timeouts')
+
+    def stop(self) -> None:
+        """Stops the thread started by :meth:`start` and waits for it to finish."""
+        self._stop_event.set()
+        thread = self._thread
+        if thread is not None and thread is not current_thread():
+            thread.join()
+        self._thread = None
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the TrackingDict class."""
+import pickle
+from hashlib import blake2b
+from typing import Any, ClassVar, Dict, Iterable, Optional
+
+# Values of these types can't be changed in place
+_PLAIN_TYPES = frozenset((str, bytes, int, float, complex, bool, type(None)))
+
+
+def _fingerprint(value: object) -> Optional[bytes]:
+    # None for values that can't be pickled, which therefore always count as changed
+    try:
+        return blake2b(pickle.dumps(value, pickle.HIGHEST_PROTOCOL), digest_size=16).digest()
+    except Exception:
+        return None
+
+
+class TrackingDict(dict):
+    """A :obj:`dict` that remembers whether it was changed. Use it for ``user_data``,
+    ``chat_data`` and ``bot_data`` via :class:`TeleGenic.ext.ContextTypes`, so that
+    :class:`TeleGenic.ext.Dispatcher` only passes data to the persistence that was actually
+    changed while handling an update. For large data this saves copying and comparing the
+    unchanged data on every update::
+
+        context_types = ContextTypes(
+            user_data=TrackingDict, chat_data=TrackingDict, bot_data=TrackingDict
+        )
+
+    Changes of mutable values stored in the dict, e.g. ``context.user_data['list'].append(1)``,
+    can't be tracked directly. Instead, a fingerprint of the pickled value is kept for every
+    value that is not a :obj:`str`, :obj:`bytes`, number or :obj:`None` and compared by
+    :attr:`changed`. Values that can't be pickled always count as changed.
+
+    Tip:
+        Computing the fingerprints means pickling the mutable values on every
+        :meth:`mark_as_unchanged`. If the dict holds large nested values that are rarely changed,
+        subclass it with :attr:`compare_values` set to :obj:`False` and call
+        :meth:`mark_as_changed` after changing such a value instead.
+
+    .. versionadded:: 13.11
+    """
+
+    compare_values: ClassVar[bool] = True
+    """:obj:`bool`: Whether changes of mutable values are detected by comparing fingerprints.
+    If :obj:`False`, only changes of the dict itself are tracked."""
+
+    __slots__ = ('_changed', '_fingerprints', '__dict__')
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._changed = False
+        self._fingerprints: Dict[Any, Optional[bytes]] = {}
+        self._take_fingerprints()
+
+    def __reduce__(self) -> tuple:
+        # The tracking state is not pickled, restored dicts start as unchanged
+        return self.__class__, (dict(self),)
+
+    def _take_fingerprints(self) -> None:
+        if self.compare_values:
+            self._fingerprints = {
+                key: _fingerprint(value)
+                for key, value in self.items()
+                if type(value) not in _PLAIN_TYPES
+            }
+
+    @property
+    def changed(self) -> bool:
+        """:obj:`bool`: Whether the dict or, if :attr:`compare_values` is set, one of the mutable
+        values stored in it was changed since :meth:`mark_as_unchanged` was called the last time.
+        """
+        if self._changed:
+            return True
+        for key, fingerprint in self._fingerprints.items():
+            # Keys of the dict itself can't have changed, otherwise _changed would be set
+            if fingerprint is None or _fingerprint(self[key]) != fingerprint:
+                return True
+        return False
+
+    def mark_as_changed(self) -> None:
+        """Marks the dict as changed, e.g. after changing a mutable value stored in it."""
+        self._changed = True
+
+    def mark_as_unchanged(self) -> None:
+        """Resets the change tracking. Called by :class:`TeleGenic.ext.Dispatcher` before the
+        data is passed to the persistence.
+        """
+        self._changed = False
+        self._take_fingerprints()
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        super().__setitem__(key, value)
+        self._changed = True
+
+    def __delitem__(self, key: Any) -> None:
+        super().__delitem__(key)
+        self._changed = True
+
+    def __ior__(self, other: Any) -> 'TrackingDict':
+        self.update(other)
+        return self
+
+    def clear(self) -> None:
+        if self:
+            self._changed = True
+        super().clear()
+
+    def pop(self, key: Any, *default: Any) -> Any:
+        if key in self:
+            self._changed = True
+        return super().pop(key, *default)
+
+    def popitem(self) -> Any:
+        item = super().popitem()
+        self._changed = True
+        return item
+
+    def setdefault(self, key: Any, default: Any = None) -> Any:
+        if key not in self:
+            self._changed = True
+        return super().setdefault(key, default)
+
+    def update(self, *args: Iterable, **kwargs: Any) -> None:  # pylint: disable=W0221
+        super().update(*args, **kwargs)
+        self._changed = True
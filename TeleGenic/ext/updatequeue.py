@@ -0,0 +1,484 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the UpdateQueue and PriorityUpdateQueue classes."""
+import heapq
+import itertools
+import logging
+import os
+import pickle
+import struct
+import tempfile
+from queue import Full, Queue
+from time import monotonic
+from typing import TYPE_CHECKING, Callable, ClassVar, Collection, Dict, List, Optional
+
+from TeleGenic import Update
+from TeleGenic.constants import UPDATE_ALL_TYPES
+
+if TYPE_CHECKING:
+    from TeleGenic import Bot
+
+_RECORD_HEADER = struct.Struct('>I')
+_NOTHING = object()
+
+
+def update_type(update: object) -> Optional[str]:
+    """Returns the type of an update, i.e. the name of the attribute of :class:`TeleGenic.Update`
+    that is set, e.g. ``'callback_query'``.
+
+    Args:
+        update (:obj:`object`): The update.
+
+    Returns:
+        :obj:`str` | :obj:`None`: The type or :obj:`None`, if ``update`` is not an
+        :class:`TeleGenic.Update` or has none of the known types.
+    """
+    if not isinstance(update, Update):
+        return None
+    for name in UPDATE_ALL_TYPES:
+        if getattr(update, name, None) is not None:
+            return name
+    return None
+
+
+class UpdateQueue(Queue):
+    """A :obj:`queue.Queue` with an optional upper bound and configurable behaviour when the
+    bound is reached. Pass it as ``update_queue`` to :class:`TeleGenic.ext.Updater` to keep the
+    memory used by pending updates predictable during floods.
+
+    With :attr:`BLOCK`, the updater waits with fetching new updates until there is space in the
+    queue again and the webhook server answers with ``503 Service Unavailable``, so that
+    TeleGenic redelivers the update later. With any of the other policies, :meth:`put` never blocks.
+
+    .. versionadded:: 13.11
+
+    Args:
+        maxsize (:obj:`int`, optional): The maximum number of updates kept in memory. ``0`` means
+            that the queue is unbounded. Defaults to ``0``.
+        overflow (:obj:`str`, optional): What to do with new updates if the queue is full. One of
+            :attr:`BLOCK`, :attr:`DROP_OLDEST`, :attr:`DROP_TYPES` and :attr:`SPILL`. Defaults to
+            :attr:`BLOCK`.
+        drop_types (Collection[:obj:`str`], optional): The update types that may be dropped, if
+            ``overflow`` is :attr:`DROP_TYPES`, e.g. ``['chat_member', 'poll']``. See
+            :attr:`TeleGenic.constants.UPDATE_ALL_TYPES`.
+        spill_path (:obj:`str`, optional): Path of the file that updates are written to, if
+            ``overflow`` is :attr:`SPILL`. Defaults to a temporary file.
+
+    Attributes:
+        overflow (:obj:`str`): What to do with new updates if the queue is full.
+        drop_types (FrozenSet[:obj:`str`]): The update types that may be dropped.
+        dropped (:obj:`int`): The number of updates that were dropped so far.
+
+    """
+
+    BLOCK: ClassVar[str] = 'block'
+    """:obj:`str`: Block :meth:`put` until there is space in the queue."""
+    DROP_OLDEST: ClassVar[str] = 'drop_oldest'
+    """:obj:`str`: Drop the oldest update in the queue to make space for the new one."""
+    DROP_TYPES: ClassVar[str] = 'drop_types'
+    """:obj:`str`: Drop the new update, if its type is one of :attr:`drop_types`. Otherwise, drop
+    the oldest update in the queue with one of these types. If there is none, block."""
+    SPILL: ClassVar[str] = 'spill'
+    """:obj:`str`: Write new updates to disk and read them back when there is space in memory
+    again. Updates are rebuilt with the bot passed to :meth:`set_bot`."""
+
+    __slots__ = (
+        'overflow',
+        'drop_types',
+        'dropped',
+        'bot',
+        'logger',
+        '_spill_path',
+        '_spill_file',
+        '_spill_read_offset',
+        '_spilled',
+    )
+
+    def __init__(
+        self,
+        maxsize: int = 0,
+        overflow: str = BLOCK,
+        drop_types: Collection[str] = None,
+        spill_path: str = None,
+    ):
+        if overflow not in (self.BLOCK, self.DROP_OLDEST, self.DROP_TYPES, self.SPILL):
+            raise ValueError(f'Unknown overflow policy {overflow!r}')
+        if overflow == self.DROP_TYPES and not drop_types:
+            raise ValueError('drop_types must be passed for the drop_types policy')
+        super().__init__(maxsize)
+        self.overflow = overflow
+        self.drop_types = frozenset(drop_types or ())
+        self.dropped = 0
+        self.bot: Optional['Bot'] = None
+        self.logger = logging.getLogger(__name__)
+        self._spill_path = spill_path
+        self._spill_file = None
+        self._spill_read_offset = 0
+        self._spilled = 0
+
+    def set_bot(self, bot: 'Bot') -> None:
+        """Sets the bot that is used to rebuild updates that were spilled to disk.
+
+        Args:
+            bot (:class:`TeleGenic.Bot`): The bot.
+        """
+        self.bot = bot
+
+    @property
+    def congested(self) -> bool:
+        """:obj:`bool`: Whether a call to :meth:`put` would currently block."""
+        with self.mutex:
+            return self.overflow == self.BLOCK and 0 < self.maxsize <= self._qsize()
+
+    @property
+    def spilled(self) -> int:
+        """:obj:`int`: The number of updates that are currently stored on disk."""
+        return self._spilled
+
+    def wait_for_space(self, timeout: float = None) -> bool:
+        """Blocks until :attr:`congested` is :obj:`False`.
+
+        Args:
+            timeout (:obj:`float`, optional): Maximum time in seconds to wait. ``None`` means
+                indefinite. Default is ``None``.
+
+        Returns:
+            :obj:`bool`: Whether the queue has space.
+        """
+        with self.not_full:
+            return self.not_full.wait_for(
+                lambda: not (self.overflow == self.BLOCK and 0 < self.maxsize <= self._qsize()),
+                timeout,
+            )
+
+    def put(self, item: object, block: bool = True, timeout: float = None) -> None:
+        """Puts an update into the queue. If the queue is full, the :attr:`overflow` policy
+        is applied.
+
+        Args:
+            item (:class:`TeleGenic.Update` | :obj:`object`): The update.
+            block (:obj:`bool`, optional): Whether to block if the policy requires to wait for
+                space. Defaults to :obj:`True`.
+            timeout (:obj:`float`, optional): Maximum time in seconds to block. ``None`` means
+                indefinite. Default is ``None``.
+
+        Raises:
+            :class:`queue.Full`: If there was no space within the ``timeout`` or ``block`` is
+                :obj:`False` and the policy requires to wait for space.
+
+        """
+        if self.maxsize <= 0 or self.overflow == self.BLOCK:
+            super().put(item, block=block, timeout=timeout)
+            return
+
+        with self.not_full:
+            if self.overflow != self.SPILL and self._memory_size() >= self.maxsize:
+                if not self._make_room(item):
+                    # The new update was dropped
+                    return
+                self._wait_for_room(block, timeout)
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def _make_room(self, item: object) -> bool:
+        # Returns False, if `item` should be dropped instead
+        if self.overflow == self.DROP_OLDEST:
+            self._drop_first(lambda queued: True)
+            return True
+
+        if update_type(item) in self.drop_types:
+            self._count_drop(item)
+            return False
+        self._drop_first(lambda queued: update_type(queued) in self.drop_types)
+        return True
+
+    def _wait_for_room(self, block: bool, timeout: Optional[float]) -> None:
+        # Only reached for the drop_types policy, if no update could be dropped
+        if self._memory_size() < self.maxsize:
+            return
+        if not block:
+            raise Full
+        if timeout is None:
+            while self._memory_size() >= self.maxsize:
+                self.not_full.wait()
+        elif timeout < 0:
+            raise ValueError("'timeout' must be a non-negative number")
+        else:
+            endtime = monotonic() + timeout
+            while self._memory_size() >= self.maxsize:
+                remaining = endtime - monotonic()
+                if remaining <= 0.0:
+                    raise Full
+                self.not_full.wait(remaining)
+
+    def _drop_first(self, predicate: Callable[[object], bool]) -> None:
+        # Drops the oldest queued update for which predicate returns True, if any
+        dropped = self._remove_first(predicate)
+        if dropped is _NOTHING:
+            return
+        self._count_drop(dropped)
+        # The dropped update will never be marked as done by a consumer
+        self.unfinished_tasks -= 1
+        if self.unfinished_tasks == 0:
+            self.all_tasks_done.notify_all()
+
+    def _count_drop(self, item: object) -> None:
+        self.dropped += 1
+        self.logger.debug('Update queue is full, dropping %s', item)
+
+    # The following methods are called while holding the mutex. Subclasses that store the
+    # updates differently have to override them along with _init, _put and _get
+
+    def _memory_size(self) -> int:
+        return len(self.queue)
+
+    def _remove_first(self, predicate: Callable[[object], bool]) -> object:
+        for index, queued in enumerate(self.queue):
+            if predicate(queued):
+                del self.queue[index]
+                return queued
+        return _NOTHING
+
+    def _qsize(self) -> int:
+        return self._memory_size() + self._spilled
+
+    def _put(self, item: object) -> None:
+        if self.overflow == self.SPILL and (
+            self._spilled or self._memory_size() >= self.maxsize > 0
+        ):
+            # Once updates are spilled, all new updates have to be spilled as well to keep the
+            # order
+            self._spill(item)
+        else:
+            self.queue.append(item)
+
+    def _get(self) -> object:
+        item = self.queue.popleft()
+        if self._spilled:
+            self.queue.append(self._unspill())
+        return item
+
+    def _spill(self, item: object) -> None:
+        if self._spill_file is None:
+            if self._spill_path is None:
+                fd, self._spill_path = tempfile.mkstemp(prefix='update_queue_', suffix='.spill')
+                os.close(fd)
+            # pylint: disable=R1732
+            self._spill_file = open(self._spill_path, 'w+b')
+            self._spill_read_offset = 0
+
+        if isinstance(item, Update):
+            # Updates reference the bot, which can't be pickled
+            record = pickle.dumps((True, item.to_dict()), protocol=pickle.HIGHEST_PROTOCOL)
+        else:
+            record = pickle.dumps((False, item), protocol=pickle.HIGHEST_PROTOCOL)
+        self._spill_file.seek(0, os.SEEK_END)
+        self._spill_file.write(_RECORD_HEADER.pack(len(record)))
+        self._spill_file.write(record)
+        self._spilled += 1
+
+    def _unspill(self) -> object:
+        spill_file = self._spill_file
+        spill_file.seek(self._spill_read_offset)  # type: ignore[union-attr]
+        (length,) = _RECORD_HEADER.unpack(
+            spill_file.read(_RECORD_HEADER.size)  # type: ignore[union-attr]
+        )
+        is_update, data = pickle.loads(spill_file.read(length))  # type: ignore[union-attr]
+        self._spill_read_offset += _RECORD_HEADER.size + length
+        self._spilled -= 1
+
+        if not self._spilled:
+            # Everything was read back, so the file can start from scratch
+            spill_file.seek(0)  # type: ignore[union-attr]
+            spill_file.truncate()  # type: ignore[union-attr]
+            self._spill_read_offset = 0
+
+        return Update.de_json(data, self.bot) if is_update else data  # type: ignore[arg-type]
+
+    def close(self) -> None:
+        """Closes and removes the spill file, if any. Updates that are still stored on disk are
+        lost.
+        """
+        with self.mutex:
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+                os.remove(self._spill_path)  # type: ignore[arg-type]
+            self._spilled = 0
+
+
+class PriorityUpdateQueue(UpdateQueue):
+    """An :class:`UpdateQueue` that hands out updates ordered by their type instead of the order
+    they arrived in, so that latency sensitive updates like callback queries are not delayed by
+    a backlog of e.g. ``chat_member`` updates. Updates of the same priority are handed out in
+    the order they arrived in.
+
+    To make sure that updates with a low priority are not starved by a steady stream of updates
+    with a higher priority, every :attr:`starvation_interval`-th call of :meth:`get` returns the
+    oldest update in the queue regardless of its priority.
+
+    Pass it as ``update_queue`` to :class:`TeleGenic.ext.Updater` or
+    :class:`TeleGenic.ext.Dispatcher`.
+
+    Note:
+        The :attr:`SPILL` policy is not supported. With :attr:`DROP_OLDEST`, the update that
+        arrived first is dropped, regardless of its priority.
+
+    .. versionadded:: 13.11
+
+    Args:
+        maxsize (:obj:`int`, optional): The maximum number of updates kept in memory. ``0`` means
+            that the queue is unbounded. Defaults to ``0``.
+        overflow (:obj:`str`, optional): What to do with new updates if the queue is full. One of
+            :attr:`BLOCK`, :attr:`DROP_OLDEST` and :attr:`DROP_TYPES`. Defaults to :attr:`BLOCK`.
+        drop_types (Collection[:obj:`str`], optional): The update types that may be dropped, if
+            ``overflow`` is :attr:`DROP_TYPES`.
+        priorities (Dict[:obj:`str`, :obj:`int`], optional): The priority of each update type.
+            Lower values are handed out first. Defaults to :attr:`DEFAULT_PRIORITIES`.
+        default_priority (:obj:`int`, optional): The priority of updates whose type is not
+            contained in ``priorities`` and of objects that are not updates. Defaults to ``1``.
+        starvation_interval (:obj:`int`, optional): Every how many calls of :meth:`get` the oldest
+            update is returned. ``0`` disables the starvation protection. Defaults to ``10``.
+
+    Attributes:
+        priorities (Dict[:obj:`str`, :obj:`int`]): The priority of each update type.
+        default_priority (:obj:`int`): The priority of all other updates.
+        starvation_interval (:obj:`int`): Every how many calls of :meth:`get` the oldest
+            update is returned.
+
+    """
+
+    DEFAULT_PRIORITIES: ClassVar[Dict[str, int]] = {
+        Update.CALLBACK_QUERY: 0,
+        Update.INLINE_QUERY: 0,
+        Update.PRE_CHECKOUT_QUERY: 0,
+        Update.SHIPPING_QUERY: 0,
+        Update.POLL: 2,
+        Update.POLL_ANSWER: 2,
+        Update.MY_CHAT_MEMBER: 2,
+        Update.CHAT_MEMBER: 2,
+        Update.CHAT_JOIN_REQUEST: 2,
+    }
+    """Dict[:obj:`str`, :obj:`int`]: Queries that have to be answered quickly come first, updates
+    about polls and chat members come last. Everything else uses :attr:`default_priority`."""
+
+    __slots__ = (
+        'priorities',
+        'default_priority',
+        'starvation_interval',
+        '_heap',
+        '_size',
+        '_sequence',
+        '_gets',
+    )
+
+    def __init__(
+        self,
+        maxsize: int = 0,
+        overflow: str = UpdateQueue.BLOCK,
+        drop_types: Collection[str] = None,
+        priorities: Dict[str, int] = None,
+        default_priority: int = 1,
+        starvation_interval: int = 10,
+    ):
+        if overflow == self.SPILL:
+            raise ValueError('PriorityUpdateQueue does not support the spill policy')
+        if starvation_interval < 0:
+            raise ValueError('starvation_interval must not be negative')
+        self.priorities = dict(self.DEFAULT_PRIORITIES if priorities is None else priorities)
+        self.default_priority = default_priority
+        self.starvation_interval = starvation_interval
+        super().__init__(maxsize, overflow=overflow, drop_types=drop_types)
+
+    def priority_of(self, update: object) -> int:
+        """Returns the priority of an update.
+
+        Args:
+            update (:class:`TeleGenic.Update` | :obj:`object`): The update.
+
+        Returns:
+            :obj:`int`: The priority. Lower values are handed out first.
+        """
+        return self.priorities.get(update_type(update), self.default_priority)  # type: ignore
+
+    # Each entry is a list [priority, sequence number, item] that is referenced both by the heap
+    # and by self.queue, which keeps the arrival order. Entries that were taken from one of them
+    # are marked by replacing the item with _NOTHING and skipped when they show up in the other.
+
+    def _init(self, maxsize: int) -> None:
+        super()._init(maxsize)
+        self._heap: List[list] = []
+        self._size = 0
+        self._sequence = itertools.count()
+        self._gets = 0
+
+    def _memory_size(self) -> int:
+        return self._size
+
+    def _remove_first(self, predicate: Callable[[object], bool]) -> object:
+        for entry in self.queue:
+            if entry[2] is not _NOTHING and predicate(entry[2]):
+                return self._take(entry)
+        return _NOTHING
+
+    def _put(self, item: object) -> None:
+        entry = [self.priority_of(item), next(self._sequence), item]
+        heapq.heappush(self._heap, entry)
+        self.queue.append(entry)
+        self._size += 1
+
+    def _get(self) -> object:
+        self._gets += 1
+        if self.starvation_interval and self._gets % self.starvation_interval == 0:
+            entries = self.queue
+            while entries[0][2] is _NOTHING:
+                entries.popleft()
+            entry = entries.popleft()
+        else:
+            while self._heap[0][2] is _NOTHING:
+                heapq.heappop(self._heap)
+            entry = heapq.heappop(self._heap)
+
+        item = self._take(entry)
+        # Drop stale entries from the front of the arrival order, so that it doesn't grow
+        # while most updates are taken from the heap
+        while self.queue and self.queue[0][2] is _NOTHING:
+            self.queue.popleft()
+        return item
+
+    def _take(self, entry: list) -> object:
+        item = entry[2]
+        entry[2] = _NOTHING
+        self._size -= 1
+        if not self._size:
+            self._heap.clear()
+            self.queue.clear()
+        else:
+            if len(self._heap) > 2 * self._size + 32:
+                # Low priority entries taken in arrival order would otherwise pile up in the heap
+                self._heap = [entry for entry in self._heap if entry[2] is not _NOTHING]
+                heapq.heapify(self._heap)
+            if len(self.queue) > 2 * self._size + 32:
+                # Likewise for entries taken from the heap, which are only dropped from the front
+                # of the arrival order, while an older update waits there
+                live = [entry for entry in self.queue if entry[2] is not _NOTHING]
+                self.queue.clear()
+                self.queue.extend(live)
+        return item
@@ -19,7 +19,6 @@
 """This module contains the class Updater, which tries to make creating TeleGenic bots intuitive."""
 
 import logging
-import ssl
 import warnings
 from queue import Queue
 from signal import SIGABRT, SIGINT, SIGTERM, signal
@@ -39,14 +38,22 @@ from typing import (
     overload,
 )
 
-from TeleGenic import Bot, TeleGenicError
+from TeleGenic import Bot, TeleGenicError, Update
 from TeleGenic.error import InvalidToken, RetryAfter, TimedOut, Unauthorized
 from TeleGenic.ext import Dispatcher, JobQueue, ContextTypes, ExtBot
+from TeleGenic.ext.retryscheduler import RetryScheduler
+from TeleGenic.ext.updatequeue import UpdateQueue
 from TeleGenic.utils.deprecate import TeleGenicDeprecationWarning, set_new_attribute_deprecated
 from TeleGenic.utils.helpers import get_signal_name, DEFAULT_FALSE, DefaultValue
 from TeleGenic.utils.request import Request
 from TeleGenic.ext.utils.types import CCT, UD, CD, BD
-from TeleGenic.ext.utils.webhookhandler import WebhookAppClass, WebhookServer
+from TeleGenic.ext.utils.webhookhandler import (
+    MultiProcessWebhookServer,
+    WebhookAppClass,
+    WebhookDecoder,
+    WebhookServer,
+    create_ssl_context,
+)
 
 if TYPE_CHECKING:
     from TeleGenic.ext import BasePersistence, Defaults, CallbackContext
@@ -77,6 +84,12 @@ class Updater(Generic[CCT, UD, CD, BD]):
         base_file_url (:obj:`str`, optional): Base_file_url for the bot.
         workers (:obj:`int`, optional): Amount of threads in the thread pool for functions
             decorated with ``@run_async`` (ignored if `dispatcher` argument is used).
+        max_workers (:obj:`int`, optional): Maximum number of threads in the thread pool. If
+            greater than ``workers``, the pool grows and shrinks with the load. See
+            :class:`TeleGenic.ext.Dispatcher` (ignored if `dispatcher` argument is used).
+            Defaults to ``workers``.
+
+            .. versionadded:: 13.11
         bot (:class:`TeleGenic.Bot`, optional): A pre-initialized bot instance (ignored if
             `dispatcher` argument is used). If a pre-initialized bot is used, it is the user's
             responsibility to create it using a `Request` instance with a large enough connection
@@ -113,6 +126,11 @@ class Updater(Generic[CCT, UD, CD, BD]):
             :class:`TeleGenic.ext.ContextTypes` will be used.
 
             .. versionadded:: 13.6
+        update_queue (:obj:`Queue`, optional): The queue to put the updates into (ignored if
+            `dispatcher` argument is used). Pass a :class:`TeleGenic.ext.UpdateQueue` to bound the
+            number of pending updates. Defaults to an unbounded :obj:`queue.Queue`.
+
+            .. versionadded:: 13.11
 
     Raises:
         ValueError: If both :attr:`token` and :attr:`bot` are passed or none of them.
@@ -130,6 +148,11 @@ class Updater(Generic[CCT, UD, CD, BD]):
         persistence (:class:`TeleGenic.ext.BasePersistence`): Optional. The persistence class to
             store data that should be persistent over restarts.
         use_context (:obj:`bool`): Optional. :obj:`True` if using context based callbacks.
+        retry_scheduler (:class:`TeleGenic.ext.RetryScheduler`): Decides how long to wait after
+            errors while polling. Its :attr:`~TeleGenic.ext.RetryScheduler.state` tells whether
+            the connection to TeleGenic works. Its settings may be changed before polling starts.
+
+            .. versionadded:: 13.11
 
     """
 
@@ -147,6 +170,7 @@ class Updater(Generic[CCT, UD, CD, BD]):
         '_request',
         'is_idle',
         'httpd',
+        'retry_scheduler',
         '__lock',
         '__threads',
         '__dict__',
@@ -168,6 +192,8 @@ class Updater(Generic[CCT, UD, CD, BD]):
         use_context: bool = True,
         base_file_url: str = None,
         arbitrary_callback_data: Union[DefaultValue, bool, int, None] = DEFAULT_FALSE,
+        update_queue: Queue = None,
+        max_workers: int = None,
     ):
         ...
 
@@ -188,6 +214,8 @@ class Updater(Generic[CCT, UD, CD, BD]):
         base_file_url: str = None,
         arbitrary_callback_data: Union[DefaultValue, bool, int, None] = DEFAULT_FALSE,
         context_types: ContextTypes[CCT, UD, CD, BD] = None,
+        update_queue: Queue = None,
+        max_workers: int = None,
     ):
         ...
 
@@ -216,6 +244,8 @@ class Updater(Generic[CCT, UD, CD, BD]):
         base_file_url: str = None,
         arbitrary_callback_data: Union[DefaultValue, bool, int, None] = DEFAULT_FALSE,
         context_types: ContextTypes[CCT, UD, CD, BD] = None,
+        update_queue: Queue = None,
+        max_workers: int = None,
     ):
 
         if defaults and bot:
@@ -250,12 +280,16 @@ class Updater(Generic[CCT, UD, CD, BD]):
                 raise ValueError('`dispatcher` and `context_types` are mutually exclusive')
             if workers is not None:
                 raise ValueError('`dispatcher` and `workers` are mutually exclusive')
+            if update_queue is not None:
+                raise ValueError('`dispatcher` and `update_queue` are mutually exclusive')
+            if max_workers is not None:
+                raise ValueError('`dispatcher` and `max_workers` are mutually exclusive')
 
         self.logger = logging.getLogger(__name__)
         self._request = None
 
         if dispatcher is None:
-            con_pool_size = workers + 4
+            con_pool_size = (workers if max_workers is None else max_workers) + 4
 
             if bot is not None:
                 self.bot = bot
@@ -290,15 +324,16 @@ class Updater(Generic[CCT, UD, CD, BD]):
                         else arbitrary_callback_data
                     ),
                 )
-            self.update_queue: Queue = Queue()
+            self.update_queue: Queue = update_queue if update_queue is not None else Queue()
             self.job_queue = JobQueue()
             self.__exception_event = Event()
             self.persistence = persistence
-            self.dispatcher = Dispatcher(
+            self.dispatcher = self._create_dispatcher(
                 self.bot,
                 self.update_queue,
                 job_queue=self.job_queue,
                 workers=workers,
+                max_workers=max_workers,
                 exception_event=self.__exception_event,
                 persistence=persistence,
                 use_context=use_context,
@@ -306,7 +341,7 @@ class Updater(Generic[CCT, UD, CD, BD]):
             )
             self.job_queue.set_dispatcher(self.dispatcher)
         else:
-            con_pool_size = dispatcher.workers + 4
+            con_pool_size = dispatcher.max_workers + 4
 
             self.bot = dispatcher.bot
             if self.bot.request.con_pool_size < con_pool_size:
@@ -320,14 +355,22 @@ class Updater(Generic[CCT, UD, CD, BD]):
             self.job_queue = dispatcher.job_queue
             self.dispatcher = dispatcher
 
+        if isinstance(self.update_queue, UpdateQueue):
+            self.update_queue.set_bot(self.bot)
+
         self.user_sig_handler = user_sig_handler
         self.last_update_id = 0
         self.running = False
         self.is_idle = False
         self.httpd = None
+        self.retry_scheduler = RetryScheduler()
         self.__lock = Lock()
         self.__threads: List[Thread] = []
 
+    def _create_dispatcher(self, *args: Any, **kwargs: Any) -> Dispatcher[CCT, UD, CD, BD]:
+        # Subclasses may override this to use a different kind of dispatcher
+        return Dispatcher(*args, **kwargs)
+
     def __setattr__(self, key: str, value: object) -> None:
         if key.startswith('__'):
             key = f"_{self.__class__.__name__}{key}"
@@ -366,6 +409,7 @@ class Updater(Generic[CCT, UD, CD, BD]):
         read_latency: float = 2.0,
         allowed_updates: List[str] = None,
         drop_pending_updates: bool = None,
+        pipelined: bool = False,
     ) -> Optional[Queue]:
         """Starts polling updates from TeleGenic.
 
@@ -393,6 +437,19 @@ class Updater(Generic[CCT, UD, CD, BD]):
             read_latency (:obj:`float` | :obj:`int`, optional): Grace time in seconds for receiving
                 the reply from server. Will be added to the ``timeout`` value and used as the read
                 timeout from server (Default: ``2``).
+            pipelined (:obj:`bool`, optional): Pass :obj:`True` to convert the fetched updates to
+                :class:`TeleGenic.Update` objects on a separate thread, while the next request
+                to :meth:`TeleGenic.Bot.get_updates` is already running. This reduces the latency
+                when receiving many updates. Defaults to :obj:`False`.
+
+                Note:
+                    Updates are delivered at most once in this mode: the offset for the next
+                    request is advanced before the updates are converted. If converting an update
+                    fails, it is not fetched again. Instead, a :class:`TeleGenic.TeleGenicError`
+                    caused by the original exception is passed to the error handlers of the
+                    dispatcher, along with the ``update_id`` in its message.
+
+                .. versionadded:: 13.11
 
         Returns:
             :obj:`Queue`: The update queue that can be filled from the main thread.
@@ -420,17 +477,30 @@ class Updater(Generic[CCT, UD, CD, BD]):
                 dispatcher_ready = Event()
                 polling_ready = Event()
                 self._init_thread(self.dispatcher.start, "dispatcher", ready=dispatcher_ready)
-                self._init_thread(
-                    self._start_polling,
-                    "updater",
+                polling_args: Tuple = (
                     poll_interval,
                     timeout,
                     read_latency,
                     bootstrap_retries,
                     drop_pending_updates,
                     allowed_updates,
-                    ready=polling_ready,
                 )
+                if pipelined:
+                    # A few batches of up to 100 updates each, so that the polling waits if
+                    # converting the updates can't keep up
+                    decode_queue: Queue = Queue(maxsize=4)
+                    self._init_thread(self._decode_updates, "decoder", decode_queue)
+                    self._init_thread(
+                        self._start_pipelined_polling,
+                        "updater",
+                        decode_queue,
+                        *polling_args,
+                        ready=polling_ready,
+                    )
+                else:
+                    self._init_thread(
+                        self._start_polling, "updater", *polling_args, ready=polling_ready
+                    )
 
                 self.logger.debug('Waiting for Dispatcher and polling to start')
                 dispatcher_ready.wait()
@@ -455,6 +525,9 @@ class Updater(Generic[CCT, UD, CD, BD]):
         drop_pending_updates: bool = None,
         ip_address: str = None,
         max_connections: int = 40,
+        decode_workers: int = 0,
+        decode_batch_size: int = 1,
+        processes: int = 1,
     ) -> Optional[Queue]:
         """
         Starts a small http server to listen for updates via webhook. If :attr:`cert`
@@ -507,6 +580,28 @@ class Updater(Generic[CCT, UD, CD, BD]):
                 :meth:`TeleGenic.Bot.set_webhook`.
 
                 .. versionadded:: 13.6
+            decode_workers (:obj:`int`, optional): Pass a positive number to answer webhook
+                requests right away and convert their data to :class:`TeleGenic.Update` objects on
+                that many worker threads. Otherwise, this happens on the thread of the webhook
+                server before answering the request, which delays all other requests. Note that
+                with more than one worker, updates may be processed in a different order than they
+                were received. Defaults to ``0``.
+
+                .. versionadded:: 13.11
+            decode_batch_size (:obj:`int`, optional): The maximum number of requests a worker
+                converts at once before putting the updates into the update queue. Only relevant,
+                if ``decode_workers`` is passed. Defaults to ``1``.
+
+                .. versionadded:: 13.11
+            processes (:obj:`int`, optional): The number of processes running the webhook
+                server. Pass a number greater than one to handle TLS, HTTP and JSON parsing on
+                several CPU cores. The processes share the port via ``SO_REUSEPORT`` and forward
+                the received data to this process. They are started with the ``spawn`` method,
+                so the main module of your bot must be guarded by
+                ``if __name__ == '__main__':``. ``decode_workers`` is ignored in this case.
+                Defaults to ``1``.
+
+                .. versionadded:: 13.11
 
         Returns:
             :obj:`Queue`: The update queue that can be filled from the main thread.
@@ -557,6 +652,9 @@ class Updater(Generic[CCT, UD, CD, BD]):
                     ready=webhook_ready,
                     ip_address=ip_address,
                     max_connections=max_connections,
+                    decode_workers=decode_workers,
+                    decode_batch_size=decode_batch_size,
+                    processes=processes,
                 )
 
                 self.logger.debug('Waiting for Dispatcher and Webhook to start')
@@ -576,11 +674,13 @@ class Updater(Generic[CCT, UD, CD, BD]):
         bootstrap_retries,
         drop_pending_updates,
         allowed_updates,
+        decode_queue=None,
         ready=None,
     ):  # pragma: no cover
         # Thread target of thread 'updater'. Runs in background, pulls
         # updates from TeleGenic and inserts them in the update queue of the
-        # Dispatcher.
+        # Dispatcher. If decode_queue is passed, the updates are passed to the thread 'decoder'
+        # instead.
 
         self.logger.debug('Updater thread started (polling)')
 
@@ -594,12 +694,20 @@ class Updater(Generic[CCT, UD, CD, BD]):
         self.logger.debug('Bootstrap done')
 
         def polling_action_cb():
+            # Apply backpressure: Don't fetch more updates than the queue can take
+            if not self._wait_for_queue_space():
+                return True
+
+            if decode_queue is not None:
+                return polling_json_action_cb()
+
             updates = self.bot.get_updates(
                 self.last_update_id,
-                timeout=timeout,
+                timeout=self.retry_scheduler.poll_timeout(timeout),
                 read_latency=read_latency,
                 allowed_updates=allowed_updates,
             )
+            self.retry_scheduler.record_batch(len(updates))
 
             if updates:
                 if not self.running:
@@ -611,6 +719,26 @@ class Updater(Generic[CCT, UD, CD, BD]):
 
             return True
 
+        def polling_json_action_cb():
+            updates = self.bot._get_updates_json(  # pylint: disable=W0212
+                self.last_update_id,
+                timeout=self.retry_scheduler.poll_timeout(timeout),
+                read_latency=read_latency,
+                allowed_updates=allowed_updates,
+            )
+            self.retry_scheduler.record_batch(len(updates))
+
+            if updates:
+                if not self.running:
+                    self.logger.debug('Updates ignored and will be pulled again on restart')
+                else:
+                    # The offset only depends on the IDs, so the next request doesn't have to
+                    # wait for the conversion
+                    decode_queue.put(updates)
+                    self.last_update_id = updates[-1]['update_id'] + 1
+
+            return True
+
         def polling_onerr_cb(exc):
             # Put the error into the update queue and let the Dispatcher
             # broadcast it
@@ -620,11 +748,54 @@ class Updater(Generic[CCT, UD, CD, BD]):
             ready.set()
 
         self._network_loop_retry(
-            polling_action_cb, polling_onerr_cb, 'getting Updates', poll_interval
+            polling_action_cb,
+            polling_onerr_cb,
+            'getting Updates',
+            poll_interval,
+            self.retry_scheduler,
         )
 
+    def _start_pipelined_polling(self, decode_queue: Queue, *args: object, **kwargs: Any) -> None:
+        # Thread target of thread 'updater' in pipelined polling mode
+        try:
+            self._start_polling(*args, decode_queue=decode_queue, **kwargs)
+        finally:
+            # Lets the thread 'decoder' end after converting the remaining updates
+            decode_queue.put(None)
+
+    def _decode_updates(self, decode_queue: Queue) -> None:
+        # Thread target of thread 'decoder'. Converts the updates fetched by the thread 'updater'
+        # in pipelined polling mode and inserts them in the update queue of the Dispatcher.
+        while True:
+            updates = decode_queue.get()
+            if updates is None:
+                break
+            for data in updates:
+                try:
+                    update = Update.de_json(data, self.bot)
+                    if isinstance(self.bot, ExtBot):
+                        self.bot.insert_callback_data(update)
+                except Exception as exc:
+                    # The update is not fetched again, as the offset was advanced already. Let
+                    # the error handlers know about it, like about errors while fetching
+                    update_id = data.get('update_id')
+                    self.logger.exception('Failed to convert update %s', update_id)
+                    error = TeleGenicError(f'Failed to convert update {update_id}: {exc!r}')
+                    error.__cause__ = exc
+                    self.update_queue.put(error)
+                    continue
+                self.update_queue.put(update)
+
+    def _wait_for_queue_space(self) -> bool:
+        # Returns whether there is space in the update queue. Gives up after a second, so that
+        # stopping the updater is not delayed
+        if isinstance(self.update_queue, UpdateQueue) and self.update_queue.congested:
+            self.logger.debug('Update queue is full, waiting before fetching new updates')
+            return self.update_queue.wait_for_space(timeout=1)
+        return True
+
     @no_type_check
-    def _network_loop_retry(self, action_cb, onerr_cb, description, interval):
+    def _network_loop_retry(self, action_cb, onerr_cb, description, interval, scheduler=None):
         """Perform a loop calling `action_cb`, retrying after network errors.
 
         Stop condition for loop: `self.running` evaluates :obj:`False` or return value of
@@ -637,45 +808,39 @@ class Updater(Generic[CCT, UD, CD, BD]):
             description (:obj:`str`): Description text to use for logs and exception raised.
             interval (:obj:`float` | :obj:`int`): Interval to sleep between each call to
                 `action_cb`.
+            scheduler (:class:`TeleGenic.ext.RetryScheduler`, optional): Decides how long to sleep
+                after errors. Defaults to a new scheduler.
 
         """
         self.logger.debug('Start network loop retry %s', description)
-        cur_interval = interval
+        if scheduler is None:
+            scheduler = RetryScheduler()
+        scheduler.interval = interval
         while self.running:
+            scheduler.before_request()
             try:
                 if not action_cb():
+                    scheduler.record_success()
                     break
             except RetryAfter as exc:
                 self.logger.info('%s', exc)
-                cur_interval = 0.5 + exc.retry_after
+                cur_interval = scheduler.record_failure(exc)
             except TimedOut as toe:
                 self.logger.debug('Timed out %s: %s', description, toe)
-                # If failure is due to timeout, we should retry asap.
-                cur_interval = 0
+                cur_interval = scheduler.record_failure(toe)
             except InvalidToken as pex:
                 self.logger.error('Invalid token; aborting')
                 raise pex
             except TeleGenicError as TeleGenic_exc:
                 self.logger.error('Error while %s: %s', description, TeleGenic_exc)
                 onerr_cb(TeleGenic_exc)
-                cur_interval = self._increase_poll_interval(cur_interval)
+                cur_interval = scheduler.record_failure(TeleGenic_exc)
             else:
-                cur_interval = interval
+                cur_interval = scheduler.record_success()
 
             if cur_interval:
                 sleep(cur_interval)
 
-    @staticmethod
-    def _increase_poll_interval(current_interval: float) -> float:
-        # increase waiting times on subsequent errors up to 30secs
-        if current_interval == 0:
-            current_interval = 1
-        elif current_interval < 30:
-            current_interval *= 1.5
-        else:
-            current_interval = min(30.0, current_interval)
-        return current_interval
-
     @no_type_check
     def _start_webhook(
         self,
@@ -691,33 +856,33 @@ class Updater(Generic[CCT, UD, CD, BD]):
         ready=None,
         ip_address=None,
         max_connections: int = 40,
+        decode_workers: int = 0,
+        decode_batch_size: int = 1,
+        processes: int = 1,
     ):
         self.logger.debug('Updater thread started (webhook)')
 
-        # Note that we only use the SSL certificate for the WebhookServer, if the key is also
-        # present. This is because the WebhookServer may not actually be in charge of performing
-        # the SSL handshake, e.g. in case a reverse proxy is used
-        use_ssl = cert is not None and key is not None
-
         if not url_path.startswith('/'):
             url_path = f'/{url_path}'
 
-        # Create Tornado app instance
-        app = WebhookAppClass(url_path, self.bot, self.update_queue)
+        decoder = None
+        if decode_workers and processes <= 1:
+            decoder = WebhookDecoder(
+                self.bot, self.update_queue, workers=decode_workers, batch_size=decode_batch_size
+            )
 
         # Form SSL Context
-        # An SSLError is raised if the private key does not match with the certificate
-        if use_ssl:
-            try:
-                ssl_ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
-                ssl_ctx.load_cert_chain(cert, key)
-            except ssl.SSLError as exc:
-                raise TeleGenicError('Invalid SSL Certificate') from exc
-        else:
-            ssl_ctx = None
+        ssl_ctx = create_ssl_context(cert, key)
 
         # Create and start server
-        self.httpd = WebhookServer(listen, port, app, ssl_ctx)
+        if processes > 1:
+            self.httpd = MultiProcessWebhookServer(
+                listen, port, url_path, self.bot, self.update_queue, processes, cert, key
+            )
+        else:
+            # Create Tornado app instance
+            app = WebhookAppClass(url_path, self.bot, self.update_queue, decoder)
+            self.httpd = WebhookServer(listen, port, app, ssl_ctx)
 
         if not webhook_url:
             webhook_url = self._gen_webhook_url(listen, port, url_path)
@@ -736,7 +901,16 @@ class Updater(Generic[CCT, UD, CD, BD]):
         if cert_file is not None:
             cert_file.close()
 
-        self.httpd.serve_forever(ready=ready)
+        if decoder is None:
+            self.httpd.serve_forever(ready=ready)
+            return
+
+        decoder.start(name=f'Bot:{self.bot.id}:webhook_decoder')
+        try:
+            self.httpd.serve_forever(ready=ready)
+        finally:
+            # Converts the data received so far
+            decoder.stop()
 
     @staticmethod
     def _gen_webhook_url(listen: str, port: int, url_path: str) -> str:
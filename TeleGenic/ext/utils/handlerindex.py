@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the routing index used by the Dispatcher to narrow down the handlers
+that have to be checked for an update."""
+import re
+from heapq import merge
+from typing import TYPE_CHECKING, Dict, Hashable, Iterable, List, Optional, Pattern, Tuple
+
+from TeleGenic import MessageEntity, Update
+from TeleGenic.constants import UPDATE_ALL_TYPES
+
+if TYPE_CHECKING:
+    from TeleGenic.ext import Handler
+
+RoutingKey = Tuple[str, Hashable]
+"""Tuple[:obj:`str`, :obj:`object`]: A key under which a handler may be found in the index."""
+
+CALLBACK_PREFIX = 'callback_prefix'
+CHAT_TYPE = 'chat_type'
+COMMAND = 'command'
+UPDATE_TYPE = 'update'
+
+# Bumped whenever an attribute of any handler is set, see invalidate_indexes
+_generation = 0
+
+_REGEX_SPECIAL_CHARS = frozenset('.^$*+?{}[]\\|()')
+
+
+def regex_literal_prefix(pattern: object) -> str:
+    """Returns the literal text that any string matched by ``re.match(pattern, string)`` has to
+    start with. If no such prefix can be determined safely, an empty string is returned.
+
+    Args:
+        pattern (:obj:`object`): The pattern. Only compiled :obj:`str` patterns are considered.
+
+    Returns:
+        :obj:`str`
+    """
+    if not isinstance(pattern, Pattern) or not isinstance(pattern.pattern, str):
+        return ''
+    if pattern.flags & (re.IGNORECASE | re.VERBOSE):
+        return ''
+    source = pattern.pattern
+    # An alternation may apply to the whole pattern, in which case there is no common prefix
+    if '|' in source:
+        return ''
+
+    prefix: List[str] = []
+    for idx, char in enumerate(source):
+        if idx == 0 and char == '^':
+            continue
+        if char in _REGEX_SPECIAL_CHARS:
+            # A quantifier that allows zero repetitions makes the preceding char optional
+            if char in '*?{' and prefix:
+                prefix.pop()
+            break
+        prefix.append(char)
+    return ''.join(prefix)
+
+
+def invalidate_indexes() -> None:
+    """Marks all :class:`HandlerIndex` instances as outdated, so that they are rebuilt before
+    they are used the next time. Called whenever an attribute of a handler is set, as the routing
+    keys of the handler may depend on it.
+    """
+    global _generation  # pylint: disable=W0603
+    _generation += 1
+
+
+def handler_routing_keys(handler: 'Handler') -> Optional[List[RoutingKey]]:
+    """Returns the routing keys of a handler or :obj:`None`, if the handler has to be checked for
+    every update. The keys provided by :meth:`TeleGenic.ext.Handler._routing_keys` are only
+    trusted, if the class that defines them also defines the :meth:`check_update` in use, i.e.
+    subclasses that override :meth:`check_update` are always checked.
+
+    Args:
+        handler (:class:`TeleGenic.ext.Handler`): The handler.
+
+    Returns:
+        List[:obj:`tuple`] | :obj:`None`
+    """
+    for cls in type(handler).__mro__:
+        if '_routing_keys' in cls.__dict__:
+            if type(handler).check_update is not cls.__dict__.get('check_update'):
+                return None
+            return handler._routing_keys()  # pylint: disable=W0212
+    return None
+
+
+def update_routing_keys(update: object) -> Tuple[List[RoutingKey], object]:
+    """Computes the routing keys of an update. This is done once per update and the result is
+    shared by all groups.
+
+    Args:
+        update (:obj:`object`): The update.
+
+    Returns:
+        Tuple[List[:obj:`tuple`], :obj:`object`]: The routing keys and the callback data of the
+        update, if any. The callback data is :obj:`None` if the update is not an
+        :class:`TeleGenic.Update`.
+    """
+    if not isinstance(update, Update):
+        return [], None
+
+    keys: List[RoutingKey] = []
+    for update_type in UPDATE_ALL_TYPES:
+        if getattr(update, update_type, None):
+            keys.append((UPDATE_TYPE, update_type))
+            # The chat type key is combined with the update type, so that it only narrows down
+            # the handlers of one kind of update
+            if update.inline_query:
+                chat_type = update.inline_query.chat_type
+            else:
+                chat_type = update.effective_chat.type if update.effective_chat else None
+            if chat_type:
+                keys.append((CHAT_TYPE, (update_type, chat_type)))
+
+    message = update.effective_message
+    if (
+        message
+        and message.entities
+        and message.entities[0].type == MessageEntity.BOT_COMMAND
+        and message.entities[0].offset == 0
+        and message.text
+    ):
+        command = message.text[1 : message.entities[0].length]
+        keys.append((COMMAND, command.split('@')[0].lower()))
+
+    callback_data = update.callback_query.data if update.callback_query else None
+    return keys, callback_data
+
+
+class HandlerIndex:
+    """Routing index over the handlers of a single group of the
+    :class:`TeleGenic.ext.Dispatcher`.
+
+    Handlers that can only match certain kinds of updates (e.g. a
+    :class:`TeleGenic.ext.CommandHandler` only matches its commands) are filed under routing keys,
+    all other handlers are checked for every update. :meth:`candidates` yields the handlers that
+    could match an update in the order in which they were added, so that the first match per group
+    is the same as without the index.
+
+    The index is rebuilt, if the list of handlers was changed or if an attribute of any handler
+    was set since it was built, see :meth:`is_valid_for`. Changing an attribute in place, e.g.
+    appending to :attr:`TeleGenic.ext.CommandHandler.command`, can't be detected. Assign a new
+    value instead or remove the handler and add it again.
+
+    Args:
+        handlers (List[:class:`TeleGenic.ext.Handler`]): The handlers of the group.
+    """
+
+    __slots__ = (
+        'handlers',
+        '_size',
+        '_indexed',
+        '_wildcards',
+        '_keyed',
+        '_prefixed',
+        '_prefix_lengths',
+        '_all_prefixed',
+        '_snapshot',
+        '_generation',
+    )
+
+    def __init__(self, handlers: List['Handler']):
+        self.handlers = handlers
+        self._size = len(handlers)
+        # Detects handlers that were replaced or reordered in place
+        self._snapshot = list(handlers)
+        self._generation = _generation
+        self._wildcards: List[int] = []
+        self._keyed: Dict[RoutingKey, List[int]] = {}
+        self._prefixed: Dict[str, List[int]] = {}
+        self._all_prefixed: List[int] = []
+
+        for position, handler in enumerate(handlers):
+            keys = handler_routing_keys(handler)
+            if keys is None:
+                self._wildcards.append(position)
+                continue
+            for kind, value in keys:
+                if kind == CALLBACK_PREFIX:
+                    self._prefixed.setdefault(str(value), []).append(position)
+                    self._all_prefixed.append(position)
+                else:
+                    self._keyed.setdefault((kind, value), []).append(position)
+
+        self._prefix_lengths = sorted({len(prefix) for prefix in self._prefixed})
+        self._indexed = bool(self._keyed or self._prefixed)
+
+    def is_valid_for(self, handlers: List['Handler']) -> bool:
+        """Checks whether this index was built for the passed handler list in its current state,
+        i.e. the list contains the same handlers in the same order and no attribute of a handler
+        was set since.
+
+        Args:
+            handlers (List[:class:`TeleGenic.ext.Handler`]): The handlers of the group.
+
+        Returns:
+            :obj:`bool`
+        """
+        return (
+            handlers is self.handlers
+            and self._generation == _generation
+            and len(handlers) == self._size
+            # Compares by identity, as handlers don't define __eq__
+            and handlers == self._snapshot
+        )
+
+    def candidates(self, keys: List[RoutingKey], callback_data: object) -> Iterable['Handler']:
+        """Yields the handlers that may handle an update with the given routing keys.
+
+        Args:
+            keys (List[:obj:`tuple`]): The routing keys as returned by
+                :func:`update_routing_keys`.
+            callback_data (:obj:`object`): The callback data as returned by
+                :func:`update_routing_keys`.
+
+        Returns:
+            Iterable[:class:`TeleGenic.ext.Handler`]
+        """
+        if not self._indexed:
+            return self.handlers
+
+        positions = [self._wildcards]
+        for key in keys:
+            found = self._keyed.get(key)
+            if found:
+                positions.append(found)
+
+        if self._prefixed and callback_data is not None:
+            if isinstance(callback_data, str):
+                for length in self._prefix_lengths:
+                    found = self._prefixed.get(callback_data[:length])
+                    if found:
+                        positions.append(found)
+            else:
+                # Patterns can't match arbitrary callback data, but checking them preserves the
+                # behaviour without index
+                positions.append(self._all_prefixed)
+
+        return self._positions_to_handlers(positions)
+
+    def _positions_to_handlers(self, positions: List[List[int]]) -> Iterable['Handler']:
+        handlers = self.handlers
+        if len(positions) == 1:
+            return [handlers[position] for position in positions[0]]
+
+        result = []
+        last = -1
+        for position in merge(*positions):
+            # A handler may be filed under multiple keys
+            if position != last:
+                result.append(handlers[position])
+                last = position
+        return result
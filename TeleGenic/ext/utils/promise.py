@@ -99,16 +99,34 @@ class Promise:
             self._exception = exc
 
         finally:
-            self.done.set()
-            if self._exception is None and self._done_callback:
-                try:
-                    self._done_callback(self.result())
-                except Exception as exc:
-                    logger.warning(
-                        "`done_callback` of a Promise raised the following exception."
-                        " The exception won't be handled by error handlers."
-                    )
-                    logger.warning("Full traceback:", exc_info=exc)
+            self._set_done()
+
+    async def run_coroutine(self) -> None:
+        """Awaits the coroutine returned by :attr:`pooled_function`. Use this instead of
+        :meth:`run`, if :attr:`pooled_function` is a coroutine function.
+
+        .. versionadded:: 13.11
+        """
+        try:
+            self._result = await self.pooled_function(*self.args, **self.kwargs)
+
+        except Exception as exc:
+            self._exception = exc
+
+        finally:
+            self._set_done()
+
+    def _set_done(self) -> None:
+        self.done.set()
+        if self._exception is None and self._done_callback:
+            try:
+                self._done_callback(self.result())
+            except Exception as exc:
+                logger.warning(
+                    "`done_callback` of a Promise raised the following exception."
+                    " The exception won't be handled by error handlers."
+                )
+                logger.warning("Full traceback:", exc_info=exc)
 
     def __call__(self) -> None:
         self.run()
@@ -19,17 +19,23 @@
 # pylint: disable=C0114
 
 import logging
-from queue import Queue
+import multiprocessing
+import signal
+import socket
+import ssl
+import time
+from queue import Empty, Full, Queue
 from ssl import SSLContext
-from threading import Event, Lock
-from typing import TYPE_CHECKING, Any, Optional
+from threading import Event, Lock, Thread
+from typing import TYPE_CHECKING, Any, List, Optional
 
 import tornado.web
 from tornado import httputil
 from tornado.httpserver import HTTPServer
-from tornado.ioloop import IOLoop
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.netutil import bind_sockets
 
-from TeleGenic import Update
+from TeleGenic import TeleGenicError, Update
 from TeleGenic.ext import ExtBot
 from TeleGenic.utils.deprecate import set_new_attribute_deprecated
 from TeleGenic.utils.types import JSONDict
@@ -102,9 +108,330 @@ class WebhookServer:
         )
 
 
+def create_ssl_context(cert: Optional[str], key: Optional[str]) -> Optional[SSLContext]:
+    # Note that we only use the SSL certificate for the WebhookServer, if the key is also
+    # present. This is because the WebhookServer may not actually be in charge of performing
+    # the SSL handshake, e.g. in case a reverse proxy is used
+    if cert is None or key is None:
+        return None
+    # An SSLError is raised if the private key does not match with the certificate
+    try:
+        ssl_ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_ctx.load_cert_chain(cert, key)
+    except ssl.SSLError as exc:
+        raise TeleGenicError('Invalid SSL Certificate') from exc
+    return ssl_ctx
+
+
+class MultiProcessWebhookServer:
+    """Runs the webhook server in several processes to use more than one CPU core for TLS, HTTP
+    and JSON parsing. Every process listens on the same port via ``SO_REUSEPORT``, so the
+    operating system distributes the connections among them. The processes forward the parsed
+    data to this process, where it is converted to updates, as the bot and its callback data
+    cache live here. Has the same interface as :class:`WebhookServer`.
+
+    The processes are started with the ``spawn`` method, so the main module of the bot must be
+    importable without side effects, i.e. guarded by ``if __name__ == '__main__':``. If a process
+    exits before it is ready to accept connections, e.g. because the port is in use, the other
+    processes are terminated and :class:`TeleGenic.error.TeleGenicError` is raised.
+    """
+
+    __slots__ = (
+        'listen',
+        'port',
+        'url_path',
+        'cert',
+        'key',
+        'processes',
+        'bot',
+        'update_queue',
+        'logger',
+        'is_running',
+        'server_lock',
+        'shutdown_lock',
+        '_context',
+        '_data',
+        '_stop_event',
+        '_workers',
+        'start_timeout',
+        '__dict__',
+    )
+
+    def __init__(
+        self,
+        listen: str,
+        port: int,
+        url_path: str,
+        bot: 'Bot',
+        update_queue: Queue,
+        processes: int,
+        cert: str = None,
+        key: str = None,
+        max_pending: int = 1000,
+        start_timeout: float = 60.0,
+    ):
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            raise RuntimeError('Multiple webhook processes require SO_REUSEPORT')
+        self.listen = listen
+        self.port = port
+        self.url_path = url_path
+        self.cert = cert
+        self.key = key
+        self.processes = processes
+        self.start_timeout = start_timeout
+        self.bot = bot
+        self.update_queue = update_queue
+        self.logger = logging.getLogger(__name__)
+        self.is_running = False
+        self.server_lock = Lock()
+        self.shutdown_lock = Lock()
+        self._context = multiprocessing.get_context('spawn')
+        self._data = self._context.Queue(maxsize=max_pending)
+        self._stop_event = self._context.Event()
+        self._workers: List[multiprocessing.process.BaseProcess] = []
+
+    def __setattr__(self, key: str, value: object) -> None:
+        set_new_attribute_deprecated(self, key, value)
+
+    def serve_forever(self, ready: Event = None) -> None:
+        with self.server_lock:
+            self._stop_event.clear()
+            worker_ready = [self._context.Event() for _ in range(self.processes)]
+            for i, event in enumerate(worker_ready):
+                process = self._context.Process(
+                    target=_serve_webhook_process,
+                    args=(
+                        self.listen,
+                        self.port,
+                        self.url_path,
+                        self.cert,
+                        self.key,
+                        self._data,
+                        event,
+                        self._stop_event,
+                    ),
+                    name=f'webhook_process_{i}',
+                    daemon=True,
+                )
+                process.start()
+                self._workers.append(process)
+            try:
+                self._wait_for_workers(worker_ready)
+            except TeleGenicError:
+                self._terminate_workers()
+                # Don't let the caller wait for a server that won't start
+                if ready is not None:
+                    ready.set()
+                raise
+
+            self.is_running = True
+            self.logger.debug('Webhook Server started with %d processes.', self.processes)
+            if ready is not None:
+                ready.set()
+
+            while not self._stop_event.is_set():
+                try:
+                    self._put_update(self._data.get(timeout=0.5))
+                except Empty:
+                    continue
+
+            for process in self._workers:
+                process.join()
+            self._workers = []
+            # The processes may have forwarded some more data before they stopped
+            while True:
+                try:
+                    self._put_update(self._data.get(block=False))
+                except Empty:
+                    break
+            self.logger.debug('Webhook Server stopped.')
+            self.is_running = False
+
+    def _wait_for_workers(self, worker_ready: List[Any]) -> None:
+        deadline = time.monotonic() + self.start_timeout
+        for process, event in zip(self._workers, worker_ready):
+            while not event.wait(0.1):
+                if not process.is_alive():
+                    raise TeleGenicError(
+                        f'Webhook process {process.name} exited with code {process.exitcode} '
+                        f'before it was ready'
+                    )
+                if time.monotonic() > deadline:
+                    raise TeleGenicError(
+                        f'Webhook process {process.name} was not ready after '
+                        f'{self.start_timeout} seconds'
+                    )
+
+    def _terminate_workers(self) -> None:
+        self._stop_event.set()
+        for process in self._workers:
+            if process.is_alive():
+                process.terminate()
+        for process in self._workers:
+            process.join()
+        self._workers = []
+
+    def _put_update(self, data: JSONDict) -> None:
+        try:
+            update = Update.de_json(data, self.bot)
+        except Exception:
+            self.logger.exception('Failed to convert webhook data to an update')
+            return
+        if update:
+            self.logger.debug('Received Update with ID %d on Webhook', update.update_id)
+            # handle arbitrary callback data, if necessary
+            if isinstance(self.bot, ExtBot):
+                self.bot.insert_callback_data(update)
+            self.update_queue.put(update)
+
+    def shutdown(self) -> None:
+        with self.shutdown_lock:
+            if not self.is_running:
+                self.logger.warning('Webhook Server already stopped.')
+                return
+            self._stop_event.set()
+
+
+def _serve_webhook_process(
+    listen: str,
+    port: int,
+    url_path: str,
+    cert: Optional[str],
+    key: Optional[str],
+    data_queue: Queue,
+    ready: Event,
+    stop_event: Event,
+) -> None:  # pragma: no cover
+    # Target of the processes of MultiProcessWebhookServer. The main process handles the signals
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    IOLoop().make_current()
+    loop = IOLoop.current()
+    app = tornado.web.Application(
+        [(rf"{url_path}/?", ForwardingWebhookHandler, {"data_queue": data_queue})],
+        log_function=lambda handler: None,
+    )
+    server = HTTPServer(app, ssl_options=create_ssl_context(cert, key))
+    server.add_sockets(bind_sockets(port, address=listen, reuse_port=True))
+
+    def check_stop() -> None:
+        if stop_event.is_set():
+            server.stop()
+            loop.stop()
+
+    PeriodicCallback(check_stop, 200).start()
+    ready.set()
+    loop.start()
+
+
+class WebhookDecoder:
+    """Converts the bodies of webhook requests to updates on a pool of worker threads, so that
+    :class:`WebhookHandler` can answer the request right away instead of blocking the event loop
+    of the server. As the workers run concurrently, updates may be put into the update queue in a
+    different order than they were received - just like TeleGenic may deliver updates over
+    concurrent connections anyway.
+    """
+
+    __slots__ = (
+        'bot',
+        'update_queue',
+        'workers',
+        'batch_size',
+        'logger',
+        '_bodies',
+        '_threads',
+        '__dict__',
+    )
+
+    def __init__(
+        self,
+        bot: 'Bot',
+        update_queue: Queue,
+        workers: int = 4,
+        max_pending: int = 1000,
+        batch_size: int = 1,
+    ):
+        self.bot = bot
+        self.update_queue = update_queue
+        self.workers = workers
+        # Each worker takes up to batch_size bodies at once and puts the resulting updates into
+        # the update queue together
+        self.batch_size = batch_size
+        self.logger = logging.getLogger(__name__)
+        self._bodies: Queue = Queue(maxsize=max_pending)
+        self._threads: List[Thread] = []
+
+    def __setattr__(self, key: str, value: object) -> None:
+        set_new_attribute_deprecated(self, key, value)
+
+    def start(self, name: str = 'webhook_decoder') -> None:
+        for i in range(self.workers):
+            thread = Thread(target=self._work, name=f'{name}_{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        # The remaining bodies are converted before the workers end
+        for _ in self._threads:
+            self._bodies.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, body: bytes) -> bool:
+        """Returns whether the body was accepted. Never blocks."""
+        try:
+            self._bodies.put(body, block=False)
+            return True
+        except Full:
+            return False
+
+    def _work(self) -> None:
+        while True:
+            bodies = [self._bodies.get()]
+            while bodies[-1] is not None and len(bodies) < self.batch_size:
+                try:
+                    bodies.append(self._bodies.get(block=False))
+                except Empty:
+                    break
+
+            updates = []
+            for body in bodies:
+                if body is None:
+                    continue
+                try:
+                    update = self.decode(body)
+                except Exception:
+                    self.logger.exception('Failed to convert webhook data to an update')
+                    continue
+                if update:
+                    updates.append(update)
+            for update in updates:
+                self.update_queue.put(update)
+
+            if bodies[-1] is None:
+                return
+
+    def decode(self, body: bytes) -> Optional[Update]:
+        data = json.loads(body.decode())
+        self.logger.debug('Webhook received data: %s', data)
+        update = Update.de_json(data, self.bot)
+        if update:
+            self.logger.debug('Received Update with ID %d on Webhook', update.update_id)
+            # handle arbitrary callback data, if necessary
+            if isinstance(self.bot, ExtBot):
+                self.bot.insert_callback_data(update)
+        return update
+
+
 class WebhookAppClass(tornado.web.Application):
-    def __init__(self, webhook_path: str, bot: 'Bot', update_queue: Queue):
-        self.shared_objects = {"bot": bot, "update_queue": update_queue}
+    def __init__(
+        self,
+        webhook_path: str,
+        bot: 'Bot',
+        update_queue: Queue,
+        decoder: WebhookDecoder = None,
+    ):
+        self.shared_objects = {"bot": bot, "update_queue": update_queue, "decoder": decoder}
         handlers = [(rf"{webhook_path}/?", WebhookHandler, self.shared_objects)]  # noqa
         tornado.web.Application.__init__(self, handlers)  # type: ignore
 
@@ -126,10 +453,13 @@ class WebhookHandler(tornado.web.RequestHandler):
         super().__init__(application, request, **kwargs)
         self.logger = logging.getLogger(__name__)
 
-    def initialize(self, bot: 'Bot', update_queue: Queue) -> None:
+    def initialize(
+        self, bot: 'Bot', update_queue: Queue, decoder: WebhookDecoder = None
+    ) -> None:
         # pylint: disable=W0201
         self.bot = bot
         self.update_queue = update_queue
+        self.decoder = decoder
 
     def set_default_headers(self) -> None:
         self.set_header("Content-Type", 'application/json; charset="utf-8"')
@@ -137,6 +467,14 @@ class WebhookHandler(tornado.web.RequestHandler):
     def post(self) -> None:
         self.logger.debug('Webhook triggered')
         self._validate_post()
+        if self.decoder is not None:
+            # Answers right away, the update is created by the decoder
+            if not self.decoder.submit(self.request.body):
+                # Let TeleGenic deliver the update again later
+                self.logger.debug('Webhook decoder is busy, rejecting update')
+                self.set_status(503)
+                self.set_header('Retry-After', '1')
+            return
         json_string = self.request.body.decode()
         data = json.loads(json_string)
         self.set_status(200)
@@ -147,7 +485,14 @@ class WebhookHandler(tornado.web.RequestHandler):
             # handle arbitrary callback data, if necessary
             if isinstance(self.bot, ExtBot):
                 self.bot.insert_callback_data(update)
-            self.update_queue.put(update)
+            try:
+                # Blocking would block the whole server
+                self.update_queue.put(update, block=False)
+            except Full:
+                # Let TeleGenic deliver the update again later
+                self.logger.debug('Update queue is full, rejecting update %d', update.update_id)
+                self.set_status(503)
+                self.set_header('Retry-After', '1')
 
     def _validate_post(self) -> None:
         ct_header = self.request.headers.get("Content-Type", None)
@@ -175,3 +520,29 @@ class WebhookHandler(tornado.web.RequestHandler):
             "Exception in WebhookHandler",
             exc_info=kwargs['exc_info'],
         )
+
+
+# pylint: disable=W0223
+class ForwardingWebhookHandler(tornado.web.RequestHandler):
+    """Used by the processes of :class:`MultiProcessWebhookServer`. Parses the data and forwards
+    it to the main process."""
+
+    SUPPORTED_METHODS = ["POST"]  # type: ignore
+
+    def initialize(self, data_queue: Queue) -> None:
+        # pylint: disable=W0201
+        self.data_queue = data_queue
+
+    def set_default_headers(self) -> None:
+        self.set_header("Content-Type", 'application/json; charset="utf-8"')
+
+    def post(self) -> None:
+        if self.request.headers.get("Content-Type", None) != 'application/json':
+            raise tornado.web.HTTPError(403)
+        data = json.loads(self.request.body.decode())
+        try:
+            self.data_queue.put(data, block=False)
+        except Full:
+            # Let TeleGenic deliver the update again later
+            self.set_status(503)
+            self.set_header('Retry-After', '1')
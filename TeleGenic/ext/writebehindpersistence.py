@@ -0,0 +1,500 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+"""This module contains the WriteBehindPersistence class."""
+import logging
+from threading import Condition, Lock, Thread
+from typing import Callable, ClassVar, DefaultDict, Dict, Hashable, Optional, Tuple
+
+from TeleGenic import Bot
+from TeleGenic.ext import BasePersistence
+from TeleGenic.ext.utils.types import UD, CD, BD, ConversationDict, CDCData
+
+_NOTHING = object()
+
+
+class WriteBehindPersistence(BasePersistence[UD, CD, BD]):
+    """Wraps another persistence and takes writing the data off the path of the dispatcher. The
+    ``update_*`` methods only remember which chats, users and conversations changed. A background
+    thread then passes the changed data to the wrapped persistence in batches, either every
+    ``flush_interval`` seconds or once ``max_pending`` changes accumulated. Multiple changes of the
+    same chat or user between two batches are written only once. If ``max_pending`` changes are
+    pending, a change of a further chat, user or conversation waits until the background thread
+    started writing them, so that the pending changes can't grow without bound.
+
+    When the wrapped persistence is flushed is selected by ``durability``:
+
+    * :attr:`BEST_EFFORT`: The changes are written in the background. The wrapped persistence is
+      only flushed by :meth:`flush`, i.e. it decides itself when the data is saved.
+    * :attr:`FLUSH_AFTER_BATCH`: Like :attr:`BEST_EFFORT`, but the wrapped persistence is
+      flushed after each batch, i.e. at most ``flush_interval`` seconds plus the time needed for
+      writing after a change.
+    * :attr:`WRITE_THROUGH`: The changes are written and the wrapped persistence is flushed by the
+      ``update_*`` methods before they return. Writing is part of handling the updates again.
+
+    None of the durability levels syncs any files to disk, they only select when the wrapped
+    persistence is flushed. Whether flushed data survives a crash of the operating system depends
+    on the ``flush`` method of the wrapped persistence. E.g.
+    :class:`TeleGenic.ext.PicklePersistence` in journal mode only hands its journal entries to
+    the operating system without syncing them, so the latest entries may be lost on a crash, while
+    the complete file written on compaction and by ``flush`` is synced to disk.
+
+    If writing a change to the wrapped persistence fails, the error is logged and the change is
+    kept for the next batch, unless it was changed again meanwhile. Failed batches are retried
+    after ``flush_interval`` seconds.
+
+    Note:
+        * Changes that were not written yet are lost if the process is killed. :meth:`flush`
+          writes all pending changes and is called by :class:`TeleGenic.ext.Updater` on shutdown.
+        * The data is copied by the wrapped persistence when the batch is written, i.e. in the
+          background thread. Handlers that modify the data at the same time should synchronize
+          access to it, as they have to when running asynchronously.
+        * :class:`TeleGenic.ext.PicklePersistence` with ``on_flush=False`` writes the file for
+          every changed chat and user of a batch. To write it only once per batch, create it with
+          ``on_flush=True`` and use :attr:`FLUSH_AFTER_BATCH` durability.
+
+    .. versionadded:: 13.11
+
+    Args:
+        persistence (:class:`TeleGenic.ext.BasePersistence`): The persistence to write the data
+            to. The ``store_*`` settings are taken from it.
+        flush_interval (:obj:`float`, optional): Maximum number of seconds that changes are kept
+            before they are written. Defaults to ``5``.
+        max_pending (:obj:`int`, optional): Number of changed chats, users and conversations at
+            which a batch is written before ``flush_interval`` has passed. Further changes wait
+            until the batch is taken over by the background thread. Defaults to ``100``.
+        flush_after_batch (:obj:`bool`, optional): Whether to call the :meth:`flush` method of the
+            wrapped persistence after each batch. Same as passing :attr:`FLUSH_AFTER_BATCH` as
+            ``durability``. Defaults to :obj:`False`.
+        durability (:obj:`str`, optional): One of :attr:`BEST_EFFORT`, :attr:`FLUSH_AFTER_BATCH`
+            and :attr:`WRITE_THROUGH`. Defaults to :attr:`FLUSH_AFTER_BATCH`, if
+            ``flush_after_batch`` is :obj:`True`, and to :attr:`BEST_EFFORT` otherwise.
+
+    Attributes:
+        persistence (:class:`TeleGenic.ext.BasePersistence`): The wrapped persistence.
+        flush_interval (:obj:`float`): Maximum number of seconds that changes are kept before they
+            are written.
+        max_pending (:obj:`int`): Number of changes at which a batch is written early.
+        flush_after_batch (:obj:`bool`): Whether to call the :meth:`flush` method of the wrapped
+            persistence after each batch.
+        durability (:obj:`str`): When the wrapped persistence is flushed.
+
+    """
+
+    BEST_EFFORT: ClassVar[str] = 'best_effort'
+    """:obj:`str`: Changes are written in the background, the wrapped persistence is only flushed
+    by :meth:`flush`."""
+    FLUSH_AFTER_BATCH: ClassVar[str] = 'flush_after_batch'
+    """:obj:`str`: Changes are written in the background and the wrapped persistence is flushed
+    after each batch."""
+    WRITE_THROUGH: ClassVar[str] = 'write_through'
+    """:obj:`str`: Changes are written and the wrapped persistence is flushed before the
+    ``update_*`` methods return."""
+
+    __slots__ = (
+        'persistence',
+        'flush_interval',
+        'max_pending',
+        'flush_after_batch',
+        'durability',
+        'logger',
+        '_condition',
+        '_sync_lock',
+        '_thread',
+        '_stopping',
+        '_user_data',
+        '_chat_data',
+        '_bot_data',
+        '_callback_data',
+        '_conversations',
+    )
+
+    def __init__(
+        self,
+        persistence: BasePersistence[UD, CD, BD],
+        flush_interval: float = 5.0,
+        max_pending: int = 100,
+        flush_after_batch: bool = False,
+        durability: str = None,
+    ):
+        super().__init__(
+            store_user_data=persistence.store_user_data,
+            store_chat_data=persistence.store_chat_data,
+            store_bot_data=persistence.store_bot_data,
+            store_callback_data=persistence.store_callback_data,
+        )
+        if flush_interval <= 0:
+            raise ValueError('flush_interval must be positive')
+        if max_pending < 1:
+            raise ValueError('max_pending must be a positive integer')
+        if durability is None:
+            durability = self.FLUSH_AFTER_BATCH if flush_after_batch else self.BEST_EFFORT
+        if durability not in (self.BEST_EFFORT, self.FLUSH_AFTER_BATCH, self.WRITE_THROUGH):
+            raise ValueError(f'Unknown durability {durability!r}')
+
+        self.persistence = persistence
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.flush_after_batch = flush_after_batch
+        self.durability = durability
+        self.logger = logging.getLogger(__name__)
+        self._condition = Condition()
+        self._sync_lock = Lock()
+        self._thread: Optional[Thread] = None
+        self._stopping = False
+        self._user_data: Dict[int, UD] = {}
+        self._chat_data: Dict[int, CD] = {}
+        self._bot_data: object = _NOTHING
+        self._callback_data: object = _NOTHING
+        self._conversations: Dict[Tuple[str, Tuple[int, ...]], Optional[object]] = {}
+
+    def set_bot(self, bot: Bot) -> None:
+        """Sets the bot for this persistence and the wrapped persistence.
+
+        Args:
+            bot (:class:`TeleGenic.Bot`): The bot.
+        """
+        super().set_bot(bot)
+        self.persistence.set_bot(bot)
+
+    @classmethod
+    def replace_bot(cls, obj: object) -> object:
+        """Returns ``obj`` unchanged. Bots are replaced by the wrapped persistence, when the data
+        is written.
+
+        Args:
+            obj (:obj:`object`): The object
+
+        Returns:
+            :obj:`obj`: ``obj``.
+        """
+        return obj
+
+    def insert_bot(self, obj: object) -> object:
+        """Returns ``obj`` unchanged. Bots are inserted by the wrapped persistence, when the data
+        is loaded.
+
+        Args:
+            obj (:obj:`object`): The object
+
+        Returns:
+            :obj:`obj`: ``obj``.
+        """
+        return obj
+
+    @property
+    def pending(self) -> int:
+        """:obj:`int`: The number of changes that were not written yet."""
+        with self._condition:
+            return self._pending()
+
+    def _pending(self) -> int:
+        return (
+            len(self._user_data)
+            + len(self._chat_data)
+            + len(self._conversations)
+            + (self._bot_data is not _NOTHING)
+            + (self._callback_data is not _NOTHING)
+        )
+
+    def get_user_data(self) -> DefaultDict[int, UD]:
+        """Returns the ``user_data`` of the wrapped persistence.
+
+        Returns:
+            DefaultDict[:obj:`int`, :class:`TeleGenic.ext.utils.types.UD`]: The restored user data.
+        """
+        return self.persistence.get_user_data()
+
+    def get_chat_data(self) -> DefaultDict[int, CD]:
+        """Returns the ``chat_data`` of the wrapped persistence.
+
+        Returns:
+            DefaultDict[:obj:`int`, :class:`TeleGenic.ext.utils.types.CD`]: The restored chat data.
+        """
+        return self.persistence.get_chat_data()
+
+    def get_bot_data(self) -> BD:
+        """Returns the ``bot_data`` of the wrapped persistence.
+
+        Returns:
+            :class:`TeleGenic.ext.utils.types.BD`: The restored bot data.
+        """
+        return self.persistence.get_bot_data()
+
+    def get_callback_data(self) -> Optional[CDCData]:
+        """Returns the ``callback_data`` of the wrapped persistence.
+
+        Returns:
+            Optional[:class:`TeleGenic.ext.utils.types.CDCData`]: The restored meta data or
+            :obj:`None`, if no data was stored.
+        """
+        return self.persistence.get_callback_data()
+
+    def get_conversations(self, name: str) -> ConversationDict:
+        """Returns the conversations of the wrapped persistence, including changes that were not
+        written yet.
+
+        Args:
+            name (:obj:`str`): The handlers name.
+
+        Returns:
+            :obj:`dict`: The restored conversations for the handler.
+        """
+        conversations = dict(self.persistence.get_conversations(name))
+        with self._condition:
+            for (conversation_name, key), new_state in self._conversations.items():
+                if conversation_name == name:
+                    conversations[key] = new_state
+        return conversations
+
+    def update_conversation(
+        self, name: str, key: Tuple[int, ...], new_state: Optional[object]
+    ) -> None:
+        """Remembers the new state of the conversation to be written with the next batch.
+
+        Args:
+            name (:obj:`str`): The handler's name.
+            key (:obj:`tuple`): The key the state is changed for.
+            new_state (:obj:`tuple` | :obj:`any`): The new state for the given key.
+        """
+        if self.durability == self.WRITE_THROUGH:
+            self._write_through(self.persistence.update_conversation, name, key, new_state)
+            return
+        with self._condition:
+            self._wait_for_room(self._conversations, (name, key))
+            self._conversations[(name, key)] = new_state
+            self._changed()
+
+    def update_user_data(self, user_id: int, data: UD) -> None:
+        """Remembers the ``user_data`` to be written with the next batch.
+
+        Args:
+            user_id (:obj:`int`): The user the data might have been changed for.
+            data (:class:`TeleGenic.ext.utils.types.UD`): The
+                :attr:`TeleGenic.ext.Dispatcher.user_data` ``[user_id]``.
+        """
+        if self.durability == self.WRITE_THROUGH:
+            self._write_through(self.persistence.update_user_data, user_id, data)
+            return
+        with self._condition:
+            self._wait_for_room(self._user_data, user_id)
+            self._user_data[user_id] = data
+            self._changed()
+
+    def update_chat_data(self, chat_id: int, data: CD) -> None:
+        """Remembers the ``chat_data`` to be written with the next batch.
+
+        Args:
+            chat_id (:obj:`int`): The chat the data might have been changed for.
+            data (:class:`TeleGenic.ext.utils.types.CD`): The
+                :attr:`TeleGenic.ext.Dispatcher.chat_data` ``[chat_id]``.
+        """
+        if self.durability == self.WRITE_THROUGH:
+            self._write_through(self.persistence.update_chat_data, chat_id, data)
+            return
+        with self._condition:
+            self._wait_for_room(self._chat_data, chat_id)
+            self._chat_data[chat_id] = data
+            self._changed()
+
+    def update_bot_data(self, data: BD) -> None:
+        """Remembers the ``bot_data`` to be written with the next batch.
+
+        Args:
+            data (:class:`TeleGenic.ext.utils.types.BD`): The
+                :attr:`TeleGenic.ext.Dispatcher.bot_data`.
+        """
+        if self.durability == self.WRITE_THROUGH:
+            self._write_through(self.persistence.update_bot_data, data)
+            return
+        with self._condition:
+            self._bot_data = data
+            self._changed()
+
+    def update_callback_data(self, data: CDCData) -> None:
+        """Remembers the ``callback_data`` to be written with the next batch.
+
+        Args:
+            data (:class:`TeleGenic.ext.utils.types.CDCData`): The relevant data to restore
+                :class:`TeleGenic.ext.CallbackDataCache`.
+        """
+        if self.durability == self.WRITE_THROUGH:
+            self._write_through(self.persistence.update_callback_data, data)
+            return
+        with self._condition:
+            self._callback_data = data
+            self._changed()
+
+    def refresh_user_data(self, user_id: int, user_data: UD) -> None:
+        """Calls :meth:`refresh_user_data` of the wrapped persistence.
+
+        Args:
+            user_id (:obj:`int`): The user ID this :attr:`user_data` is associated with.
+            user_data (:class:`TeleGenic.ext.utils.types.UD`): The ``user_data`` of a single user.
+        """
+        self.persistence.refresh_user_data(user_id, user_data)
+
+    def refresh_chat_data(self, chat_id: int, chat_data: CD) -> None:
+        """Calls :meth:`refresh_chat_data` of the wrapped persistence.
+
+        Args:
+            chat_id (:obj:`int`): The chat ID this :attr:`chat_data` is associated with.
+            chat_data (:class:`TeleGenic.ext.utils.types.CD`): The ``chat_data`` of a single chat.
+        """
+        self.persistence.refresh_chat_data(chat_id, chat_data)
+
+    def refresh_bot_data(self, bot_data: BD) -> None:
+        """Calls :meth:`refresh_bot_data` of the wrapped persistence.
+
+        Args:
+            bot_data (:class:`TeleGenic.ext.utils.types.BD`): The ``bot_data``.
+        """
+        self.persistence.refresh_bot_data(bot_data)
+
+    def flush(self) -> None:
+        """Writes all pending changes, stops the background thread and calls :meth:`flush` of
+        the wrapped persistence. The thread is started again with the next change.
+        """
+        with self._condition:
+            thread = self._thread
+            self._stopping = True
+            self._condition.notify_all()
+        if thread is not None:
+            thread.join()
+
+        with self._condition:
+            self._thread = None
+            self._stopping = False
+            # Changes waiting for room are added to the batch or start a new thread
+            self._condition.notify_all()
+        self._write_batch()
+        self.persistence.flush()
+
+    def _wait_for_room(self, pending: Dict, key: Hashable) -> None:
+        # Must be called while holding the condition. Changing already pending data doesn't need
+        # room. Without a running thread, nobody would make room, _changed() starts one
+        if key in pending:
+            return
+        while (
+            self._pending() >= self.max_pending
+            and self._thread is not None
+            and not self._stopping
+        ):
+            self._condition.notify_all()
+            self._condition.wait()
+
+    def _write_through(self, method: Callable[..., None], *args: object) -> None:
+        # Errors are passed on to the dispatcher, as the change was not saved
+        with self._sync_lock:
+            method(*args)
+            self.persistence.flush()
+
+    def _changed(self) -> None:
+        # Must be called while holding the condition
+        if self._thread is None and not self._stopping:
+            self._thread = Thread(target=self._run, name='WriteBehindPersistence', daemon=True)
+            self._thread.start()
+        elif self._pending() >= self.max_pending:
+            self._condition.notify_all()
+
+    def _run(self) -> None:
+        failed = False
+        while True:
+            with self._condition:
+                # Failed changes are not retried right away, even if they fill up the batch
+                self._condition.wait_for(
+                    lambda: self._stopping
+                    or (not failed and self._pending() >= self.max_pending),
+                    self.flush_interval,
+                )
+                if self._stopping:
+                    # flush() writes the remaining changes
+                    return
+            failed = not self._write_batch()
+
+    def _write_batch(self) -> bool:
+        # Returns whether all changes were written
+        with self._condition:
+            user_data, self._user_data = self._user_data, {}
+            chat_data, self._chat_data = self._chat_data, {}
+            bot_data, self._bot_data = self._bot_data, _NOTHING
+            callback_data, self._callback_data = self._callback_data, _NOTHING
+            conversations, self._conversations = self._conversations, {}
+            # Wakes up changes waiting for room
+            self._condition.notify_all()
+
+        written = failed = False
+        for user_id, data in user_data.items():
+            if self._write(self.persistence.update_user_data, user_id, data):
+                written = True
+            else:
+                failed = True
+                with self._condition:
+                    # Newer changes take precedence
+                    self._user_data.setdefault(user_id, data)
+        for chat_id, data in chat_data.items():
+            if self._write(self.persistence.update_chat_data, chat_id, data):
+                written = True
+            else:
+                failed = True
+                with self._condition:
+                    self._chat_data.setdefault(chat_id, data)
+        if bot_data is not _NOTHING:
+            if self._write(self.persistence.update_bot_data, bot_data):
+                written = True
+            else:
+                failed = True
+                with self._condition:
+                    if self._bot_data is _NOTHING:
+                        self._bot_data = bot_data
+        if callback_data is not _NOTHING:
+            if self._write(self.persistence.update_callback_data, callback_data):
+                written = True
+            else:
+                failed = True
+                with self._condition:
+                    if self._callback_data is _NOTHING:
+                        self._callback_data = callback_data
+        for (name, key), new_state in conversations.items():
+            if self._write(self.persistence.update_conversation, name, key, new_state):
+                written = True
+            else:
+                failed = True
+                with self._condition:
+                    self._conversations.setdefault((name, key), new_state)
+
+        if failed:
+            with self._condition:
+                # Makes sure that the failed changes are retried, see _run
+                self._changed()
+
+        if written and self.durability == self.FLUSH_AFTER_BATCH:
+            try:
+                self.persistence.flush()
+            except Exception:
+                self.logger.exception('Flushing the wrapped persistence raised an error.')
+        return not failed
+
+    def _write(self, method: Callable[..., None], *args: object) -> bool:
+        try:
+            method(*args)
+            return True
+        except Exception:
+            # The change is kept and written with the next batch
+            self.logger.exception('Writing a batch to the wrapped persistence raised an error.')
+            return False
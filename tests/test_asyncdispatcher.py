@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+import asyncio
+from queue import Queue
+from threading import Thread
+from time import sleep
+
+import pytest
+
+from TeleGenic import Chat, Message, TeleGenicError, Update, User
+from TeleGenic.ext import (
+    AsyncDispatcher,
+    AsyncUpdater,
+    CallbackContext,
+    Dispatcher,
+    DispatcherHandlerStop,
+    Filters,
+    MessageHandler,
+    TypeHandler,
+)
+
+
+@pytest.fixture(scope='function')
+def adp(bot):
+    dispatcher = AsyncDispatcher(bot, Queue(), workers=2, concurrent_updates=16)
+    thr = Thread(target=dispatcher.start)
+    thr.start()
+    dispatcher.wait_for_loop()
+    yield dispatcher
+    if dispatcher.running:
+        dispatcher.stop()
+    thr.join()
+
+
+class TestAsyncDispatcher:
+    message_update = Update(
+        1, message=Message(1, None, Chat(1, ''), from_user=User(1, '', False), text='Text')
+    )
+
+    def test_slot_behaviour(self, bot, mro_slots):
+        inst = AsyncDispatcher(bot, Queue())
+        for attr in inst.__slots__:
+            assert getattr(inst, attr, 'err') != 'err', f"got extra slot '{attr}'"
+        assert len(mro_slots(inst)) == len(set(mro_slots(inst))), "duplicate slot"
+
+    @pytest.mark.filterwarnings('ignore:.*:pytest.PytestUnhandledThreadExceptionWarning')
+    def test_start_failure(self, bot, monkeypatch):
+        dispatcher = AsyncDispatcher(bot, Queue(), workers=2)
+
+        def fail(*args, **kwargs):
+            raise RuntimeError('no executor')
+
+        monkeypatch.setattr('TeleGenic.ext.asyncdispatcher.ThreadPoolExecutor', fail)
+        thr = Thread(target=dispatcher.start)
+        thr.start()
+        with pytest.raises(TeleGenicError, match='failed to start') as exc_info:
+            dispatcher.wait_for_loop()
+        assert isinstance(exc_info.value.__cause__, RuntimeError)
+        thr.join()
+        assert not dispatcher.running
+        assert not dispatcher.has_running_threads
+
+    def test_concurrent_updates_validation(self, bot):
+        with pytest.raises(ValueError, match='concurrent_updates'):
+            AsyncDispatcher(bot, Queue(), concurrent_updates=0)
+
+    def test_coroutine_callbacks_run_concurrently(self, adp):
+        received = []
+
+        async def callback(update, context):
+            assert isinstance(context, CallbackContext)
+            await asyncio.sleep(0.5)
+            received.append(update)
+
+        adp.add_handler(TypeHandler(int, callback))
+        for i in range(10):
+            adp.update_queue.put(i)
+        adp.update_queue.join()
+        assert sorted(received) == list(range(10))
+
+    def test_concurrent_updates_limit(self, bot):
+        dispatcher = AsyncDispatcher(bot, Queue(), workers=1, concurrent_updates=2)
+        running = []
+        max_running = []
+
+        async def callback(update, context):
+            running.append(update)
+            max_running.append(len(running))
+            await asyncio.sleep(0.1)
+            running.remove(update)
+
+        dispatcher.add_handler(TypeHandler(int, callback))
+        thr = Thread(target=dispatcher.start)
+        thr.start()
+        for i in range(6):
+            dispatcher.update_queue.put(i)
+        dispatcher.update_queue.join()
+        dispatcher.stop()
+        thr.join()
+        assert max(max_running) == 2
+
+    def test_sync_callbacks(self, adp):
+        received = []
+        adp.add_handler(MessageHandler(Filters.all, lambda u, c: received.append(u)))
+        adp.update_queue.put(self.message_update)
+        adp.update_queue.join()
+        assert received == [self.message_update]
+
+    def test_groups_and_handler_stop(self, adp):
+        received = []
+
+        async def first(update, context):
+            received.append(1)
+
+        async def second(update, context):
+            received.append(2)
+            raise DispatcherHandlerStop
+
+        def third(update, context):
+            received.append(3)
+
+        adp.add_handler(TypeHandler(int, first))
+        adp.add_handler(TypeHandler(int, second), group=1)
+        adp.add_handler(TypeHandler(int, third), group=2)
+        adp.update_queue.put(1)
+        adp.update_queue.join()
+        assert received == [1, 2]
+
+    @pytest.mark.parametrize('coroutine_error_handler', [True, False])
+    def test_error_handler(self, adp, coroutine_error_handler):
+        received = []
+
+        async def callback(update, context):
+            raise ValueError('test')
+
+        if coroutine_error_handler:
+
+            async def error_handler(update, context):
+                received.append(str(context.error))
+
+        else:
+
+            def error_handler(update, context):
+                received.append(str(context.error))
+
+        adp.add_handler(TypeHandler(int, callback))
+        adp.add_error_handler(error_handler)
+        adp.update_queue.put(1)
+        adp.update_queue.join()
+        sleep(0.1)
+        assert received == ['test']
+
+    def test_block_coroutine(self, adp):
+        async def coroutine(value):
+            await asyncio.sleep(0.1)
+            return value
+
+        promise = adp.block(coroutine, 42)
+        assert promise.result(timeout=1) == 42
+
+    def test_run_coroutine(self, adp):
+        assert adp.run_coroutine(asyncio.sleep(0.1, result=42)).result(timeout=1) == 42
+
+    def test_run_coroutine_not_running(self, bot):
+        dispatcher = AsyncDispatcher(bot, Queue())
+        coroutine = asyncio.sleep(0)
+        with pytest.raises(RuntimeError, match='while running'):
+            dispatcher.run_coroutine(coroutine)
+        coroutine.close()
+
+    def test_stop_waits_for_pending_tasks(self, adp):
+        received = []
+
+        async def callback(update, context):
+            await asyncio.sleep(0.5)
+            received.append(update)
+
+        adp.add_handler(TypeHandler(int, callback))
+        adp.update_queue.put(1)
+        adp.stop()
+        assert received == [1]
+        assert adp.loop is None
+
+
+class TestAsyncUpdater:
+    def test_creates_async_dispatcher(self, bot):
+        updater = AsyncUpdater(bot=bot, concurrent_updates=8)
+        assert isinstance(updater.dispatcher, AsyncDispatcher)
+        assert updater.dispatcher.concurrent_updates == 8
+
+    def test_dispatcher_type_check(self, bot):
+        with pytest.raises(TypeError, match='AsyncDispatcher'):
+            AsyncUpdater(dispatcher=Dispatcher(bot, Queue()), workers=None)
+
+    def test_polling(self, bot, monkeypatch):
+        updater = AsyncUpdater(bot=bot)
+        received = []
+        offsets = []
+
+        def get_updates(offset=None, *args, **kwargs):
+            offsets.append(offset)
+            sleep(0.05)
+            if len(offsets) == 1:
+                return [Update(5), Update(6)]
+            return []
+
+        async def callback(update, context):
+            received.append(update.update_id)
+
+        monkeypatch.setattr(bot, 'get_updates', get_updates)
+        monkeypatch.setattr(bot, 'delete_webhook', lambda *args, **kwargs: True)
+        updater.dispatcher.add_handler(TypeHandler(Update, callback))
+
+        updater.start_polling()
+        sleep(0.5)
+        updater.stop()
+        assert received == [5, 6]
+        assert offsets[:2] == [0, 7]
+
+    def test_pipelined_polling(self, bot, monkeypatch):
+        updater = AsyncUpdater(bot=bot)
+        received = []
+        offsets = []
+
+        def get_updates_json(offset=None, *args, **kwargs):
+            offsets.append(offset)
+            sleep(0.05)
+            if len(offsets) == 1:
+                return [{'update_id': 5}, {'update_id': 6}]
+            return []
+
+        async def callback(update, context):
+            received.append(update.update_id)
+
+        monkeypatch.setattr(bot, '_get_updates_json', get_updates_json)
+        monkeypatch.setattr(bot, 'delete_webhook', lambda *args, **kwargs: True)
+        updater.dispatcher.add_handler(TypeHandler(Update, callback))
+
+        updater.start_polling(pipelined=True)
+        sleep(0.5)
+        updater.stop()
+        assert received == [5, 6]
+        assert offsets[:2] == [0, 7]
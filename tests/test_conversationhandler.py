@@ -17,6 +17,8 @@
 # You should have received a copy of the GNU Lesser Public License
 # along with this program.  If not, see [http://www.gnu.org/licenses/].
 import logging
+from queue import Queue
+from threading import Event, Thread, current_thread
 from time import sleep
 
 import pytest
@@ -42,10 +44,14 @@ from TeleGenic.ext import (
     Filters,
     InlineQueryHandler,
     CallbackContext,
+    Dispatcher,
     DispatcherHandlerStop,
     TypeHandler,
     JobQueue,
+    TimerWheel,
+    ConversationStore,
 )
+from TeleGenic.utils.deprecate import TeleGenicDeprecationWarning
 
 
 @pytest.fixture(scope='class')
@@ -793,7 +799,7 @@ class TestConversationHandler:
         assert not handler.check_update(Update(0, pre_checkout_query=pre_checkout_query))
         assert not handler.check_update(Update(0, shipping_query=shipping_query))
 
-    def test_no_jobqueue_warning(self, dp, bot, user1, caplog):
+    def test_timeout_without_jobqueue(self, dp, bot, user1, caplog):
         handler = ConversationHandler(
             entry_points=self.entry_points,
             states=self.states,
@@ -820,20 +826,18 @@ class TestConversationHandler:
 
         with caplog.at_level(logging.WARNING):
             dp.process_update(Update(update_id=0, message=message))
-            sleep(0.5)
-        assert len(caplog.records) == 1
-        assert (
-            caplog.records[0].message
-            == "Ignoring `conversation_timeout` because the Dispatcher has no JobQueue."
-        )
+            assert handler.conversations.get((self.group.id, user1.id)) == self.THIRSTY
+            sleep(0.75)
+        assert not caplog.records
+        assert handler.conversations.get((self.group.id, user1.id)) is None
         # now set dp.job_queue back to it's original value
         dp.job_queue = jqueue
 
     def test_schedule_job_exception(self, dp, bot, user1, monkeypatch, caplog):
-        def mocked_run_once(*a, **kw):
+        def mocked_start(*a, **kw):
             raise Exception("job error")
 
-        monkeypatch.setattr(dp.job_queue, "run_once", mocked_run_once)
+        monkeypatch.setattr(TimerWheel, "start", mocked_start)
         handler = ConversationHandler(
             entry_points=self.entry_points,
             states=self.states,
@@ -948,6 +952,172 @@ class TestConversationHandler:
         sleep(0.7)
         assert handler.conversations.get((self.group.id, user1.id)) is None
 
+    def test_timeout_jobs_deprecated(self, dp, bot, user1):
+        handler = ConversationHandler(
+            entry_points=self.entry_points,
+            states=self.states,
+            fallbacks=self.fallbacks,
+            conversation_timeout=100,
+        )
+        dp.add_handler(handler)
+        message = Message(
+            0,
+            None,
+            self.group,
+            from_user=user1,
+            text='/start',
+            entities=[
+                MessageEntity(type=MessageEntity.BOT_COMMAND, offset=0, length=len('/start'))
+            ],
+            bot=bot,
+        )
+        dp.process_update(Update(update_id=0, message=message))
+
+        with pytest.warns(TeleGenicDeprecationWarning, match='timeout_jobs is deprecated'):
+            assert handler.timeout_jobs == {(self.group.id, user1.id): None}
+        with pytest.raises(ValueError, match='timeout_jobs'):
+            handler.timeout_jobs = {}
+        handler.conversations.cancel_timeout((self.group.id, user1.id))
+        with pytest.warns(TeleGenicDeprecationWarning):
+            assert handler.timeout_jobs == {}
+
+    def test_conversation_timeout_single_thread(self, bot, user1, user2):
+        # Stopping the dispatcher stops its worker threads, so the shared one can't be used
+        dp = Dispatcher(bot, Queue(), workers=1, use_context=False)
+        ready = Event()
+        thread = Thread(target=dp.start, kwargs={'ready': ready})
+        thread.start()
+        ready.wait()
+        handler = ConversationHandler(
+            entry_points=self.entry_points,
+            states=self.states,
+            fallbacks=self.fallbacks,
+            conversation_timeout=0.5,
+        )
+        dp.add_handler(handler)
+
+        for user in (user1, user2):
+            message = Message(
+                0,
+                None,
+                self.group,
+                from_user=user,
+                text='/start',
+                entities=[
+                    MessageEntity(type=MessageEntity.BOT_COMMAND, offset=0, length=len('/start'))
+                ],
+                bot=bot,
+            )
+            dp.process_update(Update(update_id=0, message=message))
+            assert handler.conversations.get((self.group.id, user.id)) == self.THIRSTY
+        # One thread of the dispatcher tracks the timeouts of all conversations
+        assert handler.conversations.timer_wheel is dp.timer_wheel
+        assert dp.timer_wheel.running
+        assert handler.conversations.has_timeout((self.group.id, user1.id))
+        assert handler.conversations.has_timeout((self.group.id, user2.id))
+        sleep(0.75)
+        assert handler.conversations.get((self.group.id, user1.id)) is None
+        assert handler.conversations.get((self.group.id, user2.id)) is None
+        assert not handler.conversations.has_timeout((self.group.id, user1.id))
+
+        dp.stop()
+        thread.join()
+        assert not dp.timer_wheel.running
+
+    def test_timeouts_run_in_worker_threads(self, bot, user1, user2):
+        dp = Dispatcher(bot, Queue(), workers=2, use_context=False)
+        ready = Event()
+        thread = Thread(target=dp.start, kwargs={'ready': ready})
+        thread.start()
+        ready.wait()
+        threads = []
+
+        def slow_timeout(bot, update):
+            threads.append(current_thread().name)
+            sleep(0.5)
+
+        self.states.update({ConversationHandler.TIMEOUT: [TypeHandler(Update, slow_timeout)]})
+        handler = ConversationHandler(
+            entry_points=self.entry_points,
+            states=self.states,
+            fallbacks=self.fallbacks,
+            conversation_timeout=0.1,
+        )
+        dp.add_handler(handler)
+        for user in (user1, user2):
+            message = Message(
+                0,
+                None,
+                self.group,
+                from_user=user,
+                text='/start',
+                entities=[
+                    MessageEntity(type=MessageEntity.BOT_COMMAND, offset=0, length=len('/start'))
+                ],
+                bot=bot,
+            )
+            dp.process_update(Update(update_id=0, message=message))
+
+        # The slow handlers neither block the timer wheel nor each other
+        sleep(0.45)
+        assert len(threads) == 2
+        assert all(':worker:' in name for name in threads)
+        dp.stop()
+        thread.join()
+
+    def test_outdated_timeout_is_ignored(self, dp, bot, user1, monkeypatch):
+        callbacks = []
+        set_timeout = ConversationStore.set_timeout
+
+        def capture_set_timeout(store, key, timeout, data=None):
+            callbacks.append(data)
+            return set_timeout(store, key, timeout, data)
+
+        monkeypatch.setattr(ConversationStore, 'set_timeout', capture_set_timeout)
+        self.states.update({ConversationHandler.TIMEOUT: [TypeHandler(Update, self.passout2)]})
+        handler = ConversationHandler(
+            entry_points=self.entry_points,
+            states=self.states,
+            fallbacks=self.fallbacks,
+            conversation_timeout=100,
+        )
+        dp.add_handler(handler)
+        key = (self.group.id, user1.id)
+
+        message = Message(
+            0,
+            None,
+            self.group,
+            from_user=user1,
+            text='/start',
+            entities=[
+                MessageEntity(type=MessageEntity.BOT_COMMAND, offset=0, length=len('/start'))
+            ],
+            bot=bot,
+        )
+        dp.process_update(Update(update_id=0, message=message))
+        message.text = '/brew'
+        message.entities[0].length = len('/brew')
+        dp.process_update(Update(update_id=1, message=message))
+        assert len(callbacks) == 2
+
+        # The conversation got a newer timeout
+        callbacks[0]()
+        assert handler.conversations.get(key) == self.BREWING
+        assert not self.is_timeout
+
+        # The state changed
+        handler.conversations.cancel_timeout(key)
+        handler.conversations[key] = self.DRINKING
+        callbacks[1]()
+        assert handler.conversations.get(key) == self.DRINKING
+        assert not self.is_timeout
+
+        handler.conversations[key] = self.BREWING
+        callbacks[1]()
+        assert handler.conversations.get(key) is None
+        assert self.is_timeout
+
     def test_timeout_not_triggered_on_conv_end_async(self, bot, dp, user1):
         def timeout(*a, **kw):
             self.test_flag = True
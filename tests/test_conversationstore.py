@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+import pickle
+import time
+from copy import copy
+
+from TeleGenic.ext import ConversationStore, TimerWheel
+
+
+class TestConversationStore:
+    def test_slot_behaviour(self, mro_slots):
+        inst = ConversationStore()
+        for attr in inst.__slots__:
+            assert getattr(inst, attr, 'err') != 'err', f"got extra slot '{attr}'"
+        assert len(mro_slots(inst)) == len(set(mro_slots(inst))), "duplicate slot"
+
+    def test_is_dict(self):
+        store = ConversationStore({(1,): 'state'})
+        assert store == {(1,): 'state'}
+        assert store.next_deadline() is None
+        assert store.pop_expired() == []
+
+    def test_pop_expired(self):
+        store = ConversationStore({(1,): 1, (2,): 2, (3,): 3})
+        deadline = store.set_timeout((2,), 0.01, 'two')
+        store.set_timeout((1,), 0.02, 'one')
+        store.set_timeout((3,), 100, 'three')
+        assert store.next_deadline() == deadline
+        assert store.has_timeout((2,))
+
+        assert store.pop_expired(now=deadline - 0.001) == []
+        time.sleep(0.05)
+        assert store.pop_expired() == [((2,), 'two'), ((1,), 'one')]
+        assert store.pop_expired() == []
+        assert not store.has_timeout((2,))
+        assert store.has_timeout((3,))
+        # The states are kept
+        assert store == {(1,): 1, (2,): 2, (3,): 3}
+
+    def test_reschedule_and_cancel(self):
+        store = ConversationStore()
+        store.set_timeout((1,), 0, 'old')
+        store.set_timeout((1,), 100, 'new')
+        store.set_timeout((2,), 0)
+        assert store.cancel_timeout((2,))
+        assert not store.cancel_timeout((2,))
+        assert store.pop_expired(now=time.monotonic() + 1) == []
+        assert store.has_timeout((1,))
+
+    def test_delete_cancels_timeout(self):
+        store = ConversationStore({(1,): 1, (2,): 2, (3,): 3})
+        for key in store:
+            store.set_timeout(key, 0)
+        del store[(1,)]
+        store.pop((2,))
+        assert store.pop_expired(now=time.monotonic() + 1) == [((3,), None)]
+
+        store[(4,)] = 4
+        store.set_timeout((4,), 0)
+        store.clear()
+        assert store.next_deadline() is None
+
+    def test_shared_timer_wheel(self):
+        timer_wheel = TimerWheel()
+        first = ConversationStore({(1,): 1}, timer_wheel=timer_wheel)
+        second = ConversationStore({(1,): 1}, timer_wheel=timer_wheel)
+        assert first.timer_wheel is second.timer_wheel
+        first.set_timeout((1,), 100, 'first')
+        second.set_timeout((1,), 100, 'second')
+        assert len(timer_wheel) == 2
+
+        second.clear()
+        assert len(timer_wheel) == 1
+        assert first.has_timeout((1,))
+        assert not second.has_timeout((1,))
+        assert first.pop_expired(now=time.monotonic() + 101) == [((1,), 'first')]
+
+    def test_copy_and_pickle(self):
+        store = ConversationStore({(1,): 'state'})
+        store.set_timeout((1,), 100)
+        assert type(copy(store)) is dict
+        assert type(store.copy()) is dict
+        restored = pickle.loads(pickle.dumps(store))
+        assert type(restored) is dict
+        assert restored == {(1,): 'state'}
@@ -17,27 +17,54 @@
 # You should have received a copy of the GNU Lesser Public License
 # along with this program.  If not, see [http://www.gnu.org/licenses/].
 import logging
+import re
 from queue import Queue
-from threading import current_thread
+from threading import Event, Thread, current_thread
 from time import sleep
 
 import pytest
 
-from TeleGenic import TeleGenicError, Message, User, Chat, Update, Bot, MessageEntity
+from TeleGenic import (
+    TeleGenicError,
+    Message,
+    User,
+    Chat,
+    Update,
+    Bot,
+    MessageEntity,
+    CallbackQuery,
+    InlineQuery,
+)
 from TeleGenic.ext import (
     MessageHandler,
     Filters,
     Defaults,
     CommandHandler,
+    CallbackQueryHandler,
+    ChatMemberHandler,
+    InlineQueryHandler,
+    PrefixHandler,
+    TypeHandler,
     CallbackContext,
     JobQueue,
     BasePersistence,
     ContextTypes,
+    TrackingDict,
 )
 from TeleGenic.ext.dispatcher import block, Dispatcher, DispatcherHandlerStop
 from TeleGenic.utils.deprecate import TeleGenicDeprecationWarning
 from TeleGenic.utils.helpers import DEFAULT_FALSE
-from tests.conftest import create_dp
+from TeleGenic.ext.utils.handlerindex import (
+    CALLBACK_PREFIX,
+    CHAT_TYPE,
+    COMMAND,
+    UPDATE_TYPE,
+    HandlerIndex,
+    handler_routing_keys,
+    regex_literal_prefix,
+    update_routing_keys,
+)
+from tests.conftest import create_dp, make_command_update
 from collections import defaultdict
 
 
@@ -456,6 +483,159 @@ class TestDispatcher:
         sleep(0.1)
         assert self.count == 3
 
+    def test_indexed_routing_keeps_order_in_group(self, dp):
+        dp.add_handler(MessageHandler(Filters.photo, self.callback_set_count(1)))
+        dp.add_handler(CommandHandler('test', self.callback_set_count(2)))
+        dp.add_handler(CommandHandler('other', self.callback_set_count(3)))
+        dp.add_handler(MessageHandler(Filters.all, self.callback_set_count(4)))
+
+        dp.process_update(make_command_update('/test', bot=dp.bot))
+        assert self.count == 2
+        dp.process_update(make_command_update('/other', bot=dp.bot))
+        assert self.count == 3
+        dp.process_update(make_command_update('/unknown', bot=dp.bot))
+        assert self.count == 4
+
+    def test_indexed_routing_wildcard_before_keyed(self, dp):
+        dp.add_handler(MessageHandler(Filters.all, self.callback_set_count(1)))
+        dp.add_handler(CommandHandler('test', self.callback_set_count(2)))
+        dp.process_update(make_command_update('/test', bot=dp.bot))
+        assert self.count == 1
+
+    def test_indexed_routing_skips_unrelated_handlers(self, dp, monkeypatch):
+        checked = []
+        original = CommandHandler.check_update
+
+        def check_update(handler, update):
+            checked.append(handler.command)
+            return original(handler, update)
+
+        monkeypatch.setattr(CommandHandler, 'check_update', check_update)
+        dp.add_handler(CommandHandler('other', self.callback_set_count(1)))
+        dp.add_handler(CommandHandler('test', self.callback_set_count(2)))
+
+        dp.process_update(make_command_update('/test', bot=dp.bot))
+        assert self.count == 2
+        assert checked == [['test']]
+
+    def test_indexed_routing_subclass_overriding_check_update(self, dp):
+        class AlwaysCommandHandler(CommandHandler):
+            def check_update(self, update):
+                return True
+
+        dp.add_handler(AlwaysCommandHandler('other', self.callback_set_count(1)))
+        dp.process_update(self.message_update)
+        assert self.count == 1
+
+    def test_indexed_routing_prefix_handler(self, dp):
+        dp.add_handler(PrefixHandler('!', 'test', self.callback_set_count(1)))
+        dp.process_update(make_command_update('!test', bot=dp.bot))
+        assert self.count == 1
+
+    def test_indexed_routing_add_remove(self, dp):
+        handler = CommandHandler('test', self.callback_increase_count)
+        dp.add_handler(handler)
+        dp.process_update(make_command_update('/test', bot=dp.bot))
+        assert self.count == 1
+
+        dp.remove_handler(handler)
+        dp.add_handler(CommandHandler('other', self.callback_increase_count))
+        dp.process_update(make_command_update('/test', bot=dp.bot))
+        assert self.count == 1
+        dp.process_update(make_command_update('/other', bot=dp.bot))
+        assert self.count == 2
+
+    def test_indexed_routing_replaced_handler(self, dp):
+        dp.add_handler(CommandHandler('test', self.callback_set_count(1)))
+        dp.process_update(make_command_update('/test', bot=dp.bot))
+        assert self.count == 1
+
+        dp.handlers[0][0] = CommandHandler('other', self.callback_set_count(2))
+        dp.process_update(make_command_update('/other', bot=dp.bot))
+        assert self.count == 2
+
+    def test_indexed_routing_changed_attribute(self, dp):
+        handler = CommandHandler('test', self.callback_set_count(1))
+        dp.add_handler(handler)
+        dp.process_update(make_command_update('/test', bot=dp.bot))
+        assert self.count == 1
+
+        handler.command = ['other']
+        self.count = 0
+        dp.process_update(make_command_update('/test', bot=dp.bot))
+        assert self.count == 0
+        dp.process_update(make_command_update('/other', bot=dp.bot))
+        assert self.count == 1
+
+    def test_indexed_routing_chat_type(self, dp):
+        dp.add_handler(InlineQueryHandler(self.callback_set_count(1), chat_types=['private']))
+        dp.add_handler(InlineQueryHandler(self.callback_set_count(2)))
+        for chat_type, expected in (('private', 1), ('group', 2), (None, 2)):
+            inline_query = InlineQuery(1, User(1, '', False), 'query', '', chat_type=chat_type)
+            dp.process_update(Update(1, inline_query=inline_query))
+            assert self.count == expected
+
+    @pytest.mark.parametrize(
+        'data,expected',
+        [('abc_1', 1), ('abd', 2), ('xyz', 3), ('a', 3)],
+        ids=['prefix', 'other prefix', 'no prefix', 'short data'],
+    )
+    def test_indexed_routing_callback_query(self, dp, data, expected):
+        dp.add_handler(CallbackQueryHandler(self.callback_set_count(1), pattern='^abc'))
+        dp.add_handler(CallbackQueryHandler(self.callback_set_count(2), pattern='ab.'))
+        dp.add_handler(CallbackQueryHandler(self.callback_set_count(3)))
+
+        callback_query = CallbackQuery(1, User(1, '', False), 'chat', data=data)
+        dp.process_update(Update(1, callback_query=callback_query))
+        assert self.count == expected
+
+    @pytest.mark.parametrize(
+        'pattern,prefix',
+        [
+            ('^abc', 'abc'),
+            ('abc.*', 'abc'),
+            ('abc?', 'ab'),
+            ('ab{2}', 'a'),
+            ('a|b', ''),
+            ('(abc)', ''),
+            (re.compile('abc', re.IGNORECASE), ''),
+            (str, ''),
+            (None, ''),
+        ],
+    )
+    def test_regex_literal_prefix(self, pattern, prefix):
+        if isinstance(pattern, str):
+            pattern = re.compile(pattern)
+        assert regex_literal_prefix(pattern) == prefix
+
+    def test_handler_index_slots(self, mro_slots):
+        index = HandlerIndex([])
+        for attr in index.__slots__:
+            assert getattr(index, attr, 'err') != 'err', f"got extra slot '{attr}'"
+        assert not hasattr(index, '__dict__')
+        assert len(mro_slots(index)) == len(set(mro_slots(index))), "duplicate slot"
+
+    def test_handler_routing_keys(self):
+        handlers = [
+            CommandHandler('start', self.callback_increase_count),
+            CallbackQueryHandler(self.callback_increase_count, pattern='^abc'),
+            CallbackQueryHandler(self.callback_increase_count),
+            ChatMemberHandler(self.callback_increase_count),
+        ]
+        assert [handler_routing_keys(handler) for handler in handlers] == [
+            [(COMMAND, 'start')],
+            [(CALLBACK_PREFIX, 'abc')],
+            [(UPDATE_TYPE, 'callback_query')],
+            [(UPDATE_TYPE, 'my_chat_member'), (UPDATE_TYPE, 'chat_member')],
+        ]
+        handler = InlineQueryHandler(self.callback_increase_count, chat_types=['private'])
+        assert handler_routing_keys(handler) == [(CHAT_TYPE, ('inline_query', 'private'))]
+
+    def test_update_routing_keys_chat_type(self):
+        keys, _ = update_routing_keys(make_command_update('/test', chat=Chat(1, 'private')))
+        assert (UPDATE_TYPE, 'message') in keys
+        assert (CHAT_TYPE, ('message', 'private')) in keys
+
     def test_add_handler_errors(self, dp):
         handler = 'not a handler'
         with pytest.raises(TypeError, match='handler is not an instance of'):
@@ -1020,3 +1200,163 @@ class TestDispatcher:
         dispatcher.process_update(self.message_update)
         sleep(0.1)
         assert self.received == (CustomContext, float, complex, int)
+
+    def test_lanes_keep_order_per_chat(self, bot):
+        dispatcher = Dispatcher(bot, Queue(), workers=1, lanes=4)
+        received = defaultdict(list)
+        threads = set()
+
+        def callback(update, context):
+            threads.add(current_thread().name)
+            sleep(0.01 if update.message.message_id % 2 else 0)
+            received[update.effective_chat.id].append(update.message.message_id)
+
+        dispatcher.add_handler(MessageHandler(Filters.all, callback))
+        thr = Thread(target=dispatcher.start)
+        thr.start()
+        for message_id in range(20):
+            for chat_id in range(4):
+                message = Message(message_id, None, Chat(chat_id, 'private'), text='Text')
+                dispatcher.update_queue.put(Update(message_id, message=message))
+        dispatcher.update_queue.join()
+        dispatcher.stop()
+        thr.join()
+
+        assert all(received[chat_id] == list(range(20)) for chat_id in range(4))
+        assert all('lane' in name for name in threads)
+        assert len(threads) > 1
+
+    def test_lanes_custom_key(self, bot):
+        keys = []
+        threads = set()
+
+        def lane_key(update):
+            keys.append(update)
+            return 'key'
+
+        dispatcher = Dispatcher(bot, Queue(), workers=1, lanes=2, lane_key=lane_key)
+        dispatcher.add_handler(TypeHandler(str, lambda u, c: threads.add(current_thread().name)))
+        thr = Thread(target=dispatcher.start)
+        thr.start()
+        dispatcher.update_queue.put('update')
+        dispatcher.update_queue.put('other update')
+        dispatcher.update_queue.join()
+        dispatcher.stop()
+        thr.join()
+
+        assert keys == ['update', 'other update']
+        assert len(threads) == 1
+
+    def test_lanes_stop_processes_pending_updates(self, bot):
+        dispatcher = Dispatcher(bot, Queue(), workers=1, lanes=2)
+        received = []
+
+        def callback(update, context):
+            sleep(0.05)
+            received.append(update)
+
+        dispatcher.add_handler(TypeHandler(int, callback))
+        ready = Event()
+        thr = Thread(target=dispatcher.start, kwargs={'ready': ready})
+        thr.start()
+        ready.wait()
+        for i in range(5):
+            dispatcher.update_queue.put(i)
+        dispatcher.stop()
+        thr.join()
+        assert received == list(range(5))
+
+    def test_max_workers_smaller_than_workers(self, bot):
+        with pytest.raises(ValueError, match='max_workers'):
+            Dispatcher(bot, Queue(), workers=2, max_workers=1)
+
+    def test_elastic_worker_pool(self, bot):
+        dispatcher = Dispatcher(bot, Queue(), workers=1, max_workers=3, worker_idle_timeout=0.1)
+        release = Event()
+        ready = Event()
+        thr = Thread(target=dispatcher.start, kwargs={'ready': ready})
+        thr.start()
+        ready.wait()
+        assert dispatcher.worker_pool_size == 1
+
+        promises = [dispatcher.block(release.wait) for _ in range(5)]
+        sleep(0.1)
+        # The pool grew to its maximum, because all workers are busy
+        assert dispatcher.worker_pool_size == 3
+
+        release.set()
+        for promise in promises:
+            promise.result(timeout=1)
+        sleep(0.5)
+        # The additional workers stopped after being idle
+        assert dispatcher.worker_pool_size == 1
+        assert dispatcher.worker_queue_latency > 0
+
+        dispatcher.stop()
+        thr.join()
+        assert dispatcher.worker_pool_size == 0
+
+    def test_fixed_worker_pool(self, bot):
+        dispatcher = Dispatcher(bot, Queue(), workers=2)
+        ready = Event()
+        thr = Thread(target=dispatcher.start, kwargs={'ready': ready})
+        thr.start()
+        ready.wait()
+
+        promises = [dispatcher.block(sleep, 0.05) for _ in range(6)]
+        for promise in promises:
+            promise.result(timeout=1)
+        assert dispatcher.max_workers == 2
+        assert dispatcher.worker_pool_size == 2
+
+        dispatcher.stop()
+        thr.join()
+
+    def test_update_persistence_skips_unchanged_tracking_dicts(self, bot):
+        written = []
+
+        class OwnPersistence(BasePersistence):
+            def get_bot_data(self):
+                return TrackingDict()
+
+            def update_bot_data(self, data):
+                written.append('bot_data')
+
+            def get_chat_data(self):
+                return defaultdict(TrackingDict)
+
+            def update_chat_data(self, chat_id, data):
+                written.append(('chat_data', chat_id))
+
+            def get_user_data(self):
+                return defaultdict(TrackingDict)
+
+            def update_user_data(self, user_id, data):
+                written.append(('user_data', user_id))
+
+            def get_conversations(self, name):
+                pass
+
+            def update_conversation(self, name, key, new_state):
+                pass
+
+        context_types = ContextTypes(
+            bot_data=TrackingDict, chat_data=TrackingDict, user_data=TrackingDict
+        )
+        dispatcher = Dispatcher(
+            bot, Queue(), workers=1, persistence=OwnPersistence(), context_types=context_types
+        )
+
+        def callback(update, context):
+            if update.message.text == 'change':
+                context.chat_data['changed'] = True
+
+        dispatcher.add_handler(MessageHandler(Filters.all, callback))
+        message = Message(1, None, Chat(1, 'private'), from_user=User(2, '', False), text='read')
+        dispatcher.process_update(Update(1, message=message))
+        assert written == []
+
+        message = Message(2, None, Chat(1, 'private'), from_user=User(2, '', False), text='change')
+        dispatcher.process_update(Update(2, message=message))
+        assert written == [('chat_data', 1)]
+        assert not dispatcher.chat_data[1].changed
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+import json
+
+import pytest
+
+from TeleGenic.ext import JsonLinesPersistence
+
+
+@pytest.fixture(scope='function')
+def filepath(tmp_path):
+    return str(tmp_path / 'persistence.jsonl')
+
+
+@pytest.fixture(scope='function')
+def jsonlines_persistence(filepath):
+    return JsonLinesPersistence(filepath, store_callback_data=True)
+
+
+def read_lines(filepath):
+    with open(filepath, encoding='utf-8') as file:
+        return [json.loads(line) for line in file]
+
+
+class TestJsonLinesPersistence:
+    def test_slot_behaviour(self, jsonlines_persistence, mro_slots, recwarn):
+        inst = jsonlines_persistence
+        for attr in inst.__slots__:
+            assert getattr(inst, attr, 'err') != 'err', f"got extra slot '{attr}'"
+        assert len(mro_slots(inst)) == len(set(mro_slots(inst))), "duplicate slot"
+        inst.custom, inst.filepath = 'should give warning', inst.filepath
+        assert len(recwarn) == 1 and 'custom' in str(recwarn[0].message), recwarn.list
+
+    def test_no_file(self, jsonlines_persistence):
+        assert jsonlines_persistence.get_user_data() == {}
+        assert jsonlines_persistence.get_chat_data() == {}
+        assert jsonlines_persistence.get_bot_data() == {}
+        assert jsonlines_persistence.get_callback_data() is None
+        assert jsonlines_persistence.get_conversations('name') == {}
+
+    def test_round_trip(self, jsonlines_persistence, filepath):
+        jsonlines_persistence.get_user_data()
+        jsonlines_persistence.update_user_data(1, {'a': 'b', 2: 3})
+        jsonlines_persistence.update_chat_data(-1, {'c': 'd'})
+        jsonlines_persistence.update_bot_data({'e': 'f'})
+        jsonlines_persistence.update_callback_data(([('uuid', 1.5, {'g': 'h'})], {'i': 'uuid'}))
+        jsonlines_persistence.update_conversation('name', (1, 2), 3)
+
+        restored = JsonLinesPersistence(filepath, store_callback_data=True)
+        assert restored.get_user_data() == {1: {'a': 'b', 2: 3}}
+        assert restored.get_chat_data() == {-1: {'c': 'd'}}
+        assert restored.get_bot_data() == {'e': 'f'}
+        assert restored.get_callback_data() == ([('uuid', 1.5, {'g': 'h'})], {'i': 'uuid'})
+        assert restored.get_conversations('name') == {(1, 2): 3}
+        assert restored.user_data_json == json.dumps({1: {'a': 'b', 2: 3}})
+
+    def test_one_line_per_change(self, jsonlines_persistence, filepath):
+        jsonlines_persistence.get_user_data()
+        jsonlines_persistence.update_user_data(1, {'a': 'b'})
+        jsonlines_persistence.update_user_data(2, {'c': 'd'})
+        jsonlines_persistence.update_user_data(2, {'c': 'd'})
+        jsonlines_persistence.update_user_data(1, {'a': 'e'})
+        assert read_lines(filepath) == [
+            {'type': 'user_data', 'id': 1, 'data': {'a': 'b'}},
+            {'type': 'user_data', 'id': 2, 'data': {'c': 'd'}},
+            {'type': 'user_data', 'id': 1, 'data': {'a': 'e'}},
+        ]
+        assert JsonLinesPersistence(filepath).get_user_data() == {1: {'a': 'e'}, 2: {'c': 'd'}}
+
+    def test_flush(self, jsonlines_persistence, filepath):
+        jsonlines_persistence.get_user_data()
+        for value in range(3):
+            jsonlines_persistence.update_user_data(1, {'value': value})
+        jsonlines_persistence.update_conversation('name', (1,), 1)
+        jsonlines_persistence.update_conversation('name', (1,), None)
+        jsonlines_persistence.flush()
+        assert read_lines(filepath) == [{'type': 'user_data', 'id': 1, 'data': {'value': 2}}]
+
+        # Appending continues after flushing
+        jsonlines_persistence.update_user_data(2, {})
+        assert len(read_lines(filepath)) == 2
+
+    def test_flush_before_loading(self, jsonlines_persistence, filepath):
+        jsonlines_persistence.get_user_data()
+        jsonlines_persistence.update_user_data(1, {'a': 'b'})
+        JsonLinesPersistence(filepath).flush()
+        assert JsonLinesPersistence(filepath).get_user_data() == {1: {'a': 'b'}}
+
+    def test_on_flush(self, filepath):
+        persistence = JsonLinesPersistence(filepath, on_flush=True)
+        persistence.get_user_data()
+        persistence.update_user_data(1, {'a': 'b'})
+        assert JsonLinesPersistence(filepath).get_user_data() == {}
+        persistence.flush()
+        assert JsonLinesPersistence(filepath).get_user_data() == {1: {'a': 'b'}}
+
+    def test_incomplete_last_line(self, jsonlines_persistence, filepath):
+        jsonlines_persistence.get_user_data()
+        jsonlines_persistence.update_user_data(1, {'a': 'b'})
+        with open(filepath, 'a', encoding='utf-8') as file:
+            file.write('{"type": "user_data", "id": 2, "da')
+
+        restored = JsonLinesPersistence(filepath)
+        assert restored.get_user_data() == {1: {'a': 'b'}}
+        restored.update_user_data(3, {'c': 'd'})
+        assert JsonLinesPersistence(filepath).get_user_data() == {1: {'a': 'b'}, 3: {'c': 'd'}}
+
+    @pytest.mark.parametrize(
+        'line', ['no json', '{"type": "unknown"}', '{"type": "user_data", "id": "a", "data": {}}']
+    )
+    def test_invalid_line(self, filepath, line):
+        with open(filepath, 'w', encoding='utf-8') as file:
+            file.write(line + '\n')
+        with pytest.raises(TypeError, match='line 1'):
+            JsonLinesPersistence(filepath).get_user_data()
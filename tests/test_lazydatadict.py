@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+import copy
+import pickle
+from collections import defaultdict
+
+import pytest
+
+from TeleGenic.ext import LazyDataDict
+
+
+@pytest.fixture(scope='function')
+def stored():
+    return {1: {'a': 1}, 2: {'b': 2}, 3: {'c': 3}}
+
+
+@pytest.fixture(scope='function')
+def evicted():
+    return []
+
+
+@pytest.fixture(scope='function')
+def lazy_dict(stored, evicted):
+    return LazyDataDict(
+        dict, stored.get, max_size=2, on_evict=lambda key, value: evicted.append((key, value))
+    )
+
+
+class TestLazyDataDict:
+    def test_slot_behaviour(self, lazy_dict, mro_slots):
+        for attr in lazy_dict.__slots__:
+            assert getattr(lazy_dict, attr, 'err') != 'err', f"got extra slot '{attr}'"
+        assert len(mro_slots(lazy_dict)) == len(set(mro_slots(lazy_dict))), "same slot"
+
+    def test_is_defaultdict(self, lazy_dict):
+        assert isinstance(lazy_dict, defaultdict)
+        assert lazy_dict.default_factory is dict
+
+    def test_loads_on_access(self, lazy_dict):
+        assert len(lazy_dict) == 0
+        assert 1 not in lazy_dict
+        assert lazy_dict[1] == {'a': 1}
+        assert 1 in lazy_dict
+        assert lazy_dict[1] is lazy_dict[1]
+
+    def test_default_factory(self, lazy_dict):
+        assert lazy_dict[4] == {}
+        lazy_dict[4]['d'] = 4
+        assert lazy_dict[4] == {'d': 4}
+
+    def test_no_default_factory(self, stored):
+        lazy_dict = LazyDataDict(None, stored.get)
+        assert lazy_dict[1] == {'a': 1}
+        with pytest.raises(KeyError):
+            lazy_dict[4]
+
+    def test_evicts_least_recently_used(self, lazy_dict, evicted):
+        lazy_dict[1]
+        lazy_dict[2]
+        lazy_dict[1]
+        lazy_dict[3]
+        assert list(lazy_dict) == [1, 3]
+        assert evicted == [(2, {'b': 2})]
+
+        lazy_dict[5] = {'e': 5}
+        assert list(lazy_dict) == [3, 5]
+        assert evicted == [(2, {'b': 2}), (1, {'a': 1})]
+
+    def test_no_max_size(self, stored, evicted):
+        lazy_dict = LazyDataDict(dict, stored.get, on_evict=lambda *args: evicted.append(args))
+        for key in range(10):
+            lazy_dict[key]
+        assert len(lazy_dict) == 10
+        assert evicted == []
+
+    def test_failing_eviction_keeps_data(self, stored, caplog):
+        def on_evict(_, __):
+            raise RuntimeError('database unavailable')
+
+        lazy_dict = LazyDataDict(dict, stored.get, max_size=1, on_evict=on_evict)
+        lazy_dict[1]
+        lazy_dict[2]
+        assert list(lazy_dict) == [2, 1]
+        assert 'Keeping it in memory' in caplog.text
+
+    def test_copy(self, lazy_dict):
+        lazy_dict[1]
+        copies = [lazy_dict.copy(), copy.copy(lazy_dict), pickle.loads(pickle.dumps(lazy_dict))]
+        for copied in copies:
+            assert type(copied) is defaultdict
+            assert copied == {1: {'a': 1}}
+            assert copied.default_factory is dict
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+import threading
+import time
+
+import pytest
+
+from TeleGenic import Chat, Message, Update, User
+from TeleGenic.error import InvalidToken, NetworkError
+from TeleGenic.ext import ExtBot, MultiBotUpdater, TypeHandler
+
+TOKENS = ('123:ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghi', '456:ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghi')
+
+
+def make_update(update_id):
+    return Update(
+        update_id,
+        message=Message(1, None, Chat(1, ''), from_user=User(1, '', False), text='multi'),
+    )
+
+
+@pytest.fixture(scope='function')
+def multi_updater():
+    multi_updater = MultiBotUpdater(poll_workers=2, workers=2)
+    yield multi_updater
+    multi_updater.stop()
+
+
+class TestMultiBotUpdater:
+    def test_slot_behaviour(self, multi_updater, mro_slots):
+        for attr in multi_updater.__slots__:
+            assert getattr(multi_updater, attr, 'err') != 'err', f"got extra slot '{attr}'"
+        assert len(mro_slots(multi_updater)) == len(set(mro_slots(multi_updater))), "same slot"
+
+    def test_add_bot(self, multi_updater):
+        dispatchers = [multi_updater.add_bot(token) for token in TOKENS]
+        assert multi_updater.dispatchers == dict(zip(TOKENS, dispatchers))
+        # All bots share the connection pool
+        assert dispatchers[0].bot.request is dispatchers[1].bot.request
+        assert dispatchers[0].bot.api_key == TOKENS[0]
+        with pytest.raises(ValueError, match='already added'):
+            multi_updater.add_bot(TOKENS[0])
+
+    def test_invalid_arguments(self):
+        with pytest.raises(ValueError, match='must be positive'):
+            MultiBotUpdater(poll_workers=0)
+
+    def test_polling(self, monkeypatch, multi_updater):
+        offsets = {token: [] for token in TOKENS}
+        timeouts = []
+        deleted = []
+
+        def get_updates(bot, offset=None, timeout=0, **kwargs):
+            offsets[bot.api_key].append(offset)
+            timeouts.append(timeout)
+            time.sleep(0.01)
+            if bot.api_key == TOKENS[0]:
+                return [make_update(i) for i in range(offset or 0, (offset or 0) + 2)]
+            return [make_update(100)] if not offset else []
+
+        monkeypatch.setattr(ExtBot, 'get_updates', get_updates)
+        monkeypatch.setattr(
+            ExtBot, 'delete_webhook', lambda bot, **kwargs: deleted.append(bot.api_key)
+        )
+
+        received = {token: [] for token in TOKENS}
+        for token in TOKENS:
+            dispatcher = multi_updater.add_bot(token)
+            dispatcher.add_handler(
+                TypeHandler(
+                    Update, lambda u, c, t=token: received[t].append((c.bot.api_key, u.update_id))
+                )
+            )
+
+        multi_updater.start_polling(poll_interval=0.05, timeout=5)
+        time.sleep(0.3)
+        multi_updater.stop()
+        assert not multi_updater.running
+
+        assert sorted(deleted) == sorted(TOKENS)
+        assert set(timeouts) == {5}
+        # Updates are routed to the dispatcher of their bot and processed in order
+        ids = [update_id for _, update_id in received[TOKENS[0]]]
+        assert ids == list(range(len(ids)))
+        assert len(ids) >= 4
+        assert {token for token, _ in received[TOKENS[0]]} == {TOKENS[0]}
+        assert received[TOKENS[1]] == [(TOKENS[1], 100)]
+        # The offsets are confirmed per bot
+        assert offsets[TOKENS[0]][:2] == [0, 2]
+        assert offsets[TOKENS[1]][:2] == [0, 101]
+
+    def test_long_polling_by_default(self, monkeypatch):
+        timeouts = []
+        threads = set()
+        tokens = [f'{i}:ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghi' for i in range(100, 110)]
+
+        def get_updates(bot, offset=None, timeout=0, **kwargs):
+            timeouts.append(timeout)
+            threads.add(threading.current_thread().name)
+            time.sleep(0.2)
+            return []
+
+        monkeypatch.setattr(ExtBot, 'get_updates', get_updates)
+        monkeypatch.setattr(ExtBot, 'delete_webhook', lambda bot, **kwargs: True)
+        multi_updater = MultiBotUpdater(workers=1)
+        assert multi_updater.poll_workers is None
+        for token in tokens:
+            multi_updater.add_bot(token)
+        multi_updater.start_polling(timeout=5)
+        time.sleep(0.3)
+        multi_updater.stop()
+        # All bots are long polled at the same time, each on its own thread
+        assert set(timeouts) == {5}
+        assert len(timeouts) >= len(tokens)
+        assert len(threads) == len(tokens)
+
+    def test_short_polling_with_more_bots(self, monkeypatch):
+        timeouts = []
+
+        def get_updates(bot, offset=None, timeout=0, **kwargs):
+            timeouts.append(timeout)
+            return []
+
+        monkeypatch.setattr(ExtBot, 'get_updates', get_updates)
+        monkeypatch.setattr(ExtBot, 'delete_webhook', lambda bot, **kwargs: True)
+        multi_updater = MultiBotUpdater(poll_workers=1, workers=1)
+        for token in TOKENS:
+            multi_updater.add_bot(token)
+        with pytest.raises(ValueError, match='short_poll_interval'):
+            multi_updater.start_polling(short_poll_interval=0)
+        multi_updater.start_polling(poll_interval=0, timeout=5, short_poll_interval=0.1)
+        time.sleep(0.35)
+        multi_updater.stop()
+        assert set(timeouts) == {0}
+        # Each bot is polled about every short_poll_interval instead of in a tight loop
+        assert 2 <= len(timeouts) <= 10
+
+    def test_errors(self, monkeypatch, multi_updater):
+        polled = {token: 0 for token in TOKENS}
+
+        def get_updates(bot, offset=None, **kwargs):
+            polled[bot.api_key] += 1
+            if bot.api_key == TOKENS[0]:
+                raise InvalidToken()
+            raise NetworkError('network down')
+
+        monkeypatch.setattr(ExtBot, 'get_updates', get_updates)
+        monkeypatch.setattr(ExtBot, 'delete_webhook', lambda bot, **kwargs: True)
+
+        errors = []
+        for token in TOKENS:
+            dispatcher = multi_updater.add_bot(token)
+            dispatcher.add_error_handler(lambda u, c, t=token: errors.append((t, c.error)))
+
+        multi_updater.start_polling(poll_interval=0, timeout=5)
+        time.sleep(0.3)
+        multi_updater.stop()
+
+        # A bot with an invalid token is no longer polled
+        assert polled[TOKENS[0]] == 1
+        # Network errors are passed to the error handlers of the bot and polling is retried later
+        assert 1 <= polled[TOKENS[1]] < 5
+        assert len(errors) == polled[TOKENS[1]]
+        assert all(token == TOKENS[1] for token, _ in errors)
+        assert all(isinstance(error, NetworkError) for _, error in errors)
+        assert multi_updater._entries[TOKENS[1]].scheduler.failures == polled[TOKENS[1]]
@@ -16,13 +16,14 @@
 #
 # You should have received a copy of the GNU Lesser Public License
 # along with this program.  If not, see [http://www.gnu.org/licenses/].
+import datetime
 import gzip
 import signal
 import uuid
 from threading import Lock
 
-from telegram.ext.callbackdatacache import CallbackDataCache
-from telegram.utils.helpers import encode_conversations_to_json
+from TeleGenic.ext.callbackdatacache import CallbackDataCache
+from TeleGenic.utils.helpers import encode_conversations_to_json
 
 try:
     import ujson as json
@@ -38,8 +39,8 @@ from sys import version_info as py_ver
 
 import pytest
 
-from telegram import Update, Message, User, Chat, MessageEntity, Bot
-from telegram.ext import (
+from TeleGenic import Update, Message, User, Chat, MessageEntity, Bot
+from TeleGenic.ext import (
     BasePersistence,
     Updater,
     ConversationHandler,
@@ -51,6 +52,7 @@ from telegram.ext import (
     TypeHandler,
     JobQueue,
     ContextTypes,
+    BinarySerializer,
 )
 
 
@@ -847,6 +849,55 @@ class TestBasePersistence:
         assert make_assertion(persistence.bot_data)
         assert make_assertion(persistence.get_bot_data())
 
+    def test_replace_insert_bot_plain_data(self, bot, bot_persistence):
+        persistence = bot_persistence
+        persistence.set_bot(bot)
+        shared_list = [1, 'two', None]
+        shared_dict = {'a': 1.5}
+        data = {
+            'list_1': shared_list,
+            'list_2': shared_list,
+            'dict_1': shared_dict,
+            'dict_2': shared_dict,
+            'nested': [(1, [2, {3: 'three'}]), {(4, 5): frozenset({6})}, {7, 8}],
+            'default': defaultdict(list, {1: [2]}),
+            'date': datetime.datetime(2022, 1, 1),
+        }
+
+        for copied in (persistence.replace_bot(data), persistence.insert_bot(data)):
+            assert copied == data
+            assert copied is not data
+            assert copied['list_1'] is copied['list_2']
+            assert copied['list_1'] is not shared_list
+            assert copied['dict_1'] is copied['dict_2']
+            assert copied['dict_1'] is not shared_dict
+            assert copied['nested'][0][1] is not data['nested'][0][1]
+            assert copied['nested'][2] is not data['nested'][2]
+            assert isinstance(copied['default'], defaultdict)
+            assert copied['default'][1] is not data['default'][1]
+
+        # The placeholder is replaced even though the data is otherwise plain
+        replaced = {'bots': [persistence.REPLACED_BOT]}
+        assert persistence.insert_bot(replaced) == {'bots': [bot]}
+
+    def test_replace_insert_bot_deeply_nested_data(self, bot, bot_persistence):
+        persistence = bot_persistence
+        persistence.set_bot(bot)
+        data = current = []
+        for i in range(10000):
+            nested = [i, {'i': i}]
+            current.append(nested)
+            current = nested
+
+        copied = persistence.replace_bot(data)
+        assert copied is not data
+        depth = 0
+        while copied:
+            assert copied[0][1] == {'i': depth}
+            copied = copied[0][2:]
+            depth += 1
+        assert depth == 10000
+
     def test_set_bot_exception(self, bot):
         non_ext_bot = Bot(bot.api_key)
         persistence = OwnPersistence(store_callback_data=True)
@@ -1902,6 +1953,157 @@ class TestPicklePersistence:
         data = pickle_persistence.get_callback_data()[1]
         assert data['test'] == 'Working4!'
 
+    @pytest.mark.parametrize(
+        'single_file,journal', [(True, False), (False, False), (True, True)]
+    )
+    def test_binary_serializer(self, single_file, journal):
+        persistence = PicklePersistence(
+            'pickletest',
+            single_file=single_file,
+            journal=journal,
+            store_callback_data=True,
+            serializer=BinarySerializer(),
+        )
+        persistence.get_user_data()
+        persistence.update_user_data(1, {'a': {2: 'b'}})
+        persistence.update_chat_data(-1, {'c': 'd'})
+        persistence.update_bot_data({'e': Chat(1, 'private')})
+        persistence.update_callback_data(([('uuid', 1.5, {'f': 'g'})], {'h': 'uuid'}))
+        persistence.update_conversation('name', (1, 2), 3)
+
+        restored = PicklePersistence(
+            'pickletest',
+            single_file=single_file,
+            journal=journal,
+            store_callback_data=True,
+            serializer=BinarySerializer(),
+        )
+        assert restored.get_user_data() == {1: {'a': {2: 'b'}}}
+        assert restored.get_chat_data() == {-1: {'c': 'd'}}
+        assert restored.get_bot_data() == {'e': Chat(1, 'private')}
+        assert restored.get_callback_data() == ([('uuid', 1.5, {'f': 'g'})], {'h': 'uuid'})
+        assert restored.get_conversations('name') == {(1, 2): 3}
+
+    def test_journal_requires_single_file(self):
+        with pytest.raises(ValueError, match='single_file'):
+            PicklePersistence('pickletest', single_file=False, journal=True)
+
+    def test_journal(self, good_pickle_files):
+        persistence = PicklePersistence('pickletest', journal=True)
+        assert persistence.get_user_data()[12345] == {
+            'test1': 'test2',
+            'test3': {'test4': 'test5'},
+        }
+        persistence.update_user_data(12345, {'test': 'journal'})
+        persistence.update_chat_data(-1, {'test': 'journal'})
+        persistence.update_bot_data({'test': 'journal'})
+        persistence.update_callback_data(([], {'test': 'journal'}))
+        persistence.update_conversation('name1', (123, 123), 'journal')
+
+        # The pickle file is not rewritten
+        with open('pickletest', 'rb') as f:
+            assert 'test' not in pickle.load(f)['bot_data']
+        assert os.path.getsize('pickletest.journal') > 0
+
+        restored = PicklePersistence('pickletest', journal=True)
+        assert restored.get_user_data()[12345] == {'test': 'journal'}
+        assert restored.get_user_data()[67890] == {3: 'test4'}
+        assert restored.get_chat_data()[-1] == {'test': 'journal'}
+        assert restored.get_bot_data() == {'test': 'journal'}
+        assert restored.get_callback_data() == ([], {'test': 'journal'})
+        assert restored.get_conversations('name1')[(123, 123)] == 'journal'
+
+    def test_journal_compaction(self):
+        persistence = PicklePersistence('pickletest', journal=True, journal_size=3)
+        persistence.get_user_data()
+        for user_id in range(4):
+            persistence.update_user_data(user_id, {'id': user_id})
+        compaction = persistence._compaction
+        if compaction is not None:
+            compaction.join()
+
+        assert not os.path.exists('pickletest.journal.old')
+        with open('pickletest', 'rb') as f:
+            snapshot = pickle.load(f)
+        assert snapshot['user_data'] == {user_id: {'id': user_id} for user_id in range(3)}
+        restored = PicklePersistence('pickletest', journal=True)
+        assert restored.get_user_data() == {user_id: {'id': user_id} for user_id in range(4)}
+
+    def test_journal_failed_compaction_is_retried(self, monkeypatch, caplog):
+        write_snapshot = PicklePersistence._write_snapshot
+        calls = []
+
+        def failing_write_snapshot(self, snapshot):
+            calls.append(snapshot)
+            if len(calls) == 1:
+                raise OSError('disk full')
+            write_snapshot(self, snapshot)
+
+        monkeypatch.setattr(PicklePersistence, '_write_snapshot', failing_write_snapshot)
+        persistence = PicklePersistence('pickletest', journal=True, journal_size=3)
+        persistence.get_user_data()
+        for user_id in range(3):
+            persistence.update_user_data(user_id, {'id': user_id})
+        compaction = persistence._compaction
+        if compaction is not None:
+            compaction.join()
+        assert 'Compacting the journal failed' in caplog.text
+        assert persistence._compaction is None
+        assert os.path.exists('pickletest.journal.old')
+
+        # The old journal is merged with the new one when the next compaction starts
+        for user_id in range(3, 6):
+            persistence.update_user_data(user_id, {'id': user_id})
+        compaction = persistence._compaction
+        if compaction is not None:
+            compaction.join()
+        assert len(calls) == 2
+        assert not os.path.exists('pickletest.journal.old')
+        with open('pickletest', 'rb') as f:
+            snapshot = pickle.load(f)
+        assert snapshot['user_data'] == {user_id: {'id': user_id} for user_id in range(6)}
+        restored = PicklePersistence('pickletest', journal=True)
+        assert restored.get_user_data() == {user_id: {'id': user_id} for user_id in range(6)}
+
+    def test_journal_replays_unfinished_compaction(self):
+        persistence = PicklePersistence('pickletest', journal=True)
+        persistence.get_user_data()
+        persistence.update_user_data(1, {'old': 'journal'})
+        persistence._close_journal()
+        os.replace('pickletest.journal', 'pickletest.journal.old')
+        persistence.update_user_data(2, {'new': 'journal'})
+
+        restored = PicklePersistence('pickletest', journal=True)
+        assert restored.get_user_data() == {1: {'old': 'journal'}, 2: {'new': 'journal'}}
+
+    def test_journal_incomplete_entry(self):
+        persistence = PicklePersistence('pickletest', journal=True)
+        persistence.get_user_data()
+        persistence.update_user_data(1, {'a': 'b'})
+        persistence._close_journal()
+        size = os.path.getsize('pickletest.journal')
+        with open('pickletest.journal', 'ab') as f:
+            f.write(pickle.dumps(('user_data', 2, {'c': 'd'}))[:-3])
+
+        restored = PicklePersistence('pickletest', journal=True)
+        assert restored.get_user_data() == {1: {'a': 'b'}}
+        assert os.path.getsize('pickletest.journal') == size
+        restored.update_user_data(3, {'e': 'f'})
+        restored = PicklePersistence('pickletest', journal=True)
+        assert restored.get_user_data() == {1: {'a': 'b'}, 3: {'e': 'f'}}
+
+    def test_journal_flush(self):
+        persistence = PicklePersistence('pickletest', journal=True)
+        persistence.flush()
+        assert not os.path.exists('pickletest')
+
+        persistence.get_user_data()
+        persistence.update_user_data(1, {'a': 'b'})
+        persistence.flush()
+        assert not os.path.exists('pickletest.journal')
+        with open('pickletest', 'rb') as f:
+            assert pickle.load(f)['user_data'] == {1: {'a': 'b'}}
+
     @pytest.mark.parametrize('singlefile', [True, False])
     @pytest.mark.parametrize('ud', [int, float, complex])
     @pytest.mark.parametrize('cd', [int, float, complex])
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+import os
+from concurrent.futures import ProcessPoolExecutor
+from queue import Queue
+
+import pytest
+
+from TeleGenic import Chat, Message, Update, User
+from TeleGenic.ext import (
+    CallbackContext,
+    Dispatcher,
+    Filters,
+    MessageHandler,
+    ProcessCallback,
+    ProcessContext,
+)
+
+
+def process_callback(update, context):
+    context.chat_data['pid'] = os.getpid()
+    context.chat_data['text'] = update.effective_message.text
+    context.user_data.pop('removed', None)
+    context.bot_data['count'] = context.bot_data.get('count', 0) + 1
+    return update.effective_message.text.upper()
+
+
+def raising_callback(update, context):
+    raise ValueError('raised in process')
+
+
+@pytest.fixture(scope='module')
+def executor():
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        yield pool
+
+
+class TestProcessCallback:
+    update = Update(
+        1,
+        message=Message(
+            1, None, Chat(1, 'private'), from_user=User(1, 'user', False), text='Text'
+        ),
+    )
+
+    def test_slot_behaviour(self, mro_slots, recwarn):
+        inst = ProcessCallback(process_callback)
+        for attr in inst.__slots__:
+            assert getattr(inst, attr, 'err') != 'err', f"got extra slot '{attr}'"
+        assert len(mro_slots(inst)) == len(set(mro_slots(inst))), "duplicate slot"
+        inst.custom, inst.callback = 'should give warning', inst.callback
+        assert len(recwarn) == 1 and 'custom' in str(recwarn[0].message), recwarn.list
+
+    def test_runs_in_process_and_merges_data(self, bot, executor):
+        dispatcher = Dispatcher(bot, Queue(), workers=1)
+        dispatcher.chat_data[1]['kept'] = 'chat'
+        dispatcher.user_data[1].update({'removed': True, 'kept': 'user'})
+        context = CallbackContext.from_update(self.update, dispatcher)
+
+        result = ProcessCallback(process_callback, executor=executor)(self.update, context)
+
+        assert result == 'TEXT'
+        assert dispatcher.chat_data[1]['pid'] != os.getpid()
+        assert dispatcher.chat_data[1]['text'] == 'Text'
+        assert dispatcher.chat_data[1]['kept'] == 'chat'
+        assert dispatcher.user_data[1] == {'kept': 'user'}
+        assert dispatcher.bot_data == {'count': 1}
+        assert context.chat_data is dispatcher.chat_data[1]
+
+    def test_preserves_concurrent_changes(self, bot, executor, monkeypatch):
+        dispatcher = Dispatcher(bot, Queue(), workers=1)
+        context = CallbackContext.from_update(self.update, dispatcher)
+        submit = executor.submit
+
+        def concurrent_submit(*args, **kwargs):
+            future = submit(*args, **kwargs)
+            # simulates a change by another handler while the process runs
+            dispatcher.chat_data[1]['other'] = 'value'
+            return future
+
+        monkeypatch.setattr(executor, 'submit', concurrent_submit)
+        ProcessCallback(process_callback, executor=executor)(self.update, context)
+        assert dispatcher.chat_data[1]['other'] == 'value'
+        assert dispatcher.chat_data[1]['text'] == 'Text'
+
+    def test_done(self, bot, executor):
+        dispatcher = Dispatcher(bot, Queue(), workers=1)
+        context = CallbackContext.from_update(self.update, dispatcher)
+
+        def done(update, ctx):
+            assert ctx.chat_data['text'] == 'Text'
+            return ctx.result * 2
+
+        process = ProcessCallback(process_callback, executor=executor, done=done)
+        assert process(self.update, context) == 'TEXTTEXT'
+
+    def test_exception(self, bot, executor):
+        dispatcher = Dispatcher(bot, Queue(), workers=1)
+        context = CallbackContext.from_update(self.update, dispatcher)
+        with pytest.raises(ValueError, match='raised in process'):
+            ProcessCallback(raising_callback, executor=executor)(self.update, context)
+
+    def test_no_context(self, bot):
+        with pytest.raises(TypeError, match='context based'):
+            ProcessCallback(process_callback)(self.update, bot)
+
+    def test_with_dispatcher(self, bot, executor):
+        dispatcher = Dispatcher(bot, Queue(), workers=1)
+        dispatcher.add_handler(
+            MessageHandler(Filters.text, ProcessCallback(process_callback, executor=executor))
+        )
+        dispatcher.process_update(self.update)
+        assert dispatcher.chat_data[1]['text'] == 'Text'
+
+    def test_default_executor(self, bot):
+        from TeleGenic.ext import processcallback
+
+        dispatcher = Dispatcher(bot, Queue(), workers=1)
+        context = CallbackContext.from_update(self.update, dispatcher)
+        assert ProcessCallback(process_callback)(self.update, context) == 'TEXT'
+        executor = processcallback._DEFAULT_EXECUTOR
+        assert executor._mp_context.get_start_method() == 'spawn'
+
+        dispatcher.stop()
+        assert processcallback._DEFAULT_EXECUTOR is None
+        with pytest.raises(RuntimeError, match='shutdown'):
+            executor.submit(os.getpid)
+        # A new executor is started on demand
+        assert ProcessCallback(process_callback)(self.update, context) == 'TEXT'
+        processcallback._shutdown_default_executor()
+
+    def test_process_context(self):
+        context = ProcessContext(['arg'], {}, {}, {})
+        assert context.args == ['arg']
+        assert context.chat_data == context.user_data == context.bot_data == {}
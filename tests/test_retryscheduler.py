@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+import logging
+
+import pytest
+
+from TeleGenic import TeleGenicError
+from TeleGenic.error import NetworkError, RetryAfter, TimedOut
+from TeleGenic.ext import RetryScheduler
+
+
+@pytest.fixture(scope='function')
+def scheduler():
+    return RetryScheduler(
+        interval=0.1, base_delay=1, max_delay=4, failure_threshold=5, reset_timeout=20
+    )
+
+
+class TestRetryScheduler:
+    def test_slot_behaviour(self, scheduler, mro_slots):
+        for attr in scheduler.__slots__:
+            assert getattr(scheduler, attr, 'err') != 'err', f"got extra slot '{attr}'"
+        assert len(mro_slots(scheduler)) == len(set(mro_slots(scheduler))), "duplicate slot"
+
+    def test_invalid_threshold(self):
+        with pytest.raises(ValueError, match='must be positive'):
+            RetryScheduler(failure_threshold=0)
+
+    def test_success(self, scheduler):
+        assert scheduler.record_success() == 0.1
+        assert scheduler.state == RetryScheduler.CLOSED
+        assert scheduler.failures == 0
+
+    def test_backlog(self, scheduler):
+        scheduler.record_batch(100)
+        assert scheduler.record_success() == 0
+        assert scheduler.record_success() == 0.1
+        scheduler.record_batch(99)
+        assert scheduler.record_success() == 0.1
+
+    def test_exponential_backoff(self, scheduler):
+        for bound in (1, 2, 4, 4):
+            delay = scheduler.record_failure(NetworkError('error'))
+            # Randomized between half and the full value
+            assert bound / 2 <= delay <= bound
+        assert scheduler.failures == 4
+        assert scheduler.state == RetryScheduler.CLOSED
+
+        scheduler.record_success()
+        assert scheduler.failures == 0
+        assert scheduler.record_failure(TeleGenicError('error')) <= 1
+
+    def test_timed_out(self, scheduler):
+        # A single time out is retried right away
+        assert scheduler.record_failure(TimedOut()) == 0
+        assert 0.5 <= scheduler.record_failure(TimedOut()) <= 1
+        assert scheduler.timeouts == 2
+        assert scheduler.failures == 0
+        assert scheduler.poll_timeout(10) == scheduler.probe_timeout
+
+        scheduler.record_success()
+        assert scheduler.timeouts == 0
+        assert scheduler.record_failure(TimedOut()) == 0
+
+    def test_timed_out_run_keeps_circuit_closed(self, scheduler, caplog):
+        with caplog.at_level(logging.WARNING):
+            delays = []
+            for _ in range(20):
+                scheduler.before_request()
+                delays.append(scheduler.record_failure(TimedOut()))
+        # The backoff is capped by max_delay instead of waiting reset_timeout
+        assert scheduler.state == RetryScheduler.CLOSED
+        assert max(delays) <= scheduler.max_delay
+        assert all(2 <= delay <= 4 for delay in delays[3:])
+        assert not caplog.records
+
+        # Other failures count from zero
+        assert 0.5 <= scheduler.record_failure(NetworkError('error')) <= 1
+        assert scheduler.failures == 1
+        assert scheduler.timeouts == 0
+
+    def test_retry_after(self, scheduler):
+        assert scheduler.record_failure(RetryAfter(3)) == 3.5
+        assert scheduler.failures == 0
+        assert scheduler.state == RetryScheduler.CLOSED
+
+    def test_poll_timeout(self, scheduler):
+        assert scheduler.poll_timeout(10) == 10
+        scheduler.record_failure(NetworkError('error'))
+        assert scheduler.poll_timeout(10) == scheduler.probe_timeout
+        assert scheduler.poll_timeout(0) == 0
+        scheduler.record_success()
+        assert scheduler.poll_timeout(10) == 10
+
+    def test_circuit_breaker(self, scheduler, caplog):
+        with caplog.at_level(logging.WARNING):
+            for _ in range(4):
+                scheduler.before_request()
+                scheduler.record_failure(NetworkError('error'))
+            assert scheduler.state == RetryScheduler.CLOSED
+            assert not caplog.records
+
+            scheduler.before_request()
+            assert 10 <= scheduler.record_failure(NetworkError('error')) <= 20
+            assert scheduler.state == RetryScheduler.OPEN
+            assert len(caplog.records) == 1
+            assert caplog.records[0].getMessage().startswith('Circuit opened after 5 failures')
+
+        # The next request is a trial
+        scheduler.before_request()
+        assert scheduler.state == RetryScheduler.HALF_OPEN
+        assert 10 <= scheduler.record_failure(NetworkError('error')) <= 20
+        assert scheduler.state == RetryScheduler.OPEN
+
+        scheduler.before_request()
+        assert scheduler.record_success() == 0.1
+        assert scheduler.state == RetryScheduler.CLOSED
+        assert scheduler.failures == 0
+
+    def test_timed_out_trial_reopens_circuit(self, scheduler):
+        for _ in range(5):
+            scheduler.before_request()
+            scheduler.record_failure(NetworkError('error'))
+        assert scheduler.state == RetryScheduler.OPEN
+
+        # A time out of the trial doesn't prove that the connection works again
+        scheduler.before_request()
+        assert scheduler.state == RetryScheduler.HALF_OPEN
+        assert 10 <= scheduler.record_failure(TimedOut()) <= 20
+        assert scheduler.state == RetryScheduler.OPEN
+        assert scheduler.failures == 5
+
+        # Once the connection works, the circuit closes as usual
+        scheduler.before_request()
+        assert scheduler.state == RetryScheduler.HALF_OPEN
+        scheduler.record_success()
+        assert scheduler.state == RetryScheduler.CLOSED
+        assert scheduler.timeouts == 0
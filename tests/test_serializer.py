@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+import datetime
+import io
+import pickle
+from collections import defaultdict
+
+import pytest
+
+from TeleGenic import Chat
+from TeleGenic.ext import BinarySerializer, PickleSerializer, Serializer
+
+
+VALUES = [
+    None,
+    True,
+    False,
+    0,
+    1,
+    -1,
+    63,
+    -64,
+    1000,
+    -1001234567890,
+    2 ** 64 - 1,
+    2 ** 70,
+    -(2 ** 70),
+    1.5,
+    float('inf'),
+    '',
+    'text',
+    'ünïcödé \ud800',
+    b'\x00bytes',
+    [],
+    [1, 'a', None],
+    (),
+    (1, (2, 3)),
+    set(),
+    {1, 2},
+    frozenset({'a'}),
+    {},
+    {1: {'a': [1, 2]}, 'b': {(1, 2): 3}},
+    [[], {}, ((),), [set()]],
+    datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc),
+    defaultdict(list, {1: [2]}),
+    Chat(1, 'private'),
+]
+
+
+@pytest.fixture(scope='function', params=[PickleSerializer, BinarySerializer])
+def serializer(request):
+    return request.param()
+
+
+class TestSerializer:
+    def test_slot_behaviour(self, serializer, mro_slots):
+        for attr in serializer.__slots__:
+            assert getattr(serializer, attr, 'err') != 'err', f"got extra slot '{attr}'"
+        assert len(mro_slots(serializer)) == len(set(mro_slots(serializer))), "duplicate slot"
+
+    def test_is_serializer(self, serializer):
+        assert isinstance(serializer, Serializer)
+        assert serializer.protocol == pickle.DEFAULT_PROTOCOL
+
+    @pytest.mark.parametrize('value', VALUES, ids=repr)
+    def test_round_trip(self, serializer, value):
+        restored = serializer.loads(serializer.dumps(value))
+        assert restored == value
+        assert type(restored) is type(value)
+
+    def test_dump_and_load(self, serializer):
+        file = io.BytesIO()
+        for value in VALUES:
+            serializer.dump(value, file)
+        file.seek(0)
+        assert [serializer.load(file) for _ in VALUES] == VALUES
+        with pytest.raises(EOFError):
+            serializer.load(file)
+
+
+class TestBinarySerializer:
+    def test_compact(self):
+        data = {
+            'user_data': {user_id: {'name': 'name', 'count': user_id} for user_id in range(100)},
+            'conversations': {'handler': {(chat_id, chat_id): 1 for chat_id in range(100)}},
+        }
+        assert len(BinarySerializer().dumps(data)) < len(pickle.dumps(data))
+
+    def test_repeated_strings_are_stored_once(self):
+        serializer = BinarySerializer()
+        once = len(serializer.dumps(['a long string']))
+        assert len(serializer.dumps(['a long string'] * 2)) == once + 2
+        assert serializer.loads(serializer.dumps(['a long string'] * 2)) == ['a long string'] * 2
+
+    def test_deeply_nested(self):
+        serializer = BinarySerializer()
+        data = []
+        for _ in range(10000):
+            data = [data]
+        restored, depth = serializer.loads(serializer.dumps(data)), 0
+        while restored:
+            (restored,), depth = restored, depth + 1
+        assert restored == []
+        assert depth == 10000
+
+    def test_variable_length_integers(self):
+        # Large integers are written as variable-length integers, which are always readable
+        serializer = BinarySerializer()
+        assert serializer.loads(b'\x03\x96\x01') == 75
+        assert serializer.loads(b'\x03\x95\x01') == -75
+
+    def test_invalid_data(self):
+        serializer = BinarySerializer()
+        data = serializer.dumps({'key': 'value'})
+        with pytest.raises(ValueError, match='truncated'):
+            serializer.loads(data[:-2])
+        with pytest.raises(ValueError, match='after the end'):
+            serializer.loads(data + b'\x00')
+        with pytest.raises(ValueError, match='Invalid type'):
+            serializer.loads(b'\xff')
+
+    def test_truncated_file(self):
+        serializer = BinarySerializer()
+        file = io.BytesIO()
+        serializer.dump({'key': 'value'}, file)
+        with pytest.raises(EOFError, match='truncated'):
+            serializer.load(io.BytesIO(file.getvalue()[:-1]))
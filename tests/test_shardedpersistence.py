@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+from threading import Event, Thread
+
+import pytest
+
+from TeleGenic.ext import DictPersistence, ShardedPersistence
+
+
+class RecordingPersistence(DictPersistence):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.flushed = False
+        self.refreshed = []
+
+    def flush(self):
+        self.flushed = True
+
+    def refresh_user_data(self, user_id, user_data):
+        self.refreshed.append(user_id)
+
+
+@pytest.fixture(scope='function')
+def shards():
+    return [RecordingPersistence(store_callback_data=True) for _ in range(3)]
+
+
+@pytest.fixture(scope='function')
+def sharded_persistence(shards, bot):
+    persistence = ShardedPersistence(shards)
+    persistence.set_bot(bot)
+    return persistence
+
+
+class TestShardedPersistence:
+    def test_slot_behaviour(self, sharded_persistence, mro_slots, recwarn):
+        inst = sharded_persistence
+        for attr in inst.__slots__:
+            assert getattr(inst, attr, 'err') != 'err', f"got extra slot '{attr}'"
+        assert len(mro_slots(inst)) == len(set(mro_slots(inst))), "duplicate slot"
+        inst.custom, inst.shards = 'should give warning', inst.shards
+        assert len(recwarn) == 1 and 'custom' in str(recwarn[0].message), recwarn.list
+
+    def test_init(self, shards):
+        with pytest.raises(ValueError, match='At least one'):
+            ShardedPersistence([])
+        with pytest.raises(ValueError, match='same store_'):
+            ShardedPersistence([DictPersistence(), DictPersistence(store_bot_data=False)])
+
+        persistence = ShardedPersistence(shards)
+        assert persistence.shards == tuple(shards)
+        assert persistence.store_callback_data
+
+    def test_set_bot(self, sharded_persistence, shards, bot):
+        assert all(shard.bot is bot for shard in shards)
+
+    def test_sharding(self, sharded_persistence, shards):
+        for key in range(-3, 6):
+            sharded_persistence.update_user_data(key, {'user': key})
+            sharded_persistence.update_chat_data(key, {'chat': key})
+            sharded_persistence.update_conversation('name', (key, 1), key)
+        sharded_persistence.update_bot_data({'bot': 'data'})
+        sharded_persistence.update_callback_data(([], {'callback': 'data'}))
+
+        for index, shard in enumerate(shards):
+            expected = {key for key in range(-3, 6) if key % 3 == index}
+            assert set(shard.user_data) == expected
+            assert set(shard.chat_data) == expected
+            assert {key[0] for key in shard.conversations['name']} == expected
+        assert shards[0].bot_data == {'bot': 'data'}
+        assert shards[0].callback_data == ([], {'callback': 'data'})
+        assert shards[1].bot_data is None
+
+        assert sharded_persistence.get_user_data() == {key: {'user': key} for key in range(-3, 6)}
+        assert sharded_persistence.get_chat_data() == {key: {'chat': key} for key in range(-3, 6)}
+        assert sharded_persistence.get_conversations('name') == {
+            (key, 1): key for key in range(-3, 6)
+        }
+        assert sharded_persistence.get_bot_data() == {'bot': 'data'}
+        assert sharded_persistence.get_callback_data() == ([], {'callback': 'data'})
+
+    def test_get_user_data_is_defaultdict(self, sharded_persistence):
+        user_data = sharded_persistence.get_user_data()
+        assert user_data[1] == {}
+
+    def test_refresh_and_flush(self, sharded_persistence, shards):
+        sharded_persistence.refresh_user_data(4, {})
+        assert [shard.refreshed for shard in shards] == [[], [4], []]
+        sharded_persistence.flush()
+        assert all(shard.flushed for shard in shards)
+
+    def test_shards_do_not_block_each_other(self, shards):
+        entered = Event()
+        release = Event()
+
+        class SlowPersistence(RecordingPersistence):
+            def update_user_data(self, user_id, data):
+                entered.set()
+                release.wait(2)
+                super().update_user_data(user_id, data)
+
+        persistence = ShardedPersistence([SlowPersistence(), RecordingPersistence()])
+        thread = Thread(target=persistence.update_user_data, args=(0, {'slow': True}))
+        thread.start()
+        try:
+            assert entered.wait(2)
+            persistence.update_user_data(1, {'fast': True})
+            assert persistence.shards[1].user_data == {1: {'fast': True}}
+            assert not persistence.shards[0].user_data
+        finally:
+            release.set()
+            thread.join()
+        assert persistence.shards[0].user_data == {0: {'slow': True}}
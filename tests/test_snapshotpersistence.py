@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+import os
+from collections import defaultdict
+
+import pytest
+
+from TeleGenic.ext import LazyDataDict, PickleSerializer, SnapshotPersistence
+
+
+class CountingSerializer(PickleSerializer):
+    def __init__(self):
+        super().__init__()
+        self.loaded = 0
+
+    def loads(self, data):
+        self.loaded += 1
+        return super().loads(data)
+
+
+@pytest.fixture(scope='function')
+def filepath(tmp_path):
+    return str(tmp_path / 'snapshot')
+
+
+@pytest.fixture(scope='function')
+def snapshot_persistence(filepath):
+    persistence = SnapshotPersistence(filepath, store_callback_data=True)
+    yield persistence
+    if persistence._snapshot is not None:
+        persistence._snapshot.close()
+
+
+def fill(persistence, count=100):
+    for key in range(-count, count, 2):
+        persistence.update_user_data(key, {'user': key})
+        persistence.update_chat_data(key, {'chat': key})
+    persistence.update_bot_data({'bot': 'data'})
+    persistence.update_callback_data(([('id', 1.0, {'button': 1})], {'query': 'id'}))
+    persistence.update_conversation('name', (1, 2), 3)
+
+
+class TestSnapshotPersistence:
+    def test_slot_behaviour(self, snapshot_persistence, mro_slots, recwarn):
+        inst = snapshot_persistence
+        for attr in inst.__slots__:
+            assert getattr(inst, attr, 'err') != 'err', f"got extra slot '{attr}'"
+        assert len(mro_slots(inst)) == len(set(mro_slots(inst))), "duplicate slot"
+        inst.custom, inst.filepath = 'should give warning', inst.filepath
+        assert len(recwarn) == 1 and 'custom' in str(recwarn[0].message), recwarn.list
+
+    def test_no_file(self, snapshot_persistence, filepath):
+        user_data = snapshot_persistence.get_user_data()
+        assert isinstance(user_data, LazyDataDict)
+        assert user_data[1] == {}
+        assert snapshot_persistence.get_chat_data()[1] == {}
+        assert snapshot_persistence.get_bot_data() == {}
+        assert snapshot_persistence.get_callback_data() is None
+        assert snapshot_persistence.get_conversations('name') == {}
+        assert not os.path.exists(filepath)
+
+    def test_invalid_file(self, filepath):
+        with open(filepath, 'wb') as file:
+            file.write(b'garbage')
+        with pytest.raises(TypeError, match='is not a valid snapshot'):
+            SnapshotPersistence(filepath).get_user_data()
+
+        open(filepath, 'wb').close()
+        with pytest.raises(TypeError, match='is not a valid snapshot'):
+            SnapshotPersistence(filepath).get_bot_data()
+
+    def test_round_trip(self, snapshot_persistence, filepath):
+        fill(snapshot_persistence)
+        snapshot_persistence.flush()
+        assert not os.path.exists(f'{filepath}.tmp')
+
+        persistence = SnapshotPersistence(filepath, store_callback_data=True)
+        user_data = persistence.get_user_data()
+        chat_data = persistence.get_chat_data()
+        for key in range(-100, 100, 2):
+            assert user_data[key] == {'user': key}
+            assert chat_data[key] == {'chat': key}
+        assert user_data[1] == {}
+        assert persistence.get_bot_data() == {'bot': 'data'}
+        assert persistence.get_callback_data() == (
+            [('id', 1.0, {'button': 1})],
+            {'query': 'id'},
+        )
+        assert persistence.get_conversations('name') == {(1, 2): 3}
+        persistence._snapshot.close()
+
+    def test_lazy_loading(self, snapshot_persistence, filepath):
+        fill(snapshot_persistence)
+        snapshot_persistence.flush()
+
+        serializer = CountingSerializer()
+        persistence = SnapshotPersistence(filepath, serializer=serializer, cache_size=10)
+        user_data = persistence.get_user_data()
+        # Only bot_data, callback_data and the conversations are decoded on startup
+        assert serializer.loaded == 1
+        assert len(user_data) == 0
+        assert user_data[4] == {'user': 4}
+        assert serializer.loaded == 2
+        assert user_data[4] == {'user': 4}
+        assert serializer.loaded == 2
+
+        for key in range(0, 40, 2):
+            _ = user_data[key]
+        assert len(user_data) == 10
+        persistence._snapshot.close()
+
+    def test_flush_merges(self, snapshot_persistence, filepath):
+        fill(snapshot_persistence)
+        snapshot_persistence.flush()
+
+        user_data = snapshot_persistence.get_user_data()
+        user_data[2]['changed'] = True
+        snapshot_persistence.update_user_data(2, user_data[2])
+        snapshot_persistence.update_user_data(1000, {'new': 'user'})
+        snapshot_persistence.update_user_data(-1000, {'new': 'user'})
+        snapshot_persistence.update_conversation('name', (1, 2), None)
+        # Pending changes are visible before they are flushed
+        assert snapshot_persistence._load_entry('user_data', 1000) == {'new': 'user'}
+        snapshot_persistence.flush()
+
+        persistence = SnapshotPersistence(filepath)
+        user_data = persistence.get_user_data()
+        assert user_data[2] == {'user': 2, 'changed': True}
+        assert user_data[4] == {'user': 4}
+        assert user_data[1000] == user_data[-1000] == {'new': 'user'}
+        assert persistence._snapshot.get('user_data', 3) is None
+        assert persistence.get_conversations('name') == {}
+        persistence._snapshot.close()
+
+    def test_failed_flush_keeps_changes(self, snapshot_persistence, monkeypatch):
+        snapshot_persistence.update_user_data(1, {'old': 'data'})
+
+        def fail(*args):
+            raise OSError('disk full')
+
+        monkeypatch.setattr('TeleGenic.ext.snapshotpersistence._write_snapshot', fail)
+        with pytest.raises(OSError, match='disk full'):
+            snapshot_persistence.flush()
+        snapshot_persistence.update_user_data(2, {'new': 'data'})
+        monkeypatch.undo()
+
+        snapshot_persistence.flush()
+        assert snapshot_persistence._load_entry('user_data', 1) == {'old': 'data'}
+        assert snapshot_persistence._load_entry('user_data', 2) == {'new': 'data'}
+
+    def test_with_dispatcher(self, bot, filepath):
+        persistence = SnapshotPersistence(filepath)
+        persistence.set_bot(bot)
+        user_data = persistence.get_user_data()
+        user_data[1]['bot'] = bot
+        persistence.update_user_data(1, user_data[1])
+        persistence.flush()
+
+        persistence = SnapshotPersistence(filepath)
+        persistence.set_bot(bot)
+        assert persistence.get_user_data()[1]['bot'] is bot
+        assert isinstance(persistence.get_chat_data(), defaultdict)
+        persistence._snapshot.close()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+import sqlite3
+from collections import defaultdict
+from queue import Queue
+
+import pytest
+
+from TeleGenic import Chat, Message, MessageEntity, Update, User
+from TeleGenic.ext import (
+    BinarySerializer,
+    CommandHandler,
+    ContextTypes,
+    ConversationHandler,
+    Dispatcher,
+    Filters,
+    LazyDataDict,
+    MessageHandler,
+    SqlitePersistence,
+    TrackingDict,
+)
+
+
+@pytest.fixture(scope='function')
+def filepath(tmp_path):
+    return str(tmp_path / 'persistence.sqlite')
+
+
+@pytest.fixture(scope='function')
+def sqlite_persistence(filepath, bot):
+    persistence = SqlitePersistence(filepath, store_callback_data=True)
+    persistence.set_bot(bot)
+    return persistence
+
+
+def count_rows(filepath, table):
+    with sqlite3.connect(filepath) as connection:
+        return connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+class TestSqlitePersistence:
+    def test_slot_behaviour(self, sqlite_persistence, mro_slots, recwarn):
+        inst = sqlite_persistence
+        for attr in inst.__slots__:
+            assert getattr(inst, attr, 'err') != 'err', f"got extra slot '{attr}'"
+        assert len(mro_slots(inst)) == len(set(mro_slots(inst))), "duplicate slot"
+        inst.custom, inst.filepath = 'should give warning', inst.filepath
+        assert len(recwarn) == 1 and 'custom' in str(recwarn[0].message), recwarn.list
+
+    def test_no_database(self, sqlite_persistence):
+        assert sqlite_persistence.get_user_data() == defaultdict(dict)
+        assert sqlite_persistence.get_chat_data() == defaultdict(dict)
+        assert sqlite_persistence.get_bot_data() == {}
+        assert sqlite_persistence.get_callback_data() is None
+        assert sqlite_persistence.get_conversations('name') == {}
+
+    def test_wal_mode(self, sqlite_persistence, filepath):
+        sqlite_persistence.get_bot_data()
+        with sqlite3.connect(filepath) as connection:
+            assert connection.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+    def test_round_trip(self, sqlite_persistence, filepath, bot):
+        sqlite_persistence.update_user_data(12345, {'test1': 'test2', 'bot': bot})
+        sqlite_persistence.update_chat_data(-12345, {'test3': 'test4'})
+        sqlite_persistence.update_bot_data({'test5': 'test6'})
+        sqlite_persistence.update_callback_data(([('id', 1, {'a': 'b'})], {'c': 'd'}))
+        sqlite_persistence.update_conversation('name', (123, 123), 3)
+        sqlite_persistence.update_conversation('name', (456, 456), 'state')
+
+        restored = SqlitePersistence(filepath, store_callback_data=True)
+        restored.set_bot(bot)
+        user_data = restored.get_user_data()
+        assert isinstance(user_data, defaultdict)
+        assert user_data[12345]['test1'] == 'test2'
+        assert user_data[12345]['bot'] is bot
+        assert restored.get_chat_data()[-12345] == {'test3': 'test4'}
+        assert restored.get_bot_data() == {'test5': 'test6'}
+        assert restored.get_callback_data() == ([('id', 1, {'a': 'b'})], {'c': 'd'})
+        assert restored.get_conversations('name') == {(123, 123): 3, (456, 456): 'state'}
+        assert restored.get_conversations('other') == {}
+
+    def test_one_row_per_key(self, sqlite_persistence, filepath):
+        for user_id in range(3):
+            sqlite_persistence.update_user_data(user_id, {'id': user_id})
+        sqlite_persistence.update_user_data(1, {'id': 'changed'})
+        assert count_rows(filepath, 'user_data') == 3
+
+        restored = SqlitePersistence(filepath)
+        assert restored.get_user_data() == {0: {'id': 0}, 1: {'id': 'changed'}, 2: {'id': 2}}
+
+    def test_ended_conversation_is_deleted(self, sqlite_persistence, filepath):
+        sqlite_persistence.update_conversation('name', (1,), 'state')
+        assert count_rows(filepath, 'conversations') == 1
+        sqlite_persistence.update_conversation('name', (1,), None)
+        assert count_rows(filepath, 'conversations') == 0
+
+    def test_on_flush(self, filepath):
+        persistence = SqlitePersistence(filepath, on_flush=True)
+        persistence.update_user_data(1, {'a': 'b'})
+        persistence.update_chat_data(2, {'c': 'd'})
+        persistence.update_conversation('name', (1,), 'state')
+        assert SqlitePersistence(filepath).get_user_data() == {}
+
+        persistence.flush()
+        restored = SqlitePersistence(filepath)
+        assert restored.get_user_data() == {1: {'a': 'b'}}
+        assert restored.get_chat_data() == {2: {'c': 'd'}}
+        assert restored.get_conversations('name') == {(1,): 'state'}
+
+    def test_invalid_data(self, filepath):
+        SqlitePersistence(filepath).update_user_data(1, {})
+        with sqlite3.connect(filepath) as connection:
+            connection.execute("UPDATE user_data SET data = X'00'")
+        with pytest.raises(TypeError, match='unpickled'):
+            SqlitePersistence(filepath).get_user_data()
+
+    def test_serializer(self, filepath):
+        persistence = SqlitePersistence(filepath, serializer=BinarySerializer())
+        persistence.update_user_data(1, {'a': (1, 2)})
+        persistence.update_conversation('name', (1,), 'state')
+        with sqlite3.connect(filepath) as connection:
+            data = connection.execute('SELECT data FROM user_data').fetchone()[0]
+        assert BinarySerializer().loads(data) == {'a': (1, 2)}
+
+        restored = SqlitePersistence(filepath, serializer=BinarySerializer())
+        assert restored.get_user_data() == {1: {'a': (1, 2)}}
+        assert restored.get_conversations('name') == {(1,): 'state'}
+
+    def test_custom_context_types(self, filepath):
+        class UserData(dict):
+            pass
+
+        persistence = SqlitePersistence(filepath, context_types=ContextTypes(user_data=UserData))
+        assert isinstance(persistence.get_user_data()[1], UserData)
+
+    def test_lazy_load(self, filepath, bot):
+        persistence = SqlitePersistence(filepath)
+        for user_id in range(3):
+            persistence.update_user_data(user_id, {'id': user_id, 'bot': bot})
+        persistence.update_chat_data(1, {'a': 'b'})
+
+        lazy = SqlitePersistence(filepath, lazy_load=True)
+        lazy.set_bot(bot)
+        user_data = lazy.get_user_data()
+        assert isinstance(user_data, LazyDataDict)
+        assert lazy.get_user_data() is user_data
+        assert len(user_data) == 0
+        assert user_data[1] == {'id': 1, 'bot': bot}
+        assert user_data[1]['bot'] is bot
+        assert user_data[5] == {}
+        assert list(user_data) == [1, 5]
+        assert lazy.get_chat_data()[1] == {'a': 'b'}
+
+    @pytest.mark.parametrize('on_flush', [True, False])
+    def test_lazy_load_eviction(self, filepath, on_flush):
+        persistence = SqlitePersistence(filepath, lazy_load=True, cache_size=2, on_flush=on_flush)
+        user_data = persistence.get_user_data()
+        for user_id in range(5):
+            user_data[user_id]['id'] = user_id
+        assert list(user_data) == [3, 4]
+
+        # Evicted data is written, or pending until the next flush
+        assert user_data[0] == {'id': 0}
+        persistence.flush()
+        restored = SqlitePersistence(filepath).get_user_data()
+        assert restored == {user_id: {'id': user_id} for user_id in range(4)}
+
+    def test_lazy_load_unchanged_tracking_dict(self, filepath):
+        persistence = SqlitePersistence(
+            filepath,
+            lazy_load=True,
+            cache_size=1,
+            context_types=ContextTypes(user_data=TrackingDict),
+        )
+        user_data = persistence.get_user_data()
+        user_data[1]['a'] = 'b'
+        user_data[2].mark_as_unchanged()
+        user_data[3]
+        assert SqlitePersistence(filepath).get_user_data() == {1: {'a': 'b'}}
+
+    @pytest.mark.parametrize('lazy_load', [False, True])
+    def test_with_dispatcher(self, bot, filepath, lazy_load):
+        persistence = SqlitePersistence(filepath, lazy_load=lazy_load, cache_size=1)
+        dispatcher = Dispatcher(bot, Queue(), workers=1, persistence=persistence)
+
+        def callback(update, context):
+            context.user_data['count'] = context.user_data.get('count', 0) + 1
+            return 1
+
+        conversation = ConversationHandler(
+            [CommandHandler('start', callback)],
+            {1: [MessageHandler(Filters.text, callback)]},
+            [],
+            name='conversation',
+            persistent=True,
+        )
+        dispatcher.add_handler(conversation)
+        command = [MessageEntity(MessageEntity.BOT_COMMAND, 0, 6)]
+        for message_id, text in enumerate(['/start', 'text']):
+            message = Message(
+                message_id,
+                None,
+                Chat(1, 'private'),
+                from_user=User(2, 'name', False),
+                text=text,
+                entities=command if message_id == 0 else [],
+                bot=bot,
+            )
+            dispatcher.process_update(Update(message_id, message=message))
+
+        restored = SqlitePersistence(filepath)
+        assert restored.get_user_data()[2] == {'count': 2}
+        assert restored.get_conversations('conversation') == {(1, 2): 1}
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+import logging
+import time
+from threading import Event
+
+import pytest
+
+from TeleGenic.ext import TimerWheel
+
+
+@pytest.fixture(scope='function')
+def timer_wheel():
+    timer_wheel = TimerWheel(tick_interval=0.01, wheel_size=8)
+    yield timer_wheel
+    timer_wheel.stop()
+
+
+class TestTimerWheel:
+    def test_slot_behaviour(self, timer_wheel, mro_slots):
+        for attr in timer_wheel.__slots__:
+            assert getattr(timer_wheel, attr, 'err') != 'err', f"got extra slot '{attr}'"
+        assert len(mro_slots(timer_wheel)) == len(set(mro_slots(timer_wheel))), "duplicate slot"
+
+    def test_init(self):
+        with pytest.raises(ValueError, match='must be positive'):
+            TimerWheel(tick_interval=0)
+        with pytest.raises(ValueError, match='must be positive'):
+            TimerWheel(wheel_size=0)
+
+    def test_expire(self, timer_wheel):
+        second = timer_wheel.schedule('second', 0.02, 2)
+        first = timer_wheel.schedule('first', 0.015, 1)
+        timer_wheel.schedule('later', 1, 3)
+        assert len(timer_wheel) == 3
+        assert 'first' in timer_wheel
+        assert timer_wheel.next_deadline() == first
+
+        # Timeouts never expire early
+        assert timer_wheel.expire(now=first - 0.001) == []
+        assert timer_wheel.expire(now=second + 0.01) == [('first', 1), ('second', 2)]
+        assert timer_wheel.expire(now=second + 0.01) == []
+        assert 'first' not in timer_wheel
+        assert len(timer_wheel) == 1
+
+    def test_later_revolutions(self, timer_wheel):
+        # The wheel covers 0.08 seconds, so these timeouts share buckets
+        now = time.monotonic()
+        for index in range(20):
+            timer_wheel.schedule(index, 0.03 * index, index)
+
+        expired_at = {}
+        for step in range(1, 80):
+            for key, _ in timer_wheel.expire(now=now + 0.01 * step):
+                expired_at[key] = step
+        assert sorted(expired_at) == list(range(20))
+        for index, step in expired_at.items():
+            # Not early and at most about one tick late
+            assert 0.03 * index <= 0.01 * step < 0.03 * index + 0.025
+
+    def test_skipped_ticks(self, timer_wheel):
+        # More ticks than buckets passed between two calls
+        timer_wheel.schedule('a', 0.05, 'a')
+        timer_wheel.schedule('b', 0.5, 'b')
+        assert timer_wheel.expire(now=time.monotonic() + 1) == [('a', 'a'), ('b', 'b')]
+
+    def test_reschedule_and_cancel(self, timer_wheel):
+        timer_wheel.schedule('key', 0, 'old')
+        deadline = timer_wheel.schedule('key', 0.5, 'new')
+        assert timer_wheel.next_deadline() == deadline
+        assert timer_wheel.expire(now=time.monotonic() + 0.1) == []
+        assert timer_wheel.cancel('key')
+        assert not timer_wheel.cancel('key')
+        assert timer_wheel.next_deadline() is None
+
+        timer_wheel.schedule('key', 0)
+        timer_wheel.clear()
+        assert len(timer_wheel) == 0
+        assert timer_wheel.expire(now=time.monotonic() + 1) == []
+
+    def test_thread(self, timer_wheel, caplog):
+        expired = []
+        event = Event()
+
+        def callback(timeouts):
+            expired.extend(timeouts)
+            if len(expired) == 3:
+                event.set()
+            raise RuntimeError('callback error')
+
+        timer_wheel.start(callback, name='test_timer_wheel')
+        assert timer_wheel.running
+        with caplog.at_level(logging.ERROR):
+            for index in range(3):
+                timer_wheel.schedule(index, 0.01 * index, index)
+            assert event.wait(1)
+        assert sorted(data for _, data in expired) == [0, 1, 2]
+        assert caplog.records[0].exc_info[1].args == ('callback error',)
+
+        timer_wheel.stop()
+        assert not timer_wheel.running
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+import pickle
+
+import pytest
+
+from TeleGenic.ext import TrackingDict
+
+
+@pytest.fixture(scope='function')
+def tracking_dict():
+    return TrackingDict({'a': 1, 'b': [1]})
+
+
+class TestTrackingDict:
+    def test_slot_behaviour(self, tracking_dict, mro_slots):
+        for attr in tracking_dict.__slots__:
+            assert getattr(tracking_dict, attr, 'err') != 'err', f"got extra slot '{attr}'"
+        assert len(mro_slots(tracking_dict)) == len(set(mro_slots(tracking_dict))), "same slot"
+
+    def test_init(self, tracking_dict):
+        assert tracking_dict == {'a': 1, 'b': [1]}
+        assert not tracking_dict.changed
+        assert not TrackingDict().changed
+
+    @pytest.mark.parametrize(
+        'mutation',
+        [
+            lambda d: d.__setitem__('c', 3),
+            lambda d: d.__delitem__('a'),
+            lambda d: d.clear(),
+            lambda d: d.pop('a'),
+            lambda d: d.popitem(),
+            lambda d: d.setdefault('c', 3),
+            lambda d: d.update(c=3),
+            lambda d: d.__ior__({'c': 3}),
+            lambda d: d.mark_as_changed(),
+        ],
+    )
+    def test_mutations(self, tracking_dict, mutation):
+        mutation(tracking_dict)
+        assert tracking_dict.changed
+        tracking_dict.mark_as_unchanged()
+        assert not tracking_dict.changed
+
+    def test_no_mutations(self, tracking_dict):
+        tracking_dict.pop('c', None)
+        tracking_dict.setdefault('a', 2)
+        tracking_dict.get('a')
+        TrackingDict().clear()
+        # Changing a mutable value back and forth is no change
+        tracking_dict['b'].append(2)
+        tracking_dict['b'].pop()
+        assert not tracking_dict.changed
+
+    def test_mutable_values(self, tracking_dict):
+        tracking_dict['b'].append(2)
+        assert tracking_dict.changed
+        tracking_dict.mark_as_unchanged()
+        assert not tracking_dict.changed
+
+        tracking_dict['c'] = {'nested': []}
+        tracking_dict.mark_as_unchanged()
+        tracking_dict['c']['nested'].append(1)
+        assert tracking_dict.changed
+
+    def test_unpicklable_values(self):
+        tracking_dict = TrackingDict({'a': lambda: None})
+        assert tracking_dict.changed
+        tracking_dict.mark_as_unchanged()
+        assert tracking_dict.changed
+
+    def test_compare_values_disabled(self):
+        class MarkingDict(TrackingDict):
+            compare_values = False
+
+        marking_dict = MarkingDict({'a': [1]})
+        marking_dict['a'].append(2)
+        assert not marking_dict.changed
+        marking_dict.mark_as_changed()
+        assert marking_dict.changed
+
+    def test_pickle(self, tracking_dict):
+        restored = pickle.loads(pickle.dumps(tracking_dict))
+        assert isinstance(restored, TrackingDict)
+        assert restored == tracking_dict
+        assert not restored.changed
+
+        tracking_dict['b'].append(2)
+        restored = pickle.loads(pickle.dumps(tracking_dict))
+        assert restored == tracking_dict
+        assert not restored.changed
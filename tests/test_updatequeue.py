@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+import json
+from queue import Full
+from threading import Event, Thread
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+from TeleGenic import CallbackQuery, Chat, Message, Poll, Update, User
+from TeleGenic.ext import PriorityUpdateQueue, UpdateQueue
+from TeleGenic.ext.updatequeue import update_type
+from TeleGenic.ext.utils.webhookhandler import WebhookAppClass, WebhookServer
+
+
+def make_update(update_id, kind='message'):
+    if kind == 'message':
+        return Update(update_id, message=Message(update_id, None, Chat(1, 'private'), text='t'))
+    if kind == 'poll':
+        return Update(update_id, poll=Poll('1', 'q', [], 0, False, False, 'regular', False))
+    return Update(
+        update_id, callback_query=CallbackQuery(str(update_id), User(1, '', False), 'c', data='d')
+    )
+
+
+class TestUpdateQueue:
+    def test_slot_behaviour(self, mro_slots):
+        inst = UpdateQueue()
+        for attr in inst.__slots__:
+            assert getattr(inst, attr, 'err') != 'err', f"got extra slot '{attr}'"
+        assert len(mro_slots(inst)) == len(set(mro_slots(inst))), "duplicate slot"
+
+    def test_init_errors(self):
+        with pytest.raises(ValueError, match='Unknown overflow'):
+            UpdateQueue(1, overflow='unknown')
+        with pytest.raises(ValueError, match='drop_types'):
+            UpdateQueue(1, overflow=UpdateQueue.DROP_TYPES)
+
+    def test_update_type(self):
+        assert update_type(make_update(1)) == 'message'
+        assert update_type(make_update(1, 'callback_query')) == 'callback_query'
+        assert update_type('string') is None
+
+    def test_block(self):
+        queue = UpdateQueue(2)
+        queue.put(1)
+        assert not queue.congested
+        queue.put(2)
+        assert queue.congested
+        assert not queue.wait_for_space(timeout=0.01)
+        with pytest.raises(Full):
+            queue.put(3, block=False)
+        queue.get()
+        assert queue.wait_for_space(timeout=0.01)
+
+    def test_drop_oldest(self):
+        queue = UpdateQueue(2, overflow=UpdateQueue.DROP_OLDEST)
+        for i in range(5):
+            queue.put(i, block=False)
+        assert not queue.congested
+        assert queue.dropped == 3
+        assert [queue.get(), queue.get()] == [3, 4]
+        queue.task_done()
+        queue.task_done()
+        # all tasks are done, even though the dropped updates were never marked as done
+        queue.join()
+
+    def test_drop_types(self):
+        queue = UpdateQueue(2, overflow=UpdateQueue.DROP_TYPES, drop_types=['poll'])
+        queue.put(make_update(1, 'poll'))
+        queue.put(make_update(2))
+        # new droppable update is dropped
+        queue.put(make_update(3, 'poll'))
+        assert [update.update_id for update in queue.queue] == [1, 2]
+        # queued droppable update is dropped for a new update
+        queue.put(make_update(4, 'callback_query'))
+        assert [update.update_id for update in queue.queue] == [2, 4]
+        assert queue.dropped == 2
+        # nothing left to drop
+        with pytest.raises(Full):
+            queue.put(make_update(5), block=False)
+        with pytest.raises(Full):
+            queue.put(make_update(5), timeout=0.01)
+
+    def test_spill(self, bot, tmp_path):
+        path = tmp_path / 'spill'
+        queue = UpdateQueue(2, overflow=UpdateQueue.SPILL, spill_path=str(path))
+        queue.set_bot(bot)
+        for i in range(5):
+            queue.put(make_update(i, 'callback_query'), block=False)
+        queue.put('not an update')
+        assert queue.qsize() == 6
+        assert queue.spilled == 4
+        assert path.stat().st_size > 0
+
+        items = [queue.get() for _ in range(6)]
+        assert [item.update_id for item in items[:5]] == list(range(5))
+        assert items[5] == 'not an update'
+        assert items[4].callback_query.bot is bot
+        assert queue.spilled == 0
+        assert path.stat().st_size == 0
+
+        queue.close()
+        assert not path.exists()
+
+    def test_webhook_rejects_when_full(self, bot):
+        queue = UpdateQueue(1)
+        app = WebhookAppClass('/hook', bot, queue)
+        server = WebhookServer('127.0.0.1', 8765, app, None)
+        ready = Event()
+        thread = Thread(target=server.serve_forever, kwargs={'ready': ready})
+        thread.start()
+        ready.wait()
+
+        def post(update_id):
+            payload = json.dumps(make_update(update_id).to_dict()).encode()
+            request = Request(
+                'http://127.0.0.1:8765/hook',
+                data=payload,
+                headers={'content-type': 'application/json'},
+            )
+            return urlopen(request)
+
+        try:
+            assert post(1).code == 200
+            with pytest.raises(HTTPError) as exc_info:
+                post(2)
+            assert exc_info.value.code == 503
+            assert exc_info.value.headers['Retry-After'] == '1'
+            assert queue.qsize() == 1
+        finally:
+            server.shutdown()
+            thread.join()
+
+
+class TestPriorityUpdateQueue:
+    def test_slot_behaviour(self, mro_slots):
+        inst = PriorityUpdateQueue()
+        for attr in inst.__slots__:
+            assert getattr(inst, attr, 'err') != 'err', f"got extra slot '{attr}'"
+        assert len(mro_slots(inst)) == len(set(mro_slots(inst))), "duplicate slot"
+
+    def test_init_errors(self):
+        with pytest.raises(ValueError, match='spill'):
+            PriorityUpdateQueue(1, overflow=PriorityUpdateQueue.SPILL)
+        with pytest.raises(ValueError, match='starvation_interval'):
+            PriorityUpdateQueue(starvation_interval=-1)
+
+    def test_priority_order(self):
+        queue = PriorityUpdateQueue(starvation_interval=0)
+        queue.put(make_update(1, 'poll'))
+        queue.put(make_update(2))
+        queue.put(make_update(3, 'callback_query'))
+        queue.put('not an update')
+        queue.put(make_update(4, 'callback_query'))
+        assert queue.qsize() == 5
+        assert queue.priority_of('not an update') == queue.default_priority
+
+        items = [queue.get() for _ in range(5)]
+        assert [getattr(item, 'update_id', item) for item in items] == [
+            3,
+            4,
+            2,
+            'not an update',
+            1,
+        ]
+        assert queue.empty()
+
+    def test_custom_priorities(self):
+        queue = PriorityUpdateQueue(priorities={'poll': -1}, starvation_interval=0)
+        queue.put(make_update(1, 'callback_query'))
+        queue.put(make_update(2, 'poll'))
+        assert queue.get().update_id == 2
+        assert queue.get().update_id == 1
+
+    def test_starvation_interval(self):
+        queue = PriorityUpdateQueue(starvation_interval=3)
+        queue.put(make_update(0, 'poll'))
+        for update_id in range(1, 6):
+            queue.put(make_update(update_id, 'callback_query'))
+
+        # every third get hands out the oldest update
+        assert [queue.get().update_id for _ in range(3)] == [1, 2, 0]
+        assert [queue.get().update_id for _ in range(3)] == [3, 4, 5]
+        assert queue.empty()
+
+    def test_many_updates(self):
+        queue = PriorityUpdateQueue(starvation_interval=4)
+        for update_id in range(200):
+            queue.put(make_update(update_id, 'poll' if update_id % 2 else 'callback_query'))
+        received = [queue.get().update_id for _ in range(200)]
+        assert sorted(received) == list(range(200))
+        assert queue.empty()
+        assert not queue._heap
+        assert not queue.queue
+
+    def test_stale_entries_are_compacted(self):
+        queue = PriorityUpdateQueue(starvation_interval=0)
+        # The oldest update waits at the front of the arrival order, while a steady stream of
+        # higher priority updates is taken from the heap
+        queue.put(make_update(0, 'poll'))
+        for update_id in range(1, 1001):
+            queue.put(make_update(update_id, 'callback_query'))
+            assert queue.get().update_id == update_id
+            assert len(queue.queue) <= 2 * queue.qsize() + 33
+        assert queue.get().update_id == 0
+        assert queue.empty()
+
+    def test_drop_oldest(self):
+        queue = PriorityUpdateQueue(2, overflow=PriorityUpdateQueue.DROP_OLDEST)
+        queue.put(make_update(1, 'callback_query'))
+        queue.put(make_update(2, 'poll'))
+        queue.put(make_update(3))
+        assert queue.dropped == 1
+        assert queue.qsize() == 2
+        assert [queue.get().update_id, queue.get().update_id] == [3, 2]
+        queue.task_done()
+        queue.task_done()
+        queue.join()
+
+    def test_drop_types(self):
+        queue = PriorityUpdateQueue(
+            2, overflow=PriorityUpdateQueue.DROP_TYPES, drop_types=['poll']
+        )
+        queue.put(make_update(1, 'poll'))
+        queue.put(make_update(2))
+        queue.put(make_update(3, 'callback_query'))
+        assert queue.dropped == 1
+        assert [queue.get().update_id, queue.get().update_id] == [3, 2]
+        assert queue.empty()
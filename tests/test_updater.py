@@ -20,6 +20,7 @@ import asyncio
 import logging
 import os
 import signal
+import socket
 import sys
 import threading
 from contextlib import contextmanager
@@ -46,7 +47,7 @@ from TeleGenic import (
     InlineKeyboardMarkup,
     InlineKeyboardButton,
 )
-from TeleGenic.error import Unauthorized, InvalidToken, TimedOut, RetryAfter
+from TeleGenic.error import Unauthorized, InvalidToken, NetworkError, TimedOut, RetryAfter
 from TeleGenic.ext import (
     Updater,
     Dispatcher,
@@ -54,9 +55,16 @@ from TeleGenic.ext import (
     Defaults,
     InvalidCallbackData,
     ExtBot,
+    RetryScheduler,
+    TypeHandler,
+    UpdateQueue,
 )
 from TeleGenic.utils.deprecate import TeleGenicDeprecationWarning
-from TeleGenic.ext.utils.webhookhandler import WebhookServer
+from TeleGenic.ext.utils.webhookhandler import (
+    MultiProcessWebhookServer,
+    WebhookDecoder,
+    WebhookServer,
+)
 
 signalskip = pytest.mark.skipif(
     sys.platform == 'win32',
@@ -206,6 +214,95 @@ class TestUpdater:
         event.wait()
         assert self.err_handler_called.wait(0.5) is not True
 
+    def test_pipelined_polling(self, monkeypatch, updater, caplog):
+        offsets = []
+        received = []
+        done = Event()
+
+        def get_updates_json(offset=None, *args, **kwargs):
+            offsets.append(offset)
+            if len(offsets) > 2:
+                sleep(0.01)
+                return []
+            first = offset or 1
+            updates = [
+                {
+                    'update_id': update_id,
+                    'message': {
+                        'message_id': update_id,
+                        'date': 0,
+                        'chat': {'id': 1, 'type': 'private'},
+                        'text': str(update_id),
+                    },
+                }
+                for update_id in range(first, first + 3)
+            ]
+            # Invalid updates are skipped and passed to the error handlers, but still confirmed
+            updates[1]['message'] = 'invalid'
+            return updates
+
+        def callback(bot, update):
+            received.append(update.update_id)
+            if len(received) == 4 and len(errors) == 2:
+                done.set()
+
+        def error_handler(bot, update, error):
+            errors.append(error)
+            if len(received) == 4 and len(errors) == 2:
+                done.set()
+
+        errors = []
+        monkeypatch.setattr(updater.bot, '_get_updates_json', get_updates_json)
+        monkeypatch.setattr(updater.bot, 'delete_webhook', lambda *args, **kwargs: True)
+        updater.dispatcher.add_handler(TypeHandler(Update, callback))
+        updater.dispatcher.add_error_handler(error_handler)
+        with caplog.at_level(logging.ERROR):
+            updater.start_polling(0.01, pipelined=True)
+            assert done.wait(2)
+            updater.stop()
+
+        assert received == [1, 3, 4, 6]
+        assert [str(error) for error in errors] == [
+            f'Failed to convert update {update_id}: {error.__cause__!r}'
+            for update_id, error in zip((2, 5), errors)
+        ]
+        assert all(isinstance(error, TeleGenicError) for error in errors)
+        assert offsets[:2] == [0, 4]
+        assert updater.last_update_id == 7
+        assert [record.getMessage() for record in caplog.records] == [
+            'Failed to convert update 2',
+            'Failed to convert update 5',
+        ]
+
+    def test_polling_retry_scheduler(self, monkeypatch, updater):
+        timeouts = []
+        states = []
+        done = Event()
+
+        def get_updates(*args, timeout=0, **kwargs):
+            timeouts.append(timeout)
+            states.append(updater.retry_scheduler.state)
+            if len(timeouts) <= 2:
+                raise NetworkError('network down')
+            if len(timeouts) == 4:
+                done.set()
+            return []
+
+        monkeypatch.setattr(updater.bot, 'get_updates', get_updates)
+        monkeypatch.setattr(updater.bot, 'delete_webhook', lambda *args, **kwargs: True)
+        updater.retry_scheduler.base_delay = 0.01
+        updater.retry_scheduler.reset_timeout = 0.01
+        updater.retry_scheduler.failure_threshold = 2
+        updater.start_polling(0.01, timeout=5)
+        assert done.wait(2)
+        updater.stop()
+
+        # While requests fail, long polling uses a short timeout. After two failures the circuit
+        # opens and the next request is a trial
+        assert timeouts[:4] == [5, 1, 1, 5]
+        assert states[:4] == ['closed', 'closed', 'half_open', 'closed']
+        assert updater.retry_scheduler.state == RetryScheduler.CLOSED
+
     @pytest.mark.parametrize('ext_bot', [True, False])
     def test_webhook(self, monkeypatch, updater, ext_bot):
         # Testing with both ExtBot and Bot to make sure any logic in WebhookHandler
@@ -255,6 +352,101 @@ class TestUpdater:
             assert not updater.httpd.is_running
             updater.stop()
 
+    def test_webhook_decode_workers(self, monkeypatch, updater, caplog):
+        q = Queue()
+        monkeypatch.setattr(updater.bot, 'set_webhook', lambda *args, **kwargs: True)
+        monkeypatch.setattr(updater.bot, 'delete_webhook', lambda *args, **kwargs: True)
+        monkeypatch.setattr('TeleGenic.ext.Dispatcher.process_update', lambda _, u: q.put(u))
+
+        ip = '127.0.0.1'
+        port = randrange(1024, 49152)  # Select random port
+        updater.start_webhook(ip, port, url_path='TOKEN', decode_workers=2, decode_batch_size=4)
+        sleep(0.2)
+        try:
+            updates = [
+                Update(
+                    update_id,
+                    message=Message(
+                        1, None, Chat(1, ''), from_user=User(1, '', False), text='Webhook'
+                    ),
+                )
+                for update_id in range(3)
+            ]
+            for update in updates:
+                assert self._send_webhook_msg(ip, port, update.to_json(), 'TOKEN').code == 200
+            # Invalid data is acknowledged, as it is only converted afterwards
+            with caplog.at_level(logging.ERROR):
+                assert self._send_webhook_msg(ip, port, '{invalid', 'TOKEN').code == 200
+                sleep(0.2)
+            assert sorted((q.get(False) for _ in range(3)), key=lambda u: u.update_id) == updates
+            assert q.empty()
+            assert caplog.records[-1].getMessage() == 'Failed to convert webhook data to an update'
+        finally:
+            updater.stop()
+        threads = threading.enumerate()
+        assert not any(thread.name.endswith('webhook_decoder_0') for thread in threads)
+
+    def test_webhook_decoder_full(self, bot):
+        decoder = WebhookDecoder(bot, Queue(), workers=1, max_pending=1)
+        assert decoder.submit(b'{}')
+        assert not decoder.submit(b'{}')
+        decoder.start()
+        decoder.stop()
+        assert decoder.update_queue.empty()
+
+    @pytest.mark.skipif(not hasattr(socket, 'SO_REUSEPORT'), reason='requires SO_REUSEPORT')
+    def test_webhook_processes(self, monkeypatch, updater):
+        q = Queue()
+        monkeypatch.setattr(updater.bot, 'set_webhook', lambda *args, **kwargs: True)
+        monkeypatch.setattr(updater.bot, 'delete_webhook', lambda *args, **kwargs: True)
+        monkeypatch.setattr('TeleGenic.ext.Dispatcher.process_update', lambda _, u: q.put(u))
+
+        ip = '127.0.0.1'
+        port = randrange(1024, 49152)  # Select random port
+        updater.start_webhook(ip, port, url_path='TOKEN', processes=2)
+        httpd = updater.httpd
+        try:
+            assert isinstance(httpd, MultiProcessWebhookServer)
+            assert len(httpd._workers) == 2
+            updates = [
+                Update(
+                    update_id,
+                    message=Message(
+                        1, None, Chat(1, ''), from_user=User(1, '', False), text='Webhook'
+                    ),
+                )
+                for update_id in range(4)
+            ]
+            for update in updates:
+                assert self._send_webhook_msg(ip, port, update.to_json(), 'TOKEN').code == 200
+            with pytest.raises(HTTPError) as exc_info:
+                self._send_webhook_msg(ip, port, update.to_json(), 'TOKEN', content_type='a')
+            assert exc_info.value.code == 403
+            sleep(1)
+            assert sorted((q.get(False) for _ in range(4)), key=lambda u: u.update_id) == updates
+            assert q.empty()
+        finally:
+            updater.stop()
+        assert not httpd.is_running
+        assert not httpd._workers
+
+    @pytest.mark.skipif(not hasattr(socket, 'SO_REUSEPORT'), reason='requires SO_REUSEPORT')
+    def test_webhook_processes_fail_to_start(self, bot):
+        ip = '127.0.0.1'
+        ready = Event()
+        # Without SO_REUSEPORT, the processes can't bind to the port
+        with socket.socket() as sock:
+            sock.bind((ip, 0))
+            sock.listen()
+            httpd = MultiProcessWebhookServer(
+                ip, sock.getsockname()[1], 'TOKEN', bot, Queue(), processes=2
+            )
+            with pytest.raises(TeleGenicError, match='exited with code'):
+                httpd.serve_forever(ready=ready)
+        assert ready.is_set()
+        assert not httpd.is_running
+        assert not httpd._workers
+
     @pytest.mark.parametrize('invalid_data', [True, False])
     def test_webhook_arbitrary_callback_data(self, monkeypatch, updater, invalid_data):
         """Here we only test one simple setup. TeleGenic.ext.ExtBot.insert_callback_data is tested
@@ -718,6 +910,24 @@ class TestUpdater:
         with pytest.raises(ValueError):
             Updater(dispatcher=dispatcher, context_types=True)
 
+    def test_mutual_exclude_update_queue_dispatcher(self, bot):
+        dispatcher = Dispatcher(bot, None)
+        with pytest.raises(ValueError, match='update_queue'):
+            Updater(dispatcher=dispatcher, workers=None, update_queue=UpdateQueue())
+
+    def test_update_queue(self, bot):
+        update_queue = UpdateQueue(maxsize=10)
+        updater = Updater(bot=bot, update_queue=update_queue)
+        assert updater.update_queue is update_queue
+        assert updater.dispatcher.update_queue is update_queue
+        assert update_queue.bot is bot
+
+    def test_wait_for_queue_space(self, bot):
+        updater = Updater(bot=bot, update_queue=UpdateQueue(maxsize=1))
+        assert updater._wait_for_queue_space()
+        updater.update_queue.put(1)
+        assert not updater._wait_for_queue_space()
+
     def test_defaults_warning(self, bot):
         with pytest.warns(TeleGenicDeprecationWarning, match='no effect when a Bot is passed'):
             Updater(bot=bot, defaults=Defaults())
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+#
+# A library that provides a Python interface to the TeleGenic Bot API
+# Copyright (C) 2015-2022
+# Leandro Toledo de Souza <devs@python-TeleGenic-bot.org>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser Public License for more details.
+#
+# You should have received a copy of the GNU Lesser Public License
+# along with this program.  If not, see [http://www.gnu.org/licenses/].
+from collections import defaultdict
+from queue import Queue
+from threading import Event, Thread
+from time import sleep
+
+import pytest
+
+from TeleGenic import Chat, Message, Update, User
+from TeleGenic.ext import (
+    Dispatcher,
+    DictPersistence,
+    Filters,
+    MessageHandler,
+    PicklePersistence,
+    WriteBehindPersistence,
+)
+
+
+class CountingPersistence(DictPersistence):
+    __slots__ = ('writes', 'flushes', 'fail')
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.writes = []
+        self.flushes = 0
+        self.fail = False
+
+    def update_chat_data(self, chat_id, data):
+        if self.fail:
+            raise RuntimeError('write failed')
+        self.writes.append(('chat', chat_id))
+        super().update_chat_data(chat_id, data)
+
+    def update_user_data(self, user_id, data):
+        self.writes.append(('user', user_id))
+        super().update_user_data(user_id, data)
+
+    def flush(self):
+        self.flushes += 1
+
+
+@pytest.fixture(scope='function')
+def counting_persistence():
+    return CountingPersistence()
+
+
+class TestWriteBehindPersistence:
+    def test_slot_behaviour(self, counting_persistence, mro_slots, recwarn):
+        inst = WriteBehindPersistence(counting_persistence)
+        for attr in inst.__slots__:
+            assert getattr(inst, attr, 'err') != 'err', f"got extra slot '{attr}'"
+        assert len(mro_slots(inst)) == len(set(mro_slots(inst))), "duplicate slot"
+        inst.custom, inst.flush_interval = 'should give warning', 1
+        assert len(recwarn) == 1 and 'custom' in str(recwarn[0].message), recwarn.list
+
+    def test_init(self, counting_persistence):
+        counting_persistence.store_bot_data = False
+        persistence = WriteBehindPersistence(counting_persistence)
+        assert not persistence.store_bot_data
+        assert persistence.store_chat_data
+        with pytest.raises(ValueError, match='flush_interval'):
+            WriteBehindPersistence(counting_persistence, flush_interval=0)
+        with pytest.raises(ValueError, match='max_pending'):
+            WriteBehindPersistence(counting_persistence, max_pending=0)
+        with pytest.raises(ValueError, match='durability'):
+            WriteBehindPersistence(counting_persistence, durability='always')
+
+        assert persistence.durability == WriteBehindPersistence.BEST_EFFORT
+        persistence = WriteBehindPersistence(counting_persistence, flush_after_batch=True)
+        assert persistence.durability == WriteBehindPersistence.FLUSH_AFTER_BATCH
+
+    def test_changes_are_coalesced(self, counting_persistence):
+        persistence = WriteBehindPersistence(counting_persistence, flush_interval=60)
+        for i in range(5):
+            persistence.update_chat_data(1, {'count': i})
+        persistence.update_user_data(2, {'a': 'b'})
+        assert persistence.pending == 2
+        assert counting_persistence.writes == []
+
+        persistence.flush()
+        assert persistence.pending == 0
+        assert counting_persistence.writes == [('user', 2), ('chat', 1)]
+        assert counting_persistence.chat_data[1] == {'count': 4}
+        assert counting_persistence.flushes == 1
+
+    def test_flush_interval(self, counting_persistence):
+        persistence = WriteBehindPersistence(counting_persistence, flush_interval=0.05)
+        persistence.update_chat_data(1, {'a': 'b'})
+        sleep(0.3)
+        assert counting_persistence.writes == [('chat', 1)]
+        assert counting_persistence.flushes == 0
+        persistence.flush()
+
+    def test_max_pending(self, counting_persistence):
+        persistence = WriteBehindPersistence(
+            counting_persistence, flush_interval=60, max_pending=3, flush_after_batch=True
+        )
+        for chat_id in range(3):
+            persistence.update_chat_data(chat_id, {})
+        sleep(0.2)
+        assert len(counting_persistence.writes) == 3
+        assert counting_persistence.flushes == 1
+        persistence.flush()
+        # nothing was pending, only the wrapped persistence is flushed
+        assert len(counting_persistence.writes) == 3
+
+    def test_flush_after_batch_durability(self, counting_persistence):
+        persistence = WriteBehindPersistence(
+            counting_persistence,
+            flush_interval=0.05,
+            durability=WriteBehindPersistence.FLUSH_AFTER_BATCH,
+        )
+        persistence.update_chat_data(1, {})
+        sleep(0.3)
+        assert counting_persistence.writes == [('chat', 1)]
+        assert counting_persistence.flushes == 1
+        persistence.flush()
+
+    def test_write_through_durability(self, counting_persistence):
+        persistence = WriteBehindPersistence(
+            counting_persistence, durability=WriteBehindPersistence.WRITE_THROUGH
+        )
+        persistence.update_chat_data(1, {'a': 'b'})
+        persistence.update_user_data(2, {})
+        persistence.update_conversation('name', (1,), 'state')
+        assert counting_persistence.writes == [('chat', 1), ('user', 2)]
+        assert counting_persistence.get_conversations('name') == {(1,): 'state'}
+        assert counting_persistence.flushes == 3
+        assert persistence.pending == 0
+
+        counting_persistence.fail = True
+        with pytest.raises(RuntimeError, match='write failed'):
+            persistence.update_chat_data(1, {})
+
+    def test_pending_changes_are_bounded(self, counting_persistence):
+        writing = Event()
+        release = Event()
+        update_chat_data = counting_persistence.update_chat_data
+
+        def slow_update_chat_data(chat_id, data):
+            writing.set()
+            release.wait(2)
+            update_chat_data(chat_id, data)
+
+        counting_persistence.update_chat_data = slow_update_chat_data
+        persistence = WriteBehindPersistence(
+            counting_persistence, flush_interval=60, max_pending=2
+        )
+        persistence.update_chat_data(1, {})
+        persistence.update_chat_data(2, {})
+        assert writing.wait(2)
+
+        # The first batch is being written, the next one fills up
+        persistence.update_chat_data(3, {})
+        persistence.update_chat_data(4, {})
+        thread = Thread(target=persistence.update_chat_data, args=(5, {}))
+        thread.start()
+        thread.join(0.2)
+        assert thread.is_alive()
+        # Changing pending data doesn't wait
+        persistence.update_chat_data(4, {'changed': True})
+
+        release.set()
+        thread.join(2)
+        assert not thread.is_alive()
+        persistence.flush()
+        assert counting_persistence.chat_data == {
+            1: {},
+            2: {},
+            3: {},
+            4: {'changed': True},
+            5: {},
+        }
+
+    def test_failed_write_is_retried(self, counting_persistence, caplog):
+        persistence = WriteBehindPersistence(counting_persistence, flush_interval=60)
+        counting_persistence.fail = True
+        persistence.update_chat_data(1, {'a': 'b'})
+        persistence.update_user_data(2, {})
+        persistence.flush()
+        assert 'Writing a batch' in caplog.text
+        assert counting_persistence.writes == [('user', 2)]
+        assert persistence.pending == 1
+
+        counting_persistence.fail = False
+        persistence.flush()
+        assert persistence.pending == 0
+        assert counting_persistence.chat_data[1] == {'a': 'b'}
+
+    def test_failed_write_keeps_newer_changes(self, counting_persistence):
+        writing = Event()
+        release = Event()
+        update_chat_data = counting_persistence.update_chat_data
+
+        def failing_update_chat_data(chat_id, data):
+            writing.set()
+            release.wait(2)
+            update_chat_data(chat_id, data)
+
+        counting_persistence.update_chat_data = failing_update_chat_data
+        counting_persistence.fail = True
+        persistence = WriteBehindPersistence(
+            counting_persistence, flush_interval=60, max_pending=1
+        )
+        persistence.update_chat_data(1, {'old': True})
+        assert writing.wait(2)
+        # Changed while the failing write is in progress
+        persistence.update_chat_data(1, {'new': True})
+        release.set()
+        sleep(0.2)
+        assert persistence.pending == 1
+
+        counting_persistence.fail = False
+        persistence.flush()
+        assert counting_persistence.chat_data[1] == {'new': True}
+
+    def test_failed_batch_is_not_retried_right_away(self, counting_persistence):
+        persistence = WriteBehindPersistence(
+            counting_persistence, flush_interval=60, max_pending=1
+        )
+        counting_persistence.fail = True
+        persistence.update_chat_data(1, {})
+        sleep(0.3)
+        # The batch is full again, but the write is only retried after flush_interval
+        assert persistence.pending == 1
+        counting_persistence.fail = False
+        sleep(0.2)
+        assert counting_persistence.writes == []
+        persistence.flush()
+        assert counting_persistence.writes == [('chat', 1)]
+
+    def test_conversations(self, counting_persistence):
+        persistence = WriteBehindPersistence(counting_persistence, flush_interval=60)
+        counting_persistence.update_conversation('name', (1,), 'state')
+        counting_persistence.update_conversation('name', (2,), 'state')
+        persistence.update_conversation('name', (1,), None)
+        persistence.update_conversation('name', (3,), 'new')
+        persistence.update_conversation('other', (1,), 'other')
+
+        expected = {(1,): None, (2,): 'state', (3,): 'new'}
+        assert persistence.get_conversations('name') == expected
+        persistence.flush()
+        assert counting_persistence.get_conversations('name') == expected
+
+    def test_with_dispatcher(self, bot, tmp_path):
+        filename = str(tmp_path / 'data')
+        pickle_persistence = PicklePersistence(filename, on_flush=True)
+        persistence = WriteBehindPersistence(pickle_persistence, flush_after_batch=True)
+        dispatcher = Dispatcher(bot, Queue(), workers=1, persistence=persistence)
+        assert isinstance(dispatcher.chat_data, defaultdict)
+
+        def callback(update, context):
+            context.chat_data['count'] = context.chat_data.get('count', 0) + 1
+            context.user_data['name'] = update.effective_user.first_name
+
+        dispatcher.add_handler(MessageHandler(Filters.all, callback))
+        for message_id in range(3):
+            message = Message(
+                message_id, None, Chat(1, 'private'), from_user=User(2, 'name', False)
+            )
+            dispatcher.process_update(Update(message_id, message=message))
+        persistence.flush()
+
+        restored = PicklePersistence(filename)
+        assert restored.get_chat_data()[1] == {'count': 3}
+        assert restored.get_user_data()[2] == {'name': 'name'}